@@ -22,9 +22,15 @@ Ansible - Helper functions
 
 # Imports #####################################################################
 
-from contextlib import contextmanager
+from collections import namedtuple
+from contextlib import contextmanager, suppress
+from datetime import datetime, timezone
+import fcntl
+import hashlib
+import json
 import logging
 import os
+import shlex
 import shutil
 import subprocess
 from tempfile import mkdtemp, NamedTemporaryFile
@@ -32,6 +38,7 @@ import yaml
 
 from django.conf import settings
 
+from instance.logging import buffered_db_logging
 from instance.utils import poll_streams
 
 
@@ -40,6 +47,197 @@ from instance.utils import poll_streams
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+# Name of the bundled callback plugin writing the start and end events of each task (see read_task_timings())
+TASK_TIMING_CALLBACK = 'task_timing'
+
+# Environment variable naming the file the task timing callback plugin writes its events to
+TASK_TIMING_PATH_VARIABLE = 'OPENCRAFT_TASK_TIMING_PATH'
+
+
+# Classes #####################################################################
+
+TaskTiming = namedtuple('TaskTiming', [
+    'role',  # Name of the role the task belongs to, or None
+    'task',  # Name of the task (or of its action, for unnamed tasks)
+    'host',  # Host the task ran on
+    'started',  # Datetime the task started at
+    'duration',  # Number of seconds the task took to run on the host
+    'changed',  # Whether the task changed anything on the host
+    'failed',  # Whether the task failed on the host (failures ignored by the playbook don't count)
+    'skipped',  # Whether the task was skipped on the host
+])
+
+
+class AnsibleVenvCache:
+    """
+    Persistent cache of the virtualenvs used to run Ansible playbooks.
+
+    Each virtualenv is stored under a key derived from the content of the requirements file and
+    the Python interpreter it is built with, so all playbook runs with the same requirements share
+    it instead of installing them again. The cache lives in settings.ANSIBLE_VENV_CACHE_DIR
+    (an empty value disables it), and is safe to share between worker processes on the same host:
+
+    * A virtualenv is complete once its marker file exists; the marker is written atomically
+      after pip succeeded, and holds the size of the virtualenv.
+    * Building a virtualenv holds an exclusive lock on its build lock file, so that concurrent
+      callers wait for a single build.
+    * Using a complete virtualenv holds a shared lock on its lock file for as long as the playbook
+      runs, so it can't be evicted under its feet. Nothing waits for an exclusive lock on it, so
+      callers never wait for the playbooks of others.
+    * When the cache grows past settings.ANSIBLE_VENV_CACHE_MAX_SIZE, the least recently used
+      virtualenvs that are not in use are deleted.
+    """
+    MARKER_FILENAME = '.complete'
+
+    @property
+    def cache_dir(self):
+        """
+        The directory holding the cached virtualenvs, or None if the cache is disabled.
+        """
+        return settings.ANSIBLE_VENV_CACHE_DIR or None
+
+    def get_key(self, requirements_path, python_path=None):
+        """
+        Return the cache key of the virtualenv for the given requirements file and Python interpreter.
+        """
+        key_hash = hashlib.sha256()
+        key_hash.update((python_path or settings.ANSIBLE_PYTHON_PATH).encode())
+        key_hash.update(b'\0')
+        with open(requirements_path, 'rb') as requirements_file:
+            key_hash.update(requirements_file.read())
+        return key_hash.hexdigest()
+
+    @contextmanager
+    def venv(self, requirements_path):
+        """
+        A context manager that yields the path of a cached virtualenv with the given requirements,
+        building it first if necessary, and keeps it from being evicted until the context exits.
+
+        Yields None if the cache is disabled or the virtualenv could not be built.
+        """
+        if not self.cache_dir:
+            yield None
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        key = self.get_key(requirements_path)
+        venv_path = os.path.join(self.cache_dir, key)
+        marker_path = os.path.join(venv_path, self.MARKER_FILENAME)
+        while True:
+            if os.path.exists(marker_path):
+                logger.info('Using cached Ansible virtualenv %s', venv_path)
+            else:
+                with open(venv_path + '.build.lock', 'a') as build_lock_file:
+                    fcntl.flock(build_lock_file, fcntl.LOCK_EX)
+                    # Another process may have built it while this one was waiting for the lock
+                    built = os.path.exists(marker_path) or self._build(requirements_path, venv_path)
+                if not built:
+                    yield None
+                    return
+                self.evict(keep=key)
+            with open(venv_path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+                # Another process may have evicted it before the lock was taken, in which case it's built again
+                if os.path.exists(marker_path):
+                    # Record the last use for the LRU eviction
+                    os.utime(marker_path)
+                    yield venv_path
+                    return
+
+    def _build(self, requirements_path, venv_path):
+        """
+        Build the virtualenv at `venv_path`. Must hold the exclusive build lock of the virtualenv.
+
+        Returns True on success.
+        """
+        logger.info('Creating cached Ansible virtualenv %s for %s', venv_path, requirements_path)
+        # Leftovers of a build that was interrupted
+        shutil.rmtree(venv_path, ignore_errors=True)
+        result = subprocess.run(
+            render_venv_creation_command(requirements_path, venv_path),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            shell=True,
+        )
+        if result.returncode != 0:
+            logger.error(
+                'Failed to create Ansible virtualenv %s:\n%s', venv_path, result.stdout.decode('utf-8', 'replace')
+            )
+            shutil.rmtree(venv_path, ignore_errors=True)
+            return False
+        size = sum(
+            os.lstat(os.path.join(dir_path, filename)).st_size
+            for dir_path, unused_dir_names, filenames in os.walk(venv_path)
+            for filename in filenames
+        )
+        marker_tmp_path = string_to_file_path(str(size), root_dir=venv_path)
+        os.rename(marker_tmp_path, os.path.join(venv_path, self.MARKER_FILENAME))
+        return True
+
+    def entries(self):
+        """
+        Return a list of `(key, size, last_used)` tuples for the complete virtualenvs in the cache,
+        least recently used first.
+        """
+        entries = []
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return entries
+        for key in os.listdir(self.cache_dir):
+            marker_path = os.path.join(self.cache_dir, key, self.MARKER_FILENAME)
+            try:
+                with open(marker_path) as marker_file:
+                    size = int(marker_file.read())
+                last_used = os.stat(marker_path).st_mtime
+            except (OSError, ValueError):
+                continue
+            entries.append((key, size, last_used))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def remove(self, key):
+        """
+        Delete the virtualenv with the given key, unless it is in use or being built.
+
+        Returns True if it was deleted.
+        """
+        venv_path = os.path.join(self.cache_dir, key)
+        with open(venv_path + '.lock', 'a') as lock_file, open(venv_path + '.build.lock', 'a') as build_lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(build_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            # Remove the marker first, so that the virtualenv is never seen as complete while being deleted.
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(venv_path, self.MARKER_FILENAME))
+            shutil.rmtree(venv_path, ignore_errors=True)
+        logger.info('Removed cached Ansible virtualenv %s', venv_path)
+        return True
+
+    def evict(self, max_size=None, keep=None):
+        """
+        Delete the least recently used virtualenvs until the cache is no larger than `max_size` bytes
+        (by default settings.ANSIBLE_VENV_CACHE_MAX_SIZE). Virtualenvs in use and `keep` are kept.
+
+        Returns the list of the deleted keys.
+        """
+        if max_size is None:
+            max_size = settings.ANSIBLE_VENV_CACHE_MAX_SIZE
+        entries = self.entries()
+        total_size = sum(size for unused_key, size, unused_last_used in entries)
+        removed = []
+        for key, size, unused_last_used in entries:
+            if total_size <= max_size:
+                break
+            if key != keep and self.remove(key):
+                total_size -= size
+                removed.append(key)
+        return removed
+
+
+venv_cache = AnsibleVenvCache()
+
+
 # Functions ###################################################################
 
 def load_yaml(string):
@@ -106,49 +304,106 @@ def create_temp_dir():
             shutil.rmtree(temp_dir)
 
 
-def render_sandbox_creation_command(
-        requirements_path, inventory_path, vars_path, playbook_name, remote_username, venv_path):
-    """
-    Renders the shell command used to create the sandbox
+def read_task_timings(path):
     """
+    Return the list of TaskTiming of the tasks run, parsed from the events written by the task
+    timing callback plugin to the file at `path`.
 
-    venv_python_path = os.path.join(venv_path, 'bin/python')
+    Incomplete lines, like the last one of a run that got killed, are ignored, and so are the
+    tasks that didn't end.
+    """
+    started_tasks = {}
+    timings = []
+    with open(path) as events_file:
+        for line in events_file:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event['event'] == 'task_start':
+                started_tasks[event['uuid']] = event
+            elif event['event'] == 'task_end' and event['uuid'] in started_tasks:
+                start = started_tasks[event['uuid']]
+                timings.append(TaskTiming(
+                    role=start['role'],
+                    task=start['task'],
+                    host=event['host'],
+                    started=datetime.fromtimestamp(start['time'], tz=timezone.utc),
+                    duration=event['time'] - start['time'],
+                    changed=event['changed'],
+                    failed=event['failed'],
+                    skipped=event['skipped'],
+                ))
+    return timings
+
+
+def render_venv_creation_command(requirements_path, venv_path):
+    """
+    Renders the shell command used to create the virtualenv Ansible runs in
+    """
     create_venv_cmd = 'virtualenv -p {python_path} {venv_path}'.format(
         python_path=settings.ANSIBLE_PYTHON_PATH,
         venv_path=venv_path,
     )
 
     install_requirements_cmd = '{python} -u {pip} install -r {requirements_path}'.format(
-        python=venv_python_path,
+        python=os.path.join(venv_path, 'bin/python'),
         pip=os.path.join(venv_path, 'bin/pip'),
         requirements_path=requirements_path,
     )
 
+    return ' && '.join([create_venv_cmd, install_requirements_cmd])
+
+
+def render_sandbox_creation_command(
+        requirements_path, inventory_path, vars_path, playbook_name, remote_username, venv_path, create_venv=True,
+        tags=None, skip_tags=None):
+    """
+    Renders the shell command used to create the sandbox
+
+    If create_venv is False, the virtualenv at venv_path must already exist.
+    `tags` and `skip_tags` are comma-separated lists of the tags of the tasks to run or skip.
+    """
     run_playbook_cmd = '{python} -u {ansible} -i {inventory_path} -e @{vars_path} -u {user} {playbook}'.format(
-        python=venv_python_path,
+        python=os.path.join(venv_path, 'bin/python'),
         ansible=os.path.join(venv_path, 'bin/ansible-playbook'),
         inventory_path=inventory_path,
         vars_path=vars_path,
         user=remote_username,
         playbook=playbook_name,
     )
+    if tags:
+        run_playbook_cmd += ' --tags {}'.format(shlex.quote(tags))
+    if skip_tags:
+        run_playbook_cmd += ' --skip-tags {}'.format(shlex.quote(skip_tags))
 
-    return ' && '.join([create_venv_cmd, install_requirements_cmd, run_playbook_cmd])
+    if not create_venv:
+        return run_playbook_cmd
+    return ' && '.join([render_venv_creation_command(requirements_path, venv_path), run_playbook_cmd])
 
 
 @contextmanager
-def run_playbook(requirements_path, inventory_str, vars_str, playbook_path, playbook_name, username='root'):
+def run_playbook(requirements_path, inventory_str, vars_str, playbook_path, playbook_name, username='root',
+                 tags=None, skip_tags=None, task_timings=None):
     """
     Runs ansible-playbook in a dedicated venv
 
-    Ansible only supports Python 2 - so we have to run it as a separate command, in its own venv
+    Ansible only supports Python 2 - so we have to run it as a separate command, in its own venv.
+    The venv is taken from the venv cache; if the cache is disabled or the venv can't be built there,
+    a throw-away venv is created as part of the command instead.
+
+    Only the tasks with one of the given `tags` are run, and those with one of the `skip_tags` are
+    skipped (both are comma-separated lists).
+
+    If a list is given as `task_timings`, the bundled task timing callback plugin is enabled, and
+    the TaskTiming of each task run is appended to the list once the process is done.
     """
 
-    with create_temp_dir() as ansible_tmp_dir:
+    with create_temp_dir() as ansible_tmp_dir, venv_cache.venv(requirements_path) as cached_venv_path:
 
         vars_path = string_to_file_path(vars_str, root_dir=ansible_tmp_dir)
         inventory_path = string_to_file_path(inventory_str, root_dir=ansible_tmp_dir)
-        venv_path = os.path.join(ansible_tmp_dir, 'venv')
+        venv_path = cached_venv_path or os.path.join(ansible_tmp_dir, 'venv')
 
         cmd = render_sandbox_creation_command(
             requirements_path=requirements_path,
@@ -156,7 +411,10 @@ def run_playbook(requirements_path, inventory_str, vars_str, playbook_path, play
             vars_path=vars_path,
             playbook_name=playbook_name,
             remote_username=username,
-            venv_path=venv_path
+            venv_path=venv_path,
+            create_venv=cached_venv_path is None,
+            tags=tags,
+            skip_tags=skip_tags,
         )
 
         logger.info('Running: %s', cmd)
@@ -170,6 +428,17 @@ def run_playbook(requirements_path, inventory_str, vars_str, playbook_path, play
         # changing host keys are expected.
         env['ANSIBLE_HOST_KEY_CHECKING'] = 'false'
 
+        if task_timings is not None:
+            task_timings_path = os.path.join(ansible_tmp_dir, 'task_timings.jsonl')
+            open(task_timings_path, 'w').close()
+            env[TASK_TIMING_PATH_VARIABLE] = task_timings_path
+            env['ANSIBLE_CALLBACK_PLUGINS'] = os.pathsep.join(filter(None, [
+                env.get('ANSIBLE_CALLBACK_PLUGINS'), os.path.join(settings.SITE_ROOT, 'playbooks/callback_plugins'),
+            ]))
+            env['ANSIBLE_CALLBACK_WHITELIST'] = ','.join(filter(None, [
+                env.get('ANSIBLE_CALLBACK_WHITELIST'), TASK_TIMING_CALLBACK,
+            ]))
+
         yield subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
@@ -180,20 +449,30 @@ def run_playbook(requirements_path, inventory_str, vars_str, playbook_path, play
             env=env,
         )
 
+        if task_timings is not None:
+            task_timings.extend(read_task_timings(task_timings_path))
+
 
 def capture_playbook_output(
-        requirements_path, inventory_str, vars_str, playbook_path, username='root', logger_=None, collect_logs=False
+        requirements_path, inventory_str, vars_str, playbook_path, username='root', logger_=None, collect_logs=False,
+        tags=None, skip_tags=None, task_timings=None,
 ):
     """
     Convenience wrapper for run_playbook() that captures the output of the playbook run.
+
+    Playbooks can output thousands of lines, so the log entries are written to the database in batches.
+    The timings of the tasks are appended to `task_timings`, if it is a list (see run_playbook()).
     """
-    with run_playbook(
+    with buffered_db_logging(), run_playbook(
         requirements_path=requirements_path,
         inventory_str=inventory_str,
         vars_str=vars_str,
         playbook_path=os.path.dirname(playbook_path),
         playbook_name=os.path.basename(playbook_path),
         username=username,
+        tags=tags,
+        skip_tags=skip_tags,
+        task_timings=task_timings,
     ) as process:
         try:
             log_line_generator = poll_streams(
@@ -36,6 +36,7 @@ from instance.serializers.instance import (
 )
 
 from .filters import IsOrganizationOwnerFilterBackendInstance
+from .log_entries import is_log_entries_page_request, log_entries_page_response
 
 
 # Views - API #################################################################
@@ -108,7 +109,12 @@ class InstanceViewSet(viewsets.ReadOnlyModelViewSet):
     def logs(self, request, pk):
         """
         Get this Instance's log entries
+
+        Returns the latest LOG_LIMIT entries, or a page of entries when any of the `after`, `before`,
+        `level` or `limit` query parameters is given (see log_entries_page_response()).
         """
+        if is_log_entries_page_request(request):
+            return log_entries_page_response(request, [self.get_object().instance])
         return Response(InstanceLogSerializer(self.get_object()).data)
 
     @detail_route(methods=['get'])
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Paginated log entries for the API
+"""
+
+# Imports #####################################################################
+
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+from instance.models.log_entry import LogEntry, LogEntryCursor
+from instance.serializers.logentry import LogEntrySerializer
+
+
+# Functions ###################################################################
+
+def is_log_entries_page_request(request):
+    """
+    Return True if the request asks for a page of log entries, rather than for the latest log entries.
+    """
+    return any(param in request.query_params for param in ('after', 'before', 'level', 'limit'))
+
+
+def _parse_cursor(request, param):
+    """
+    Parse the cursor passed in the given query parameter, if any.
+    """
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    try:
+        return LogEntryCursor.parse(value)
+    except ValueError:
+        raise serializers.ValidationError({param: 'Expected a cursor of the form "<created>,<id>".'})
+
+
+def log_entries_page_response(request, objects):
+    """
+    Stream a page of the log entries of the given objects as JSON, oldest first.
+
+    Query parameters:
+
+    * `after`: a cursor; return the entries following it (e.g. to tail a log)
+    * `before`: a cursor; return the entries preceding it (e.g. to load older entries).
+      Without any cursor, the latest entries are returned.
+    * `level`: a comma-separated list of logging levels to restrict the entries to
+    * `limit`: the maximum number of entries to return (at most, and by default, LOG_LIMIT)
+
+    The response holds the `log_entries` and the cursors to pass as `before` and `after` to get
+    the previous and next pages (`previous_cursor` and `next_cursor`). When the page is empty,
+    the cursors passed in the request are returned, so a client can keep polling with `next_cursor`.
+    """
+    after = _parse_cursor(request, 'after')
+    before = _parse_cursor(request, 'before')
+    if after and before:
+        raise serializers.ValidationError('Only one of "after" and "before" can be used.')
+    level_list = [level.upper() for level in request.query_params.get('level', '').split(',') if level]
+    invalid_levels = set(level_list) - {level for level, unused_name in LogEntry.LOG_LEVEL_CHOICES}
+    if invalid_levels:
+        raise serializers.ValidationError({'level': 'Invalid levels: {}'.format(', '.join(sorted(invalid_levels)))})
+    try:
+        limit = min(int(request.query_params.get('limit', settings.LOG_LIMIT)), settings.LOG_LIMIT)
+    except ValueError:
+        raise serializers.ValidationError({'limit': 'Expected a number.'})
+    if limit < 1:
+        raise serializers.ValidationError({'limit': 'Expected a positive number.'})
+
+    entries = LogEntry.get_page(objects, after=after, before=before, level_list=level_list, limit=limit)
+
+    def generate():
+        """
+        Yield the JSON response one log entry at a time.
+        """
+        first = last = None
+        yield '{"log_entries": ['
+        for log_entry in entries:
+            if first is None:
+                first = log_entry
+            else:
+                yield ', '
+            last = log_entry
+            yield json.dumps(LogEntrySerializer(log_entry).data, cls=JSONEncoder)
+        previous_cursor = LogEntryCursor.for_entry(first) if first else before
+        next_cursor = LogEntryCursor.for_entry(last) if last else after
+        yield '], "previous_cursor": {}, "next_cursor": {}}}'.format(
+            json.dumps(previous_cursor and str(previous_cursor)), json.dumps(next_cursor and str(next_cursor)),
+        )
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
@@ -40,6 +40,7 @@ from instance.serializers.openedx_appserver import (
 from instance.tasks import make_appserver_active, spawn_appserver
 
 from .filters import IsOrganizationOwnerFilterBackendAppServer, IsOrganizationOwnerFilterBackendInstance
+from .log_entries import is_log_entries_page_request, log_entries_page_response
 
 # Views - API #################################################################
 
@@ -95,8 +96,14 @@ class OpenEdXAppServerViewSet(viewsets.ReadOnlyModelViewSet):
     @detail_route(methods=['get'])
     def logs(self, request, pk):
         """
-        Get this AppServer's log entries
+        Get this AppServer's log entries, including the log entries of its server
+
+        Returns the latest LOG_LIMIT entries and all error entries, or a page of entries when any of
+        the `after`, `before`, `level` or `limit` query parameters is given (see log_entries_page_response()).
         """
+        if is_log_entries_page_request(request):
+            app_server = self.get_object()
+            return log_entries_page_response(request, [app_server, app_server.server])
         return Response(OpenEdXAppServerLogSerializer(self.get_object()).data)
 
     @detail_route(methods=['post'])
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Provisioning span views
+"""
+
+# Imports #####################################################################
+
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework import serializers, viewsets
+from rest_framework.response import Response
+
+from instance.api.permissions import IsSuperUser
+from instance.models.provisioning_span import ProvisioningSpan
+
+
+# Views #######################################################################
+
+class ProvisioningTimingsViewSet(viewsets.ViewSet):
+    """
+    This API reports the number of times each phase of the provisioning ran, how many of them
+    failed, and the 50th and 95th percentiles of its duration in seconds, across all deployments.
+
+    Use the `days` query parameter to only include the spans started in the last `days` days,
+    and `phase` to only include the phases starting with the given prefix (like `playbook:`).
+    It is visible only to superusers, since it covers the instances of all organizations.
+    """
+    permission_classes = [IsSuperUser]
+
+    def list(self, request):  # pylint: disable=no-self-use
+        """
+        List the timings of each provisioning phase
+        """
+        spans = ProvisioningSpan.objects.all()
+        days = request.query_params.get('days')
+        if days:
+            try:
+                days = int(days)
+            except ValueError:
+                raise serializers.ValidationError({'days': 'Must be an integer.'})
+            spans = spans.filter(started__gte=timezone.now() - timedelta(days=days))
+        phase = request.query_params.get('phase')
+        if phase:
+            spans = spans.filter(phase__startswith=phase)
+        return Response([
+            dict(phase=phase, **timings) for phase, timings in spans.get_phase_timings().items()
+        ])
@@ -22,7 +22,11 @@ Gandi DNS - Helper functions
 
 # Imports #####################################################################
 
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
 import logging
+import threading
 import time
 import xmlrpc.client
 
@@ -35,20 +39,113 @@ from django.core.cache import cache
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+# Number of threads fetching the zone IDs of the domains in the Gandi account concurrently
+ZONE_ID_CACHE_MAX_WORKERS = 8
+
+# How long a background refresh of the zone ID cache may run before another process can start one
+ZONE_ID_CACHE_REFRESH_LOCK_TIMEOUT = 600
+
+
 # Classes #####################################################################
 
+class DNSChange:
+    """
+    Handle on DNS changes enqueued with DNSChangeQueue.enqueue()
+    """
+    def __init__(self, futures):
+        self.futures = futures
+
+    def done(self):
+        """
+        Whether the changes have been committed, or failed.
+        """
+        return all(future.done() for future in self.futures)
+
+    def wait(self, timeout=None):
+        """
+        Wait until the changes have been committed to all zones.
+
+        Raises the exception of the first zone that failed, if any.
+        """
+        for future in self.futures:
+            future.result(timeout)
+
+
+class DNSChangeQueue:
+    """
+    Queue of DNS changes, committed by one worker thread per zone.
+
+    Callers enqueue the desired state of DNS records. While the worker of a zone commits a batch,
+    the changes enqueued for that zone are coalesced, so that the last change for each name wins,
+    and committed together in a single zone version. Different zones are committed in parallel.
+    """
+    def __init__(self, api):
+        self.api = api
+        self._lock = threading.Lock()
+        # registered domain => OrderedDict of subdomain => record, or None to remove the record
+        self._pending_changes = {}
+        # registered domain => futures of the callers waiting for the pending changes
+        self._pending_futures = {}
+        # registered domains with a running worker
+        self._workers = set()
+
+    def enqueue(self, changes_by_zone):
+        """
+        Enqueue the given changes, as returned by GandiAPI.group_dns_changes(), and return a DNSChange.
+        """
+        futures = []
+        with self._lock:
+            for registered_domain, changes in changes_by_zone.items():
+                pending_changes = self._pending_changes.setdefault(registered_domain, OrderedDict())
+                for subdomain, record in changes:
+                    # Move the name to the end, so that the changes keep being applied in order
+                    pending_changes.pop(subdomain, None)
+                    pending_changes[subdomain] = record
+                future = Future()
+                self._pending_futures.setdefault(registered_domain, []).append(future)
+                futures.append(future)
+                if registered_domain not in self._workers:
+                    self._workers.add(registered_domain)
+                    threading.Thread(target=self._run_worker, args=(registered_domain,), daemon=True).start()
+        return DNSChange(futures)
+
+    def _run_worker(self, registered_domain):
+        """
+        Commit the pending changes of the given zone, batch after batch, until there are none left.
+        """
+        while True:
+            with self._lock:
+                changes = self._pending_changes.pop(registered_domain, None)
+                futures = self._pending_futures.pop(registered_domain, [])
+                if not changes:
+                    self._workers.discard(registered_domain)
+                    return
+            try:
+                self.api.apply_zone_changes(registered_domain, list(changes.items()))
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception('Failed to update the DNS records of %s.', registered_domain)
+                for future in futures:
+                    future.set_exception(exc)
+            else:
+                for future in futures:
+                    future.set_result(None)
+
+
 class GandiAPI():
     """
     Gandi API proxy object
     """
 
     def __init__(self, api_url='https://rpc.gandi.net/xmlrpc/', client=None):
-        # This is a map of domain_name => zone_id key-value pairs.
+        # This is a map of domain_name => zone_id key-value pairs, loaded from the shared cache.
         self._zone_id_cache = None
-        if client:
-            self.client = client
-        else:
-            self.client = xmlrpc.client.ServerProxy(api_url)
+        self._zone_id_cache_populated_at = None
+        self.api_url = api_url
+        self._client = client
+        self._local = threading.local()
+        self.dns_change_queue = DNSChangeQueue(self)
 
     @property
     def api_key(self):
@@ -57,6 +154,19 @@ class GandiAPI():
         """
         return settings.GANDI_API_KEY
 
+    @property
+    def client(self):
+        """
+        XML-RPC client for the Gandi API
+
+        ServerProxy objects aren't thread-safe, so each thread gets its own, unless a client was given.
+        """
+        if self._client:
+            return self._client
+        if not hasattr(self._local, 'client'):
+            self._local.client = xmlrpc.client.ServerProxy(self.api_url)
+        return self._local.client
+
     @property
     def client_zone(self):
         """
@@ -64,38 +174,126 @@ class GandiAPI():
         """
         return self.client.domain.zone
 
+    @property
+    def zone_id_cache_key(self):
+        """
+        Key of the zone ID map of the Gandi account in the shared cache
+        """
+        return 'gandi_zone_ids:{}'.format(hashlib.sha256(self.api_key.encode()).hexdigest()[:16])
+
+    def _fetch_zone_id(self, domain):
+        """
+        Fetch the zone ID of the given domain from the Gandi API.
+        """
+        return self.client.domain.info(self.api_key, domain)['zone_id']
+
     def _populate_zone_id_cache(self):
         """
-        Populate the internal zone ID cache with all domains in the current Gandi account.
+        Populate the zone ID cache with all domains in the current Gandi account.
+
+        The zone IDs are fetched concurrently, and stored in the shared cache for all processes.
         """
-        self._zone_id_cache = {}
-        for domain_dict in self.client.domain.list(self.api_key):
-            domain = domain_dict['fqdn'].lower()
-            self._zone_id_cache[domain] = self.client.domain.info(self.api_key, domain)['zone_id']
+        domains = [domain_dict['fqdn'].lower() for domain_dict in self.client.domain.list(self.api_key)]
+        with ThreadPoolExecutor(max_workers=ZONE_ID_CACHE_MAX_WORKERS) as executor:
+            zone_ids = dict(zip(domains, executor.map(self._fetch_zone_id, domains)))
+        self._store_zone_id_cache(zone_ids, time.time())
+
+    def _store_zone_id_cache(self, zone_ids, populated_at):
+        """
+        Keep the given zone ID map, both in this process and in the shared cache.
+        """
+        self._zone_id_cache = zone_ids
+        self._zone_id_cache_populated_at = populated_at
+        cache.set(self.zone_id_cache_key, (zone_ids, populated_at), timeout=None)
+
+    def _refresh_zone_id_cache(self, lock_key):
+        """
+        Populate the zone ID cache again, then release the lock held while doing so.
+        Meant to run in a background thread.
+        """
+        try:
+            self._populate_zone_id_cache()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Failed to refresh the Gandi zone ID cache.')
+        finally:
+            cache.delete(lock_key)
+
+    def _is_zone_id_cache_stale(self):
+        """
+        Whether the zone ID map of this process is older than GANDI_ZONE_ID_CACHE_TTL.
+        """
+        return time.time() - self._zone_id_cache_populated_at > settings.GANDI_ZONE_ID_CACHE_TTL
+
+    def _get_zone_ids(self):
+        """
+        Return the map of domain names to zone IDs.
+
+        The map is read from the shared cache, and only populated from the Gandi API if it isn't there.
+        Once it is older than GANDI_ZONE_ID_CACHE_TTL seconds, it is populated again in a background
+        thread, and the current map keeps being used in the meantime.
+        """
+        if self._zone_id_cache is None or self._is_zone_id_cache_stale():
+            cached = cache.get(self.zone_id_cache_key)
+            if cached is None:
+                self._populate_zone_id_cache()
+                return self._zone_id_cache
+            self._zone_id_cache, self._zone_id_cache_populated_at = cached
+            if self._is_zone_id_cache_stale():
+                # Only one refresh at a time; the lock expires in case the process dies while it runs
+                lock_key = self.zone_id_cache_key + ':refreshing'
+                if cache.add(lock_key, True, timeout=ZONE_ID_CACHE_REFRESH_LOCK_TIMEOUT):
+                    logger.info('Refreshing the Gandi zone ID cache in the background')
+                    threading.Thread(target=self._refresh_zone_id_cache, args=(lock_key,), daemon=True).start()
+        return self._zone_id_cache
+
+    def _refresh_zone_id(self, domain):
+        """
+        Fetch the zone ID of a single domain that is missing from the zone ID cache, and add it to the cache.
+
+        Returns None if the domain isn't registered in the Gandi account.
+        """
+        try:
+            zone_id = self._fetch_zone_id(domain)
+        except xmlrpc.client.Fault:
+            return None
+        zone_ids = dict(self._get_zone_ids())
+        zone_ids[domain] = zone_id
+        self._store_zone_id_cache(zone_ids, self._zone_id_cache_populated_at)
+        return zone_id
 
     def split_domain_name(self, domain):
         """
         Split the given domain name in the registered domain and the subdomain.
         """
-        if self._zone_id_cache is None:
-            self._populate_zone_id_cache()
         labels = domain.lower().split('.')
-        for split_index in range(len(labels) - 1):
-            registered_domain = '.'.join(labels[split_index:])
-            if registered_domain in self._zone_id_cache:
-                subdomain = '.'.join(labels[:split_index]) or '@'
-                return subdomain, registered_domain
-        raise ValueError(
-            'The given domain name "{}" does not match any domain registered in the Gandi account.'.format(domain)
-        )
+        candidates = ['.'.join(labels[split_index:]) for split_index in range(len(labels) - 1)]
+        zone_ids = self._get_zone_ids()
+        registered_domain = next((candidate for candidate in candidates if candidate in zone_ids), None)
+        if registered_domain is None:
+            # The domain may have been added to the account after the cache was populated.
+            # Try the shortest candidates first, since they are the most likely to be registered.
+            registered_domain = next(
+                (candidate for candidate in reversed(candidates) if self._refresh_zone_id(candidate) is not None),
+                None,
+            )
+        if registered_domain is None:
+            raise ValueError(
+                'The given domain name "{}" does not match any domain registered in the Gandi account.'.format(domain)
+            )
+        subdomain = '.'.join(labels[:candidates.index(registered_domain)]) or '@'
+        return subdomain, registered_domain
 
     def get_zone_id(self, domain):
         """
         Gandi zone ID used by domain
         """
-        if self._zone_id_cache is None:
-            self._populate_zone_id_cache()
-        return self._zone_id_cache[domain]
+        zone_ids = self._get_zone_ids()
+        if domain not in zone_ids:
+            zone_id = self._refresh_zone_id(domain)
+            if zone_id is None:
+                raise KeyError(domain)
+            return zone_id
+        return zone_ids[domain]
 
     def delete_dns_record(self, zone_id, zone_version_id, record_name):
         """
@@ -127,11 +325,12 @@ class GandiAPI():
 
     def _dns_operation(self, callback, domain, log_msg, attempts=4, retry_delay=1):
         """
-        Encapsulate logic that is common to high-level DNS operations: grab the global lock, get the
+        Encapsulate logic that is common to high-level DNS operations: grab the zone lock, get the
         zone_id for a domain, create a new zone version, activate the zone version after successful
         update, and retry the whole procedure multiple times if necessary.
         """
-        with cache.lock('gandi_set_dns_record'): # Only do one DNS update at a time
+        # Only do one DNS update at a time for each zone
+        with cache.lock('gandi_set_dns_record:{}'.format(domain)):
             for i in range(1, attempts + 1):
                 try:
                     logger.info('%s (attempt %d out of %d)', log_msg, i, attempts)
@@ -147,46 +346,84 @@ class GandiAPI():
                     retry_delay *= 2
         return result
 
-    def set_dns_record(self, domain, **record):
+    def group_dns_changes(self, set_records=(), remove_domains=()):
         """
-        Set a DNS record. This method takes the mandatory `domain` parameter to be able to support
-        multiple domains, handled by the same Gandi account.
+        Group the given DNS changes by registered domain.
+
+        `set_records` is an iterable of (domain, record) pairs, where record is a dict with the
+        fields of the DNS record except its name, which gets extracted from the FQDN in `domain`.
+        `remove_domains` is an iterable of domain names whose records should be removed.
+
+        Returns a map of registered domain => list of (subdomain, record) pairs, where record is None
+        if the records of the subdomain should only be removed.
         """
-        if 'ttl' not in record.keys():
-            record['ttl'] = 1200
-        assert 'name' not in record, 'The name gets extracted from the FQDN passed in `domain`.'
-        record['name'], registered_domain = self.split_domain_name(domain)
+        changes_by_zone = OrderedDict()
+        for domain, record in set_records:
+            record = dict(record)
+            if 'ttl' not in record.keys():
+                record['ttl'] = 1200
+            assert 'name' not in record, 'The name gets extracted from the FQDN passed in `domain`.'
+            record['name'], registered_domain = self.split_domain_name(domain)
+            changes_by_zone.setdefault(registered_domain, []).append((record['name'], record))
+        for domain in remove_domains:
+            subdomain, registered_domain = self.split_domain_name(domain)
+            changes_by_zone.setdefault(registered_domain, []).append((subdomain, None))
+        return changes_by_zone
 
-        def set_dns_record_callback(zone_id, zone_version):
+    def apply_zone_changes(self, registered_domain, changes):
+        """
+        Apply the given (subdomain, record) changes to the zone of the registered domain, in a single new version.
+        """
+        def apply_zone_changes_callback(zone_id, zone_version):
             """
             Callback to be passed to _dns_operation().
             """
-            self.delete_dns_record(zone_id, zone_version, record['name'])
-            return self.add_dns_record(zone_id, zone_version, record)
+            for subdomain, record in changes:
+                self.delete_dns_record(zone_id, zone_version, subdomain)
+                if record is not None:
+                    self.add_dns_record(zone_id, zone_version, record)
 
         self._dns_operation(
-            callback=set_dns_record_callback,
+            callback=apply_zone_changes_callback,
             domain=registered_domain,
-            log_msg='Setting DNS record: {}'.format(record),
+            log_msg='Updating DNS records of {}: setting {}, deleting {}'.format(
+                registered_domain,
+                [record for _, record in changes if record is not None],
+                [subdomain for subdomain, record in changes if record is None],
+            ),
         )
 
-    def remove_dns_record(self, domain):
+    def update_dns_records(self, set_records=(), remove_domains=()):
         """
-        Remove the given name for the domain.
+        Set and remove several DNS records, using a single new version of each zone involved.
+
+        See group_dns_changes() for the format of the arguments.
         """
-        subdomain, registered_domain = self.split_domain_name(domain)
+        for registered_domain, changes in self.group_dns_changes(set_records, remove_domains).items():
+            self.apply_zone_changes(registered_domain, changes)
 
-        def remove_dns_record_callback(zone_id, zone_version):
-            """
-            Callback to be passed to _dns_operation().
-            """
-            self.delete_dns_record(zone_id, zone_version, subdomain)
+    def enqueue_dns_changes(self, set_records=(), remove_domains=()):
+        """
+        Enqueue DNS changes, to be committed in the background by the worker of each zone involved.
 
-        self._dns_operation(
-            callback=remove_dns_record_callback,
-            domain=registered_domain,
-            log_msg='Deleting DNS record: {}'.format(subdomain),
-        )
+        Changes enqueued concurrently for the same zone are coalesced. Returns a DNSChange, whose
+        wait() method blocks until the changes are committed.
+        See group_dns_changes() for the format of the arguments.
+        """
+        return self.dns_change_queue.enqueue(self.group_dns_changes(set_records, remove_domains))
+
+    def set_dns_record(self, domain, **record):
+        """
+        Set a DNS record. This method takes the mandatory `domain` parameter to be able to support
+        multiple domains, handled by the same Gandi account.
+        """
+        self.update_dns_records(set_records=[(domain, record)])
+
+    def remove_dns_record(self, domain):
+        """
+        Remove the given name for the domain.
+        """
+        self.update_dns_records(remove_domains=[domain])
 
 
 api = GandiAPI()
@@ -22,12 +22,18 @@ Instance app - Logging utils
 
 # Imports #####################################################################
 
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
 import logging
+import sys
+import threading
 import traceback
 
 from django.apps import apps
-from django.db import connection, models, ProgrammingError
+from django.conf import settings
+from django.db import connection, IntegrityError, models, ProgrammingError, transaction
+from django.utils import timezone
 from swampdragon.pubsub_providers.data_publisher import publish_data
 
 from instance.serializers.logentry import LogEntrySerializer
@@ -55,12 +61,152 @@ def log_exception(method):
     return wrapper
 
 
+def save_log_entries(save, count):
+    """
+    Call `save()` to write `count` log entries to the database, and return True on success.
+
+    When the LogEntry table is partitioned and has no partition for the current month (if the
+    `update_log_partitions` task stopped running), the partition is created and the entries are
+    saved again. Logging must never raise, so entries that still can't be saved are dropped, with
+    the error written to stderr.
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                save()
+            return True
+        except ProgrammingError:
+            # This can occur if django tries to log something before migrations have created the log table.
+            # Make sure that is actually what happened:
+            assert 'instance_logentry' not in connection.introspection.table_names()
+            return False
+        except IntegrityError as exc:
+            if attempt == 0 and 'no partition of relation' in str(exc):
+                # Imported here, since the models use this module
+                from instance.models.log_entry import LogEntryPartition
+                try:
+                    LogEntryPartition.for_month(timezone.now()).create()
+                    continue
+                except Exception as create_exc:  # pylint: disable=broad-except
+                    exc = create_exc
+            sys.stderr.write('Dropping {} log entries that could not be saved: {}\n'.format(count, exc))
+            return False
+
+
+@contextmanager
+def buffered_db_logging(capacity=None, flush_interval=None):
+    """
+    Context manager (or decorator) that buffers the log entries written by `DBHandler` in the
+    current thread, and writes them to the database in batches.
+
+    The buffer is flushed when it holds `capacity` entries, when a record of level WARNING or
+    above is emitted, `flush_interval` seconds after the oldest unflushed entry was buffered,
+    and when the block exits. Nested blocks share the buffer of the outermost block.
+    """
+    if getattr(DBHandler.local, 'buffer', None) is not None:
+        yield DBHandler.local.buffer
+        return
+
+    log_buffer = LogEntryBuffer(
+        capacity=capacity or settings.LOG_BUFFER_CAPACITY,
+        flush_interval=flush_interval or settings.LOG_BUFFER_FLUSH_INTERVAL,
+    )
+    DBHandler.local.buffer = log_buffer
+    try:
+        yield log_buffer
+    finally:
+        DBHandler.local.buffer = None
+        log_buffer.flush()
+
+
 # Classes #####################################################################
 
+class LogEntryBuffer:
+    """
+    In-memory buffer of unsaved log entries, written with a single `bulk_create()` per flush.
+
+    Websocket notifications are coalesced as well: each flush publishes a single
+    `object_log_lines` event per object, containing all of its new log entries.
+    """
+    def __init__(self, capacity, flush_interval):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.entries = []
+        self.lock = threading.RLock()
+        self.timer = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, log_entry, obj, levelno):
+        """
+        Add an unsaved LogEntry (emitted for the model object `obj`) to the buffer.
+        """
+        with self.lock:
+            self.entries.append((log_entry, obj))
+            if len(self.entries) >= self.capacity or levelno >= logging.WARNING:
+                self.flush()
+            elif self.timer is None:
+                # Make sure buffered entries show up in a timely manner even if no more records
+                # are emitted for a while, e.g. during a long-running Ansible task.
+                self.timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def _flush_from_timer(self):
+        """
+        Flush the buffer from the timer thread, and close the database connection of that thread.
+        """
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+    def flush(self):
+        """
+        Write all buffered log entries to the database and notify websocket clients.
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            entries, self.entries = self.entries, []
+            if not entries:
+                return
+
+            saved = save_log_entries(
+                lambda: apps.get_model('instance', 'LogEntry').objects.bulk_create(
+                    [log_entry for log_entry, obj in entries]
+                ),
+                len(entries),
+            )
+            if not saved:
+                return
+
+            events = OrderedDict()
+            for log_entry, obj in entries:
+                if log_entry.content_type_id is None:
+                    continue
+                key = (log_entry.content_type_id, log_entry.object_id)
+                if key not in events:
+                    events[key] = {'type': 'object_log_lines', 'log_entries': []}
+                    if hasattr(obj, 'event_context'):
+                        events[key].update(obj.event_context)
+                events[key]['log_entries'].append(LogEntrySerializer(log_entry).data)
+            for log_event in events.values():
+                publish_data('log', log_event)
+
+
 class DBHandler(logging.Handler):
     """
     Records log messages in database models
+
+    Inside a `buffered_db_logging()` block, log entries are buffered and written in batches
+    instead of being saved one by one.
     """
+    # Holds the active LogEntryBuffer of each thread, if any
+    local = threading.local()
+
     def emit(self, record):
         """
         Handles an emitted log entry and stores it in the database, optionally linking it to the
@@ -74,14 +220,19 @@ class DBHandler(logging.Handler):
             content_type = apps.get_model('contenttypes', 'ContentType').objects.get_for_model(obj)
             object_id = obj.pk
 
-        try:
-            log_entry = apps.get_model('instance', 'LogEntry').objects.create(
+        log_buffer = getattr(self.local, 'buffer', None)
+        if log_buffer is not None:
+            log_entry = apps.get_model('instance', 'LogEntry')(
                 level=record.levelname, text=self.format(record), content_type=content_type, object_id=object_id
             )
-        except ProgrammingError:
-            # This can occur if django tries to log something before migrations have created the log table.
-            # Make sure that is actually what happened:
-            assert 'instance_logentry' not in connection.introspection.table_names()
+            log_buffer.add(log_entry, obj, record.levelno)
+            return
+
+        log_entry = apps.get_model('instance', 'LogEntry')(
+            level=record.levelname, text=self.format(record), content_type=content_type, object_id=object_id
+        )
+        if not save_log_entries(log_entry.save, 1):
+            return
 
         # Send notice of entries related to any resource. Skip generic log entries that occur
         # in debug mode, like "GET /static/img/favicon/favicon-96x96.png":
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Baked images report management command
+"""
+
+# Imports #####################################################################
+
+from django.core.management.base import BaseCommand
+
+from instance.models.baked_image import BakedImage
+
+
+# Classes #####################################################################
+
+class Command(BaseCommand):
+    """
+    Management command to report the baked images and the deployment time they saved
+    """
+    help = (
+        'Lists the baked images with the number of AppServers that booted from them, and the '
+        'estimated deployment time they saved.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Include the failed and deleted images.'
+        )
+
+    def handle(self, *args, **options):
+        images = BakedImage.objects.order_by('created')
+        if not options['all']:
+            images = images.filter(status__in=[BakedImage.BAKING, BakedImage.READY])
+        total_uses = total_saved = 0
+        for image in images:
+            self.stdout.write(
+                '{id}: {release} / {configuration} / {commit} ({status}, {created:%Y-%m-%d}): '
+                'booted {uses} AppServer(s), {saved:.0f}s saved'.format(
+                    id=image.pk,
+                    release=image.openedx_release,
+                    configuration=image.configuration_version,
+                    commit=image.edx_platform_commit,
+                    status=image.status,
+                    created=image.created,
+                    uses=image.use_count,
+                    saved=image.time_saved,
+                )
+            )
+            total_uses += image.use_count
+            total_saved += image.time_saved
+        self.stdout.write('{} AppServer(s) booted from baked images, {:.1f}h saved.'.format(
+            total_uses, total_saved / 3600,
+        ))
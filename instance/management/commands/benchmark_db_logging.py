@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - database logging benchmark management command
+"""
+
+# Imports #####################################################################
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from instance.logging import buffered_db_logging
+from instance.models.log_entry import LogEntry
+from instance.models.server import OpenStackServer
+
+
+# Classes #####################################################################
+
+class Command(BaseCommand):
+    """
+    Management command to compare the throughput of unbuffered and buffered database logging
+    """
+    help = (
+        'Measures how many log lines per second can be written to the LogEntry table, with and without '
+        'buffering. All rows written by the benchmark are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lines',
+            type=int,
+            default=2000,
+            help='Number of log lines to write with each handler mode.'
+        )
+
+    def handle(self, *args, **options):
+        num_lines = options['lines']
+        with transaction.atomic():
+            # Log against a throw-away server, like the AppServer VMs Ansible output is logged for.
+            server = OpenStackServer.objects.create(name_prefix='log-benchmark')
+            unbuffered = self.measure(server, num_lines, buffered=False)
+            buffered = self.measure(server, num_lines, buffered=True)
+            written = LogEntry.objects.filter(object_id=server.pk).count()
+            transaction.set_rollback(True)
+
+        self.stdout.write('Unbuffered: {:.0f} lines/second'.format(unbuffered))
+        self.stdout.write('Buffered:   {:.0f} lines/second'.format(buffered))
+        self.stdout.write('Speedup:    {:.1f}x ({} log entries written)'.format(buffered / unbuffered, written))
+
+    @staticmethod
+    def measure(server, num_lines, buffered):
+        """
+        Log `num_lines` lines for `server` and return the number of lines written per second.
+        """
+        start = time.perf_counter()
+        if buffered:
+            # Don't let the flush timer write from another connection, outside of our transaction.
+            with buffered_db_logging(flush_interval=3600):
+                for i in range(num_lines):
+                    server.logger.info('Benchmark line #%d', i)
+        else:
+            for i in range(num_lines):
+                server.logger.info('Benchmark line #%d', i)
+        return num_lines / (time.perf_counter() - start)
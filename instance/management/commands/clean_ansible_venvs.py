@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Ansible virtualenv cache cleanup management command
+"""
+
+# Imports #####################################################################
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from instance.ansible import venv_cache
+
+
+# Classes #####################################################################
+
+class Command(BaseCommand):
+    """
+    Management command to delete cached Ansible virtualenvs
+    """
+    help = (
+        'Deletes the least recently used cached Ansible virtualenvs until the cache fits in '
+        'ANSIBLE_VENV_CACHE_MAX_SIZE. Virtualenvs used by running playbooks are never deleted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Delete all cached virtualenvs that are not in use.'
+        )
+
+    def handle(self, *args, **options):
+        if not venv_cache.cache_dir:
+            self.stdout.write('The Ansible virtualenv cache is disabled.')
+            return
+        removed = venv_cache.evict(max_size=0 if options['all'] else settings.ANSIBLE_VENV_CACHE_MAX_SIZE)
+        for key in removed:
+            self.stdout.write('Deleted {}'.format(key))
+        remaining = venv_cache.entries()
+        self.stdout.write('{} virtualenv(s) deleted, {} virtualenv(s) left using {:.1f} MiB.'.format(
+            len(removed), len(remaining), sum(size for unused_key, size, unused_last_used in remaining) / 1024 ** 2,
+        ))
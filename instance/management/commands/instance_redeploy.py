@@ -276,11 +276,10 @@ class Command(BaseCommand):
         mysql_commands = self.options.get('preupgrade_sql_commands', [])
         if mysql_commands:
             LOG.info("Performing MySQL commands: %s %s (%s)", instance, instance.domain, instance.id)
-            cursor = instance.get_mysql_cursor_for_db('edxapp')
-            if cursor is not None:
-                for command in mysql_commands:
-                    cursor.execute(command)
-                cursor.close()
+            with instance.get_mysql_cursor_for_db('edxapp') as cursor:
+                if cursor is not None:
+                    for command in mysql_commands:
+                        cursor.execute(command)
 
     def _do_redeployment(self):
         """
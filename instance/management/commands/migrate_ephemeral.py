@@ -28,6 +28,7 @@ import logging
 from django.core.management.base import BaseCommand
 
 from instance.models.instance import InstanceReference
+from instance.models.mixins.database import provision_mysql_instances
 from instance.tasks import spawn_appserver
 
 LOG = logging.getLogger(__name__)
@@ -57,13 +58,21 @@ class Command(BaseCommand):
         LOG.info('Found "%d" instances using ephemeral databases', len(refs))
 
         for ref in refs:
-            # Disable ephemeral support and spawn a new AppServer
+            # Disable ephemeral support
             LOG.info('Migrating %s to use persistent databases', ref.instance.name)
             ref.instance.use_ephemeral_databases = False
             ref.instance.save()
+
+        # Provision the MySQL databases of all instances at once, with one batch per MySQL server,
+        # so that spawning the new AppServers only provisions those that failed.
+        provision_mysql_instances([ref.instance for ref in refs])
+
+        for ref in refs:
+            # Spawn a new AppServer
             spawn_appserver(
                 instance_ref_id=ref.id,
                 mark_active_on_success=True,
                 deactivate_old_appservers=True,
-                num_attempts=3)
+                num_attempts=3,
+                skip_provisioned_mysql=True)
             LOG.info('Migrated and started provisioning a new app server for %s', ref.instance.name)
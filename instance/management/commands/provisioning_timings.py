@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Provisioning timings management command
+"""
+
+# Imports #####################################################################
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from instance.models.provisioning_span import ProvisioningSpan
+
+
+# Classes #####################################################################
+
+class Command(BaseCommand):
+    """
+    Management command to report the 50th and 95th percentiles of the duration of each provisioning phase
+    """
+    help = (
+        'Lists each phase of the provisioning of instances and AppServers, with the number of times it ran, '
+        'how many of them failed, and the 50th and 95th percentiles of its duration in seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Only include the phases started in the given number of last days.'
+        )
+        parser.add_argument(
+            '--phase',
+            help='Only include the phases starting with the given prefix, like "playbook:".'
+        )
+
+    def handle(self, *args, **options):
+        spans = ProvisioningSpan.objects.all()
+        if options['days']:
+            spans = spans.filter(started__gte=timezone.now() - timedelta(days=options['days']))
+        if options['phase']:
+            spans = spans.filter(phase__startswith=options['phase'])
+        timings = spans.get_phase_timings()
+        if not timings:
+            self.stdout.write('No provisioning spans recorded.')
+            return
+        for phase, phase_timings in timings.items():
+            self.stdout.write('{phase}: {count} run(s), {failed} failed, p50 {p50}, p95 {p95}'.format(
+                phase=phase,
+                count=phase_timings['count'],
+                failed=phase_timings['failed'],
+                p50=self.format_duration(phase_timings['p50']),
+                p95=self.format_duration(phase_timings['p95']),
+            ))
+
+    @staticmethod
+    def format_duration(duration):
+        """
+        Format a duration in seconds, or None if there is no successful span to compute it from
+        """
+        return '-' if duration is None else '{:.1f}s'.format(duration)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Slowest Ansible tasks management command
+"""
+
+# Imports #####################################################################
+
+from django.core.management.base import BaseCommand
+
+from instance.models.ansible_task_timing import AnsibleTaskTiming
+
+
+# Classes #####################################################################
+
+class Command(BaseCommand):
+    """
+    Management command to report the Ansible tasks or roles that took the most time across the last deployments
+    """
+    help = (
+        'Lists the Ansible tasks that took the most time in total across the playbook runs of the last '
+        'deployed AppServers, with the number of runs and their average and longest durations.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Number of tasks to list (default: 20).'
+        )
+        parser.add_argument(
+            '--deploys',
+            type=int,
+            default=10,
+            help='Number of last deployed AppServers to include (default: 10).'
+        )
+        parser.add_argument(
+            '--by-role',
+            action='store_true',
+            help='List the roles instead of the tasks.'
+        )
+
+    def handle(self, *args, **options):
+        timings = AnsibleTaskTiming.objects.of_last_deploys(options['deploys'])
+        slowest = timings.slowest(options['top'], by_role=options['by_role'])
+        if not slowest:
+            self.stdout.write('No Ansible task timings recorded.')
+            return
+        for entry in slowest:
+            name = entry['role'] or '(no role)'
+            if not options['by_role']:
+                name = '{} : {}'.format(name, entry['task'])
+            self.stdout.write(
+                '{total:.0f}s in {runs} run(s), {average:.1f}s average, {longest:.1f}s longest: {name}'.format(
+                    name=name, **entry
+                )
+            )
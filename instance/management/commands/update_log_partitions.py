@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - LogEntry partitions management command
+"""
+
+# Imports #####################################################################
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from instance.models.log_entry import LogEntryPartition
+
+
+# Classes #####################################################################
+
+class Command(BaseCommand):
+    """
+    Management command to create upcoming LogEntry partitions and drop expired ones
+    """
+    help = (
+        'Creates the LogEntry partitions of the next LOG_PARTITION_MONTHS_AHEAD months, and drops the '
+        'partitions only holding log entries older than LOG_DELETION_DAYS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-expired',
+            action='store_true',
+            help='Only create the upcoming partitions.'
+        )
+
+    def handle(self, *args, **options):
+        if not LogEntryPartition.is_enabled():
+            self.stdout.write('The LogEntry table is not partitioned.')
+            return
+        for partition in LogEntryPartition.create_upcoming():
+            self.stdout.write('Created {}'.format(partition.name))
+        if not options['keep_expired']:
+            cutoff = timezone.now() - timezone.timedelta(days=settings.LOG_DELETION_DAYS)
+            for partition in LogEntryPartition.drop_expired(cutoff):
+                self.stdout.write('Dropped {}'.format(partition.name))
+        partitions = LogEntryPartition.get_all()
+        self.stdout.write('{} partition(s), up to {:%Y-%m-%d}.'.format(len(partitions), partitions[-1].end))
@@ -25,11 +25,11 @@ Instance app - instances' metadata update management command
 import sys
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
 
-import consul
-
 from instance.models.openedx_instance import OpenEdXInstance
+from instance.models.utils import ConsulAgent
 
 
 # Classes #####################################################################
@@ -41,6 +41,9 @@ class Command(BaseCommand):
     """
     help = 'Updates the Consul metadata for all instances or just a single instance.'
 
+    # How many instances' metadata to read and write at once
+    BATCH_SIZE = 100
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--skip-clean',
@@ -69,13 +72,20 @@ class Command(BaseCommand):
     def update_all_instances_metadata(self):
         """
         This method will iterate over all non-archived instances to update
-        their metadata in Consul.
+        their metadata in Consul, in batches of BATCH_SIZE instances written in
+        as few transactions as possible. The metadata of all instances is read
+        once, with a single request.
         """
         instances = self.get_running_instances()
+        instances_count = instances.count()
 
-        self.stdout.write('Updating {} instances\' metadata...'.format(instances.count()))
-        for instance in instances:
-            instance.update_consul_metadata()
+        self.stdout.write('Updating {} instances\' metadata...'.format(instances_count))
+        updated = 0
+        stored_all = ConsulAgent().get_all(OpenEdXInstance.get_consul_instances_prefix()) if instances_count else {}
+        for offset in range(0, instances_count, self.BATCH_SIZE):
+            batch = instances.order_by('pk')[offset:offset + self.BATCH_SIZE]
+            updated += OpenEdXInstance.bulk_update_consul_metadata(batch, stored_all=stored_all)
+        self.stdout.write('{} instances\' metadata changed'.format(updated))
 
         self.stdout.write(self.style.SUCCESS('Successfully updated instances\' metadata'))
 
@@ -84,13 +94,13 @@ class Command(BaseCommand):
         This method will iterate over all archived instances and clean their
         metadata from Consul.
         """
-        client = consul.Consul()
         instances_ids = self.get_archived_instances()
         self.stdout.write('Cleaning metadata for {} archived instances...'.format(len(instances_ids)))
 
         for instances_id in instances_ids:
-            prefix = settings.CONSUL_PREFIX.format(ocim=settings.OCIM_ID, instance=instances_id)
-            client.kv.delete(prefix, recurse=True)
+            instance = OpenEdXInstance(id=instances_id)
+            cache.delete(instance.consul_metadata_cache_key)
+            ConsulAgent(prefix=instance.consul_prefix).purge()
         self.stdout.write(self.style.SUCCESS('Successfully cleaned archived instances\' metadata'))
 
     @staticmethod
@@ -111,7 +121,7 @@ class Command(BaseCommand):
 
         :return: A set of all archived OpenEdXInstances
         """
-        agent = consul.Consul()
+        agent = ConsulAgent.get_client()
         archived_instances_ids = set()
 
         instances_prefix = '{ocim}/instances/'.format(ocim=settings.OCIM_ID)
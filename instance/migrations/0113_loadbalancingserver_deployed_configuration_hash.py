@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2018-12-10 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0112_openedxinstance_secret_key_rsa_private'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadbalancingserver',
+            name='deployed_configuration_hash',
+            field=models.CharField(blank=True, help_text='The SHA-256 hash of the configuration fragment currently deployed on the load balancer. Reconfigurations rendering a configuration with the same hash skip running the playbook.', max_length=64),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2018-12-12 14:35
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('instance', '0113_loadbalancingserver_deployed_configuration_hash'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='logentry',
+            index_together=set([('content_type', 'object_id', 'created', 'id')]),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations
+
+# The partitions are created for the current month and this many months ahead; the
+# `update_log_partitions` task creates the following ones
+MONTHS_AHEAD = 3
+
+
+def month_start(year, month):
+    """
+    Return the first instant of the given month, which can be past December.
+    """
+    return datetime.datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def is_partitioning_supported(connection):
+    """
+    Return True if the database supports declarative partitioning.
+    """
+    return connection.vendor == 'postgresql' and connection.pg_version >= 100000
+
+
+def partition_log_entries(apps, schema_editor):
+    """
+    Turn the LogEntry table into a table partitioned by month of creation, on PostgreSQL 10+.
+
+    The existing table becomes the partition holding all entries created before next month, so
+    that no rows need to be copied, and the partitions of the following months are created.
+
+    The DDL is inlined here rather than using LogEntryPartition, so that later changes to that
+    class don't change what this migration does.
+    """
+    connection = schema_editor.connection
+    if not is_partitioning_supported(connection):
+        return
+    quote_name = connection.ops.quote_name
+    now = datetime.datetime.now(datetime.timezone.utc)
+    next_month = month_start(now.year, now.month + 1)
+    legacy_name = 'instance_logentry_before_y{:%Y}m{:%m}'.format(next_month)
+    with connection.cursor() as cursor:
+        cursor.execute("ALTER TABLE instance_logentry RENAME TO {}".format(legacy_name))
+        cursor.execute(
+            "CREATE TABLE instance_logentry (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (created)".format(legacy_name)
+        )
+        cursor.execute("ALTER SEQUENCE instance_logentry_id_seq OWNED BY instance_logentry.id")
+        cursor.execute(
+            "ALTER TABLE instance_logentry ATTACH PARTITION {} FOR VALUES FROM (MINVALUE) TO (%s)".format(legacy_name),
+            [next_month.isoformat()]
+        )
+        for offset in range(1, MONTHS_AHEAD + 1):
+            start = month_start(now.year, now.month + offset)
+            end = month_start(now.year, now.month + offset + 1)
+            name = 'instance_logentry_y{:%Y}m{:%m}'.format(start)
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS {name} PARTITION OF instance_logentry ("
+                "    PRIMARY KEY (id),"
+                "    FOREIGN KEY (content_type_id) REFERENCES django_content_type (id) DEFERRABLE INITIALLY DEFERRED"
+                ") FOR VALUES FROM (%s) TO (%s)".format(name=quote_name(name)),
+                [start.isoformat(), end.isoformat()]
+            )
+            cursor.execute("CREATE INDEX IF NOT EXISTS {} ON {} (content_type_id, object_id, created, id)".format(
+                quote_name(name + '_object_idx'), quote_name(name),
+            ))
+            cursor.execute("CREATE INDEX IF NOT EXISTS {} ON {} (level)".format(
+                quote_name(name + '_level_idx'), quote_name(name),
+            ))
+
+
+def unpartition_log_entries(apps, schema_editor):
+    """
+    Turn the partitioned LogEntry table back into a regular table.
+
+    The partition holding the entries created before the table was partitioned becomes the
+    LogEntry table again, the entries of the monthly partitions are copied into it, and the
+    partitioned table is dropped along with its monthly partitions.
+    """
+    connection = schema_editor.connection
+    if not is_partitioning_supported(connection):
+        return
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'instance_logentry'::regclass")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(
+            "SELECT pg_class.relname FROM pg_inherits JOIN pg_class ON pg_class.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = 'instance_logentry'::regclass"
+        )
+        names = [name for name, in cursor.fetchall()]
+        legacy_names = [name for name in names if name.startswith('instance_logentry_before_')]
+        if len(legacy_names) != 1:
+            raise RuntimeError('Expected exactly one legacy LogEntry partition, found {}'.format(legacy_names))
+        legacy_name = legacy_names[0]
+        cursor.execute("ALTER TABLE instance_logentry DETACH PARTITION {}".format(quote_name(legacy_name)))
+        cursor.execute("ALTER TABLE instance_logentry RENAME TO instance_logentry_partitioned")
+        cursor.execute("ALTER TABLE {} RENAME TO instance_logentry".format(quote_name(legacy_name)))
+        # Keep the sequence when dropping the partitioned table
+        cursor.execute("ALTER SEQUENCE instance_logentry_id_seq OWNED BY instance_logentry.id")
+        for name in names:
+            if name != legacy_name:
+                cursor.execute("INSERT INTO instance_logentry SELECT * FROM {}".format(quote_name(name)))
+        cursor.execute("DROP TABLE instance_logentry_partitioned")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0114_log_entries_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_log_entries, unpartition_log_entries),
+    ]
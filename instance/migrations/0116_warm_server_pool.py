@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+import instance.models.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0115_log_entry_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WarmServer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('pool_key', models.CharField(db_index=True, max_length=64)),
+                ('boot_duration', models.FloatField(help_text='The number of seconds the server took to boot.')),
+                ('server', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='warm_server', to='instance.OpenStackServer')),
+            ],
+            options={
+                'abstract': False,
+                'ordering': ('-modified', '-created'),
+                'get_latest_by': 'modified',
+            },
+            bases=(instance.models.utils.ValidateModelMixin, models.Model),
+        ),
+    ]
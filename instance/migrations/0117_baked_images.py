@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 11:40
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+import instance.models.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0116_warm_server_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BakedImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('openstack_region', models.CharField(max_length=16)),
+                ('base_image', django.contrib.postgres.fields.jsonb.JSONField(help_text='JSON openstack selector of the image this image was baked from.')),
+                ('openedx_release', models.CharField(max_length=128)),
+                ('configuration_source_repo_url', models.URLField(max_length=256)),
+                ('configuration_version', models.CharField(max_length=50)),
+                ('edx_platform_repository_url', models.CharField(max_length=256)),
+                ('edx_platform_commit', models.CharField(max_length=256)),
+                ('openstack_image_id', models.CharField(blank=True, max_length=250)),
+                ('status', models.CharField(choices=[('baking', 'Baking'), ('ready', 'Ready'), ('failed', 'Failed'), ('deleted', 'Deleted')], db_index=True, default='baking', max_length=10)),
+                ('bake_duration', models.FloatField(blank=True, help_text='The number of seconds the baked tasks took to run, saved by each use.', null=True)),
+                ('use_count', models.PositiveIntegerField(default=0, help_text='The number of AppServers that booted from it.')),
+                ('last_used', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+                'ordering': ('-modified', '-created'),
+                'get_latest_by': 'modified',
+            },
+            bases=(instance.models.utils.ValidateModelMixin, models.Model),
+        ),
+        migrations.AddField(
+            model_name='openedxappserver',
+            name='baked_image',
+            field=models.ForeignKey(blank=True, help_text='The baked image this AppServer boots from instead of openstack_server_base_image, if any.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appservers', to='instance.BakedImage'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 11:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+import instance.models.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0117_baked_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProvisioningSpan',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('phase', models.CharField(db_index=True, max_length=255)),
+                ('started', models.DateTimeField()),
+                ('duration', models.FloatField(help_text='The number of seconds the phase took.')),
+                ('success', models.BooleanField(default=True)),
+                ('appserver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='provisioning_spans', to='instance.OpenEdXAppServer')),
+                ('instance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='provisioning_spans', to='instance.InstanceReference')),
+            ],
+            options={
+                'abstract': False,
+                'ordering': ('-modified', '-created'),
+                'get_latest_by': 'modified',
+            },
+            bases=(instance.models.utils.ValidateModelMixin, models.Model),
+        ),
+    ]
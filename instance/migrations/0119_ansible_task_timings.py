@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 13:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+import instance.models.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0118_provisioning_spans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnsibleTaskTiming',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('playbook', models.CharField(max_length=255)),
+                ('role', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('task', models.TextField()),
+                ('host', models.CharField(max_length=255)),
+                ('started', models.DateTimeField()),
+                ('duration', models.FloatField(help_text='The number of seconds the task took.')),
+                ('changed', models.BooleanField(default=False)),
+                ('failed', models.BooleanField(default=False)),
+                ('skipped', models.BooleanField(default=False)),
+                ('appserver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ansible_task_timings', to='instance.OpenEdXAppServer')),
+            ],
+            options={
+                'abstract': False,
+                'ordering': ('-modified', '-created'),
+                'get_latest_by': 'modified',
+            },
+            bases=(instance.models.utils.ValidateModelMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 14:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0119_ansible_task_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='openedxappserver',
+            name='completed_playbooks',
+            field=models.PositiveSmallIntegerField(default=0, help_text='The number of playbooks that ran successfully on the server, in the order of get_playbooks(). Resuming the provisioning only runs the other ones.'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app models - Timings of the Ansible tasks run on AppServers
+"""
+
+# Imports #####################################################################
+
+from django.db import models
+from django.db.models import Avg, Count, Max, Sum
+from django_extensions.db.models import TimeStampedModel
+
+from instance.models.utils import ValidateModelMixin
+
+
+# Models ######################################################################
+
+class AnsibleTaskTimingQuerySet(models.QuerySet):
+    """
+    Additional methods for Ansible task timing querysets
+    Also used as the standard manager for the AnsibleTaskTiming model (`AnsibleTaskTiming.objects`)
+    """
+    def add(self, appserver, playbook_path, task_timings):
+        """
+        Store the given instance.ansible.TaskTiming of a run of the given playbook on the AppServer.
+        """
+        return self.bulk_create(
+            self.model(appserver=appserver, playbook=playbook_path, **task_timing._asdict())
+            for task_timing in task_timings
+        )
+
+    def of_last_deploys(self, deploys):
+        """
+        Filter the timings of the AppServers whose playbooks ran last, up to `deploys` of them.
+        """
+        appserver_ids = self.values('appserver').annotate(
+            last_started=Max('started'),
+        ).order_by('-last_started').values_list('appserver', flat=True)[:deploys]
+        return self.filter(appserver__in=list(appserver_ids))
+
+    def slowest(self, top, by_role=False):
+        """
+        Return the `top` tasks (or roles, if `by_role` is True) that took the most time in total, as
+        a list of dicts with their role (and task), the number of runs, and the total, average and
+        longest durations of the runs in seconds. Skipped tasks are ignored.
+        """
+        fields = ('role',) if by_role else ('role', 'task')
+        return list(self.filter(skipped=False).values(*fields).annotate(
+            runs=Count('id'),
+            total=Sum('duration'),
+            average=Avg('duration'),
+            longest=Max('duration'),
+        ).order_by('-total', *fields)[:top])
+
+
+class AnsibleTaskTiming(ValidateModelMixin, TimeStampedModel):
+    """
+    The run of an Ansible task on the VM of an AppServer, as reported by the task timing callback plugin.
+    """
+    appserver = models.ForeignKey(
+        'instance.OpenEdXAppServer',
+        on_delete=models.CASCADE,
+        related_name='ansible_task_timings',
+    )
+    playbook = models.CharField(max_length=255)
+    role = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    task = models.TextField()
+    host = models.CharField(max_length=255)
+    started = models.DateTimeField()
+    duration = models.FloatField(help_text='The number of seconds the task took.')
+    changed = models.BooleanField(default=False)
+    failed = models.BooleanField(default=False)
+    skipped = models.BooleanField(default=False)
+
+    objects = AnsibleTaskTimingQuerySet().as_manager()
+
+    def __str__(self):
+        return '{} : {} ({:.1f}s)'.format(self.role, self.task, self.duration)
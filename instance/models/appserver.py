@@ -155,6 +155,9 @@ class AppServer(ValidateModelMixin, TimeStampedModel):
     _status_to_configuration_failed = status.transition(
         from_states=Status.ConfiguringServer, to_state=Status.ConfigurationFailed
     )
+    _status_to_resuming_configuration = status.transition(
+        from_states=Status.ConfigurationFailed, to_state=Status.ConfiguringServer
+    )
     _status_to_terminated = status.transition(
         from_states=Status.Running, to_state=Status.Terminated
     )
@@ -260,6 +263,10 @@ class AppServer(ValidateModelMixin, TimeStampedModel):
         Returns oldest entries first.
         """
         # TODO: Filter out log entries for which the user doesn't have view rights
+        if limit:
+            # Apply the limit at the SQL/DB level while sorted by descending date, then reverse.
+            # Otherwise, we'd have to retrieve all rows and then apply the limit using python.
+            return LogEntry.get_page([self, self.server], level_list=level_list, limit=limit)
         appserver_type = ContentType.objects.get_for_model(self)
         server_type = ContentType.objects.get_for_model(self.server)
         entries = LogEntry.objects.filter(
@@ -268,10 +275,6 @@ class AppServer(ValidateModelMixin, TimeStampedModel):
         )
         if level_list:
             entries = entries.filter(level__in=level_list)
-        if limit:
-            # Apply the limit at the SQL/DB level while sorted by descending date, then reverse.
-            # Otherwise, we'd have to retrieve all rows and then apply the limit using python.
-            return reversed(list(entries[:limit]))
         return entries.order_by('created')
 
     @property
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app models - Baked images
+"""
+
+# Imports #####################################################################
+
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+from django.db.models import F, Q
+from django.utils import timezone
+from django_extensions.db.models import TimeStampedModel
+import novaclient
+
+from instance import ansible, openstack_utils
+from instance.models.server import OpenStackServer
+from instance.models.utils import ValidateModelMixin
+from instance.repo import open_cached_repository
+
+
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Constants ###################################################################
+
+# Name prefix of the reference servers images are baked from
+BAKE_NAME_PREFIX = 'bake'
+
+# The fields of an AppServer that determine which baked image it can boot from
+BAKED_IMAGE_KEY_FIELDS = (
+    'openedx_release',
+    'configuration_source_repo_url',
+    'configuration_version',
+    'edx_platform_repository_url',
+    'edx_platform_commit',
+)
+
+
+# Models ######################################################################
+
+class BakedImageQuerySet(models.QuerySet):
+    """
+    Additional methods for baked image querysets
+    Also used as the standard manager for the BakedImage model (`BakedImage.objects`)
+    """
+    def matching(self, appserver):
+        """
+        Filter the images baked for the release, configuration and base image of the given AppServer
+        """
+        return self.filter(
+            openstack_region=appserver.instance.openstack_region,
+            base_image=appserver.openstack_server_base_image,
+            **{field: getattr(appserver, field) for field in BAKED_IMAGE_KEY_FIELDS}
+        )
+
+    def usable(self):
+        """
+        Filter the images that new AppServers can boot from
+        """
+        return self.filter(
+            status=BakedImage.READY,
+            created__gt=timezone.now() - timezone.timedelta(days=settings.BAKED_IMAGE_MAX_AGE_DAYS),
+        )
+
+    def baking(self):
+        """
+        Filter the images still being baked. Images that have been baking for longer than baking can take
+        (BAKED_IMAGE_SNAPSHOT_TIMEOUT plus ANSIBLE_GLOBAL_TIMEOUT) were abandoned, e.g. by a worker that died,
+        and are left out.
+        """
+        max_bake_time = timezone.timedelta(
+            seconds=settings.BAKED_IMAGE_SNAPSHOT_TIMEOUT + settings.ANSIBLE_GLOBAL_TIMEOUT,
+        )
+        return self.filter(status=BakedImage.BAKING, created__gt=timezone.now() - max_bake_time)
+
+    def abandoned(self):
+        """
+        Filter the images that have been baking for longer than baking can take
+        """
+        return self.filter(status=BakedImage.BAKING).exclude(pk__in=self.baking())
+
+    def recently_failed(self):
+        """
+        Filter the images that failed to bake less than BAKED_IMAGE_FAILURE_BACKOFF_HOURS ago
+        """
+        return self.filter(
+            status=BakedImage.FAILED,
+            modified__gt=timezone.now() - timezone.timedelta(hours=settings.BAKED_IMAGE_FAILURE_BACKOFF_HOURS),
+        )
+
+    def get_for_appserver(self, appserver):
+        """
+        Return the newest usable image the given AppServer can boot from, or None
+        """
+        return self.usable().matching(appserver).order_by('-created').first()
+
+    def start_baking(self, appserver):
+        """
+        Create the image to bake for the release and configuration of the given AppServer, unless
+        one is already usable or being baked, or one failed to bake recently. Returns the new BakedImage, or None.
+        """
+        if self.matching(appserver).filter(
+                Q(pk__in=self.baking()) | Q(pk__in=self.usable()) | Q(pk__in=self.recently_failed())
+        ).exists():
+            return None
+        return self.create(
+            openstack_region=appserver.instance.openstack_region,
+            base_image=appserver.openstack_server_base_image,
+            **{field: getattr(appserver, field) for field in BAKED_IMAGE_KEY_FIELDS}
+        )
+
+    def collect_garbage(self):
+        """
+        Delete the images that expired, or that no AppServer booted from for BAKED_IMAGE_UNUSED_DAYS.
+        Abandoned images are marked as failed, and their snapshot deleted if there is one.
+
+        Returns the deleted images.
+        """
+        for image in self.abandoned():
+            logger.warning('Baked image %s was abandoned while baking, marking it as failed', image.image_name)
+            if image.openstack_image_id:
+                image.delete_image()
+            image.status = BakedImage.FAILED
+            image.save()
+
+        now = timezone.now()
+        unused_cutoff = now - timezone.timedelta(days=settings.BAKED_IMAGE_UNUSED_DAYS)
+        images = self.filter(status=BakedImage.READY).filter(
+            Q(created__lte=now - timezone.timedelta(days=settings.BAKED_IMAGE_MAX_AGE_DAYS)) |
+            Q(last_used__lte=unused_cutoff) |
+            Q(last_used__isnull=True, created__lte=unused_cutoff)
+        )
+        deleted = []
+        for image in images:
+            if image.delete_image():
+                deleted.append(image)
+        return deleted
+
+
+class BakedImage(ValidateModelMixin, TimeStampedModel):
+    """
+    An OpenStack image of a server on which the slow, instance-independent part of the
+    configuration playbook already ran (the tasks tagged with settings.BAKED_IMAGE_ANSIBLE_TAGS,
+    like installing system packages), for a given Open edX release and configuration.
+
+    AppServers with the same release and configuration boot from it instead of their base image,
+    and skip those tasks.
+    """
+    BAKING = 'baking'
+    READY = 'ready'
+    FAILED = 'failed'
+    DELETED = 'deleted'
+    STATUS_CHOICES = (
+        (BAKING, 'Baking'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+        (DELETED, 'Deleted'),
+    )
+
+    openstack_region = models.CharField(max_length=16)
+    base_image = JSONField(help_text='JSON openstack selector of the image this image was baked from.')
+    openedx_release = models.CharField(max_length=128)
+    configuration_source_repo_url = models.URLField(max_length=256)
+    configuration_version = models.CharField(max_length=50)
+    edx_platform_repository_url = models.CharField(max_length=256)
+    edx_platform_commit = models.CharField(max_length=256)
+    openstack_image_id = models.CharField(max_length=250, blank=True)
+    status = models.CharField(max_length=10, db_index=True, default=BAKING, choices=STATUS_CHOICES)
+    bake_duration = models.FloatField(
+        null=True, blank=True, help_text='The number of seconds the baked tasks took to run, saved by each use.',
+    )
+    use_count = models.PositiveIntegerField(default=0, help_text='The number of AppServers that booted from it.')
+    last_used = models.DateTimeField(null=True, blank=True)
+
+    objects = BakedImageQuerySet().as_manager()
+
+    def __str__(self):
+        return '{} / {} ({})'.format(self.openedx_release, self.configuration_version, self.status)
+
+    @property
+    def image_name(self):
+        """
+        Name of the OpenStack image
+        """
+        return 'opencraft-baked-{}'.format(self.pk)
+
+    @property
+    def image_selector(self):
+        """
+        JSON openstack selector of this image, to boot servers from it
+        """
+        return {'id': self.openstack_image_id}
+
+    @property
+    def time_saved(self):
+        """
+        Estimated number of seconds of deployment saved by this image so far
+        """
+        return (self.bake_duration or 0) * self.use_count
+
+    def record_use(self):
+        """
+        Count an AppServer booting from this image
+        """
+        BakedImage.objects.filter(pk=self.pk).update(use_count=F('use_count') + 1, last_used=timezone.now())
+
+    def bake(self, appserver):
+        """
+        Bake this image: boot a reference server from the base image, run the tasks of the
+        configuration playbook of `appserver` tagged with settings.BAKED_IMAGE_ANSIBLE_TAGS on it,
+        and snapshot it. The reference server is terminated afterwards.
+
+        Returns True on success.
+        """
+        assert self.status == self.BAKING
+        server = OpenStackServer.objects.create(name_prefix=BAKE_NAME_PREFIX, openstack_region=self.openstack_region)
+        try:
+            server.start(
+                flavor_selector=appserver.openstack_server_flavor,
+                image_selector=self.base_image,
+                key_name=appserver.openstack_server_ssh_keyname,
+                security_groups=[settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME],
+            )
+            server.sleep_until(lambda: server.status.accepts_ssh_commands)
+
+            playbook = appserver.default_playbook()
+            logger.info('Baking image %s on server %s', self.image_name, server)
+            with open_cached_repository(playbook.source_repo, ref=playbook.version) as configuration_repo:
+                start = time.monotonic()
+                returncode = ansible.capture_playbook_output(
+                    requirements_path=os.path.join(configuration_repo.working_dir, playbook.requirements_path),
+                    inventory_str='[{group}]\n{server_ip}\n[app:children]\n{group}'.format(
+                        group=appserver.INVENTORY_GROUP, server_ip=server.public_ip,
+                    ),
+                    vars_str=playbook.variables,
+                    playbook_path=os.path.join(configuration_repo.working_dir, playbook.playbook_path),
+                    username=settings.OPENSTACK_SANDBOX_SSH_USERNAME,
+                    logger_=logger,
+                    tags=settings.BAKED_IMAGE_ANSIBLE_TAGS,
+                )
+            if returncode != 0:
+                raise RuntimeError('Playbook exited with code {}'.format(returncode))
+            self.bake_duration = time.monotonic() - start
+
+            self.openstack_image_id = server.nova.servers.create_image(server.os_server, self.image_name)
+            self.save()
+            self._wait_for_image(server.nova)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Failed to bake image %s', self.image_name)
+            self.status = self.FAILED
+            if self.openstack_image_id:
+                self.delete_image()
+        else:
+            logger.info('Baked image %s in %.0fs', self.image_name, self.bake_duration)
+            self.status = self.READY
+        finally:
+            server.terminate()
+            self.save()
+        return self.status == self.READY
+
+    def _wait_for_image(self, nova):
+        """
+        Wait until the snapshot of this image is active.
+        """
+        timeout = settings.BAKED_IMAGE_SNAPSHOT_TIMEOUT
+        while timeout > 0:
+            status = nova.images.get(self.openstack_image_id).status
+            if status == 'ACTIVE':
+                return
+            if status not in ('QUEUED', 'SAVING'):
+                raise RuntimeError('Snapshot {} has status {}'.format(self.openstack_image_id, status))
+            time.sleep(10)
+            timeout -= 10
+        raise TimeoutError('Snapshot {} is not active yet'.format(self.openstack_image_id))
+
+    def delete_image(self):
+        """
+        Delete the OpenStack image, so no new AppServer boots from it.
+
+        Returns True on success.
+        """
+        logger.info('Deleting baked image %s (%s)', self.image_name, self.openstack_image_id)
+        try:
+            openstack_utils.get_nova_client(self.openstack_region).images.delete(self.openstack_image_id)
+        except novaclient.exceptions.NotFound:
+            pass
+        except (novaclient.exceptions.ClientException, novaclient.exceptions.EndpointNotFound) as exc:
+            logger.error('Unable to delete baked image %s: %s', self.image_name, exc)
+            return False
+        if self.status == self.READY:
+            self.status = self.DELETED
+            self.save()
+        return True
@@ -223,6 +223,17 @@ class Instance(ValidateModelMixin, models.Model):
             self.ref.instance_id = self.pk  # <- Fix needed when self.ref is accessed before the first self.save()
         self.ref.save()
 
+    def save_fields(self, **fields):
+        """
+        Set the given fields, and write only them to the database, without the side effects of `save()`.
+
+        Meant for the provisioning steps, which run concurrently on the same object: each step writes
+        the fields it sets, and the full `save()` is left to the calling thread.
+        """
+        for name, value in fields.items():
+            setattr(self, name, value)
+        type(self).objects.filter(pk=self.pk).update(**fields)
+
     def refresh_from_db(self, using=None, fields=None, **kwargs):
         """
         Reload from DB, or load related field.
@@ -255,12 +266,8 @@ class Instance(ValidateModelMixin, models.Model):
 
         Does NOT include log entries of associated AppServers or Servers (VMs)
         """
-        limit = settings.LOG_LIMIT
-
-        instance_type = ContentType.objects.get_for_model(self)
-        entries = LogEntry.objects.filter(content_type=instance_type, object_id=self.pk)
         # TODO: Filter out log entries for which the user doesn't have view rights
-        return reversed(list(entries[:limit]))
+        return LogEntry.get_page([self], limit=settings.LOG_LIMIT)
 
     def archive(self):
         """
@@ -21,6 +21,7 @@ Definition of the Load balancing server model.
 """
 import contextlib
 import functools
+import hashlib
 import logging
 import pathlib
 import random
@@ -142,6 +143,15 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
         )
     )
 
+    deployed_configuration_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text=(
+            'The SHA-256 hash of the configuration fragment currently deployed on the load balancer. '
+            'Reconfigurations rendering a configuration with the same hash skip running the playbook.'
+        )
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = ModelLoggerAdapter(logger, {'obj': self})
@@ -181,9 +191,7 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
         backend_conf = []
         for instance in self.get_instances():
             triggered_by_instance = instance.ref.pk == triggering_instance_id
-            map_entries, conf_entries = instance.get_load_balancer_configuration(
-                triggered_by_instance
-            )
+            map_entries, conf_entries = self._get_instance_configuration(instance, triggered_by_instance)
             backend_map.extend(
                 " ".join([domain.lower(), backend + self.fragment_name_postfix])
                 for domain, backend in map_entries
@@ -194,6 +202,28 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
             )
         return "\n".join(backend_map), "\n".join(backend_conf)
 
+    @staticmethod
+    def _get_instance_configuration(instance, triggered_by_instance):
+        """
+        Return the backend map and configuration entries of the given instance.
+
+        The entries are cached under the instance's load balancer fingerprint, which changes
+        whenever its active appservers or domains change, so the configuration of instances that
+        didn't change since the last reconfiguration is not rendered again. The instance that
+        triggered the reconfiguration is always rendered, so that it logs its new configuration.
+        """
+        fingerprint = instance.get_load_balancer_fingerprint()
+        if fingerprint is None:
+            return instance.get_load_balancer_configuration(triggered_by_instance)
+        cache_key = "load_balancer_fragment:{}:{}".format(instance.ref.pk, fingerprint)
+        if not triggered_by_instance:
+            configuration = cache.get(cache_key)
+            if configuration is not None:
+                return configuration
+        configuration = instance.get_load_balancer_configuration(triggered_by_instance)
+        cache.set(cache_key, configuration, settings.LOAD_BALANCER_FRAGMENT_CACHE_TIMEOUT)
+        return configuration
+
     def get_ansible_vars(self, triggering_instance_id=None):
         """
         Render the configuration script to be executed on the load balancer.
@@ -261,10 +291,18 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
                 # Memorize the configuration version, in case new threads change it.
                 self.refresh_from_db()
                 candidate_configuration_version = self.configuration_version
-                self.logger.info("Reconfiguring load-balancing server %s", self.domain)
-                self.run_playbook(self.get_ansible_vars(triggering_instance_id))
+                ansible_vars = self.get_ansible_vars(triggering_instance_id)
+                configuration_hash = hashlib.sha256(ansible_vars.encode()).hexdigest()
+                if configuration_hash == self.deployed_configuration_hash:
+                    self.logger.info(
+                        "Configuration of load-balancing server %s is unchanged; not reconfiguring.", self.domain
+                    )
+                else:
+                    self.logger.info("Reconfiguring load-balancing server %s", self.domain)
+                    self.run_playbook(ansible_vars)
                 LoadBalancingServer.objects.filter(pk=self.pk).update(
-                    deployed_configuration_version=candidate_configuration_version
+                    deployed_configuration_version=candidate_configuration_version,
+                    deployed_configuration_hash=configuration_hash,
                 )
                 self.refresh_from_db()
         except OtherReconfigurationInProgress:
@@ -280,6 +318,7 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
             self.run_playbook(
                 "FRAGMENT_NAME: {fragment_name}\nREMOVE_FRAGMENT: True".format(fragment_name=fragment_name)
             )
+            LoadBalancingServer.objects.filter(pk=self.pk).update(deployed_configuration_hash='')
 
     def delete(self, *args, **kwargs):
         """
@@ -22,13 +22,21 @@ Instance app models - LogEntry
 
 # Imports #####################################################################
 
+from collections import namedtuple
+import heapq
+import itertools
 import logging
+import re
 
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models
+from django.db.models import Q
 from django.db.models.signals import post_delete
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_extensions.db.models import TimeStampedModel
 
 from .utils import ValidateModelMixin
@@ -38,12 +46,181 @@ from .utils import ValidateModelMixin
 logger = logging.getLogger(__name__)
 
 
+# Classes #####################################################################
+
+class LogEntryCursor(namedtuple('LogEntryCursor', ['created', 'pk'])):
+    """
+    The position of a log entry in the (created, id) order of log entries, used for keyset pagination.
+
+    Its string representation is "<created>,<id>", with the creation time in UTC and ISO 8601 format.
+    """
+    @classmethod
+    def parse(cls, value):
+        """
+        Parse the string representation of a cursor. Raises ValueError if it is invalid.
+        """
+        created, separator, pk = value.rpartition(',')
+        created = parse_datetime(created) if separator else None
+        if created is None or not pk.isdigit():
+            raise ValueError('Invalid log entry cursor: {}'.format(value))
+        if timezone.is_naive(created):
+            created = timezone.make_aware(created, timezone.utc)
+        return cls(created, int(pk))
+
+    @classmethod
+    def for_entry(cls, log_entry):
+        """
+        Return the cursor pointing at the given log entry.
+        """
+        return cls(log_entry.created, log_entry.pk)
+
+    def __str__(self):
+        return '{:%Y-%m-%dT%H:%M:%S.%fZ},{}'.format(self.created.astimezone(timezone.utc), self.pk)
+
+
+class LogEntryPartition(namedtuple('LogEntryPartition', ['name', 'start', 'end'])):
+    """
+    A partition of the LogEntry table, holding the log entries created between `start` (included)
+    and `end` (excluded).
+
+    On PostgreSQL 10+, the LogEntry table is partitioned by creation time, with one partition per
+    month, so that expired log entries are deleted by dropping whole partitions instead of
+    deleting rows. The entries created before the table was partitioned are kept in a single
+    partition, with no `start`.
+    """
+    TABLE = 'instance_logentry'
+    NAME_RE = re.compile(r'^instance_logentry_(?P<before>before_)?y(?P<year>\d{4})m(?P<month>\d{2})$')
+
+    @classmethod
+    def for_month(cls, date):
+        """
+        Return the monthly partition holding the log entries created at the given date.
+        """
+        date = date.astimezone(timezone.utc)
+        start = timezone.datetime(date.year, date.month, 1, tzinfo=timezone.utc)
+        end = timezone.datetime(date.year + date.month // 12, date.month % 12 + 1, 1, tzinfo=timezone.utc)
+        return cls('{}_y{:%Y}m{:%m}'.format(cls.TABLE, start), start, end)
+
+    @classmethod
+    def for_entries_before(cls, date):
+        """
+        Return the partition holding all log entries created before the month of the given date.
+        """
+        end = cls.for_month(date).start
+        return cls('{}_before_y{:%Y}m{:%m}'.format(cls.TABLE, end), None, end)
+
+    @staticmethod
+    def is_enabled():
+        """
+        Return True if the LogEntry table is partitioned.
+        """
+        if connection.vendor != 'postgresql' or connection.pg_version < 100000:
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [LogEntryPartition.TABLE]
+            )
+            return cursor.fetchone() is not None
+
+    @classmethod
+    def get_all(cls):
+        """
+        Return the partitions of the LogEntry table, oldest first.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_class.relname FROM pg_inherits JOIN pg_class ON pg_class.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = %s::regclass",
+                [cls.TABLE]
+            )
+            names = [name for name, in cursor.fetchall()]
+        partitions = []
+        for name in names:
+            match = cls.NAME_RE.match(name)
+            if not match:
+                logger.warning('Ignoring unexpected LogEntry partition %s', name)
+                continue
+            month = timezone.datetime(int(match.group('year')), int(match.group('month')), 1, tzinfo=timezone.utc)
+            partitions.append(cls.for_entries_before(month) if match.group('before') else cls.for_month(month))
+        return sorted(partitions, key=lambda partition: partition.end)
+
+    @classmethod
+    def create_upcoming(cls, now=None, months_ahead=None):
+        """
+        Create the monthly partitions needed to hold the log entries of the current month and of
+        the next `months_ahead` months (LOG_PARTITION_MONTHS_AHEAD by default), if they don't exist.
+
+        Returns the list of partitions created.
+        """
+        now = now or timezone.now()
+        if months_ahead is None:
+            months_ahead = settings.LOG_PARTITION_MONTHS_AHEAD
+        last = cls.for_month(now)
+        for dummy in range(months_ahead):
+            last = cls.for_month(last.end)
+
+        existing_end = max((partition.end for partition in cls.get_all()), default=None)
+        partition = cls.for_month(now)
+        created = []
+        while partition.start <= last.start:
+            if existing_end is None or partition.start >= existing_end:
+                partition.create()
+                created.append(partition)
+            partition = cls.for_month(partition.end)
+        return created
+
+    @classmethod
+    def drop_expired(cls, cutoff):
+        """
+        Drop the partitions that only hold log entries created before `cutoff`.
+
+        Returns the list of partitions dropped.
+        """
+        expired = [partition for partition in cls.get_all() if partition.end <= cutoff]
+        for partition in expired:
+            partition.drop()
+        return expired
+
+    def create(self):
+        """
+        Create this monthly partition, with the same indexes and constraints as the original LogEntry table.
+        """
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} ("
+                "    PRIMARY KEY (id),"
+                "    FOREIGN KEY (content_type_id) REFERENCES django_content_type (id) DEFERRABLE INITIALLY DEFERRED"
+                ") FOR VALUES FROM (%s) TO (%s)".format(name=quote_name(self.name), table=quote_name(self.TABLE)),
+                [self.start.isoformat(), self.end.isoformat()]
+            )
+            cursor.execute("CREATE INDEX IF NOT EXISTS {} ON {} (content_type_id, object_id, created, id)".format(
+                quote_name(self.name + '_object_idx'), quote_name(self.name),
+            ))
+            cursor.execute("CREATE INDEX IF NOT EXISTS {} ON {} (level)".format(
+                quote_name(self.name + '_level_idx'), quote_name(self.name),
+            ))
+        logger.info('Created LogEntry partition %s', self.name)
+
+    def drop(self):
+        """
+        Drop this partition, and all the log entries it holds.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE {}".format(connection.ops.quote_name(self.name)))
+        logger.info('Dropped LogEntry partition %s', self.name)
+
+
 # Models ######################################################################
 
 
 class LogEntry(ValidateModelMixin, TimeStampedModel):
     """
     Single log entry
+
+    On PostgreSQL 10+, the table is partitioned by creation time: see LogEntryPartition. Since
+    PostgreSQL 10 doesn't support indexes on partitioned tables, the indexes are created on each
+    partition, and schema changes to this model need hand-written migrations.
     """
     LOG_LEVEL_CHOICES = (
         ('DEBUG', 'Debug'),
@@ -62,7 +239,8 @@ class LogEntry(ValidateModelMixin, TimeStampedModel):
     class Meta:
         ordering = ('-created', )
         index_together = [
-            ['content_type', 'object_id'],
+            # Used to page through the log entries of an object in order; see get_page()
+            ['content_type', 'object_id', 'created', 'id'],
         ]
         permissions = (
             ("read_log_entry", "Can read LogEntry"),
@@ -88,6 +266,43 @@ class LogEntry(ValidateModelMixin, TimeStampedModel):
             if not self.content_type.get_all_objects_for_this_type(pk=self.object_id).exists():
                 raise ValidationError({'object_id': 'Object attached to LogEntry has bad content_type or primary key'})
 
+    @classmethod
+    def get_page(cls, objects, after=None, before=None, level_list=None, limit=None):
+        """
+        Return an iterator over a page of the log entries of the given objects, oldest first.
+
+        If the `after` cursor is given, the page holds the oldest `limit` entries newer than it.
+        Otherwise it holds the newest `limit` entries older than the `before` cursor, if given.
+        `level_list` optionally restricts the entries to these logging levels.
+
+        Each object is queried separately, so that every query is a range scan of the
+        (content_type, object_id, created, id) index that stops after `limit` rows, and the
+        results are merged here.
+        """
+        ascending = after is not None
+        querysets = []
+        for obj in objects:
+            entries = cls.objects.filter(content_type=ContentType.objects.get_for_model(obj), object_id=obj.pk)
+            if level_list:
+                entries = entries.filter(level__in=level_list)
+            if after is not None:
+                entries = entries.filter(
+                    Q(created__gt=after.created) | Q(created=after.created, pk__gt=after.pk)
+                ).order_by('created', 'pk')
+            else:
+                if before is not None:
+                    entries = entries.filter(
+                        Q(created__lt=before.created) | Q(created=before.created, pk__lt=before.pk)
+                    )
+                entries = entries.order_by('-created', '-pk')
+            querysets.append(entries[:limit].iterator())
+        merged = itertools.islice(
+            heapq.merge(*querysets, key=LogEntryCursor.for_entry, reverse=not ascending), limit,
+        )
+        if ascending:
+            return merged
+        return reversed(list(merged))
+
     @staticmethod
     def on_post_delete(sender, instance, **kwargs):
         """
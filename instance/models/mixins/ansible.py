@@ -23,6 +23,7 @@ Instance app model mixins - Ansible
 # Imports #####################################################################
 
 from collections import namedtuple
+from contextlib import ExitStack
 import os
 import yaml
 
@@ -30,7 +31,7 @@ from django.conf import settings
 from django.db import models
 
 from instance import ansible
-from instance.repo import open_repository
+from instance.repo import open_cached_repository
 
 
 # Classes #####################################################################
@@ -43,6 +44,11 @@ Playbook = namedtuple('Playbook', [
     'variables',  # A YAML string containing extra variables to pass to ansible when running this playbook
 ])
 
+PreparedPlaybook = namedtuple('PreparedPlaybook', [
+    'playbook',  # The Playbook to run
+    'working_dir',  # Path to the checkout of its source_repo
+])
+
 
 class AnsibleAppServerMixin(models.Model):
     """
@@ -52,6 +58,10 @@ class AnsibleAppServerMixin(models.Model):
     common_configuration_settings = models.TextField(
         blank=True,
         help_text='YAML variables for commonly needed services.')
+    completed_playbooks = models.PositiveSmallIntegerField(
+        default=0,
+        help_text='The number of playbooks that ran successfully on the server, in the order of get_playbooks(). '
+                  'Resuming the provisioning only runs the other ones.')
 
     INVENTORY_GROUP = 'generic'
 
@@ -101,9 +111,18 @@ class AnsibleAppServerMixin(models.Model):
             '{group}'.format(group=self.INVENTORY_GROUP, server_ip=public_ip)
         )
 
-    def _run_playbook(self, working_dir, playbook):
+    def get_playbook_skip_tags(self, playbook):  # pylint: disable=no-self-use,unused-argument
+        """
+        Get the comma-separated tags of the tasks of the given playbook that don't need to run on
+        the AppServer's VM, or None to run all of them.
+        """
+        return None
+
+    def _run_playbook(self, working_dir, playbook, task_timings=None):
         """
         Run a playbook against the AppServer's VM
+
+        The timings of the tasks are appended to `task_timings`, if it is a list.
         """
         return ansible.capture_playbook_output(
             requirements_path=os.path.join(working_dir, playbook.requirements_path),
@@ -113,23 +132,64 @@ class AnsibleAppServerMixin(models.Model):
             username=settings.OPENSTACK_SANDBOX_SSH_USERNAME,
             logger_=self.logger,
             collect_logs=True,
+            skip_tags=self.get_playbook_skip_tags(playbook),
+            task_timings=task_timings,
         )
 
-    def run_ansible_playbooks(self):
+    def prepare_ansible_playbooks(self, stack):
+        """
+        Check out the repositories of the playbooks and build the virtualenvs they run in, none
+        of which needs the server, so this can be done while it boots.
+
+        The checkouts and virtualenvs are kept until `stack` (an ExitStack) is closed.
+        Returns a list of PreparedPlaybook objects to pass to run_ansible_playbooks().
+        """
+        prepared_playbooks = []
+        for playbook, working_dir in self._checkout_playbooks(stack):
+            self.logger.info('Preparing playbook "%s" from "%s"', playbook.playbook_path, playbook.source_repo)
+            stack.enter_context(ansible.venv_cache.venv(os.path.join(working_dir, playbook.requirements_path)))
+            prepared_playbooks.append(PreparedPlaybook(playbook, working_dir))
+        return prepared_playbooks
+
+    def get_remaining_playbooks(self):
+        """
+        Get the playbooks of get_playbooks() that didn't run successfully on the server yet.
+        """
+        return self.get_playbooks()[self.completed_playbooks:]
+
+    def _checkout_playbooks(self, stack):
+        """
+        Yield a PreparedPlaybook for each remaining playbook, checking out its repository only once it's needed.
+        """
+        for playbook in self.get_remaining_playbooks():
+            configuration_repo = stack.enter_context(open_cached_repository(playbook.source_repo, ref=playbook.version))
+            yield PreparedPlaybook(playbook, configuration_repo.working_dir)
+
+    def run_ansible_playbooks(self, prepared_playbooks=None):
         """
         Provision the server using ansible
+
+        Runs the given PreparedPlaybook objects, or checks out each remaining playbook right before running it.
+        The number of completed playbooks is saved after each successful playbook, so that a failed
+        provisioning can be resumed from the failed playbook.
         """
         log = []
-        for playbook in self.get_playbooks():
-            with open_repository(playbook.source_repo, ref=playbook.version) as configuration_repo:
+        returncode = 0
+        with ExitStack() as stack:
+            if prepared_playbooks is None:
+                prepared_playbooks = self._checkout_playbooks(stack)
+            for playbook, working_dir in prepared_playbooks:
                 self.logger.info('Running playbook "%s" from "%s"', playbook.playbook_path, playbook.source_repo)
-                playbook_log, returncode = self._run_playbook(configuration_repo.working_dir, playbook)
+                playbook_log, returncode = self._run_playbook(working_dir, playbook)
                 log += playbook_log
                 if returncode != 0:
                     self.logger.error('Playbook failed for AppServer %s', self)
                     break
-        else:
-            self.logger.info('Playbooks completed for AppServer %s', self)
+                self.completed_playbooks += 1
+                # AppServers are immutable, so only update this field
+                type(self).objects.filter(pk=self.pk).update(completed_playbooks=self.completed_playbooks)
+            else:
+                self.logger.info('Playbooks completed for AppServer %s', self)
         return (log, returncode)
 
     def save(self, *args, **kwargs):
@@ -22,108 +22,171 @@ Instance app model mixins - Database
 
 # Imports #####################################################################
 
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
 import functools
-import inspect
 import string
+import threading
 import warnings
 
 from django.conf import settings
 from django.db import models
 from django.utils.crypto import get_random_string
 import MySQLdb as mysql
+from MySQLdb.constants import CLIENT
 import pymongo
 
 from instance.models.database_server import MySQLServer, MongoDBServer, MongoDBReplicaSet
 
 
+# Constants ###################################################################
+
+# Number of idle connections kept open for each MySQL server by `mysql_connection_pool`
+MYSQL_POOL_MAX_IDLE_CONNECTIONS = 4
+
+
 # Functions ###################################################################
 
-def database_name_escaped(func):
+def _escape_database_name(connection, database):
     """
-    Decorator for functions that require name of MySQL database to be escaped.
+    Escape the name of a MySQL database for use in a query.
 
-    Escaping is necessary if a function uses the database name in a parameterized query;
-    the driver doesn't escape it properly.
+    Escaping is necessary when the database name is used as an identifier;
+    the driver doesn't escape it properly when it is passed as a query parameter.
     """
-    def wrapper(*args, **kwargs):
-        """ Escape database name, then call func """
-        signature = inspect.signature(func)
-        bound_arguments = signature.bind(*args, **kwargs)
-        # Obtain connection from cursor passed to func.
-        # This allows us to simplify the signature of func (we don't have to add a "connection" parameter).
-        connection = bound_arguments.arguments["cursor"].connection
-        database = bound_arguments.arguments["database"]
-        bound_arguments.arguments["database"] = connection.escape_string(database).decode()
-        func(*bound_arguments.args, **bound_arguments.kwargs)
-    return wrapper
+    return connection.escape_string(database).decode()
 
 
-def _get_mysql_cursor(mysql_server):
+def _get_existing_users(cursor, users):
     """
-    Get a database cursor.
+    Return the subset of `users` that already exist on the MySQL server, using a single query.
     """
-    connection = mysql.connect(
-        host=mysql_server.hostname,
-        user=mysql_server.username,
-        passwd=mysql_server.password,
-        port=mysql_server.port,
+    users = sorted(set(users))
+    if not users:
+        return set()
+    cursor.execute(
+        'SELECT DISTINCT user FROM mysql.user WHERE user IN ({})'.format(', '.join(['%s'] * len(users))),
+        users,
     )
-    return connection.cursor()
+    return {user.decode() if isinstance(user, bytes) else user for (user,) in cursor.fetchall()}
 
 
-@database_name_escaped
-def _create_database(cursor, database):
+def _execute_batch(cursor, statements):
     """
-    Create MySQL database, if it doesn't already exist.
+    Execute the given (query, parameters) statements in a single round trip, and consume their results.
     """
+    if not statements:
+        return
+    # The parameters of all statements are interpolated into the whole batch at once,
+    # so literal percent signs must be escaped in the statements that don't take any.
+    query = ';\n'.join(
+        statement if statement_parameters else statement.replace('%', '%%')
+        for statement, statement_parameters in statements
+    )
+    parameters = [parameter for _, statement_parameters in statements for parameter in statement_parameters]
     with warnings.catch_warnings():
+        # "IF [NOT] EXISTS" statements emit warnings when they are no-ops
         warnings.simplefilter("ignore")
-        cursor.execute('CREATE DATABASE IF NOT EXISTS `{db}` DEFAULT CHARACTER SET utf8'.format(db=database))
+        cursor.execute(query, parameters)
+        while cursor.nextset():
+            pass
 
 
-def _create_user(cursor, user, password):
+def _create_database(database):
+    """
+    Statement creating a MySQL database, if it doesn't already exist.
     """
-    Create MySQL user identified by password if it doesn't exist
+    return 'CREATE DATABASE IF NOT EXISTS `{db}` DEFAULT CHARACTER SET utf8'.format(db=database), ()
+
+
+def _create_user(user, password):
+    """
+    Statement creating a MySQL user identified by password.
+
+    Newer versions of MySQL support "CREATE USER IF NOT EXISTS"
+    but at this point we can't be sure that all target hosts run one of these,
+    so callers need to check whether the user exists with `_get_existing_users` first.
     """
-    # Newer versions of MySQL support "CREATE USER IF NOT EXISTS"
-    # but at this point we can't be sure that all target hosts run one of these,
-    # so we need to use a different approach for now:
-    user_exists = cursor.execute("SELECT 1 FROM mysql.user WHERE user = %s", (user,))
-    if not user_exists:
-        cursor.execute('CREATE USER %s IDENTIFIED BY %s', (user, password,))
+    return 'CREATE USER %s IDENTIFIED BY %s', (user, password)
 
 
-def _grant_privileges(cursor, database, user, privileges):
+def _grant_privileges(database, user, privileges):
     """
-    Grant privileges for databases to MySQL user
+    Statement granting privileges for databases to MySQL user
     """
     if database == "*":
         tables = "*.*"
     else:
-        tables = "`{database}`.*".format(database=database)
-    cursor.execute('GRANT {privileges} ON {tables} TO %s'.format(privileges=privileges, tables=tables), (user,))
+        tables = "`{database}`.*".format(database=database.replace('%', '%%'))
+    return 'GRANT {privileges} ON {tables} TO %s'.format(privileges=privileges, tables=tables), (user,)
 
 
-@database_name_escaped
-def _drop_database(cursor, database):
+def _drop_database(database):
     """
-    Drop MySQL database
+    Statement dropping a MySQL database, if it exists.
     """
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        cursor.execute('DROP DATABASE IF EXISTS `{database}`'.format(database=database))
+    return 'DROP DATABASE IF EXISTS `{database}`'.format(database=database), ()
 
 
-def _drop_user(cursor, user):
+def _drop_user(user):
     """
-    Drop MySQL user if it exists
+    Statement dropping a MySQL user.
+
+    As for `_create_user`, callers need to check that the user exists first.
     """
-    # Newer versions of MySQL support "DROP USER IF EXISTS"
-    # but at this point we can't be sure that all target hosts run one of these,
-    # so we need to use a different approach for now:
-    user_exists = cursor.execute("SELECT 1 FROM mysql.user WHERE user = %s", (user,))
-    if user_exists:
-        cursor.execute('DROP USER %s', (user,))
+    return 'DROP USER %s', (user,)
+
+
+def _group_by_mysql_server(instances):
+    """
+    Group the given instances by MySQL server, leaving out instances without one.
+    """
+    groups = OrderedDict()
+    for instance in instances:
+        if instance.mysql_server:
+            groups.setdefault(instance.mysql_server.pk, (instance.mysql_server, []))[1].append(instance)
+    return groups.values()
+
+
+def provision_mysql_instances(instances):
+    """
+    Create the MySQL users and databases of all the given instances.
+
+    The statements for all the instances that share a MySQL server are sent as a single batch
+    over one pooled connection, after fetching the users that already exist with a single query.
+    """
+    for mysql_server, server_instances in _group_by_mysql_server(instances):
+        with mysql_connection_pool.cursor(mysql_server) as cursor:
+            existing_users = _get_existing_users(cursor, [
+                user for instance in server_instances for user in instance.get_mysql_users()
+            ])
+            statements = []
+            for instance in server_instances:
+                statements.extend(instance.get_mysql_provisioning_statements(cursor.connection, existing_users))
+            _execute_batch(cursor, statements)
+        for instance in server_instances:
+            instance.save_fields(mysql_provisioned=True)
+
+
+def deprovision_mysql_instances(instances):
+    """
+    Drop the MySQL databases and users of all the given instances.
+
+    Like `provision_mysql_instances`, this sends a single batch of statements per MySQL server.
+    """
+    instances = [instance for instance in instances if instance.mysql_provisioned]
+    for mysql_server, server_instances in _group_by_mysql_server(instances):
+        with mysql_connection_pool.cursor(mysql_server) as cursor:
+            existing_users = _get_existing_users(cursor, [
+                user for instance in server_instances for user in instance.get_mysql_users()
+            ])
+            statements = []
+            for instance in server_instances:
+                statements.extend(instance.get_mysql_deprovisioning_statements(cursor.connection, existing_users))
+            _execute_batch(cursor, statements)
+        for instance in server_instances:
+            instance.mysql_provisioned = False
+            instance.save()
 
 
 def select_random_mysql_server():
@@ -155,6 +218,120 @@ def select_random_mongodb_replica_set():
 
 # Classes #####################################################################
 
+class MySQLConnectionPool:
+    """
+    Thread-safe pool of administrative MySQL connections, keyed by MySQLServer.
+
+    Connections are checked for liveness when they are taken out of the pool, committed when
+    the block using them exits cleanly and discarded when it raises.
+    """
+    def __init__(self, max_idle_connections=MYSQL_POOL_MAX_IDLE_CONNECTIONS):
+        self.max_idle_connections = max_idle_connections
+        self._idle_connections = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(mysql_server):
+        """
+        Key identifying the connections that can be shared for the given server.
+
+        The credentials are part of the key so that changing them on the MySQLServer
+        doesn't hand out connections authenticated with the old ones.
+        """
+        return (mysql_server.hostname, mysql_server.port, mysql_server.username, mysql_server.password)
+
+    @staticmethod
+    def _connect(mysql_server):
+        """
+        Open a new connection to the given server.
+
+        Multiple statements are allowed so that provisioning can send its statements in a single batch.
+        """
+        return mysql.connect(
+            host=mysql_server.hostname,
+            user=mysql_server.username,
+            passwd=mysql_server.password,
+            port=mysql_server.port,
+            client_flag=CLIENT.MULTI_STATEMENTS,
+        )
+
+    def _acquire(self, key, mysql_server):
+        """
+        Take a live connection out of the pool, or open a new one.
+        """
+        while True:
+            with self._lock:
+                if not self._idle_connections[key]:
+                    break
+                connection = self._idle_connections[key].pop()
+            try:
+                connection.ping()
+            except mysql.Error:
+                connection.close()
+            else:
+                return connection
+        return self._connect(mysql_server)
+
+    def _release(self, key, connection):
+        """
+        Return a connection to the pool, closing it if there are enough idle connections already.
+        """
+        with self._lock:
+            if len(self._idle_connections[key]) < self.max_idle_connections:
+                self._idle_connections[key].append(connection)
+                return
+        connection.close()
+
+    @contextmanager
+    def connection(self, mysql_server):
+        """
+        Context manager yielding a pooled connection to the given server.
+        """
+        key = self.get_key(mysql_server)
+        connection = self._acquire(key, mysql_server)
+        committed = False
+        try:
+            yield connection
+            connection.commit()
+            committed = True
+        finally:
+            if committed:
+                self._release(key, connection)
+            else:
+                connection.close()
+
+    @contextmanager
+    def cursor(self, mysql_server, database=None):
+        """
+        Context manager yielding a cursor on a pooled connection to the given server.
+
+        If `database` is given, it is selected as the default database of the connection first.
+        """
+        with self.connection(mysql_server) as connection:
+            if database:
+                connection.select_db(database)
+            cursor = connection.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def clear(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            idle_connections = [
+                connection for connections in self._idle_connections.values() for connection in connections
+            ]
+            self._idle_connections.clear()
+        for connection in idle_connections:
+            connection.close()
+
+
+mysql_connection_pool = MySQLConnectionPool()
+
+
 class MySQLInstanceMixin(models.Model):
     """
     An instance that uses mysql databases
@@ -192,58 +369,89 @@ class MySQLInstanceMixin(models.Model):
         """
         return NotImplementedError
 
+    def get_mysql_users(self):
+        """
+        All the MySQL users of this instance
+        """
+        users = list(self.global_users)
+        for database in self.mysql_databases:
+            if database["user"] not in users:
+                users.append(database["user"])
+        return users
+
+    def get_mysql_provisioning_statements(self, connection, existing_users):
+        """
+        Statements creating the mysql users and databases of this instance.
+
+        `existing_users` is the set of users that already exist on the server;
+        the users created by the returned statements are added to it.
+        """
+        statements = []
+
+        def create_user(user):
+            """ Create the given user unless it already exists """
+            if user not in existing_users:
+                statements.append(_create_user(user, self._get_mysql_pass(user)))
+                existing_users.add(user)
+
+        # Create migration and read_only users
+        create_user(self.migrate_user)
+        create_user(self.read_only_user)
+
+        # Create default databases and users, and grant privileges
+        for database in self.mysql_databases:
+            database_name = _escape_database_name(connection, database["name"])
+            statements.append(_create_database(database_name))
+            user = database["user"]
+            create_user(user)
+            privileges = database.get("priv", "ALL")
+            statements.append(_grant_privileges(database_name, user, privileges))
+            statements.append(_grant_privileges(database_name, self.migrate_user, "ALL"))
+            statements.append(_grant_privileges(database_name, self.read_only_user, "ALL"))
+            additional_users = database.get("additional_users", [])
+            for additional_user in additional_users:
+                statements.append(_grant_privileges(database_name, additional_user["name"], additional_user["priv"]))
+
+        # Create admin user with appropriate privileges
+        create_user(self.admin_user)
+        statements.append(_grant_privileges("*", self.admin_user, "CREATE USER"))
+        return statements
+
+    def get_mysql_deprovisioning_statements(self, connection, existing_users):
+        """
+        Statements dropping all the MySQL databases and users of this instance.
+
+        The users dropped by the returned statements are removed from `existing_users`.
+        """
+        statements = []
+
+        def drop_user(user):
+            """ Drop the given user if it exists """
+            if user in existing_users:
+                statements.append(_drop_user(user))
+                existing_users.remove(user)
+
+        # Drop default databases and users
+        for database in self.mysql_databases:
+            statements.append(_drop_database(_escape_database_name(connection, database["name"])))
+            drop_user(database["user"])
+
+        # Drop users with global privileges
+        for user in self.global_users:
+            drop_user(user)
+        return statements
+
     def provision_mysql(self):
         """
         Create mysql user and databases
         """
-        if self.mysql_server:
-            cursor = _get_mysql_cursor(self.mysql_server)
-
-            # Create migration and read_only users
-            _create_user(cursor, self.migrate_user, self._get_mysql_pass(self.migrate_user))
-            _create_user(cursor, self.read_only_user, self._get_mysql_pass(self.read_only_user))
-
-            # Create default databases and users, and grant privileges
-            for database in self.mysql_databases:
-                database_name = database["name"]
-                _create_database(cursor, database_name)
-                user = database["user"]
-                _create_user(cursor, user, self._get_mysql_pass(user))
-                privileges = database.get("priv", "ALL")
-                _grant_privileges(cursor, database_name, user, privileges)
-                _grant_privileges(cursor, database_name, self.migrate_user, "ALL")
-                _grant_privileges(cursor, database_name, self.read_only_user, "ALL")
-                additional_users = database.get("additional_users", [])
-                for additional_user in additional_users:
-                    _grant_privileges(cursor, database_name, additional_user["name"], additional_user["priv"])
-
-            # Create admin user with appropriate privileges
-            _create_user(cursor, self.admin_user, self._get_mysql_pass(self.admin_user))
-            _grant_privileges(cursor, "*", self.admin_user, "CREATE USER")
-
-            cursor.close()
-            self.mysql_provisioned = True
-            self.save()
+        provision_mysql_instances([self])
 
     def deprovision_mysql(self):
         """
         Drop all MySQL databases and users.
         """
-        if self.mysql_server and self.mysql_provisioned:
-            cursor = _get_mysql_cursor(self.mysql_server)
-
-            # Drop default databases and users
-            for database in self.mysql_databases:
-                database_name = database["name"]
-                _drop_database(cursor, database_name)
-                _drop_user(cursor, database["user"])
-
-            # Drop users with global privileges
-            for user in self.global_users:
-                _drop_user(cursor, user)
-
-            self.mysql_provisioned = False
-            self.save()
+        deprovision_mysql_instances([self])
 
 
 class MongoDBInstanceMixin(models.Model):
@@ -332,8 +540,7 @@ class MongoDBInstanceMixin(models.Model):
             for database in self.mongo_database_names:
                 # May update the password if the user already exists
                 mongo[database].add_user(self.mongo_user, self.mongo_pass)
-            self.mongo_provisioned = True
-            self.save()
+            self.save_fields(mongo_provisioned=True)
 
     def deprovision_mongo(self):
         """
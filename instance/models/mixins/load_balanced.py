@@ -52,20 +52,29 @@ class LoadBalancedInstance(models.Model):
         """
         return []
 
+    def get_load_balancer_fingerprint(self):  # pylint: disable=no-self-use
+        """
+        Return a hash of everything the load balancer configuration of this instance depends on.
+
+        The load balancer caches the configuration of each instance under this fingerprint.
+        Return None if the configuration can't be cached.
+        """
+        return None
+
     def set_dns_records(self):
         """
         Create CNAME records for the domain names of this instance pointing to the load balancer.
         """
         load_balancer_domain = self.load_balancing_server.domain.rstrip(".") + "."
-        for domain in self.get_managed_domains():
-            gandi.api.set_dns_record(domain, type="CNAME", value=load_balancer_domain)
+        gandi.api.enqueue_dns_changes(set_records=[
+            (domain, dict(type="CNAME", value=load_balancer_domain)) for domain in self.get_managed_domains()
+        ]).wait()
 
     def remove_dns_records(self):
         """
         Delete the DNS records for this instance.
         """
-        for domain in self.get_managed_domains():
-            gandi.api.remove_dns_record(domain)
+        gandi.api.enqueue_dns_changes(remove_domains=self.get_managed_domains()).wait()
 
     def reconfigure_load_balancer(self, load_balancing_server=None):
         """
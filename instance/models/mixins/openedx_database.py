@@ -19,11 +19,12 @@
 """
 Open edX instance database mixin
 """
+from contextlib import contextmanager
 import hashlib
 import hmac
 import yaml
 
-from instance.models.mixins.database import MySQLInstanceMixin, MongoDBInstanceMixin
+from instance.models.mixins.database import MySQLInstanceMixin, MongoDBInstanceMixin, mysql_connection_pool
 from instance.models.mixins.rabbitmq import RabbitMQInstanceMixin
 
 
@@ -171,23 +172,20 @@ class OpenEdXDatabaseMixin(MySQLInstanceMixin, MongoDBInstanceMixin, RabbitMQIns
         assert len(mysql_database_name) <= 64
         return mysql_database_name
 
+    @contextmanager
     def get_mysql_cursor_for_db(self, db_suffix):
         """
-        Get an adminstrative cursor with which to execute queries on the database
-        for the application linked to the provided db_suffix.
+        Context manager yielding an adminstrative cursor with which to execute queries on the database
+        for the application linked to the provided db_suffix, or None if there is no MySQL server.
+
+        The cursor uses a pooled connection, and the queries are committed when the block exits cleanly.
         """
         if not self.mysql_server:
-            return None
-        import MySQLdb as mysql
+            yield None
+            return
         db_name = self._get_mysql_database_name(db_suffix)
-        conn = mysql.connect(
-            host=self.mysql_server.hostname,
-            user=self.mysql_server.username,
-            passwd=self.mysql_server.password,
-            port=self.mysql_server.port,
-            database=db_name,
-        )
-        return conn.cursor()
+        with mysql_connection_pool.cursor(self.mysql_server, database=db_name) as cursor:
+            yield cursor
 
     def _get_mysql_user_name(self, suffix):
         """
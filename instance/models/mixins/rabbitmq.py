@@ -22,8 +22,10 @@ Instance app model mixins - RabbitMQ
 
 # Imports #####################################################################
 
+from collections import OrderedDict
 import json
 import string
+import threading
 import urllib.parse
 
 from django.db import IntegrityError, models
@@ -75,6 +77,83 @@ class RabbitMQAPIError(Exception):
     """Exception indicating that a call to the RabbitMQ API failed."""
 
 
+class RabbitMQAdminClient:
+    """
+    Client for the management API of a RabbitMQ server.
+
+    Each client keeps a persistent keep-alive session, and `for_server` shares one client
+    between all instances that use the same RabbitMQServer.
+    """
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, api_url, admin_username, admin_password):
+        self.api_url = api_url
+        self.session = requests.Session()
+        self.session.auth = (admin_username, admin_password)
+        self.session.headers['content-type'] = 'application/json'
+
+    @classmethod
+    def for_server(cls, rabbitmq_server):
+        """
+        Return the shared client for the given RabbitMQServer.
+
+        The credentials are part of the key so that changing them on the RabbitMQServer
+        doesn't reuse a session authenticated with the old ones.
+        """
+        key = (rabbitmq_server.api_url, rabbitmq_server.admin_username, rabbitmq_server.admin_password)
+        with cls._clients_lock:
+            if key not in cls._clients:
+                cls._clients[key] = cls(*key)
+            return cls._clients[key]
+
+    @classmethod
+    def clear(cls):
+        """
+        Close the sessions of all shared clients.
+        """
+        with cls._clients_lock:
+            clients = list(cls._clients.values())
+            cls._clients.clear()
+        for client in clients:
+            client.session.close()
+
+    def request(self, action, *url_args, data=None):
+        """
+        Send an HTTP request to the RabbitMQ API.
+        Raises a RabbitMQAPIError if the response isn't OK.
+        """
+        formatted_args = '/'.join(urllib.parse.quote(arg, safe='') for arg in url_args)
+        if data is not None:
+            data = json.dumps(data)
+
+        url = '{api_url}/api/{args}'.format(api_url=self.api_url, args=formatted_args)
+        response = self.session.request(action.upper(), url, data=data)
+        if not response.ok:
+            raise RabbitMQAPIError("URL: {url}. Verb: {action}. Response status: {status}.".format(
+                url=url,
+                action=action,
+                status=response.status_code,
+            ))
+        return response
+
+    def import_definitions(self, vhosts=(), users=(), permissions=()):
+        """
+        Create the given vhosts, users and permissions with a single definitions import.
+        """
+        return self.request('post', 'definitions', data={
+            'vhosts': list(vhosts),
+            'users': list(users),
+            'permissions': list(permissions),
+        })
+
+    def delete_users(self, usernames):
+        """
+        Delete the given users with a single request.
+        """
+        return self.request('post', 'users', 'bulk-delete', data={'users': list(usernames)})
+
+
 class RabbitMQInstanceMixin(models.Model):
     """
     An instance that uses a RabbitMQ vhost with a set of users.
@@ -109,61 +188,106 @@ class RabbitMQInstanceMixin(models.Model):
     class Meta:
         abstract = True
 
+    @property
+    def rabbitmq_client(self):
+        """
+        The shared RabbitMQAdminClient for the RabbitMQ server of this instance.
+        """
+        return RabbitMQAdminClient.for_server(self.rabbitmq_server)
+
+    @property
+    def rabbitmq_users(self):
+        """
+        The RabbitMQ users of this instance.
+        """
+        return [self.rabbitmq_provider_user, self.rabbitmq_consumer_user]
+
     def _rabbitmq_request(self, action, *url_args, data=None):
         """
         Generic method for sending an HTTP request to the RabbitMQ API.
         Raises a RabbitMQAPIError if the response isn't OK.
         """
-        formatted_args = '/'.join(urllib.parse.quote(arg, safe='') for arg in url_args)
-        if data is not None:
-            data = json.dumps(data)
-
-        url = '{api_url}/api/{args}'.format(api_url=self.rabbitmq_server.api_url, args=formatted_args)
-        response = getattr(requests, action)(
-            url,
-            auth=(self.rabbitmq_server.admin_username, self.rabbitmq_server.admin_password),
-            headers={'content-type': 'application/json'},
-            data=data
-        )
+        try:
+            return self.rabbitmq_client.request(action, *url_args, data=data)
+        except RabbitMQAPIError as exc:
+            self.logger.error("RabbitMQ API call failed for instance %s. %s", self, exc)
+            raise
 
-        if not response.ok:
-            self.logger.error(
-                "RabbitMQ API call failed for instance %s. URL: %s. Verb: %s. Response status: %s.",
-                self,
-                url,
-                action,
-                response.status_code
-            )
-            raise RabbitMQAPIError
-        return response
+    def get_rabbitmq_definitions(self):
+        """
+        The vhost, users and permissions of this instance, in the format of the definitions import API.
+        """
+        return {
+            'vhosts': [{'name': self.rabbitmq_vhost}],
+            'users': [
+                {'name': user.username, 'password': user.password, 'tags': user.username}
+                for user in self.rabbitmq_users
+            ],
+            'permissions': [
+                {'vhost': self.rabbitmq_vhost, 'user': user.username, 'configure': '.*', 'write': '.*', 'read': '.*'}
+                for user in self.rabbitmq_users
+            ],
+        }
 
     def provision_rabbitmq(self):
         """
         Creates the RabbitMQ vhost and users.
         """
-        if not self.rabbitmq_provisioned:
-            self._rabbitmq_request('put', 'vhosts', self.rabbitmq_vhost)
-
-            for user in [self.rabbitmq_provider_user, self.rabbitmq_consumer_user]:
-                self._rabbitmq_request('put', 'users', user.username, data={
-                    'password': user.password,
-                    'tags': user.username,
-                })
-                self._rabbitmq_request('put', 'permissions', self.rabbitmq_vhost, user.username, data={
-                    'configure': '.*',
-                    'write': '.*',
-                    'read': '.*'
-                })
-        self.rabbitmq_provisioned = True
-        self.save()
+        provision_rabbitmq_instances([self])
 
     def deprovision_rabbitmq(self):
         """
         Deletes the RabbitMQ vhost and users.
         """
-        if self.rabbitmq_provisioned:
-            self._rabbitmq_request('delete', 'vhosts', self.rabbitmq_vhost)
-            for user in [self.rabbitmq_consumer_user, self.rabbitmq_provider_user]:
-                self._rabbitmq_request('delete', 'users', user.username)
-        self.rabbitmq_provisioned = False
-        self.save()
+        deprovision_rabbitmq_instances([self])
+
+
+# Functions ###################################################################
+
+def _group_by_rabbitmq_server(instances):
+    """
+    Group the given instances by RabbitMQ server, leaving out instances without one.
+    """
+    groups = OrderedDict()
+    for instance in instances:
+        if instance.rabbitmq_server:
+            groups.setdefault(instance.rabbitmq_server.pk, (instance.rabbitmq_server, []))[1].append(instance)
+    return groups.values()
+
+
+def provision_rabbitmq_instances(instances):
+    """
+    Create the RabbitMQ vhosts and users of all the given instances.
+
+    The vhosts, users and permissions of all the instances that share a RabbitMQ server
+    are created with a single definitions import.
+    """
+    for rabbitmq_server, server_instances in _group_by_rabbitmq_server(instances):
+        definitions = {'vhosts': [], 'users': [], 'permissions': []}
+        for instance in server_instances:
+            if not instance.rabbitmq_provisioned:
+                for key, values in instance.get_rabbitmq_definitions().items():
+                    definitions[key].extend(values)
+        if definitions['vhosts']:
+            RabbitMQAdminClient.for_server(rabbitmq_server).import_definitions(**definitions)
+        for instance in server_instances:
+            instance.save_fields(rabbitmq_provisioned=True)
+
+
+def deprovision_rabbitmq_instances(instances):
+    """
+    Delete the RabbitMQ vhosts and users of all the given instances.
+
+    The management API has no bulk deletion of vhosts, so each vhost is deleted
+    with its own request, along with its permissions; the users of all the instances
+    that share a RabbitMQ server are then deleted with a single request.
+    """
+    instances = [instance for instance in instances if instance.rabbitmq_provisioned]
+    for rabbitmq_server, server_instances in _group_by_rabbitmq_server(instances):
+        client = RabbitMQAdminClient.for_server(rabbitmq_server)
+        for instance in server_instances:
+            client.request('delete', 'vhosts', instance.rabbitmq_vhost)
+        client.delete_users(user.username for instance in server_instances for user in instance.rabbitmq_users)
+        for instance in server_instances:
+            instance.rabbitmq_provisioned = False
+            instance.save()
@@ -128,8 +128,7 @@ class SwiftContainerInstanceMixin(models.Model):
                     auth_url=self.swift_openstack_auth_url,
                     region=self.swift_openstack_region,
                 )
-            self.swift_provisioned = True
-            self.save()
+            self.save_fields(swift_provisioned=True)
 
     def deprovision_swift(self):
         """
@@ -241,9 +240,7 @@ class S3BucketInstanceMixin(models.Model):
         )
         key_response = iam.create_access_key(self.iam_username)
         keys = key_response['create_access_key_response']['create_access_key_result']['access_key']
-        self.s3_access_key = keys['access_key_id']
-        self.s3_secret_access_key = keys['secret_access_key']
-        self.save()
+        self.save_fields(s3_access_key=keys['access_key_id'], s3_secret_access_key=keys['secret_access_key'])
 
     def get_s3_connection(self):
         """
@@ -299,7 +296,7 @@ class S3BucketInstanceMixin(models.Model):
             return
 
         if not self.s3_bucket_name:
-            self.s3_bucket_name = self.bucket_name
+            self.save_fields(s3_bucket_name=self.bucket_name)
 
         if not self.s3_access_key and not self.s3_secret_access_key:
             self.create_iam_user()
@@ -19,13 +19,22 @@
 """
 Instance app models - Open EdX AppServer models
 """
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import hashlib
+import json
+import logging
+import threading
+import time
+
 import yaml
 
 import requests
 
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.db import connection, models
 from django.db.models import Q
 from django.utils.text import slugify
 from django.contrib.postgres.fields import JSONField
@@ -33,14 +42,23 @@ from swampdragon.pubsub_providers.data_publisher import publish_data
 
 from instance import ansible
 from instance.logging import log_exception
+from instance.models.ansible_task_timing import AnsibleTaskTiming
 from instance.models.appserver import AppServer
+from instance.models.baked_image import BakedImage
 from instance.models.mixins.ansible import AnsibleAppServerMixin, Playbook
 from instance.models.mixins.utilities import EmailMixin
 from instance.models.mixins.openedx_config import OpenEdXConfigMixin
+from instance.models.provisioning_span import ProvisioningSpan
+from instance.models.server_pool import WarmServer
 from instance.models.utils import default_setting, format_help_text
 from instance.openstack_utils import get_openstack_connection, sync_security_group_rules, SecurityGroupRuleDefinition
 from userprofile.models import UserProfile
 
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
 # Constants ###################################################################
 
 
@@ -50,6 +68,57 @@ OPENEDX_APPSERVER_SECURITY_GROUP_RULES = [
     SecurityGroupRuleDefinition(**rule) for rule in settings.OPENEDX_APPSERVER_SECURITY_GROUP_RULES
 ]
 
+OPENEDX_APPSERVER_SECURITY_GROUP_DESCRIPTION = (
+    'Security group for Open EdX AppServers. Managed automatically by OpenCraft IM.'
+)
+
+
+# Functions ###################################################################
+
+def get_security_group_cache_key(region):
+    """
+    Return the cache key of the last synchronization of the main AppServer security group in the given
+    region, which changes with the name, description and rules of the group.
+    """
+    fingerprint = hashlib.sha256(json.dumps([
+        settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME,
+        OPENEDX_APPSERVER_SECURITY_GROUP_DESCRIPTION,
+        sorted(json.dumps(rule) for rule in OPENEDX_APPSERVER_SECURITY_GROUP_RULES),
+    ]).encode()).hexdigest()
+    return 'security_group:{}:{}'.format(region, fingerprint)
+
+
+def sync_main_security_group(region):
+    """
+    Create the main AppServer security group in the given region if necessary, update its
+    description and rules, and record the synchronization in the cache.
+    """
+    network = get_openstack_connection(region).network
+    main_security_group = network.find_security_group(settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME)
+    if not main_security_group:
+        # We need to create this security group:
+        main_security_group = network.create_security_group(name=settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME)
+    if main_security_group.description != OPENEDX_APPSERVER_SECURITY_GROUP_DESCRIPTION:
+        network.update_security_group(main_security_group, description=OPENEDX_APPSERVER_SECURITY_GROUP_DESCRIPTION)
+
+    # We manage this security group - update its rules to match the configured list of rules
+    sync_security_group_rules(main_security_group, OPENEDX_APPSERVER_SECURITY_GROUP_RULES, network=network)
+    cache.set(get_security_group_cache_key(region), time.time(), timeout=None)
+
+
+def _revalidate_main_security_group(region, lock_key):
+    """
+    Synchronize the main AppServer security group from a background thread, and release its lock.
+    """
+    try:
+        sync_main_security_group(region)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Unable to revalidate the AppServer security group in region %s', region)
+    finally:
+        cache.delete(lock_key)
+        # The thread has its own database connection, used for logging
+        connection.close()
+
 
 # Models ######################################################################
 
@@ -194,6 +263,14 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
         'playbook when configuring this AppServer.'
     ))
     lms_user_settings = models.TextField(blank=True, help_text='YAML variables for LMS user creation.')
+    baked_image = models.ForeignKey(
+        BakedImage,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='appservers',
+        help_text='The baked image this AppServer boots from instead of openstack_server_base_image, if any.',
+    )
 
     INVENTORY_GROUP = 'openedx-app'
     CONFIGURATION_PLAYBOOK = 'playbooks/edx_sandbox.yml'
@@ -223,11 +300,14 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
                          self.name, "active" if active else "inactive", self.instance.name)
         self.is_active = active
         self.save()
-        self.instance.reconfigure_load_balancer()
+        with self.record_span('activation:load_balancer_configuration'):
+            self.instance.reconfigure_load_balancer()
         if active:
             self.instance.enable_monitoring()
-        self.instance.set_active_vm_dns_records()
-        self.instance.update_consul_metadata()
+        with self.record_span('activation:dns'):
+            self.instance.set_active_vm_dns_records()
+        with self.record_span('activation:consul'):
+            self.instance.update_consul_metadata()
 
     @AppServer.status.only_for(AppServer.Status.New)
     def add_lms_users(self, lms_users):
@@ -250,6 +330,14 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
             variables=self.configuration_settings,
         )
 
+    def get_playbook_skip_tags(self, playbook):
+        """
+        Skip the tasks of the configuration playbook that were baked into the image this AppServer boots from.
+        """
+        if self.baked_image_id and playbook.playbook_path == self.CONFIGURATION_PLAYBOOK:
+            return settings.BAKED_IMAGE_ANSIBLE_TAGS
+        return super().get_playbook_skip_tags(playbook)
+
     def lms_user_creation_playbook(self):
         """
         Return a Playbook instance for creating LMS users.
@@ -378,27 +466,37 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
 
         The security group with the name specified by
         settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME is created and managed
-        by this code.
+        by this code. Its synchronization is cached for each region until its settings change;
+        once the cache is older than OPENEDX_APPSERVER_SECURITY_GROUP_CACHE_TTL seconds, the group
+        is synchronized again in a background thread, without waiting for it.
         """
         self.logger.info('Checking security groups (OpenStack firewall settings)')
-        network = get_openstack_connection(self.instance.openstack_region).network
-        main_security_group = network.find_security_group(settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME)
-        if not main_security_group:
-            # We need to create this security group:
-            main_security_group = network.create_security_group(name=settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME)
-        description = 'Security group for Open EdX AppServers. Managed automatically by OpenCraft IM.'
-        if main_security_group.description != description:
-            network.update_security_group(main_security_group, description=description)
-
-        # We manage this security group - update its rules to match the configured list of rules
-        sync_security_group_rules(main_security_group, OPENEDX_APPSERVER_SECURITY_GROUP_RULES, network=network)
+        region = self.instance.openstack_region
+        cache_key = get_security_group_cache_key(region)
+        synced_at = cache.get(cache_key)
+        if synced_at is None:
+            sync_main_security_group(region)
+        elif time.time() - synced_at > settings.OPENEDX_APPSERVER_SECURITY_GROUP_CACHE_TTL:
+            # Only one revalidation at a time; the lock expires in case the process dies while it runs
+            lock_key = cache_key + ':revalidating'
+            if cache.add(lock_key, True, timeout=600):
+                self.logger.info('Revalidating the security group %s in the background',
+                                 settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME)
+                threading.Thread(target=_revalidate_main_security_group, args=(region, lock_key), daemon=True).start()
 
         # For any additional security groups, just verify that the group exists:
-        groups = self.security_groups
-        groups.remove(main_security_group.name) # We already checked this group
-        for group_name in groups:
-            if network.find_security_group(group_name) is None:
-                raise Exception("Unable to find the OpenStack network security group called '{}'.".format(group_name))
+        groups = [
+            group_name for group_name in self.additional_security_groups
+            if group_name != settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME  # We already checked this group
+        ]
+        if groups:
+            network = get_openstack_connection(region).network
+            existing_groups = {group.name for group in network.security_groups()}
+            for group_name in groups:
+                if group_name not in existing_groups:
+                    raise Exception(
+                        "Unable to find the OpenStack network security group called '{}'.".format(group_name)
+                    )
 
     @property
     def server_name_prefix(self):
@@ -433,14 +531,63 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
 
         # Check firewall rules:
         try:
-            self.check_security_groups()
+            with self.record_span('security_groups'):
+                self.check_security_groups()
         except:  # pylint: disable=bare-except
             message = "Unable to check/update the network security groups for the new VM"
             self.logger.exception(message)
             self.provision_failed_email(message)
             return False
 
-        # Requesting a new server/VM:
+        # The playbooks are checked out and their virtualenvs built while the server boots.
+        # The executor is shut down before the stack is closed, so the preparation is always over by then.
+        with ExitStack() as playbook_stack, ThreadPoolExecutor(max_workers=1) as executor:
+            prepared_playbooks = executor.submit(self._prepare_ansible_playbooks_in_thread, playbook_stack)
+            if not self._start_server():
+                return False
+            self._status_to_configuring_server()
+            return self._configure_server(prepared_playbooks)
+
+    def can_resume_provisioning(self):
+        """
+        Can the failed provisioning of this AppServer be resumed, i.e. is its server still up?
+        """
+        if self.status != AppServer.Status.ConfigurationFailed:
+            return False
+        self.server.update_status()
+        return self.server.status.accepts_ssh_commands
+
+    @log_exception
+    @AppServer.status.only_for(AppServer.Status.ConfigurationFailed)
+    def resume_provisioning(self):
+        """
+        Resume the failed provisioning of this AppServer on its existing server: run the playbook
+        that failed and the following ones, and reboot the server.
+
+        Returns True on success or False on failure
+        """
+        self.logger.info('Resuming provisioning after %d completed playbook(s)', self.completed_playbooks)
+        with ExitStack() as playbook_stack, ThreadPoolExecutor(max_workers=1) as executor:
+            prepared_playbooks = executor.submit(self._prepare_ansible_playbooks_in_thread, playbook_stack)
+            self._status_to_resuming_configuration()
+            return self._configure_server(prepared_playbooks)
+
+    def _prepare_ansible_playbooks_in_thread(self, stack):
+        """
+        Call prepare_ansible_playbooks() from a thread of its own.
+        """
+        try:
+            return self.prepare_ansible_playbooks(stack)
+        finally:
+            # The thread has its own database connection, used for logging
+            connection.close()
+
+    def _start_server(self):
+        """
+        Claim a booted server/VM from the warm pool, or request a new one and wait until it accepts SSH commands.
+
+        Returns True on success or False on failure
+        """
         self._status_to_waiting_for_server()
         assert self.server.vm_not_yet_requested
         self.server.name_prefix = self.server_name_prefix
@@ -450,29 +597,42 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
             """ Does server accept SSH commands? """
             return self.server.status.accepts_ssh_commands
 
+        server_settings = dict(
+            security_groups=self.security_groups,
+            flavor_selector=self.openstack_server_flavor,
+            image_selector=self.baked_image.image_selector if self.baked_image else self.openstack_server_base_image,
+            key_name=self.openstack_server_ssh_keyname,
+        )
         try:
-            self.server.start(
-                security_groups=self.security_groups,
-                flavor_selector=self.openstack_server_flavor,
-                image_selector=self.openstack_server_base_image,
-                key_name=self.openstack_server_ssh_keyname,
-            )
-            self.logger.info('Waiting for server %s...', self.server)
-            self.server.sleep_until(lambda: self.server.status.vm_available)
-            self.logger.info('Waiting for server %s to finish booting...', self.server)
-            self.server.sleep_until(accepts_ssh_commands)
+            if WarmServer.objects.start_server(self.server, **server_settings):
+                self.logger.info('Using server %s from the warm pool', self.server)
+                return True
+            with self.record_span('vm_build'):
+                self.server.start(**server_settings)
+                self.logger.info('Waiting for server %s...', self.server)
+                self.server.sleep_until(lambda: self.server.status.vm_available)
+            with self.record_span('boot'):
+                self.logger.info('Waiting for server %s to finish booting...', self.server)
+                self.server.sleep_until(accepts_ssh_commands)
         except:  # pylint: disable=bare-except
             self._status_to_error()
             message = 'Unable to start an OpenStack server'
             self.logger.exception(message)
             self.provision_failed_email(message)
             return False
+        return True
 
+    def _configure_server(self, prepared_playbooks):
+        """
+        Run the playbooks on the server once `prepared_playbooks` (a Future) is done, and reboot it.
+        The AppServer must be in the ConfiguringServer status.
+
+        Returns True on success or False on failure
+        """
         try:
             # Provisioning (ansible)
             self.logger.info('Provisioning server...')
-            self._status_to_configuring_server()
-            log, exit_code = self.run_ansible_playbooks()
+            log, exit_code = self.run_ansible_playbooks(prepared_playbooks.result())
             if exit_code != 0:
                 self.logger.info('Provisioning failed')
                 self._status_to_configuration_failed()
@@ -482,8 +642,10 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
             # Reboot
             self.logger.info('Provisioning completed')
             self.logger.info('Rebooting server %s...', self.server)
-            self.server.reboot()
-            self.server.sleep_until(self.heartbeat_active, steady_state_check=False, timeout=1800)
+            with self.record_span('reboot'):
+                self.server.reboot()
+            with self.record_span('heartbeat'):
+                self.server.sleep_until(self.heartbeat_active, steady_state_check=False, timeout=1800)
 
             # Declare instance up and running
             self._status_to_running()
@@ -497,6 +659,25 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
             self.provision_failed_email(message)
             return False
 
+    def _run_playbook(self, working_dir, playbook, task_timings=None):
+        """
+        Run a playbook against the AppServer's VM, recording its duration as a provisioning span,
+        and the timings of its tasks as AnsibleTaskTiming objects
+        """
+        if task_timings is None:
+            task_timings = []
+        with self.record_span('playbook:{}'.format(playbook.playbook_path)) as span:
+            log, returncode = super()._run_playbook(working_dir, playbook, task_timings=task_timings)
+            span.success = returncode == 0
+        AnsibleTaskTiming.objects.add(self, playbook.playbook_path, task_timings)
+        return log, returncode
+
+    def record_span(self, phase):
+        """
+        Return a context manager recording the duration of the given provisioning phase of this AppServer.
+        """
+        return ProvisioningSpan.objects.record(self.owner, phase, appserver=self)
+
     def terminate_vm(self):
         if self.is_active:
             self.make_active(active=False)
@@ -509,9 +690,14 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
         # Always override configuration_settings - it's not meant to be manually set. We can't
         # assert that it isn't set because if a ValidationError occurred, this method could be
         # called multiple times before this AppServer is successfully created.
-        if not self.pk:
+        is_new = not self.pk
+        if is_new:
             self.configuration_settings = self.create_configuration_settings()
+            if settings.BAKED_IMAGES_ENABLED:
+                self.baked_image = BakedImage.objects.get_for_appserver(self)
         super().save(*args, **kwargs)
+        if is_new and self.baked_image:
+            self.baked_image.record_use()
         # Notify anyone monitoring for changes via swampdragon/websockets:
         publish_data('notification', {
             'type': 'openedx_appserver_update',
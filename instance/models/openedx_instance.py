@@ -19,9 +19,13 @@
 """
 Instance app models - Open edX Instance models
 """
+import hashlib
+import json
+import os
 import string
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models, transaction
 from django.db.backends.utils import truncate_name
 from django.db.models import F
@@ -42,8 +46,9 @@ from instance.models.mixins.openedx_storage import OpenEdXStorageMixin
 from instance.models.mixins.openedx_theme import OpenEdXThemeMixin
 from instance.models.mixins.secret_keys import SecretKeyInstanceMixin
 from instance.models.openedx_appserver import OpenEdXAppConfiguration
+from instance.models.provisioning_span import ProvisioningSpan
 from instance.models.utils import WrongStateException, ConsulAgent
-from instance.utils import sufficient_time_passed
+from instance.utils import run_steps, SkippedStepError, Step, sufficient_time_passed
 
 
 # Models ######################################################################
@@ -106,6 +111,28 @@ class OpenEdXInstance(DomainNameInstance, LoadBalancedInstance, OpenEdXAppConfig
         super().save(**kwargs)
         self.update_consul_metadata()
 
+    def get_load_balancer_fingerprint(self):
+        """
+        Return a hash of the active appservers and domains of this instance.
+
+        Returns None if one of the active appservers doesn't have a known public IP address yet,
+        since get_load_balancer_configuration() needs to look it up in that case.
+        """
+        active_appservers = list(
+            self.get_active_appservers().order_by('pk').values_list('pk', 'server___public_ip')
+        )
+        if any(public_ip is None for unused_pk, public_ip in active_appservers):
+            return None
+        fingerprint_data = [
+            active_appservers,
+            list(self.get_load_balanced_domains()),
+            self.domain,
+            self.domain_slug,
+            self.http_auth_info_base64().decode(),
+            settings.PRELIMINARY_PAGE_SERVER_IP,
+        ]
+        return hashlib.sha256(json.dumps(fingerprint_data).encode()).hexdigest()
+
     def get_load_balancer_configuration(self, triggered_by_instance=False):
         """
         Return the haproxy configuration fragment and backend map for this instance.
@@ -163,11 +190,13 @@ class OpenEdXInstance(DomainNameInstance, LoadBalancedInstance, OpenEdXAppConfig
         Set DNS A records for all active app servers.
         """
         self.logger.info("Setting DNS records for active app servers...")
+        records = []
         for i, appserver in enumerate(self.get_active_appservers(), 1):
             ip_addr = appserver.server.public_ip
             if ip_addr:
                 domain = "vm{index}.{base_domain}".format(index=i, base_domain=self.internal_lms_domain)
-                gandi.api.set_dns_record(domain, type="A", value=ip_addr)
+                records.append((domain, dict(type="A", value=ip_addr)))
+        gandi.api.enqueue_dns_changes(set_records=records).wait()
         # TODO: implement cleaning up DNS addresses that are no longer needed.
 
     @property
@@ -193,37 +222,77 @@ class OpenEdXInstance(DomainNameInstance, LoadBalancedInstance, OpenEdXAppConfig
         except models.ObjectDoesNotExist:
             return
 
-    def _spawn_appserver(self):
+    def _get_provisioning_steps(self, skip_provisioned_mysql=False):
         """
-            Provision a new AppServer
+        Return the Steps provisioning the external resources of this instance before spawning an AppServer.
 
-            Returns the ID of the new AppServer on success or None on failure.
+        The MySQL databases are provisioned again unless `skip_provisioned_mysql` is set and they already were.
+
+        Independent steps run concurrently; the load balancer configuration and the DNS records
+        depend on the load balancing server being selected first.
         """
+        def provisioning_step(name, func, message):
+            """ Log the given message before calling func """
+            def run():
+                """ Provision the resource """
+                self.logger.info(message)
+                func()
+            return Step(name, run)
+
+        steps = []
+        lb_requirements = ()
         if not self.load_balancing_server:
-            self.load_balancing_server = LoadBalancingServer.objects.select_random()
-            self.save()
-            self.reconfigure_load_balancer()
+            def select_load_balancer():
+                """ Select a random load balancing server for this instance """
+                self.save_fields(load_balancing_server=LoadBalancingServer.objects.select_random())
+            lb_requirements = ['load_balancer']
+            steps.append(Step('load_balancer', select_load_balancer))
+            steps.append(Step('load_balancer_configuration', self.reconfigure_load_balancer, requires=lb_requirements))
 
         # We unconditionally set the DNS records here, though this would only be strictly needed
         # when the first AppServer is spawned.  However, there is no easy way to tell whether the
         # DNS records have already been successfully set, and it doesn't hurt to always do it.
-        self.set_dns_records()
+        steps.append(Step('dns', self.set_dns_records, requires=lb_requirements))
 
         # Provision external databases:
         # TODO: Use db row-level locking to ensure we don't get any race conditions when creating these DBs.
         # Use select_for_update(nowait=True) to lock this object's row, then do these steps, then refresh_from_db
-        self.logger.info('Provisioning MySQL database...')
-        self.provision_mysql()
-        self.logger.info('Provisioning MongoDB databases...')
-        self.provision_mongo()
+        if not (skip_provisioned_mysql and self.mysql_provisioned):
+            steps.append(provisioning_step('mysql', self.provision_mysql, 'Provisioning MySQL database...'))
+        steps.append(provisioning_step('mongo', self.provision_mongo, 'Provisioning MongoDB databases...'))
         if self.storage_type == self.SWIFT_STORAGE:
-            self.logger.info('Provisioning Swift container...')
-            self.provision_swift()
+            steps.append(provisioning_step('swift', self.provision_swift, 'Provisioning Swift container...'))
         elif self.storage_type == self.S3_STORAGE:
-            self.logger.info('Provisioning S3 bucket...')
-            self.provision_s3()
-        self.logger.info('Provisioning RabbitMQ vhost...')
-        self.provision_rabbitmq()
+            steps.append(provisioning_step('s3', self.provision_s3, 'Provisioning S3 bucket...'))
+        steps.append(provisioning_step('rabbitmq', self.provision_rabbitmq, 'Provisioning RabbitMQ vhost...'))
+        return steps
+
+    def _spawn_appserver(self, skip_provisioned_mysql=False):
+        """
+            Provision a new AppServer
+
+            The external resources are provisioned concurrently first, in up to
+            SPAWN_APPSERVER_MAX_WORKERS threads. If any of them fails, the exception
+            of the first failed step is raised once the other steps are done.
+            The duration of each step that ran is recorded as a ProvisioningSpan.
+
+            Returns the ID of the new AppServer on success or None on failure.
+        """
+        results = run_steps(
+            self._get_provisioning_steps(skip_provisioned_mysql=skip_provisioned_mysql),
+            'Provisioning external resources of {}'.format(self),
+            settings.SPAWN_APPSERVER_MAX_WORKERS,
+        )
+        # Each step only writes the fields it sets, without the side effects of save(), like
+        # updating the Consul metadata, which run once from this thread.
+        self.save()
+        for name, result in results.items():
+            if not isinstance(result.exception, SkippedStepError):
+                ProvisioningSpan.objects.add(self.ref, name, result.duration, success=not result.exception)
+        for name, result in results.items():
+            if result.exception and not isinstance(result.exception, SkippedStepError):
+                self.logger.error('Provisioning step %s failed', name)
+                raise result.exception
 
         return self._create_owned_appserver()
 
@@ -232,24 +301,36 @@ class OpenEdXInstance(DomainNameInstance, LoadBalancedInstance, OpenEdXAppConfig
                         mark_active_on_success=False,
                         num_attempts=1,
                         success_tag=None,
-                        failure_tag=None):
+                        failure_tag=None,
+                        skip_provisioned_mysql=False):
         """
         Provision a new AppServer
 
         Wrapper around the spawning function to allow for multiple attempts
 
         Optionally mark the new AppServer as active when the provisioning completes.
-        Optionally retry up to 'num_attempts' times.
+        Optionally retry up to 'num_attempts' times. When RESUME_FAILED_PROVISIONING is enabled, a retry
+        resumes the provisioning of the previous AppServer from its failed playbook if its server is still up,
+        instead of spawning a new AppServer.
         Optionally tag the instance with 'success_tag' when the deployment succeeds,
         or failure_tag if it fails.
+        Optionally skip provisioning the MySQL databases if they already were, e.g. in bulk.
 
         Returns the ID of the new AppServer or None in case of failure.
         """
+        app_server = None
         for attempt in range(num_attempts):
-            self.logger.info("Spawning new AppServer, attempt {} of {}".format(attempt + 1, num_attempts))
-            app_server = self._spawn_appserver()
+            if settings.RESUME_FAILED_PROVISIONING and app_server and app_server.can_resume_provisioning():
+                self.logger.info("Resuming provisioning of {}, attempt {} of {}".format(
+                    app_server.name, attempt + 1, num_attempts
+                ))
+                provisioned = app_server.resume_provisioning()
+            else:
+                self.logger.info("Spawning new AppServer, attempt {} of {}".format(attempt + 1, num_attempts))
+                app_server = self._spawn_appserver(skip_provisioned_mysql=skip_provisioned_mysql)
+                provisioned = app_server and app_server.provision()
 
-            if app_server and app_server.provision():
+            if provisioned:
                 break
 
             self.logger.error('Failed to provision new app server')
@@ -406,6 +487,14 @@ class OpenEdXInstance(DomainNameInstance, LoadBalancedInstance, OpenEdXAppConfig
         """
         return settings.CONSUL_PREFIX.format(ocim=settings.OCIM_ID, instance=self.id)
 
+    @property
+    def consul_metadata_cache_key(self):
+        """
+        The key under which the hash and version number of the configurations last written
+        to Consul for this instance are cached.
+        """
+        return 'consul_metadata:{}'.format(self.consul_prefix)
+
     def _generate_consul_metadata(self):
         """
         Collects required configurations for this instance to reflect on Consul.
@@ -431,36 +520,149 @@ class OpenEdXInstance(DomainNameInstance, LoadBalancedInstance, OpenEdXAppConfig
 
         return configurations
 
+    def _get_consul_metadata_operations(self, agent, configurations, stored):
+        """
+        Compare the configurations to the ones stored in Consul, and return the Consul
+        transaction operations needed to write the changed ones.
+
+        If at least one field changed, the configurations' version number is incremented.
+        Every operation is a check-and-set, so the transaction fails if any of the keys it
+        writes changed since they were read.
+
+        :param agent: A ConsulAgent with this instance's prefix.
+        :param configurations: A dict of the configurations to be written on Consul.
+        :param stored: A dict mapping the keys stored in Consul to their (modify_index, value),
+                       as returned by `ConsulAgent.get_all()`.
+        :return: A pair (version, operations) with the new version number and the list of
+                 operations, which is empty if nothing changed.
+        """
+        version_index, version_number = stored.get('version', (0, 0))
+        operations = [
+            agent.cas_operation(key, value, stored.get(key, (0, None))[0])
+            for key, value in sorted(configurations.items())
+            if key not in stored or stored[key][1] != value
+        ]
+        if operations:
+            version_number = (version_number or 0) + 1
+            operations.append(agent.cas_operation('version', version_number, version_index))
+        return version_number or 0, operations
+
+    @staticmethod
+    def _hash_consul_metadata(configurations):
+        """
+        Return a hash of the given configurations, to detect saves that don't change them.
+        """
+        return hashlib.sha256(json.dumps(configurations, sort_keys=True, default=str).encode()).hexdigest()
+
     def _write_metadata_to_consul(self, configurations):
         """
         Reflect passed configurations to Consul. Values on consul
         will be updated only if they changed in this version of the
-        model using agent's `cas` parameter (Check-And-Set).
+        model, in a single transaction of check-and-set operations.
 
         If we successfully updated at least one field in Consul
         then the configurations' version number is gonna be incremented.
 
+        The hash of the configurations last written for each instance is cached, so that
+        saving an instance without changing its configurations doesn't make any request
+        to Consul.
+
         :note: This still doesn't apply removed-configurations case.
         :param configurations: A dict object contains the configurations
                                to be written on Consul.
         :return: A pair (version, changed) with the current version number and
                  a bool to indicate whether the information was updated.
         """
+        metadata_hash = self._hash_consul_metadata(configurations)
+        written_hash, written_version = cache.get(self.consul_metadata_cache_key, (None, None))
+        if written_hash == metadata_hash:
+            return written_version, False
+
         agent = ConsulAgent(prefix=self.consul_prefix)
-        version_updated = False
+        for dummy in range(settings.CONSUL_TXN_RETRIES + 1):
+            stored = agent.get_all()
+            version_number, operations = self._get_consul_metadata_operations(agent, configurations, stored)
+            if not operations or agent.txn(operations):
+                cache.set(
+                    self.consul_metadata_cache_key, (metadata_hash, version_number),
+                    settings.CONSUL_METADATA_CACHE_TIMEOUT,
+                )
+                return version_number, bool(operations)
+            self.logger.info('Consul metadata changed while it was being updated, retrying.')
+
+        self.logger.error('Could not update Consul metadata: it kept changing while it was being updated.')
+        return stored.get('version', (0, 0))[1] or 0, False
+
+    @staticmethod
+    def get_consul_instances_prefix():
+        """
+        Return the Consul prefix under which the metadata of all instances is stored.
+        """
+        return settings.CONSUL_PREFIX.split('{instance}')[0].format(ocim=settings.OCIM_ID)
 
-        version_number = agent.get('version') or 0
-        for key, value in configurations.items():
-            index, stored_value = agent.get(key, index=True)
-            cas = index if stored_value else 0
-            agent.put(key, value, cas=cas)
+    @classmethod
+    def bulk_update_consul_metadata(cls, instances, stored_all=None):
+        """
+        Reflect the configurations of the given instances on Consul, like `update_consul_metadata()`,
+        but reading the metadata of all instances with a single request, and writing it in
+        transactions of up to CONSUL_TXN_MAX_OPERATIONS operations, each covering several instances.
 
-            if not version_updated and value != stored_value:
-                version_updated = True
-                version_number += 1
-                agent.put('version', version_number)
+        Instances whose transaction fails are updated one by one.
 
-        return version_number, version_updated
+        :param stored_all: The metadata of all instances, as returned by `ConsulAgent().get_all()` for
+                           `get_consul_instances_prefix()`, when it's shared by several calls. The common
+                           prefix of instances with consecutive ids is often the prefix of all instances,
+                           so fetching it once is cheaper than for each batch of instances.
+        :return: The number of instances whose metadata was updated.
+        """
+        if not settings.CONSUL_ENABLED:
+            return 0
+
+        instances = list(instances)
+        written = cache.get_many([instance.consul_metadata_cache_key for instance in instances])
+        pending = []
+        for instance in instances:
+            configurations = instance._generate_consul_metadata()
+            metadata_hash = cls._hash_consul_metadata(configurations)
+            if written.get(instance.consul_metadata_cache_key, (None, None))[0] != metadata_hash:
+                pending.append((instance, configurations, metadata_hash))
+        if not pending:
+            return 0
+
+        if stored_all is None:
+            common_prefix = os.path.commonprefix([instance.consul_prefix for instance, dummy, dummy in pending])
+            stored_all = ConsulAgent().get_all(common_prefix)
+        batches = [[]]
+        batch_size = 0
+        for instance, configurations, metadata_hash in pending:
+            prefix = instance.consul_prefix
+            stored = {
+                key[len(prefix):]: value for key, value in stored_all.items()
+                if key.startswith(prefix) and '/' not in key[len(prefix):]
+            }
+            agent = ConsulAgent(prefix=prefix)
+            version_number, operations = instance._get_consul_metadata_operations(agent, configurations, stored)
+            if batch_size + len(operations) > settings.CONSUL_TXN_MAX_OPERATIONS and batches[-1]:
+                batches.append([])
+                batch_size = 0
+            batches[-1].append((instance, metadata_hash, version_number, operations))
+            batch_size += len(operations)
+
+        updated = 0
+        agent = ConsulAgent()
+        for batch in batches:
+            operations = [operation for dummy, dummy, dummy, instance_operations in batch
+                          for operation in instance_operations]
+            if not operations or agent.txn(operations):
+                cache.set_many({
+                    instance.consul_metadata_cache_key: (metadata_hash, version_number)
+                    for instance, metadata_hash, version_number, dummy in batch
+                }, settings.CONSUL_METADATA_CACHE_TIMEOUT)
+                updated += sum(1 for dummy, dummy, dummy, instance_operations in batch if instance_operations)
+                continue
+            for instance, dummy, dummy, dummy in batch:
+                updated += instance.update_consul_metadata()[1]
+        return updated
 
     def update_consul_metadata(self):
         """
@@ -488,5 +690,6 @@ class OpenEdXInstance(DomainNameInstance, LoadBalancedInstance, OpenEdXAppConfig
         if not settings.CONSUL_ENABLED:
             return
 
+        cache.delete(self.consul_metadata_cache_key)
         agent = ConsulAgent(prefix=self.consul_prefix)
         agent.purge()
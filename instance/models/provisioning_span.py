@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app models - Timed spans of the provisioning of instances and AppServers
+"""
+
+# Imports #####################################################################
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+import logging
+import math
+import time
+
+from django.db import models
+from django.utils import timezone
+from django_extensions.db.models import TimeStampedModel
+
+from instance.models.instance import InstanceReference
+from instance.models.utils import ValidateModelMixin
+
+
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Constants ###################################################################
+
+# Percentiles of the span durations reported for each phase
+REPORTED_PERCENTILES = (50, 95)
+
+
+# Functions ###################################################################
+
+def percentile(sorted_values, percent):
+    """
+    Return the given percentile of a sorted list of values, using the nearest-rank method,
+    or None if the list is empty.
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(math.ceil(percent / 100 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+
+# Models ######################################################################
+
+class ProvisioningSpanQuerySet(models.QuerySet):
+    """
+    Additional methods for provisioning span querysets
+    Also used as the standard manager for the ProvisioningSpan model (`ProvisioningSpan.objects`)
+    """
+    def add(self, instance_ref, phase, duration, success=True, appserver=None):
+        """
+        Record a span of the given phase, that ended now after `duration` seconds.
+        """
+        return self.create(
+            instance=instance_ref,
+            appserver=appserver,
+            phase=phase,
+            started=timezone.now() - timedelta(seconds=duration),
+            duration=duration,
+            success=success,
+        )
+
+    @contextmanager
+    def record(self, instance_ref, phase, appserver=None):
+        """
+        Context manager recording a span of the given phase for the duration of its block.
+
+        The unsaved span is yielded, so the block can set its `success` to False. The span is also
+        recorded as failed if the block raises an exception, which is then re-raised.
+        Failing to record the span is logged, and doesn't interrupt the provisioning.
+        """
+        span = self.model(instance=instance_ref, appserver=appserver, phase=phase, started=timezone.now())
+        start = time.monotonic()
+        try:
+            yield span
+        except:  # pylint: disable=bare-except
+            span.success = False
+            raise
+        finally:
+            span.duration = time.monotonic() - start
+            try:
+                span.save()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Unable to record the provisioning span %s', phase)
+
+    def get_phase_timings(self):
+        """
+        Return an OrderedDict mapping each phase to the number of spans, the number of failed spans,
+        and the REPORTED_PERCENTILES of the durations of the successful spans, ordered by phase.
+        """
+        phases = OrderedDict()
+        for phase, duration, success in self.order_by('phase', 'duration').values_list('phase', 'duration', 'success'):
+            durations, failed = phases.setdefault(phase, ([], []))
+            (durations if success else failed).append(duration)
+
+        timings = OrderedDict()
+        for phase, (durations, failed) in phases.items():
+            timings[phase] = OrderedDict([
+                ('count', len(durations) + len(failed)),
+                ('failed', len(failed)),
+            ])
+            for percent in REPORTED_PERCENTILES:
+                timings[phase]['p{}'.format(percent)] = percentile(durations, percent)
+        return timings
+
+
+class ProvisioningSpan(ValidateModelMixin, TimeStampedModel):
+    """
+    A timed phase of the provisioning of an instance or of one of its AppServers, like booting
+    the VM or running a playbook.
+    """
+    instance = models.ForeignKey(InstanceReference, on_delete=models.CASCADE, related_name='provisioning_spans')
+    appserver = models.ForeignKey(
+        'instance.OpenEdXAppServer',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='provisioning_spans',
+    )
+    phase = models.CharField(max_length=255, db_index=True)
+    started = models.DateTimeField()
+    duration = models.FloatField(help_text='The number of seconds the phase took.')
+    success = models.BooleanField(default=True)
+
+    objects = ProvisioningSpanQuerySet().as_manager()
+
+    def __str__(self):
+        return '{}: {:.1f}s{}'.format(self.phase, self.duration, '' if self.success else ' (failed)')
@@ -236,8 +236,7 @@ class Server(ValidateModelMixin, TimeStampedModel):
                         "The current status ({name}) does not fulfill the desired condition "
                         "and is not expected to change.".format(name=self.status.name)
                     )
-            time.sleep(1)
-            timeout -= 1
+            timeout -= self._wait_for_status_update(timeout)
 
         # If we get here, this means we've reached the timeout
         raise TimeoutError(
@@ -261,6 +260,15 @@ class Server(ValidateModelMixin, TimeStampedModel):
         """
         raise NotImplementedError
 
+    def _wait_for_status_update(self, timeout):  # pylint: disable=unused-argument
+        """
+        Wait before checking the status again in sleep_until(), for at most `timeout` seconds.
+
+        Returns the number of seconds waited.
+        """
+        time.sleep(1)
+        return 1
+
 
 class OpenStackServer(Server):
     """
@@ -274,19 +282,39 @@ class OpenStackServer(Server):
     openstack_id = models.CharField(max_length=250, db_index=True, blank=True)
     _public_ip = models.GenericIPAddressField(blank=True, null=True, db_column="public_ip")
 
+    # Overrides the pooled nova client when set (used by tests)
+    _nova = None
+    # Nova server received from the status watcher, used by the next update_status() call
+    _watched_os_server = None
+
     class Meta:
         verbose_name = 'OpenStack VM'
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.nova = openstack_utils.get_nova_client(self.openstack_region)
-
     def __str__(self):
         if self.openstack_id:
             return self.openstack_id
         else:
             return 'Pending OpenStack Server'
 
+    @property
+    def nova(self):
+        """
+        Nova client for the region of this server
+
+        The client is looked up lazily, so loading servers from the database doesn't cost any
+        OpenStack API calls, and it is shared with all other servers in the same region.
+        """
+        if self._nova is not None:
+            return self._nova
+        return openstack_utils.get_nova_client(self.openstack_region)
+
+    @nova.setter
+    def nova(self, nova):
+        """
+        Use a specific nova client for this server
+        """
+        self._nova = nova
+
     @property
     def os_server(self):
         """
@@ -355,7 +383,11 @@ class OpenStackServer(Server):
 
         # First check if it makes sense to update the current status.
         # This is not the case if we can not interact with the server:
+        watched_os_server, self._watched_os_server = self._watched_os_server, None
         if self.status not in [Status.BuildFailed, Status.Terminated, Status.Pending]:
+            if watched_os_server is not None:
+                self._update_status_from_nova(watched_os_server)
+                return self.status
             try:
                 os_server = self.os_server
             except novaclient.exceptions.NotFound:
@@ -374,6 +406,20 @@ class OpenStackServer(Server):
                 self._update_status_from_nova(os_server)
         return self.status
 
+    def _wait_for_status_update(self, timeout):
+        """
+        Wait until the status watcher has listed the servers of our region again.
+
+        The listing is shared with every other server being waited on in this process, and is
+        used by the next update_status() call instead of querying Nova for this server alone.
+        """
+        if not self.openstack_id:
+            return super()._wait_for_status_update(timeout)
+        waited, self._watched_os_server = openstack_utils.status_watcher.wait(
+            self.openstack_region, self.openstack_id, timeout,
+        )
+        return waited
+
     @Server.status.only_for(Status.Pending)
     def start(self,
               flavor_selector=settings.OPENSTACK_SANDBOX_FLAVOR,
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app models - Warm pool of pre-booted OpenStack servers
+"""
+
+# Imports #####################################################################
+
+from collections import namedtuple
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.utils import timezone
+from django_extensions.db.models import TimeStampedModel
+import novaclient
+import requests
+
+from instance.models.server import OpenStackServer
+from instance.models.utils import SteadyStateException, ValidateModelMixin
+
+
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Constants ###################################################################
+
+# Name prefix of the servers booted for the warm pool, until they are claimed
+WARM_POOL_NAME_PREFIX = 'warm-pool'
+
+
+# Classes #####################################################################
+
+class WarmPool(namedtuple('WarmPool', ['openstack_region', 'flavor_selector', 'image_selector', 'key_name', 'size'])):
+    """
+    A pool of servers started with the same region, flavor, image and SSH key, kept booted and
+    ready to be claimed by AppServers.
+    """
+    @classmethod
+    def get_all(cls):
+        """
+        Return the pools configured in settings.OPENSTACK_WARM_POOLS.
+
+        The region, flavor, image and SSH key of each pool default to the sandbox settings.
+        """
+        return [
+            cls(
+                openstack_region=pool.get('openstack_region', settings.OPENSTACK_REGION),
+                flavor_selector=pool.get('flavor_selector', settings.OPENSTACK_SANDBOX_FLAVOR),
+                image_selector=pool.get('image_selector', settings.OPENSTACK_SANDBOX_BASE_IMAGE),
+                key_name=pool.get('key_name', settings.OPENSTACK_SANDBOX_SSH_KEYNAME),
+                size=pool['size'],
+            )
+            for pool in settings.OPENSTACK_WARM_POOLS
+        ]
+
+    @staticmethod
+    def get_key(openstack_region, flavor_selector, image_selector, key_name):
+        """
+        Return the key of the pool holding servers started with the given settings.
+        """
+        return hashlib.sha256(
+            json.dumps([openstack_region, flavor_selector, image_selector, key_name], sort_keys=True).encode()
+        ).hexdigest()
+
+    @property
+    def key(self):
+        """
+        The key of this pool.
+        """
+        return self.get_key(self.openstack_region, self.flavor_selector, self.image_selector, self.key_name)
+
+    def _stat_key(self, name):
+        """
+        Cache key of the given statistic of this pool.
+        """
+        return 'warm_pool:{}:{}'.format(self.key, name)
+
+    def record_claim(self, time_saved=None):
+        """
+        Count a claim of a server from this pool: a hit saving `time_saved` seconds, or a miss if it's None.
+        """
+        if time_saved is None:
+            increments = {'misses': 1}
+        else:
+            increments = {'hits': 1, 'time_saved': round(time_saved)}
+        for name, value in increments.items():
+            stat_key = self._stat_key(name)
+            cache.add(stat_key, 0, timeout=None)
+            cache.incr(stat_key, value)
+
+    def get_stats(self):
+        """
+        Return the number of hits and misses of this pool, its hit rate, and the seconds of boot time saved.
+        """
+        stats = {name: cache.get(self._stat_key(name), 0) for name in ('hits', 'misses', 'time_saved')}
+        claims = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / claims if claims else None
+        return stats
+
+
+# Functions ###################################################################
+
+def _get_max_age():
+    """
+    How old warm servers can get before they are recycled
+    """
+    return timezone.timedelta(seconds=settings.OPENSTACK_WARM_POOL_MAX_AGE)
+
+
+# Models ######################################################################
+
+class WarmServerQuerySet(models.QuerySet):
+    """
+    Additional methods for warm server querysets
+    Also used as the standard manager for the WarmServer model (`WarmServer.objects`)
+    """
+    def expired(self):
+        """
+        Filter the warm servers that are too old to be claimed
+        """
+        return self.filter(created__lte=timezone.now() - _get_max_age())
+
+    def not_expired(self):
+        """
+        Filter the warm servers that can be claimed
+        """
+        return self.filter(created__gt=timezone.now() - _get_max_age())
+
+    def claim(self, pool_key):
+        """
+        Remove the oldest server of the given pool from the pool, and return its WarmServer.
+        Returns None if the pool is empty.
+
+        Each warm server is claimed only once, even by concurrent callers: the server belongs to
+        the caller that deleted its row.
+        """
+        for warm_server in self.not_expired().filter(pool_key=pool_key).order_by('created').select_related('server'):
+            deleted, unused = WarmServer.objects.filter(pk=warm_server.pk).delete()
+            if deleted:
+                return warm_server
+        return None
+
+    def start_server(self, server, flavor_selector, image_selector, key_name, security_groups):
+        """
+        Start `server` (a pending OpenStackServer) from a booted server of the matching warm pool,
+        if there is one: the pooled VM is renamed after `server`, joins the given security groups,
+        and `server` takes it over, ready to accept SSH commands.
+
+        Returns True if `server` was started, or False if it must be started normally.
+        """
+        pool_key = WarmPool.get_key(server.openstack_region, flavor_selector, image_selector, key_name)
+        pool = next((pool for pool in WarmPool.get_all() if pool.key == pool_key), None)
+        if pool is None:
+            return False
+        warm_server = self.claim(pool_key)
+        if warm_server is None:
+            logger.info('Warm pool of %s is empty', server.openstack_region)
+            pool.record_claim()
+            return False
+
+        pooled_server = warm_server.server
+        try:
+            os_server = pooled_server.os_server
+            os_server.update(name=server.name)
+            for group in set(security_groups) - {settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME}:
+                os_server.add_security_group(group)
+        except (requests.RequestException,
+                novaclient.exceptions.ClientException,
+                novaclient.exceptions.EndpointNotFound) as exc:
+            logger.error('Unable to take over server %s from the warm pool: %s', pooled_server, exc)
+            pooled_server.terminate()
+            pool.record_claim()
+            return False
+
+        server.logger.info('Taking over server %s from the warm pool', pooled_server)
+        server.openstack_id = pooled_server.openstack_id
+        server._public_ip = pooled_server._public_ip  # pylint: disable=protected-access
+        server.save()
+        server._status_to_building()  # pylint: disable=protected-access
+        server._status_to_booting()  # pylint: disable=protected-access
+        server._status_to_ready()  # pylint: disable=protected-access
+        pooled_server.delete()
+        pool.record_claim(time_saved=warm_server.boot_duration)
+        return True
+
+    def refill(self, pool):
+        """
+        Terminate the expired servers of the given pool, and boot new ones until it holds `pool.size` servers.
+
+        All missing servers are started before waiting for any of them, so they boot concurrently.
+        """
+        for warm_server in self.expired().filter(pool_key=pool.key).select_related('server'):
+            if WarmServer.objects.filter(pk=warm_server.pk).delete()[0]:
+                logger.info('Recycling expired server %s of the warm pool', warm_server.server)
+                warm_server.server.terminate()
+
+        missing = pool.size - self.not_expired().filter(pool_key=pool.key).count()
+        if missing <= 0:
+            return
+        logger.info('Booting %d server(s) for the warm pool of %s', missing, pool.openstack_region)
+        servers = []
+        for unused in range(missing):
+            server = OpenStackServer.objects.create(
+                name_prefix=WARM_POOL_NAME_PREFIX,
+                openstack_region=pool.openstack_region,
+            )
+            server.start(
+                flavor_selector=pool.flavor_selector,
+                image_selector=pool.image_selector,
+                key_name=pool.key_name,
+                security_groups=[settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME],
+            )
+            servers.append(server)
+
+        for server in servers:
+            try:
+                server.sleep_until(
+                    lambda server=server: server.status.accepts_ssh_commands,
+                    timeout=settings.OPENSTACK_WARM_POOL_BOOT_TIMEOUT,
+                )
+            except (SteadyStateException, TimeoutError):
+                logger.exception('Server %s of the warm pool failed to boot', server)
+                server.terminate()
+            else:
+                boot_duration = (timezone.now() - server.created).total_seconds()
+                self.create(server=server, pool_key=pool.key, boot_duration=boot_duration)
+
+    def terminate_orphans(self):
+        """
+        Terminate the servers booted for the warm pool that never made it into a pool, or weren't
+        fully taken over when they were claimed.
+        """
+        cutoff = timezone.now() - _get_max_age() - timezone.timedelta(seconds=settings.OPENSTACK_WARM_POOL_BOOT_TIMEOUT)
+        return OpenStackServer.objects.terminate(
+            name_prefix=WARM_POOL_NAME_PREFIX, warm_server__isnull=True, created__lt=cutoff,
+        )
+
+
+class WarmServer(ValidateModelMixin, TimeStampedModel):
+    """
+    An OpenStack server of a warm pool: booted ahead of time, and ready to be claimed by an AppServer.
+    """
+    server = models.OneToOneField(OpenStackServer, on_delete=models.CASCADE, related_name='warm_server')
+    pool_key = models.CharField(max_length=64, db_index=True)
+    boot_duration = models.FloatField(help_text='The number of seconds the server took to boot.')
+
+    objects = WarmServerQuerySet().as_manager()
+
+    def __str__(self):
+        return '{} (warm pool)'.format(self.server)
@@ -19,10 +19,12 @@
 """
 Models Utils
 """
+import base64
 import functools
 import inspect
 import json
 from json import JSONDecodeError
+import threading
 from weakref import WeakKeyDictionary
 
 from django.conf import settings
@@ -423,10 +425,25 @@ class ConsulAgent(object):
     managing prefixes, and reduces the call size to the main needed things with a
     possibility to expand it for more advanced queries.
     """
+    # The Consul client shared by all agents of this process
+    _shared_client = None
+    _shared_client_lock = threading.Lock()
+
     def __init__(self, prefix=''):
-        self._client = consul.Consul()
+        self._client = self.get_client()
         self.prefix = prefix
 
+    @classmethod
+    def get_client(cls):
+        """
+        Return the Consul client shared by all agents, so that its HTTP session and
+        connections are reused.
+        """
+        with cls._shared_client_lock:
+            if cls._shared_client is None:
+                cls._shared_client = consul.Consul()
+            return cls._shared_client
+
     def get(self, key, index=False, **kwargs):
         """
         Get's a key value from Consul's Key-Value store after casting it to
@@ -460,9 +477,56 @@ class ConsulAgent(object):
         :return: Either True or False. If False is returned, then the update has not taken place.
         """
         consul_key = self.prefix + key
-        value = json.dumps(value) if self._is_json_serializable(value) else str(value)
+        return self._client.kv.put(consul_key, self._encode_value(value), **kwargs)
 
-        return self._client.kv.put(consul_key, value, **kwargs)
+    def get_all(self, key=''):
+        """
+        Fetch all keys starting with the given key/prefixed-key from Consul's Key-Value store,
+        with a single request.
+
+        :param key: The key prefix to fetch.
+        :return: A dict mapping each key (without the agent's prefix) to a tuple of
+                 (modify_index, value), where value is cast like in `get()`.
+        """
+        dummy, data = self._client.kv.get(self.prefix + key, recurse=True)
+        return {
+            item['Key'][len(self.prefix):]: (item['ModifyIndex'], self._cast_value(item['Value']))
+            for item in data or []
+        }
+
+    def cas_operation(self, key, value, index):
+        """
+        Return a transaction operation that sets the given key/prefixed-key to the given value,
+        only if the key hasn't been modified since the given modify index (0 if the key
+        must not exist yet).
+        """
+        return {
+            'KV': {
+                'Verb': 'cas',
+                'Key': self.prefix + key,
+                'Value': base64.b64encode(self._encode_value(value).encode()).decode(),
+                'Index': index,
+            }
+        }
+
+    def txn(self, operations):
+        """
+        Apply the given operations atomically, in a single Consul transaction.
+
+        Consul limits the number of operations of a transaction (to 64 by default,
+        see CONSUL_TXN_MAX_OPERATIONS).
+
+        :param operations: A list of transaction operations, e.g. from `cas_operation()`.
+        :return: True if the transaction was applied, False if it was rolled back
+                 because one of its check-and-set operations failed.
+        """
+        try:
+            self._client.txn.put(operations)
+        except consul.base.ClientError as exc:
+            if not str(exc).startswith('409'):
+                raise
+            return False
+        return True
 
     def delete(self, key, **kwargs):
         """
@@ -516,6 +580,13 @@ class ConsulAgent(object):
 
         return value
 
+    @classmethod
+    def _encode_value(cls, value):
+        """
+        Encode the value to store it in Consul, dumping lists and dictionaries first.
+        """
+        return json.dumps(value) if cls._is_json_serializable(value) else str(value)
+
     @staticmethod
     def _is_json_serializable(obj):
         """
@@ -22,16 +22,20 @@ OpenStack - Helper functions
 
 # Imports #####################################################################
 import logging
-from collections import namedtuple, defaultdict
+from collections import Counter, namedtuple, defaultdict
+import random
+import threading
+import time
 
 from django.conf import settings
 from novaclient.client import Client as NovaClient
 from openstack.connection import Connection
 from openstack.profile import Profile
 import requests
+from swiftclient.client import get_auth as swift_get_auth
 from swiftclient.service import SwiftService
 
-from instance.utils import get_requests_retry
+from instance.utils import get_requests_retry, to_json
 
 # Logging #####################################################################
 
@@ -58,6 +62,208 @@ SecurityGroupRuleDefinition = namedtuple('SecurityGroupRuleDefinition', [
     'remote_group_id',
 ])
 
+# Classes #####################################################################
+
+class OpenStackClientPool:
+    """
+    Process-wide pool of OpenStack clients, keyed by service, region and credentials.
+
+    Clients are created lazily on first use and then shared by all callers (and threads) of
+    this process, so that their HTTP sessions and authentication tokens are reused instead of
+    authenticating again for every object that needs to talk to OpenStack.
+
+    Entries older than settings.OPENSTACK_CLIENT_POOL_MAX_AGE seconds are recreated, which
+    forces a re-authentication. The `stats` counter records pool hits, misses and re-auths.
+    """
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        # key -> Lock held while the client for that key is being created
+        self._creation_locks = {}
+        self.stats = Counter()
+
+    def _get_fresh(self, key):
+        """
+        Return the pooled client for `key` if it's not older than OPENSTACK_CLIENT_POOL_MAX_AGE, or None.
+
+        Must be called with `self._lock` held.
+        """
+        entry = self._clients.get(key)
+        if entry is not None:
+            client, created = entry
+            if time.monotonic() - created < settings.OPENSTACK_CLIENT_POOL_MAX_AGE:
+                self.stats['hits'] += 1
+                return client
+        return None
+
+    def get(self, key, create_client):
+        """
+        Return the pooled client for `key`, calling `create_client()` to (re)create it if needed.
+
+        Creating a client can involve authenticating over the network, so it happens outside of the
+        pool lock: only the callers that need the same client wait for it to be created.
+        """
+        with self._lock:
+            client = self._get_fresh(key)
+            if client is not None:
+                return client
+            creation_lock = self._creation_locks.setdefault(key, threading.Lock())
+        with creation_lock:
+            with self._lock:
+                # Another thread may have created the client while this one was waiting
+                client = self._get_fresh(key)
+                if client is not None:
+                    return client
+                if key in self._clients:
+                    self.stats['reauths'] += 1
+                    logger.info('Re-authenticating pooled OpenStack client %s', key[:2])
+                else:
+                    self.stats['misses'] += 1
+            client = create_client()
+            with self._lock:
+                self._clients[key] = (client, time.monotonic())
+            return client
+
+    def clear(self):
+        """
+        Drop all pooled clients and reset the statistics.
+        """
+        with self._lock:
+            self._clients.clear()
+            self.stats.clear()
+
+
+client_pool = OpenStackClientPool()
+
+
+class ServerStatusWatcher:
+    """
+    Process-wide watcher of the status of the OpenStack servers that are being waited on.
+
+    Instead of every waiting task querying Nova for its own server once per second, one background
+    thread per region lists all servers of the region with a single API call and wakes up the tasks
+    waiting on that region. The interval between two listings starts at
+    settings.SERVER_STATUS_WATCHER_MIN_INTERVAL and doubles (with jitter) up to
+    settings.SERVER_STATUS_WATCHER_MAX_INTERVAL while none of the watched servers changes; it drops
+    back to the minimum as soon as one of them changes or a new server starts being watched.
+
+    The watcher only fetches data: waiters apply the returned Nova server to their own model
+    instance, so all database writes stay in the task's thread.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        # region_name -> Counter of openstack_id -> number of waiting callers
+        self._waiters = defaultdict(Counter)
+        # region_name -> {openstack_id: Nova server} from the latest listing
+        self._os_servers = {}
+        # region_name -> number of listings done so far
+        self._generations = Counter()
+        # Regions with a new server to watch, which should be polled without waiting for the backoff
+        self._wakeups = set()
+        self._threads = {}
+        self.stats = Counter()
+
+    def wait(self, region_name, openstack_id, timeout):
+        """
+        Wait for the next listing of `region_name`, for at most `timeout` seconds.
+
+        Returns a `(waited, os_server)` tuple with the number of seconds waited, and the Nova server
+        with id `openstack_id` from the new listing - or None if the listing failed, didn't include
+        that server, or didn't happen before the timeout.
+        """
+        start = time.monotonic()
+        with self._condition:
+            waiters = self._waiters[region_name]
+            if not waiters[openstack_id]:
+                self._wakeups.add(region_name)
+            waiters[openstack_id] += 1
+            self._ensure_thread(region_name)
+            self._condition.notify_all()
+            generation = self._generations[region_name]
+            try:
+                polled = self._condition.wait_for(lambda: self._generations[region_name] != generation, timeout)
+                os_server = self._os_servers.get(region_name, {}).get(openstack_id) if polled else None
+            finally:
+                waiters[openstack_id] -= 1
+                if not waiters[openstack_id]:
+                    del waiters[openstack_id]
+        return time.monotonic() - start, os_server
+
+    def poll(self, region_name, interval):
+        """
+        List the servers of `region_name` once, wake up its waiters, and return the next poll interval.
+        """
+        with self._condition:
+            watched = set(self._waiters[region_name])
+            self._wakeups.discard(region_name)
+            previous = self._os_servers.get(region_name, {})
+        self.stats['polls'] += 1
+        try:
+            os_servers = {
+                os_server.id: os_server
+                for os_server in get_nova_client(region_name).servers.list()
+            }
+        except Exception as exc:  # pylint: disable=broad-except
+            # Keep the thread alive whatever happens; waiters fall back to querying their own server.
+            logger.warning('Could not list the servers of region %s: %s', region_name, exc)
+            os_servers = {}
+            changed = False
+        else:
+            changed = any(
+                self._fingerprint(os_servers.get(openstack_id)) != self._fingerprint(previous.get(openstack_id))
+                for openstack_id in watched
+            )
+        with self._condition:
+            self._os_servers[region_name] = os_servers
+            self._generations[region_name] += 1
+            self._condition.notify_all()
+        if changed:
+            return settings.SERVER_STATUS_WATCHER_MIN_INTERVAL
+        return min(interval * 2, settings.SERVER_STATUS_WATCHER_MAX_INTERVAL)
+
+    def _ensure_thread(self, region_name):
+        """
+        Start the polling thread of `region_name` if it isn't running. Must hold the condition lock.
+        """
+        if region_name not in self._threads:
+            thread = threading.Thread(
+                target=self._run, args=(region_name,), name='server-status-watcher-{}'.format(region_name),
+            )
+            thread.daemon = True
+            self._threads[region_name] = thread
+            thread.start()
+
+    def _run(self, region_name):
+        """
+        Poll `region_name` until nobody is waiting on it anymore.
+        """
+        interval = settings.SERVER_STATUS_WATCHER_MIN_INTERVAL
+        while True:
+            with self._condition:
+                if not self._waiters[region_name]:
+                    del self._threads[region_name]
+                    return
+            interval = self.poll(region_name, interval)
+            # "Equal jitter": wait between half and all of the interval, so that processes
+            # started at the same time don't keep polling the API in lockstep.
+            delay = interval / 2 + random.uniform(0, interval / 2)
+            with self._condition:
+                if self._condition.wait_for(lambda: region_name in self._wakeups, delay):
+                    interval = settings.SERVER_STATUS_WATCHER_MIN_INTERVAL
+
+    @staticmethod
+    def _fingerprint(os_server):
+        """
+        The parts of a Nova server that matter to the status of its Server instance.
+        """
+        if os_server is None:
+            return None
+        return os_server.status, to_json(getattr(os_server, 'addresses', None))
+
+
+status_watcher = ServerStatusWatcher()
+
+
 # Functions ###################################################################
 
 
@@ -69,7 +275,18 @@ def get_openstack_connection(region_name):
     instead of the service-specific APIs such as the Nova API below.
 
     The returned Connection object has an attribute for each available service,
-    e.g. "compute", "network", etc.
+    e.g. "compute", "network", etc. It is shared with all other callers for the
+    same region (see OpenStackClientPool).
+    """
+    return client_pool.get(
+        ('connection', region_name, settings.OPENSTACK_AUTH_URL, settings.OPENSTACK_USER),
+        lambda: _create_openstack_connection(region_name),
+    )
+
+
+def _create_openstack_connection(region_name):
+    """
+    Create a new OpenStack Connection object.
     """
     profile = Profile()
     profile.set_region(Profile.ALL, region_name)
@@ -123,6 +340,18 @@ def sync_security_group_rules(security_group, rule_definitions, network):
 
 
 def get_nova_client(region_name, api_version=2):
+    """
+    Get a python novaclient.Client() object with proper credentials
+
+    The client is shared with all other callers for the same region (see OpenStackClientPool).
+    """
+    return client_pool.get(
+        ('nova', region_name, settings.OPENSTACK_AUTH_URL, settings.OPENSTACK_USER, api_version),
+        lambda: _create_nova_client(region_name, api_version),
+    )
+
+
+def _create_nova_client(region_name, api_version):
     """
     Instantiate a python novaclient.Client() object with proper credentials
     """
@@ -183,8 +412,17 @@ def swift_service(
         region=settings.SWIFT_OPENSTACK_REGION):
     """
     Creates a swift service.
-    """
 
+    The storage URL and authentication token are shared with all other swift services created
+    with the same credentials (see OpenStackClientPool). The credentials are passed on as well,
+    so that the service can re-authenticate if the token has expired.
+    """
+    storage_url, token = client_pool.get(
+        ('swift', region, auth_url, user, tenant),
+        lambda: swift_get_auth(
+            auth_url, user, password, auth_version='2', os_options=dict(tenant_name=tenant, region_name=region),
+        ),
+    )
     return SwiftService(options=dict(
         auth_version='2',
         os_username=user,
@@ -192,6 +430,8 @@ def swift_service(
         os_tenant_name=tenant,
         os_auth_url=auth_url,
         os_region_name=region,
+        os_auth_token=token,
+        os_storage_url=storage_url,
     ))
 
 
@@ -22,11 +22,17 @@ Git repository - Helper functions
 
 # Imports #####################################################################
 
+from collections import Counter
 from contextlib import contextmanager
+import fcntl
+import hashlib
 import logging
+import os
+import re
 import shutil
 import tempfile
 
+from django.conf import settings
 import git
 
 
@@ -35,6 +41,186 @@ import git
 logger = logging.getLogger(__name__)
 
 
+# Classes #####################################################################
+
+class RepositoryCache:
+    """
+    Persistent cache of bare mirrors of git repositories, shared by all processes on the host.
+
+    Each checkout is a fresh `git worktree` of the mirror in a temporary directory, so checkouts
+    can't affect each other, and only take the time to write the files of the working tree:
+
+    * A reference that is a commit hash or a tag already present in the mirror is checked out
+      directly ("hit").
+    * Any other reference (e.g. a branch) is checked out after fetching the new commits ("fetch").
+    * A repository without a mirror is cloned into the cache first ("miss").
+
+    The mirrors live in settings.GIT_CACHE_DIR (an empty value disables the cache). Each mirror has
+    a lock file held exclusively while the mirror is cloned, fetched or gets worktrees added or
+    removed, and a "use" lock file held (shared) for as long as a checkout of it exists. When the
+    cache grows past settings.GIT_CACHE_MAX_SIZE, the least recently used mirrors that are not in
+    use are deleted. The `stats` counter records the hits, fetches and misses of this process.
+    """
+    def __init__(self):
+        self.stats = Counter()
+
+    @property
+    def cache_dir(self):
+        """
+        The directory holding the mirrors, or None if the cache is disabled.
+        """
+        return settings.GIT_CACHE_DIR or None
+
+    def get_mirror_path(self, repo_url):
+        """
+        Return the path of the mirror of the given repository.
+        """
+        return os.path.join(self.cache_dir, hashlib.sha256(repo_url.encode()).hexdigest() + '.git')
+
+    @contextmanager
+    def checkout(self, repo_url, ref='master'):
+        """
+        A context manager that yields a `Git` object for a fresh checkout of `ref`.
+        """
+        if not self.cache_dir:
+            with open_repository(repo_url, ref=ref) as repo:
+                yield repo
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        mirror_path = self.get_mirror_path(repo_url)
+        checkout_dir_path = tempfile.mkdtemp()
+        worktree_path = os.path.join(checkout_dir_path, 'repo')
+        with open(mirror_path + '.use', 'a') as use_lock_file:
+            fcntl.flock(use_lock_file, fcntl.LOCK_SH)
+            try:
+                with self._mirror_lock(mirror_path):
+                    mirror = self._update_mirror(repo_url, mirror_path, ref)
+                    commit = mirror.git.rev_parse('--verify', ref + '^{commit}')
+                    logger.info('Checking out %s (ref=%s, commit=%s) in %s...', repo_url, ref, commit, worktree_path)
+                    mirror.git.worktree('add', '--detach', worktree_path, commit)
+                # Record the last use for the LRU eviction
+                os.utime(mirror_path)
+                repo = git.repo.base.Repo(worktree_path)
+                repo.submodule_update()
+                yield repo.git
+            finally:
+                shutil.rmtree(checkout_dir_path)
+                if os.path.isdir(mirror_path):
+                    with self._mirror_lock(mirror_path):
+                        git.repo.base.Repo(mirror_path).git.worktree('prune')
+        self.evict(keep=mirror_path)
+
+    def _update_mirror(self, repo_url, mirror_path, ref):
+        """
+        Clone or fetch the mirror of `repo_url` as needed to check out `ref`, and return it.
+
+        Must hold the lock of the mirror.
+        """
+        if not os.path.isdir(mirror_path):
+            self.stats['misses'] += 1
+            logger.info('Repository cache miss: cloning %s in %s... (%s)', repo_url, mirror_path, self._stats_str())
+            # Clone next to the final location and move the clone there once complete, so that
+            # an interrupted clone never looks like a valid mirror.
+            tmp_mirror_path = mirror_path + '.tmp'
+            shutil.rmtree(tmp_mirror_path, ignore_errors=True)
+            git.repo.base.Repo.clone_from(repo_url, tmp_mirror_path, mirror=True)
+            os.rename(tmp_mirror_path, mirror_path)
+            return git.repo.base.Repo(mirror_path)
+        mirror = git.repo.base.Repo(mirror_path)
+        if self._is_immutable_ref(mirror, ref):
+            self.stats['hits'] += 1
+            logger.info('Repository cache hit: %s (ref=%s) (%s)', repo_url, ref, self._stats_str())
+        else:
+            self.stats['fetches'] += 1
+            logger.info('Repository cache fetch: updating %s (ref=%s)... (%s)', repo_url, ref, self._stats_str())
+            mirror.git.fetch('--prune', 'origin')
+        return mirror
+
+    @staticmethod
+    def _is_immutable_ref(mirror, ref):
+        """
+        Return True if `ref` is a commit hash or a tag present in the mirror, which fetching can't change.
+        """
+        if re.fullmatch('[0-9a-f]{40}', ref):
+            candidate = ref + '^{commit}'
+        else:
+            candidate = 'refs/tags/' + ref
+        try:
+            mirror.git.rev_parse('--verify', '--quiet', candidate)
+        except git.exc.GitCommandError:
+            return False
+        return True
+
+    def _stats_str(self):
+        """
+        Format the statistics of this process for logging.
+        """
+        return 'hits={hits}, fetches={fetches}, misses={misses}'.format(
+            hits=self.stats['hits'], fetches=self.stats['fetches'], misses=self.stats['misses'],
+        )
+
+    @contextmanager
+    def _mirror_lock(self, mirror_path):  # pylint: disable=no-self-use
+        """
+        Hold the exclusive lock of the given mirror.
+        """
+        with open(mirror_path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def entries(self):
+        """
+        Return a list of `(mirror_path, size, last_used)` tuples for the mirrors in the cache,
+        least recently used first.
+        """
+        entries = []
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return entries
+        for filename in os.listdir(self.cache_dir):
+            mirror_path = os.path.join(self.cache_dir, filename)
+            if not filename.endswith('.git') or not os.path.isdir(mirror_path):
+                continue
+            size = sum(
+                os.lstat(os.path.join(dir_path, name)).st_size
+                for dir_path, unused_dir_names, names in os.walk(mirror_path)
+                for name in names
+            )
+            entries.append((mirror_path, size, os.stat(mirror_path).st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, max_size=None, keep=None):
+        """
+        Delete the least recently used mirrors until the cache is no larger than `max_size` bytes
+        (by default settings.GIT_CACHE_MAX_SIZE). Mirrors with checkouts and `keep` are kept.
+
+        Returns the list of the deleted mirror paths.
+        """
+        if max_size is None:
+            max_size = settings.GIT_CACHE_MAX_SIZE
+        entries = self.entries()
+        total_size = sum(size for unused_path, size, unused_last_used in entries)
+        removed = []
+        for mirror_path, size, unused_last_used in entries:
+            if total_size <= max_size:
+                break
+            if mirror_path == keep:
+                continue
+            with open(mirror_path + '.use', 'a') as use_lock_file:
+                try:
+                    fcntl.flock(use_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                with self._mirror_lock(mirror_path):
+                    shutil.rmtree(mirror_path, ignore_errors=True)
+            logger.info('Removed repository mirror %s from the cache', mirror_path)
+            total_size -= size
+            removed.append(mirror_path)
+        return removed
+
+
+repository_cache = RepositoryCache()
+
+
 # Functions ###################################################################
 
 @contextmanager
@@ -53,3 +239,15 @@ def open_repository(repo_url, ref='master'):
     repo.submodule_update()
     yield repo.git
     shutil.rmtree(repo_dir_path)
+
+
+@contextmanager
+def open_cached_repository(repo_url, ref='master'):
+    """
+    Get a `Git` object for a checkout of the reference `ref` of a repository URL.
+
+    Like open_repository(), but the checkout is made from a local mirror of the repository kept in
+    the repository cache (see RepositoryCache), so only new commits need to be downloaded.
+    """
+    with repository_cache.checkout(repo_url, ref) as repo:
+        yield repo
@@ -241,6 +241,14 @@ app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
                 $scope.instance.log_entries.push(data.log_entry);
             }
         });
+        $scope.$on("swampdragon:object_log_lines", function (event, data) {
+            // A batch of log entries, written by a buffered log handler
+            if (data.instance_id == $scope.instance.id && !data.appserver_id) {
+                data.log_entries.forEach(function (logEntry) {
+                    $scope.instance.log_entries.push(logEntry);
+                });
+            }
+        });
 
         $scope.init();
     }
@@ -95,17 +95,28 @@ app.controller("OpenEdXAppServerDetails", ['$scope', '$state', '$stateParams', '
             });
         };
 
-        $scope.$on("swampdragon:object_log_line", function (event, data) {
+        var addLogEntries = function (data, logEntries) {
             if (!$scope.appserverLogs) {
                 return; // The App Server logs are not loaded yet, so no need to watch for log lines
             }
             if (data.appserver_id == $scope.appserver.id || ($scope.appserver.server && data.server_id == $scope.appserver.server.id)) {
-                if (data.log_entry.level == 'ERROR' || data.log_entry.level == 'CRITICAL') {
-                    $scope.appserverLogs.log_error_entries.push(data.log_entry);
-                }
-                $scope.appserverLogs.log_entries.push(data.log_entry);
+                logEntries.forEach(function (logEntry) {
+                    if (logEntry.level == 'ERROR' || logEntry.level == 'CRITICAL') {
+                        $scope.appserverLogs.log_error_entries.push(logEntry);
+                    }
+                    $scope.appserverLogs.log_entries.push(logEntry);
+                });
                 $scope.$apply();
             }
+        };
+
+        $scope.$on("swampdragon:object_log_line", function (event, data) {
+            addLogEntries(data, [data.log_entry]);
+        });
+
+        $scope.$on("swampdragon:object_log_lines", function (event, data) {
+            // A batch of log entries, written by a buffered log handler
+            addLogEntries(data, data.log_entries);
         });
 
         $scope.$on("swampdragon:openedx_appserver_update", function(event, data) {
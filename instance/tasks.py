@@ -26,16 +26,20 @@ from datetime import datetime
 import logging
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import connection
-from django.db.models import F
+from django.db.models import Count, F, Max
 from django.utils import timezone
 from huey.contrib.djhuey import crontab, db_task, db_periodic_task
+import requests
 
+from instance.models.baked_image import BakedImage, BAKED_IMAGE_KEY_FIELDS
 from instance.models.load_balancer import LoadBalancingServer
-from instance.models.log_entry import LogEntry
+from instance.models.log_entry import LogEntry, LogEntryPartition
 from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_instance import OpenEdXInstance
-from instance.utils import sufficient_time_passed
+from instance.models.server_pool import WarmPool, WarmServer
+from instance.utils import run_concurrently, sufficient_time_passed
 from pr_watch import github
 
 
@@ -53,7 +57,8 @@ def spawn_appserver(
         deactivate_old_appservers=False,
         num_attempts=1,
         success_tag=None,
-        failure_tag=None):
+        failure_tag=None,
+        skip_provisioned_mysql=False):
     """
     Create a new AppServer for an existing instance.
 
@@ -64,6 +69,7 @@ def spawn_appserver(
     Optionally retry up to 'num_attempts' times.
     Optionally tag the instance with 'success_tag' when the deployment succeeds,
     or failure_tag if it fails.
+    Optionally skip provisioning the MySQL databases if they already were.
     """
     logger.info('Retrieving instance: ID=%s', instance_ref_id)
     instance = OpenEdXInstance.objects.get(ref_set__pk=instance_ref_id)
@@ -71,7 +77,8 @@ def spawn_appserver(
     appserver = instance.spawn_appserver(
         num_attempts=num_attempts,
         success_tag=success_tag,
-        failure_tag=failure_tag
+        failure_tag=failure_tag,
+        skip_provisioned_mysql=skip_provisioned_mysql,
     )
 
     if appserver and mark_active_on_success:
@@ -108,32 +115,73 @@ def make_appserver_active(appserver_id, active=True, deactivate_others=False):
     return True
 
 
+def _shut_down_if_obsolete(instance, pr):
+    """
+    Shut down the given PR sandbox instance if its PR (`pr`, as returned by GitHub) got merged (more than) one week ago.
+    """
+    if pr['state'] == 'closed' and not instance.ref.is_archived:
+        closed_at = github.parse_date(pr['closed_at'])
+        now = datetime.now()
+        if sufficient_time_passed(closed_at, now, 7):
+            instance.logger.info("Shutting down obsolete sandbox instance")
+            instance.archive()
+
+
 @db_task()
 def shut_down_obsolete_pr_sandboxes():
     """
     Shut down instances whose PRs got merged (more than) one week ago.
+
+    The PRs of all the instances are fetched from GitHub with batched queries, then
+    up to CLEAN_UP_MAX_WORKERS instances are checked and shut down concurrently.
     """
-    for instance in OpenEdXInstance.objects.filter(watchedpullrequest__isnull=False):
-        pr = github.get_pr_info_by_number(
-            instance.watchedpullrequest.target_fork_name,
-            instance.watchedpullrequest.github_pr_number
+    instances = list(OpenEdXInstance.objects.filter(
+        watchedpullrequest__isnull=False, ref_set__is_archived=False,
+    ).select_related('watchedpullrequest'))
+    try:
+        prs = github.get_pr_info_by_numbers(
+            (instance.watchedpullrequest.target_fork_name, instance.watchedpullrequest.github_pr_number)
+            for instance in instances
         )
-        if pr['state'] == 'closed' and not instance.ref.is_archived:
-            closed_at = github.parse_date(pr['closed_at'])
-            now = datetime.now()
-            if sufficient_time_passed(closed_at, now, 7):
-                instance.logger.info("Shutting down obsolete sandbox instance")
-                instance.archive()
+    except (github.RateLimitExceeded, requests.RequestException) as err:
+        logger.warning('Could not fetch the PRs of the sandboxes to shut down: %s', str(err))
+        return
+
+    def shut_down_if_obsolete(instance):
+        """
+        Shut down the given instance if the PR it was fetched for is obsolete.
+        """
+        pr = prs.get((instance.watchedpullrequest.target_fork_name, instance.watchedpullrequest.github_pr_number))
+        if pr is None:
+            instance.logger.warning("Pull request not found on GitHub, skipping")
+            return
+        _shut_down_if_obsolete(instance, pr)
+
+    run_concurrently(
+        shut_down_if_obsolete, instances, 'Shutting down obsolete PR sandboxes', settings.CLEAN_UP_MAX_WORKERS,
+    )
+
+
+def _terminate_obsolete_appservers(instance):
+    """
+    Terminate the obsolete app servers of the given instance.
+    """
+    instance.logger.info("Terminating obsolete appservers for instance")
+    instance.terminate_obsolete_appservers()
 
 
 @db_task()
 def terminate_obsolete_appservers_all_instances():
     """
     Terminate obsolete app servers for all instances.
+
+    Up to CLEAN_UP_MAX_WORKERS instances are handled concurrently, since terminating
+    an app server can wait for up to SHUTDOWN_TIMEOUT seconds.
     """
-    for instance in OpenEdXInstance.objects.all():
-        instance.logger.info("Terminating obsolete appservers for instance")
-        instance.terminate_obsolete_appservers()
+    run_concurrently(
+        _terminate_obsolete_appservers, OpenEdXInstance.objects.all(), 'Terminating obsolete appservers',
+        settings.CLEAN_UP_MAX_WORKERS,
+    )
 
 
 @db_periodic_task(crontab(day='*/1', hour='1', minute='0'))
@@ -161,16 +209,96 @@ def reconfigure_dirty_load_balancers():
         load_balancer.reconfigure(mark_dirty=False)
 
 
+@db_periodic_task(crontab(minute='*/5'))
+def refill_warm_pools():
+    """
+    Keep the warm pools of booted servers filled, and recycle their expired servers.
+
+    Servers take a few minutes to boot, so runs that find the previous one still in progress are skipped.
+
+    This task runs every 5 minutes.
+    """
+    pools = WarmPool.get_all()
+    if not pools:
+        return
+    lock = cache.lock('refill_warm_pools', timeout=2 * settings.OPENSTACK_WARM_POOL_BOOT_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        logger.info('Warm pools are already being refilled')
+        return
+    try:
+        WarmServer.objects.terminate_orphans()
+        for pool in pools:
+            WarmServer.objects.refill(pool)
+            logger.info('Warm pool of %s: %s', pool.openstack_region, pool.get_stats())
+    finally:
+        lock.release()
+
+
+@db_task()
+def bake_image(baked_image_id, appserver_id):
+    """
+    Bake the given image, using the configuration of the given AppServer.
+    """
+    baked_image = BakedImage.objects.get(pk=baked_image_id)
+    baked_image.bake(OpenEdXAppServer.objects.get(pk=appserver_id))
+
+
+@db_periodic_task(crontab(minute='30'))
+def bake_images():
+    """
+    Start baking images for the releases and configurations used by at least
+    BAKED_IMAGE_MIN_APPSERVERS AppServers over the last week that didn't boot from a baked image.
+
+    This task runs every hour.
+    """
+    if not settings.BAKED_IMAGES_ENABLED:
+        return
+    candidates = OpenEdXAppServer.objects.filter(
+        created__gte=timezone.now() - timezone.timedelta(days=7),
+        baked_image__isnull=True,
+    ).values(
+        'openstack_server_base_image', *BAKED_IMAGE_KEY_FIELDS
+    ).annotate(
+        appserver_count=Count('id'), latest_appserver_id=Max('id'),
+    ).filter(appserver_count__gte=settings.BAKED_IMAGE_MIN_APPSERVERS)
+    for candidate in candidates:
+        appserver = OpenEdXAppServer.objects.get(pk=candidate['latest_appserver_id'])
+        baked_image = BakedImage.objects.start_baking(appserver)
+        if baked_image:
+            logger.info('Baking image %s for %s', baked_image.image_name, baked_image)
+            bake_image(baked_image.pk, appserver.pk)
+
+
+@db_periodic_task(crontab(day='*/1', hour='2', minute='0'))
+def delete_unused_baked_images():
+    """
+    Delete the baked images that expired or aren't used anymore.
+
+    This task runs every day.
+    """
+    for baked_image in BakedImage.objects.collect_garbage():
+        logger.info('Deleted baked image %s, which saved %.0fs of deployment', baked_image, baked_image.time_saved)
+
+
 @db_periodic_task(crontab(day='*/1', hour='0', minute='0'))
 def delete_old_logs():
     """
     Delete old log entries.
 
-    For performance reasons, we execute raw SQL against the LogEntry model's table.
+    When the LogEntry table is partitioned, the upcoming partitions are created, and the partitions
+    only holding old log entries are dropped, so log entries may be kept up to a month longer than
+    LOG_DELETION_DAYS.
+
+    Otherwise, for performance reasons, we execute raw SQL against the LogEntry model's table.
 
     This task runs every day.
     """
     cutoff = timezone.now() - timezone.timedelta(days=settings.LOG_DELETION_DAYS)
+    if LogEntryPartition.is_enabled():
+        LogEntryPartition.create_upcoming()
+        LogEntryPartition.drop_expired(cutoff)
+        return
+
     query = (
         "DELETE FROM {table} "
         "WHERE {table}.created < '{cutoff}'::timestamptz".format(
@@ -22,6 +22,8 @@ Views - Tests
 
 # Imports #####################################################################
 
+import json
+
 import ddt
 from rest_framework import status
 
@@ -184,6 +186,53 @@ class InstanceAPITestCase(APITestCase):
             self.assertEqual(expected_entry['text'].format(inst_id=instance.ref.pk), log_entry['text'])
             self.assertEqual(expected_entry['text'].format(inst_id=instance.ref.pk), log_entry['text'])
 
+    def test_get_log_entries_page(self):
+        """
+        GET - Pages of log entries, navigated with cursors
+        """
+        self.api_client.login(username='user3', password='pass')
+        instance = OpenEdXInstanceFactory(name="Test!")
+        for i in range(5):
+            instance.logger.info("info {}".format(i))
+        instance.logger.error("error")
+
+        def get_page(**params):
+            """ Get a page of log entries, decoding the streamed response """
+            response = self.api_client.get('/api/v1/instance/{pk}/logs/'.format(pk=instance.ref.pk), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return json.loads(b''.join(response.streaming_content).decode())
+
+        page = get_page(limit=2)
+        self.assertEqual([entry['text'][-6:] for entry in page['log_entries']], ['info 4', ' error'])
+        page = get_page(limit=3, before=page['previous_cursor'])
+        self.assertEqual([entry['text'][-6:] for entry in page['log_entries']], ['info 1', 'info 2', 'info 3'])
+        page = get_page(after=page['next_cursor'])
+        self.assertEqual([entry['text'][-6:] for entry in page['log_entries']], ['info 4', ' error'])
+
+        # Polling past the last entry returns no entries, and the same cursor
+        next_page = get_page(after=page['next_cursor'])
+        self.assertEqual(next_page['log_entries'], [])
+        self.assertEqual(next_page['next_cursor'], page['next_cursor'])
+
+        page = get_page(level='error')
+        self.assertEqual([entry['level'] for entry in page['log_entries']], ['ERROR'])
+
+    @ddt.data(
+        {'after': 'yesterday'},
+        {'after': '2015-08-05T18:07:00Z,1', 'before': '2015-08-05T18:07:00Z,2'},
+        {'level': 'verbose'},
+        {'limit': 'many'},
+        {'limit': 0},
+    )
+    def test_get_log_entries_page_invalid(self, params):
+        """
+        GET - Invalid log entries page parameters
+        """
+        self.api_client.login(username='user3', password='pass')
+        instance = OpenEdXInstanceFactory()
+        response = self.api_client.get('/api/v1/instance/{pk}/logs/'.format(pk=instance.ref.pk), params)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     @ddt.data(
         (None, 'Authentication credentials were not provided.'),
         ('user1', 'You do not have permission to perform this action.'),
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Provisioning timings views - Tests
+"""
+
+# Imports #####################################################################
+
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework import status
+
+from instance.models.provisioning_span import ProvisioningSpan
+from instance.tests.api.base import APITestCase
+from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
+
+
+# Tests #######################################################################
+
+class ProvisioningTimingsAPITestCase(APITestCase):
+    """
+    Test cases for the provisioning timings API calls
+    """
+    def setUp(self):
+        super().setUp()
+        instance_ref = OpenEdXInstanceFactory().ref
+        for phase, duration in (('boot', 60), ('boot', 90), ('playbook:playbooks/edx_sandbox.yml', 3000)):
+            ProvisioningSpan.objects.add(instance_ref, phase, duration)
+        old_span = ProvisioningSpan.objects.add(instance_ref, 'boot', 600)
+        old_span.started = timezone.now() - timedelta(days=10)
+        old_span.save()
+
+    def test_get_unauthenticated(self):
+        """
+        GET - Require to be authenticated
+        """
+        response = self.api_client.get('/api/v1/provisioning_timings/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_non_superuser(self):
+        """
+        GET - Test with an authenticated user without superuser privileges.
+        """
+        self.api_client.login(username='user1', password='pass')
+        response = self.api_client.get('/api/v1/provisioning_timings/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_get_superuser(self):
+        """
+        GET - The timings of each phase are listed.
+        """
+        self.api_client.login(username='user3', password='pass')
+        response = self.api_client.get('/api/v1/provisioning_timings/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'phase': 'boot', 'count': 3, 'failed': 0, 'p50': 90, 'p95': 600},
+            {'phase': 'playbook:playbooks/edx_sandbox.yml', 'count': 1, 'failed': 0, 'p50': 3000, 'p95': 3000},
+        ])
+
+    def test_get_filtered(self):
+        """
+        GET - The spans can be filtered by age and by phase.
+        """
+        self.api_client.login(username='user3', password='pass')
+        response = self.api_client.get('/api/v1/provisioning_timings/?days=7&phase=boot')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{'phase': 'boot', 'count': 2, 'failed': 0, 'p50': 60, 'p95': 90}])
+
+        response = self.api_client.get('/api/v1/provisioning_timings/?days=week')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Fake implementation of the RabbitMQ management API, served over HTTP on localhost.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from socketserver import ThreadingMixIn
+import threading
+import urllib.parse
+
+
+class FakeRabbitMQRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for FakeRabbitMQServer.
+
+    HTTP/1.1 is used so that clients can keep connections alive between requests.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        """
+        Count the connections opened by clients.
+        """
+        super().setup()
+        self.server.connection_count += 1
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """
+        Don't log requests to stderr.
+        """
+
+    def _read_json(self):
+        """
+        Return the decoded JSON body of the request, if any.
+        """
+        length = int(self.headers.get('content-length') or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length).decode())
+
+    def _respond(self, status):
+        """
+        Send an empty JSON response.
+        """
+        body = b'{}'
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        """
+        Record the request and apply it to the server state.
+        """
+        path = urllib.parse.urlparse(self.path).path
+        args = [urllib.parse.unquote(arg) for arg in path.split('/')[2:]]
+        data = self._read_json()
+        self.server.requests.append((self.command, args))
+        self._respond(self.server.apply(self.command, args, data))
+
+    do_GET = do_PUT = do_POST = do_DELETE = _handle
+
+
+class FakeRabbitMQServer(ThreadingMixIn, HTTPServer):
+    """
+    A fake implementation of the RabbitMQ management API.
+
+    The fake server keeps track of vhosts, users and permissions, as well as the requests
+    and connections it receives.  Use it as a context manager to serve in a background thread.
+    Each connection is handled in its own thread, so that connections kept alive by clients
+    don't block the server.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeRabbitMQRequestHandler)
+        self.api_url = 'http://127.0.0.1:{port}'.format(port=self.server_address[1])
+        self.vhosts = set()
+        self.users = {}
+        self.permissions = {}
+        self.requests = []
+        self.connection_count = 0
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def reset_counters(self):
+        """
+        Forget the requests and connections received so far.
+        """
+        self.requests = []
+        self.connection_count = 0
+
+    def apply(self, method, args, data):
+        """
+        Apply the given request, and return the HTTP status of the response.
+        """
+        handlers = {
+            ('POST', 'definitions'): self._import_definitions,
+            ('PUT', 'vhosts'): self._put_vhost,
+            ('DELETE', 'vhosts'): self._delete_vhost,
+            ('PUT', 'users'): self._put_user,
+            ('DELETE', 'users'): self._delete_user,
+            ('POST', 'users'): self._bulk_delete_users,
+            ('PUT', 'permissions'): self._put_permission,
+        }
+        handler = handlers.get((method, args[0] if args else None))
+        if handler is None:
+            return 405
+        try:
+            handler(data, *args[1:])
+        except KeyError:
+            return 404
+        return 200
+
+    def _import_definitions(self, data):
+        """
+        Create the vhosts, users and permissions of a definitions import.
+        """
+        for vhost in data.get('vhosts', []):
+            self._put_vhost(None, vhost['name'])
+        for user in data.get('users', []):
+            self._put_user(user, user['name'])
+        for permission in data.get('permissions', []):
+            self._put_permission(permission, permission['vhost'], permission['user'])
+
+    def _put_vhost(self, data, vhost):  # pylint: disable=unused-argument
+        """
+        Create a vhost.
+        """
+        self.vhosts.add(vhost)
+
+    def _delete_vhost(self, data, vhost):  # pylint: disable=unused-argument
+        """
+        Delete a vhost and its permissions.
+        """
+        self.vhosts.remove(vhost)
+        for key in [key for key in self.permissions if key[0] == vhost]:
+            del self.permissions[key]
+
+    def _put_user(self, data, user):
+        """
+        Create or update a user.
+        """
+        self.users[user] = data
+
+    def _delete_user(self, data, user):  # pylint: disable=unused-argument
+        """
+        Delete a user.
+        """
+        del self.users[user]
+
+    def _bulk_delete_users(self, data, action):
+        """
+        Delete several users at once.  Users that don't exist are ignored, like the actual API does.
+        """
+        if action != 'bulk-delete':
+            raise KeyError(action)
+        for user in data['users']:
+            self.users.pop(user, None)
+
+    def _put_permission(self, data, vhost, user):
+        """
+        Set the permissions of a user on a vhost.
+        """
+        if vhost not in self.vhosts or user not in self.users:
+            raise KeyError(vhost, user)
+        self.permissions[(vhost, user)] = data
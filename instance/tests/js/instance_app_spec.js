@@ -190,6 +190,20 @@ describe('Instance app', function () {
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.instance.log_entries.push).toHaveBeenCalledWith(logEntry);
             });
+            it("update the instance's log entries with batches of log entries", function() {
+                const logEntries = [
+                    {created: new Date(), level: "INFO", text: "A long time ago"},
+                    {created: new Date(), level: "INFO", text: "in a galaxy far, far away"},
+                ];
+                swampdragon.sendChannelMessage({
+                    type: "object_log_lines",
+                    instance_id: instanceDetail.id,
+                    log_entries: logEntries,
+                });
+                expect($scope.refresh).not.toHaveBeenCalled();
+                expect($scope.instance.log_entries.push).toHaveBeenCalledWith(logEntries[0]);
+                expect($scope.instance.log_entries.push).toHaveBeenCalledWith(logEntries[1]);
+            });
             it("do not update the instance's log entries for other instance logs", function() {
                 swampdragon.sendChannelMessage({
                     type: "object_log_line",
@@ -437,6 +451,22 @@ describe('Instance app', function () {
                 expect($scope.appserverLogs.log_entries.push).toHaveBeenCalledWith(logEntry);
                 expect($scope.appserverLogs.log_error_entries.push).toHaveBeenCalledWith(logEntry);
             });
+            it("update the AppServer's log entries with batches of AppServer logs", function() {
+                const logEntries = [
+                    {created: new Date(), level: "INFO", text: "A long time ago"},
+                    {created: new Date(), level: "ERROR", text: "Something went wrong"},
+                ];
+                swampdragon.sendChannelMessage({
+                    type: "object_log_lines",
+                    appserver_id: appServerDetail.id,
+                    log_entries: logEntries,
+                });
+                expect($scope.refresh).not.toHaveBeenCalled();
+                expect($scope.appserverLogs.log_entries.push).toHaveBeenCalledWith(logEntries[0]);
+                expect($scope.appserverLogs.log_entries.push).toHaveBeenCalledWith(logEntries[1]);
+                expect($scope.appserverLogs.log_error_entries.push).toHaveBeenCalledWith(logEntries[1]);
+                expect($scope.appserverLogs.log_error_entries.push).not.toHaveBeenCalledWith(logEntries[0]);
+            });
             it("do not update the AppServer's log entries for other AppServer logs", function() {
                 swampdragon.sendChannelMessage({
                     type: "object_log_line",
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance - baked_images_report unit tests
+"""
+
+# Imports #####################################################################
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from instance.models.baked_image import BakedImage
+
+
+# Tests #######################################################################
+
+class BakedImagesReportTestCase(TestCase):
+    """
+    Test cases for the `baked_images_report` management command.
+    """
+    def setUp(self):
+        for status, use_count in ((BakedImage.READY, 3), (BakedImage.DELETED, 6)):
+            BakedImage.objects.create(
+                openstack_region='region1',
+                base_image={'name': 'xenial'},
+                openedx_release='open-release/ginkgo.1',
+                configuration_source_repo_url='https://github.com/edx/configuration.git',
+                configuration_version='open-release/ginkgo.1',
+                edx_platform_repository_url='https://github.com/edx/edx-platform.git',
+                edx_platform_commit='abc123',
+                status=status,
+                bake_duration=600,
+                use_count=use_count,
+            )
+
+    def test_report(self):
+        """
+        The usable images are listed with the time they saved.
+        """
+        out = StringIO()
+        call_command('baked_images_report', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertRegex(lines[0], r'open-release/ginkgo.1 / open-release/ginkgo.1 / abc123 \(ready, .*\): '
+                                   r'booted 3 AppServer\(s\), 1800s saved$')
+        self.assertEqual(lines[1], '3 AppServer(s) booted from baked images, 0.5h saved.')
+
+    def test_report_all(self):
+        """
+        Deleted images are included with --all.
+        """
+        out = StringIO()
+        call_command('baked_images_report', '--all', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[2], '9 AppServer(s) booted from baked images, 1.5h saved.')
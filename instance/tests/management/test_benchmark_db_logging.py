@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance - benchmark_db_logging unit tests
+"""
+
+# Imports #####################################################################
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from instance.models.log_entry import LogEntry
+from instance.models.server import OpenStackServer
+
+
+# Tests #######################################################################
+
+class BenchmarkDBLoggingTestCase(TestCase):
+    """
+    Test cases for the `benchmark_db_logging` management command.
+    """
+    def test_benchmark(self):
+        """
+        Verify that the command reports the throughput of both handler modes and doesn't leave any data behind.
+        """
+        log_entry_count = LogEntry.objects.count()
+        out = StringIO()
+        call_command('benchmark_db_logging', lines=20, stdout=out)
+
+        self.assertIn('Unbuffered:', out.getvalue())
+        self.assertIn('Buffered:', out.getvalue())
+        self.assertIn('(40 log entries written)', out.getvalue())
+        self.assertFalse(OpenStackServer.objects.filter(name_prefix='log-benchmark').exists())
+        self.assertEqual(LogEntry.objects.count(), log_entry_count)
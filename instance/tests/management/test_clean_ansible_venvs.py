@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance - clean_ansible_venvs unit tests
+"""
+
+# Imports #####################################################################
+
+import os
+import shutil
+from tempfile import mkdtemp
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from instance.ansible import string_to_file_path, venv_cache
+
+
+# Tests #######################################################################
+
+@patch(
+    'instance.ansible.render_venv_creation_command',
+    side_effect=lambda requirements_path, venv_path: 'mkdir -p {0} && head -c 1000 /dev/zero > {0}/python'.format(
+        venv_path
+    ),
+)
+class CleanAnsibleVenvsTestCase(TestCase):
+    """
+    Test cases for the `clean_ansible_venvs` management command.
+    """
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def build_venvs(self, count):
+        """
+        Build `count` fake virtualenvs in the cache.
+        """
+        for version in range(count):
+            requirements_path = string_to_file_path('ansible=={}\n'.format(version))
+            try:
+                with venv_cache.venv(requirements_path):
+                    pass
+            finally:
+                os.remove(requirements_path)
+
+    def test_clean(self, mock_render):
+        """
+        Verify that the command deletes virtualenvs until the cache fits in its max size.
+        """
+        with override_settings(ANSIBLE_VENV_CACHE_DIR=self.cache_dir, ANSIBLE_VENV_CACHE_MAX_SIZE=10000):
+            self.build_venvs(3)
+            out = StringIO()
+            with override_settings(ANSIBLE_VENV_CACHE_MAX_SIZE=1500):
+                call_command('clean_ansible_venvs', stdout=out)
+            self.assertIn('2 virtualenv(s) deleted, 1 virtualenv(s) left', out.getvalue())
+
+            out = StringIO()
+            call_command('clean_ansible_venvs', all=True, stdout=out)
+            self.assertIn('1 virtualenv(s) deleted, 0 virtualenv(s) left', out.getvalue())
+            self.assertEqual(venv_cache.entries(), [])
+
+    @override_settings(ANSIBLE_VENV_CACHE_DIR='')
+    def test_cache_disabled(self, mock_render):
+        """
+        Verify that the command doesn't do anything when the cache is disabled.
+        """
+        out = StringIO()
+        call_command('clean_ansible_venvs', stdout=out)
+        self.assertIn('The Ansible virtualenv cache is disabled.', out.getvalue())
@@ -53,8 +53,9 @@ class MigrateEphemeralTestCase(TestCase):
             # Field already removed from database
             pass
 
+    @patch('instance.management.commands.migrate_ephemeral.provision_mysql_instances')
     @patch('instance.tasks.spawn_appserver')
-    def test_migrate(self, mock_spawn_appserver):
+    def test_migrate(self, mock_spawn_appserver, mock_provision_mysql_instances):
         """
         Verify that the command correctly migrate an instance to use external databases.
         """
@@ -75,6 +76,8 @@ class MigrateEphemeralTestCase(TestCase):
                 self.assertTrue(expected <= actual)
 
             self.assertTrue(mock_spawn_appserver.called)
+            self.assertTrue(mock_spawn_appserver.call_args[1]['skip_provisioned_mysql'])
+            self.assertEqual(mock_provision_mysql_instances.call_count, 1)
         except TypeError:
             # Field already removed from database
             pass
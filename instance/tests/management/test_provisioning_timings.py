@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance - provisioning_timings unit tests
+"""
+
+# Imports #####################################################################
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from instance.models.provisioning_span import ProvisioningSpan
+from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
+
+
+# Tests #######################################################################
+
+class ProvisioningTimingsTestCase(TestCase):
+    """
+    Test cases for the `provisioning_timings` management command.
+    """
+    def setUp(self):
+        instance_ref = OpenEdXInstanceFactory().ref
+        for phase, duration, success in (('boot', 60, True), ('boot', 90, True), ('dns', 2, False)):
+            ProvisioningSpan.objects.add(instance_ref, phase, duration, success=success)
+
+    def test_report(self):
+        """
+        Each phase is listed with its percentiles.
+        """
+        out = StringIO()
+        call_command('provisioning_timings', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'boot: 2 run(s), 0 failed, p50 60.0s, p95 90.0s',
+            'dns: 1 run(s), 1 failed, p50 -, p95 -',
+        ])
+
+    def test_report_phase(self):
+        """
+        The report can be limited to some phases.
+        """
+        out = StringIO()
+        call_command('provisioning_timings', '--phase', 'dns', '--days', '1', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['dns: 1 run(s), 1 failed, p50 -, p95 -'])
+
+    def test_no_spans(self):
+        """
+        An empty report is explicit.
+        """
+        ProvisioningSpan.objects.all().delete()
+        out = StringIO()
+        call_command('provisioning_timings', stdout=out)
+        self.assertEqual(out.getvalue(), 'No provisioning spans recorded.\n')
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance - slowest_ansible_tasks unit tests
+"""
+
+# Imports #####################################################################
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from instance.tests.models.factories.openedx_appserver import make_test_appserver
+from instance.tests.models.test_ansible_task_timing import add_task_timings
+
+
+# Tests #######################################################################
+
+class SlowestAnsibleTasksTestCase(TestCase):
+    """
+    Test cases for the `slowest_ansible_tasks` management command.
+    """
+    def test_report(self):
+        """
+        The slowest tasks are listed first.
+        """
+        add_task_timings(make_test_appserver(), [
+            ('common', 'Install packages', 300, False),
+            ('edxapp', 'Compile assets', 600, False),
+            (None, 'Gathering Facts', 5, False),
+        ])
+        out = StringIO()
+        call_command('slowest_ansible_tasks', '--top', '2', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            '600s in 1 run(s), 600.0s average, 600.0s longest: edxapp : Compile assets',
+            '300s in 1 run(s), 300.0s average, 300.0s longest: common : Install packages',
+        ])
+
+        out = StringIO()
+        call_command('slowest_ansible_tasks', '--by-role', stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[-1], '5s in 1 run(s), 5.0s average, 5.0s longest: (no role)')
+
+    def test_no_timings(self):
+        """
+        An empty report is explicit.
+        """
+        out = StringIO()
+        call_command('slowest_ansible_tasks', stdout=out)
+        self.assertEqual(out.getvalue(), 'No Ansible task timings recorded.\n')
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance - update_log_partitions unit tests
+"""
+
+# Imports #####################################################################
+
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from instance.models.log_entry import LogEntryPartition
+
+
+# Tests #######################################################################
+
+class UpdateLogPartitionsTestCase(TestCase):
+    """
+    Test cases for the `update_log_partitions` management command.
+    """
+    @patch('instance.models.log_entry.LogEntryPartition.is_enabled', return_value=False)
+    def test_not_partitioned(self, mock_is_enabled):
+        """
+        Nothing is done if the LogEntry table isn't partitioned.
+        """
+        out = StringIO()
+        call_command('update_log_partitions', stdout=out)
+        self.assertEqual(out.getvalue(), 'The LogEntry table is not partitioned.\n')
+
+    def test_create_partitions(self):
+        """
+        The partitions of the upcoming months are created.
+        """
+        if not LogEntryPartition.is_enabled():
+            self.skipTest('The LogEntry table is not partitioned')
+        with self.settings(LOG_PARTITION_MONTHS_AHEAD=6):
+            out = StringIO()
+            call_command('update_log_partitions', '--keep-expired', stdout=out)
+        last = LogEntryPartition.for_month(timezone.now())
+        for dummy in range(6):
+            last = LogEntryPartition.for_month(last.end)
+        partitions = LogEntryPartition.get_all()
+        self.assertEqual(partitions[-1], last)
+        self.assertIn('Created {}\n'.format(partitions[-1].name), out.getvalue())
+        self.assertTrue(out.getvalue().endswith(
+            '{} partition(s), up to {:%Y-%m-%d}.\n'.format(len(partitions), partitions[-1].end)
+        ))
@@ -37,6 +37,7 @@ from instance.tests.utils import skip_unless_consul_running
 
 
 @skip_unless_consul_running()
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class UpdateMetadataTestCase(TestCase):
     """
     Test cases for the `update_metadata` management command.
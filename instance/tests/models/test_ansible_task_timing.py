@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+AnsibleTaskTiming model - Tests
+"""
+
+# Imports #####################################################################
+
+from datetime import timedelta
+
+from django.utils import timezone
+
+from instance.ansible import TaskTiming
+from instance.models.ansible_task_timing import AnsibleTaskTiming
+from instance.tests.base import TestCase
+from instance.tests.models.factories.openedx_appserver import make_test_appserver
+
+
+# Functions ###################################################################
+
+def add_task_timings(appserver, timings, started=None):
+    """
+    Store the timings of the given (role, task, duration, skipped) tasks of a deployment of the AppServer
+    """
+    started = started or timezone.now()
+    AnsibleTaskTiming.objects.add(appserver, 'playbooks/edx_sandbox.yml', [
+        TaskTiming(role=role, task=task, host='1.2.3.4', started=started, duration=duration, changed=True,
+                   failed=False, skipped=skipped)
+        for role, task, duration, skipped in timings
+    ])
+
+
+# Tests #######################################################################
+
+class AnsibleTaskTimingTestCase(TestCase):
+    """
+    Test cases for the AnsibleTaskTiming model
+    """
+    def setUp(self):
+        super().setUp()
+        self.old_appserver = make_test_appserver()
+        add_task_timings(self.old_appserver, [
+            ('edxapp', 'Compile assets', 1200, False),
+        ], started=timezone.now() - timedelta(days=2))
+        self.appserver = make_test_appserver(self.old_appserver.instance)
+        add_task_timings(self.appserver, [
+            ('edxapp', 'Compile assets', 600, False),
+            ('edxapp', 'Install requirements', 900, False),
+            ('common', 'Install packages', 300, False),
+            ('common', 'Install packages', 50, True),
+            (None, 'Gathering Facts', 5, False),
+        ])
+
+    def test_slowest_tasks(self):
+        """
+        The tasks are ordered by their total duration, and the skipped runs are ignored.
+        """
+        slowest = AnsibleTaskTiming.objects.slowest(3)
+        self.assertEqual(
+            [(entry['role'], entry['task'], entry['runs'], entry['total'], entry['longest']) for entry in slowest],
+            [
+                ('edxapp', 'Compile assets', 2, 1800, 1200),
+                ('edxapp', 'Install requirements', 1, 900, 900),
+                ('common', 'Install packages', 1, 300, 300),
+            ],
+        )
+        self.assertEqual(slowest[0]['average'], 900)
+
+    def test_slowest_roles(self):
+        """
+        The durations of the tasks can be aggregated by role.
+        """
+        self.assertEqual(
+            [(entry['role'], entry['runs'], entry['total']) for entry in AnsibleTaskTiming.objects.slowest(5, True)],
+            [('edxapp', 3, 2700), ('common', 1, 300), (None, 1, 5)],
+        )
+
+    def test_of_last_deploys(self):
+        """
+        The timings can be limited to the last deployed AppServers.
+        """
+        timings = AnsibleTaskTiming.objects.of_last_deploys(1)
+        self.assertEqual(set(timings.values_list('appserver', flat=True)), {self.appserver.pk})
+        self.assertEqual(AnsibleTaskTiming.objects.of_last_deploys(2).count(), 6)
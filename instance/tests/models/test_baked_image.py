@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+BakedImage model - Tests
+"""
+
+# Imports #####################################################################
+
+from unittest.mock import patch, PropertyMock
+
+from django.test import override_settings
+from django.utils import timezone
+from freezegun import freeze_time
+
+from instance.models.baked_image import BakedImage, BAKED_IMAGE_KEY_FIELDS
+from instance.models.server import OpenStackServer
+from instance.tests.base import TestCase
+from instance.tests.models.factories.openedx_appserver import make_test_appserver
+
+
+# Tests #######################################################################
+
+@override_settings(
+    BAKED_IMAGE_MAX_AGE_DAYS=14, BAKED_IMAGE_UNUSED_DAYS=3, BAKED_IMAGE_FAILURE_BACKOFF_HOURS=24,
+    BAKED_IMAGE_ANSIBLE_TAGS='install:base',
+)
+class BakedImageTestCase(TestCase):
+    """
+    Test cases for the BakedImage model
+    """
+    def setUp(self):
+        super().setUp()
+        self.appserver = make_test_appserver()
+
+    def make_baked_image(self, status=BakedImage.READY, **kwargs):
+        """
+        Create an image baked for the configuration of self.appserver
+        """
+        fields = dict(
+            openstack_region=self.appserver.instance.openstack_region,
+            base_image=self.appserver.openstack_server_base_image,
+            openstack_image_id='image-id',
+            status=status,
+            bake_duration=600,
+            **{field: getattr(self.appserver, field) for field in BAKED_IMAGE_KEY_FIELDS}
+        )
+        fields.update(kwargs)
+        return BakedImage.objects.create(**fields)
+
+    def test_get_for_appserver(self):
+        """
+        AppServers get the newest usable image baked for their release and configuration
+        """
+        with freeze_time(timezone.now() - timezone.timedelta(days=15)):
+            self.make_baked_image(openstack_image_id='expired')
+        self.make_baked_image(openstack_image_id='baking', status=BakedImage.BAKING)
+        self.make_baked_image(openstack_image_id='other-commit', edx_platform_commit='other')
+        self.make_baked_image(openstack_image_id='other-image', base_image={'name': 'other'})
+        self.assertIsNone(BakedImage.objects.get_for_appserver(self.appserver))
+
+        with freeze_time(timezone.now() - timezone.timedelta(days=1)):
+            self.make_baked_image(openstack_image_id='old')
+        image = self.make_baked_image(openstack_image_id='new')
+        self.assertEqual(BakedImage.objects.get_for_appserver(self.appserver), image)
+        self.assertEqual(image.image_selector, {'id': 'new'})
+
+    def test_start_baking(self):
+        """
+        Only one image is baked at a time for a release and configuration
+        """
+        with freeze_time(timezone.now() - timezone.timedelta(hours=25)):
+            self.make_baked_image(status=BakedImage.FAILED)
+        image = BakedImage.objects.start_baking(self.appserver)
+        self.assertEqual(image.status, BakedImage.BAKING)
+        self.assertEqual(image.edx_platform_commit, self.appserver.edx_platform_commit)
+        self.assertIsNone(BakedImage.objects.start_baking(self.appserver))
+        image.status = BakedImage.READY
+        image.save()
+        self.assertIsNone(BakedImage.objects.start_baking(self.appserver))
+
+    def test_start_baking_after_failure(self):
+        """
+        No image is baked for a release and configuration for BAKED_IMAGE_FAILURE_BACKOFF_HOURS after a failure
+        """
+        self.make_baked_image(status=BakedImage.FAILED)
+        self.assertIsNone(BakedImage.objects.start_baking(self.appserver))
+        with freeze_time(timezone.now() + timezone.timedelta(hours=25)):
+            self.assertEqual(BakedImage.objects.start_baking(self.appserver).status, BakedImage.BAKING)
+
+    @override_settings(BAKED_IMAGE_SNAPSHOT_TIMEOUT=3600, ANSIBLE_GLOBAL_TIMEOUT=3600)
+    def test_start_baking_abandoned(self):
+        """
+        An image that has been baking for longer than baking can take doesn't prevent baking a new one
+        """
+        with freeze_time(timezone.now() - timezone.timedelta(hours=3)):
+            abandoned = self.make_baked_image(status=BakedImage.BAKING, openstack_image_id='')
+        self.assertEqual(list(BakedImage.objects.abandoned()), [abandoned])
+        self.assertEqual(BakedImage.objects.start_baking(self.appserver).status, BakedImage.BAKING)
+
+    @override_settings(BAKED_IMAGE_SNAPSHOT_TIMEOUT=3600, ANSIBLE_GLOBAL_TIMEOUT=3600)
+    @patch('instance.models.baked_image.openstack_utils.get_nova_client')
+    def test_collect_garbage_abandoned(self, mock_get_nova_client):
+        """
+        Abandoned images are marked as failed, and their snapshot is deleted
+        """
+        with freeze_time(timezone.now() - timezone.timedelta(hours=3)):
+            abandoned = self.make_baked_image(status=BakedImage.BAKING, openstack_image_id='abandoned')
+        baking = self.make_baked_image(status=BakedImage.BAKING, openstack_image_id='')
+
+        self.assertEqual(BakedImage.objects.collect_garbage(), [])
+        abandoned.refresh_from_db()
+        baking.refresh_from_db()
+        self.assertEqual(abandoned.status, BakedImage.FAILED)
+        self.assertEqual(baking.status, BakedImage.BAKING)
+        mock_get_nova_client.return_value.images.delete.assert_called_once_with('abandoned')
+
+    @patch('instance.models.baked_image.openstack_utils.get_nova_client')
+    def test_collect_garbage(self, mock_get_nova_client):
+        """
+        Expired images, and images that weren't used for a while, are deleted
+        """
+        with freeze_time(timezone.now() - timezone.timedelta(days=15)):
+            expired = self.make_baked_image(openstack_image_id='expired')
+        with freeze_time(timezone.now() - timezone.timedelta(days=5)):
+            unused = self.make_baked_image(openstack_image_id='unused')
+            used = self.make_baked_image(openstack_image_id='used')
+        used.record_use()
+        self.make_baked_image(openstack_image_id='new')
+
+        deleted = BakedImage.objects.collect_garbage()
+        self.assertCountEqual(deleted, [expired, unused])
+        self.assertCountEqual(
+            [call[0][0] for call in mock_get_nova_client.return_value.images.delete.call_args_list],
+            ['expired', 'unused'],
+        )
+        self.assertEqual(
+            set(BakedImage.objects.filter(status=BakedImage.DELETED).values_list('openstack_image_id', flat=True)),
+            {'expired', 'unused'},
+        )
+
+    @patch('instance.models.baked_image.ansible.capture_playbook_output', return_value=0)
+    @patch('instance.models.baked_image.open_cached_repository')
+    @patch('instance.models.server.openstack_utils.get_nova_client')
+    @patch('instance.models.baked_image.OpenStackServer.public_ip', new_callable=PropertyMock, return_value='192.0.2.1')
+    @patch('instance.models.baked_image.OpenStackServer.terminate')
+    @patch('instance.models.baked_image.OpenStackServer.sleep_until')
+    @patch('instance.models.baked_image.OpenStackServer.start')
+    def test_bake(self, mock_start, mock_sleep_until, mock_terminate, mock_public_ip, mock_get_nova_client,
+                  mock_open_repo, mock_capture_playbook_output):
+        """
+        Baking runs the tagged tasks of the configuration playbook on a reference server, and snapshots it
+        """
+        nova = mock_get_nova_client.return_value
+        nova.servers.create_image.return_value = 'snapshot-id'
+        nova.images.get.return_value.status = 'ACTIVE'
+        mock_open_repo.return_value.__enter__.return_value.working_dir = '/configuration'
+        image = BakedImage.objects.start_baking(self.appserver)
+
+        self.assertTrue(image.bake(self.appserver))
+        image.refresh_from_db()
+        self.assertEqual(image.status, BakedImage.READY)
+        self.assertEqual(image.openstack_image_id, 'snapshot-id')
+        self.assertIsNotNone(image.bake_duration)
+        self.assertEqual(mock_start.call_args[1]['image_selector'], self.appserver.openstack_server_base_image)
+        kwargs = mock_capture_playbook_output.call_args[1]
+        self.assertEqual(kwargs['tags'], 'install:base')
+        self.assertEqual(kwargs['playbook_path'], '/configuration/playbooks/edx_sandbox.yml')
+        self.assertIn('192.0.2.1', kwargs['inventory_str'])
+        self.assertEqual(mock_terminate.call_count, 1)
+        self.assertTrue(OpenStackServer.objects.filter(name_prefix='bake').exists())
+
+    @patch('instance.models.baked_image.ansible.capture_playbook_output', return_value=2)
+    @patch('instance.models.baked_image.open_cached_repository')
+    @patch('instance.models.server.openstack_utils.get_nova_client')
+    @patch('instance.models.baked_image.OpenStackServer.public_ip', new_callable=PropertyMock, return_value='192.0.2.1')
+    @patch('instance.models.baked_image.OpenStackServer.terminate')
+    @patch('instance.models.baked_image.OpenStackServer.sleep_until')
+    @patch('instance.models.baked_image.OpenStackServer.start')
+    def test_bake_failed(self, mock_start, mock_sleep_until, mock_terminate, mock_public_ip, mock_get_nova_client,
+                         mock_open_repo, mock_capture_playbook_output):
+        """
+        When the playbook fails, no image is created, and the reference server is terminated
+        """
+        image = BakedImage.objects.start_baking(self.appserver)
+        self.assertFalse(image.bake(self.appserver))
+        image.refresh_from_db()
+        self.assertEqual(image.status, BakedImage.FAILED)
+        self.assertFalse(mock_get_nova_client.return_value.servers.create_image.called)
+        self.assertEqual(mock_terminate.call_count, 1)
+        self.assertIsNone(BakedImage.objects.start_baking(self.appserver))
+
+    def test_appserver_boots_from_baked_image(self):
+        """
+        New AppServers boot from a matching baked image, and skip its tasks
+        """
+        image = self.make_baked_image()
+        with self.settings(BAKED_IMAGES_ENABLED=True):
+            appserver = make_test_appserver(instance=self.appserver.instance)
+        self.assertEqual(appserver.baked_image, image)
+        image.refresh_from_db()
+        self.assertEqual(image.use_count, 1)
+        self.assertEqual(image.time_saved, 600)
+        self.assertEqual(appserver.get_playbook_skip_tags(appserver.default_playbook()), 'install:base')
+        self.assertIsNone(appserver.get_playbook_skip_tags(appserver.lms_user_creation_playbook()))
+        self.assertIsNone(self.appserver.get_playbook_skip_tags(self.appserver.default_playbook()))
+
+        with self.settings(BAKED_IMAGES_ENABLED=False):
+            self.assertIsNone(make_test_appserver(instance=self.appserver.instance).baked_image)
@@ -42,6 +42,7 @@ def mock_instances():
         map_entries = [(domain, backend_name) for domain in domains]
         conf_entries = [(backend_name, "    server test-server {}:80".format(ip_address))]
         instance.get_load_balancer_configuration.return_value = map_entries, conf_entries
+        instance.get_load_balancer_fingerprint.return_value = None
         return instance
 
     return [
@@ -103,6 +104,52 @@ class LoadBalancingServerTest(TestCase):
         self.load_balancer.delete()
         self.assertEqual(mock_run_playbook.call_count, 2)
 
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances')
+    def test_get_configuration_cached(self, mock_get_instances):
+        """
+        Test that the configuration of each instance is only rendered again when its fingerprint changes.
+        """
+        instances = mock_get_instances.return_value = mock_instances()
+        for i, instance in enumerate(instances):
+            instance.ref.pk = i
+            instance.get_load_balancer_fingerprint.return_value = 'fingerprint'
+        configuration = self.load_balancer.get_configuration()
+        self.assertEqual(self.load_balancer.get_configuration(), configuration)
+        self.assertEqual([instance.get_load_balancer_configuration.call_count for instance in instances], [1, 1])
+
+        instances[1].get_load_balancer_fingerprint.return_value = 'new-fingerprint'
+        self.assertEqual(self.load_balancer.get_configuration(), configuration)
+        self.assertEqual([instance.get_load_balancer_configuration.call_count for instance in instances], [1, 2])
+
+        # The instance triggering the reconfiguration is always rendered
+        self.load_balancer.get_configuration(triggering_instance_id=0)
+        self.assertEqual([instance.get_load_balancer_configuration.call_count for instance in instances], [2, 2])
+
+    @patch("instance.ansible.poll_streams")
+    @patch("instance.ansible.run_playbook")
+    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
+    def test_reconfigure_unchanged(self, mock_get_instances, mock_run_playbook, mock_poll_streams):
+        """
+        Test that the playbook is skipped when the configuration is the same as the deployed one.
+        """
+        mock_run_playbook.return_value.__enter__.return_value.returncode = 0
+        self.load_balancer.reconfigure()
+        self.load_balancer.reconfigure()
+        self.assertEqual(mock_run_playbook.call_count, 1)
+        self.assertEqual(self.load_balancer.configuration_version, 3)
+        self.assertEqual(self.load_balancer.deployed_configuration_version, 3)
+
+        # Once the fragment has been removed, it is deployed again
+        self.load_balancer.deconfigure()
+        self.load_balancer.reconfigure()
+        self.assertEqual(mock_run_playbook.call_count, 3)
+
+        # Configuration changes are deployed
+        mock_get_instances.return_value = mock_instances()[:1]
+        self.load_balancer.reconfigure()
+        self.assertEqual(mock_run_playbook.call_count, 4)
+
     @patch("instance.ansible.poll_streams")
     @patch("instance.ansible.run_playbook")
     @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
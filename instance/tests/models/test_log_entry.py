@@ -26,10 +26,13 @@ from unittest.mock import patch
 
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError
 from django.test import override_settings
+from django.utils import timezone
 from freezegun import freeze_time
 
-from instance.models.log_entry import LogEntry
+from instance.logging import buffered_db_logging
+from instance.models.log_entry import LogEntry, LogEntryCursor, LogEntryPartition
 from instance.tests.base import TestCase
 from instance.tests.models.factories.openedx_appserver import make_test_appserver
 from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
@@ -194,12 +197,16 @@ class LoggingTestCase(TestCase):
         The expected queries upon inserting a log entry are:
         1. SELECT (1) AS "a" FROM "django_content_type" WHERE "django_content_type"."id" = {content_type_id} LIMIT 1
         2. SELECT (1) AS "a" FROM "instance_openstackserver" WHERE "instance_openstackserver"."id" = {object_id} LIMIT 1
-        3. INSERT INTO "instance_logentry" (...)
+        3. SAVEPOINT ...
+        4. INSERT INTO "instance_logentry" (...)
+        5. RELEASE SAVEPOINT ...
 
         The first two are used to validate the foreign keys. 1. is added by django, and 2. is
         added by us since the object_id foreign key constraint is not enforced by the database.
+        The savepoint keeps a failed insert from breaking the current transaction; outside of
+        a transaction, as in production, it doesn't cost any query.
         """
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(5):
             self.server.logger.info('some log message')
 
     def test_log_delete_num_queries(self):
@@ -307,3 +314,204 @@ class LoggingTestCase(TestCase):
         self.assertEqual(entries[2].level, "CRITICAL")
         self.assertEqual(entries[2].created.strftime("%Y-%m-%d %H:%M:%S"), "2015-08-05 18:07:06")
         self.assertEqual(entries[2].text, self.appserver_prefix + "Line #7, exception")
+
+    def test_log_entries_page(self):
+        """
+        Check keyset pagination over the log entries of an AppServer and its server
+        """
+        LogEntry.objects.all().delete()
+        lines = [
+            ("2015-08-05 18:07:00", self.app_server.logger.info, 'Line #1, on app_server'),
+            ("2015-08-05 18:07:01", self.server.logger.info, 'Line #2, on server'),
+            ("2015-08-05 18:07:01", self.app_server.logger.error, 'Line #3, on app_server'),
+            ("2015-08-05 18:07:01", self.server.logger.info, 'Line #4, on server'),
+            ("2015-08-05 18:07:02", self.app_server.logger.info, 'Line #5, on app_server'),
+            ("2015-08-05 18:07:03", self.server.logger.error, 'Line #6, on server'),
+        ]
+        for date, log, text in lines:
+            with freeze_time(date):
+                log(text)
+        objects = [self.app_server, self.server]
+        all_entries = list(LogEntry.get_page(objects))
+        self.assertEqual([entry.text.rpartition('| ')[2] for entry in all_entries], [text for _, _, text in lines])
+
+        # Latest entries, then going backwards
+        page = list(LogEntry.get_page(objects, limit=4))
+        self.assertEqual(page, all_entries[2:])
+        page = list(LogEntry.get_page(objects, before=LogEntryCursor.for_entry(page[0]), limit=4))
+        self.assertEqual(page, all_entries[:2])
+
+        # Going forwards, e.g. to tail the log
+        page = list(LogEntry.get_page(objects, after=LogEntryCursor.for_entry(all_entries[0]), limit=2))
+        self.assertEqual(page, all_entries[1:3])
+        page = list(LogEntry.get_page(objects, after=LogEntryCursor.for_entry(page[-1]), limit=2))
+        self.assertEqual(page, all_entries[3:5])
+        page = list(LogEntry.get_page(objects, after=LogEntryCursor.for_entry(all_entries[-1])))
+        self.assertEqual(page, [])
+
+        # Filtering by level
+        page = list(LogEntry.get_page(objects, level_list=['ERROR'], limit=1))
+        self.assertEqual(page, [all_entries[5]])
+        page = list(LogEntry.get_page(objects, before=LogEntryCursor.for_entry(page[0]), level_list=['ERROR']))
+        self.assertEqual(page, [all_entries[2]])
+
+    def test_log_entry_cursor(self):
+        """
+        Check the string representation of log entry cursors
+        """
+        with freeze_time("2015-08-05 18:07:00.123456"):
+            self.server.logger.info('Line #1, on server')
+        log_entry = LogEntry.objects.get(text__endswith='Line #1, on server')
+        cursor = LogEntryCursor.for_entry(log_entry)
+        self.assertEqual(str(cursor), '2015-08-05T18:07:00.123456Z,{}'.format(log_entry.pk))
+        self.assertEqual(LogEntryCursor.parse(str(cursor)), cursor)
+        for invalid_cursor in ('', '2015-08-05T18:07:00Z', '2015-08-05T18:07:00Z,', 'yesterday,1', '2015-08-05,abc'):
+            with self.assertRaises(ValueError):
+                LogEntryCursor.parse(invalid_cursor)
+
+    def test_log_entry_partition(self):
+        """
+        Check the names and bounds of LogEntry partitions
+        """
+        partition = LogEntryPartition.for_month(timezone.datetime(2018, 12, 31, 23, 59, tzinfo=timezone.utc))
+        self.assertEqual(partition.name, 'instance_logentry_y2018m12')
+        self.assertEqual(partition.start, timezone.datetime(2018, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(partition.end, timezone.datetime(2019, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(LogEntryPartition.for_month(partition.end).name, 'instance_logentry_y2019m01')
+
+        partition = LogEntryPartition.for_entries_before(timezone.datetime(2019, 1, 15, tzinfo=timezone.utc))
+        self.assertEqual(partition.name, 'instance_logentry_before_y2019m01')
+        self.assertIsNone(partition.start)
+        self.assertEqual(partition.end, timezone.datetime(2019, 1, 1, tzinfo=timezone.utc))
+
+        for name in ('instance_logentry_y2018m12', 'instance_logentry_before_y2019m01'):
+            self.assertTrue(LogEntryPartition.NAME_RE.match(name))
+
+    def test_buffered_log_entries(self):
+        """
+        Check that buffered log entries are only written when the buffer is flushed
+        """
+        with freeze_time("2015-08-05 18:07:00"):
+            with buffered_db_logging(flush_interval=3600) as log_buffer:
+                self.server.logger.info('Line #1, on server')
+                self.app_server.logger.info('Line #2, on app_server')
+                self.assertEqual(len(log_buffer), 2)
+                self.assertEqual(list(self.app_server.log_entries), [])
+            self.assertEqual(len(log_buffer), 0)
+
+        self.check_log_entries(self.app_server.log_entries, [
+            ("2015-08-05 18:07:00", 'INFO', self.server_prefix + 'Line #1, on server'),
+            ("2015-08-05 18:07:00", 'INFO', self.appserver_prefix + 'Line #2, on app_server'),
+        ])
+
+    def test_buffered_log_flush_thresholds(self):
+        """
+        Check that the buffer is flushed when it is full, and when a warning or error is logged
+        """
+        with buffered_db_logging(capacity=3, flush_interval=3600) as log_buffer:
+            self.server.logger.info('Line #1')
+            self.server.logger.info('Line #2')
+            self.assertEqual(len(log_buffer), 2)
+            self.server.logger.info('Line #3')
+            self.assertEqual(len(log_buffer), 0)
+            self.assertEqual(len(list(self.app_server.log_entries)), 3)
+
+            self.server.logger.info('Line #4')
+            self.server.logger.error('Line #5')
+            self.assertEqual(len(log_buffer), 0)
+            self.assertEqual(len(list(self.app_server.log_entries)), 5)
+
+    def test_buffered_log_nested(self):
+        """
+        Check that nested buffered blocks share the outermost buffer
+        """
+        with buffered_db_logging(flush_interval=3600) as outer_buffer:
+            with buffered_db_logging() as inner_buffer:
+                self.server.logger.info('Line #1')
+            self.assertIs(inner_buffer, outer_buffer)
+            self.assertEqual(len(outer_buffer), 1)
+        self.assertEqual(len(list(self.app_server.log_entries)), 1)
+
+    def test_buffered_log_num_queries(self):
+        """
+        Check that buffered log entries are written with a single query per flush (plus the
+        savepoint around it, since tests run in a transaction).
+        """
+        with self.assertNumQueries(3):
+            with buffered_db_logging(flush_interval=3600):
+                for i in range(50):
+                    self.server.logger.info('Line #%d', i)
+
+    @patch('instance.models.log_entry.LogEntryPartition.create')
+    def test_log_missing_partition(self, mock_create_partition):
+        """
+        Check that the partition of the current month is created when it's missing, and the entry saved again
+        """
+        save = LogEntry.save
+        errors = [IntegrityError('no partition of relation "instance_logentry" found for row')]
+
+        def save_without_partition(log_entry, *args, **kwargs):
+            """ Fail like PostgreSQL does when the partition is missing, the first time """
+            if errors:
+                raise errors.pop()
+            return save(log_entry, *args, **kwargs)
+
+        with patch('instance.models.log_entry.LogEntry.save', autospec=True, side_effect=save_without_partition):
+            self.server.logger.info('Line #1')
+
+        self.assertEqual(mock_create_partition.call_count, 1)
+        self.assertEqual([entry.text for entry in self.app_server.log_entries], [self.server_prefix + 'Line #1'])
+
+    @patch('instance.logging.sys.stderr')
+    @patch('instance.models.log_entry.LogEntryPartition.create')
+    def test_log_unsaved(self, mock_create_partition, mock_stderr):
+        """
+        Check that log entries that can't be saved are dropped, instead of raising from the logging handler
+        """
+        error = IntegrityError('no partition of relation "instance_logentry" found for row')
+        with patch('instance.models.log_entry.LogEntry.save', side_effect=error):
+            self.server.logger.info('Line #1')
+        with patch('instance.models.log_entry.LogEntry.objects.bulk_create', side_effect=error):
+            with buffered_db_logging(flush_interval=3600):
+                self.server.logger.info('Line #2')
+                self.server.logger.info('Line #3')
+
+        self.assertEqual(mock_create_partition.call_count, 2)
+        self.assertEqual(list(self.app_server.log_entries), [])
+        mock_stderr.write.assert_called_with(
+            'Dropping 2 log entries that could not be saved: '
+            'no partition of relation "instance_logentry" found for row\n'
+        )
+
+    @patch('instance.logging.publish_data')
+    def test_buffered_log_publish(self, mock_publish_data):
+        """
+        Check that buffered log entries are published as a single event per object
+        """
+        with freeze_time("2015-09-21 21:07:00"), buffered_db_logging(flush_interval=3600):
+            self.server.logger.info('Line #1, on server')
+            self.instance.logger.info('Line #2, on instance')
+            self.server.logger.info('Line #3, on server')
+            mock_publish_data.assert_not_called()
+
+        self.assertEqual(mock_publish_data.call_count, 2)
+        mock_publish_data.assert_any_call('log', {
+            'type': 'object_log_lines',
+            'log_entries': [
+                {'created': '2015-09-21T21:07:00Z', 'level': 'INFO', 'text': self.server_prefix + 'Line #1, on server'},
+                {'created': '2015-09-21T21:07:00Z', 'level': 'INFO', 'text': self.server_prefix + 'Line #3, on server'},
+            ],
+            'server_id': self.server.pk,
+        })
+        mock_publish_data.assert_any_call('log', {
+            'type': 'object_log_lines',
+            'log_entries': [
+                {
+                    'created': '2015-09-21T21:07:00Z',
+                    'level': 'INFO',
+                    'text': self.instance_prefix + 'Line #2, on instance',
+                },
+            ],
+            'instance_id': self.instance.ref.pk,
+            'instance_type': 'OpenEdXInstance',
+        })
@@ -22,11 +22,14 @@ OpenEdXAppServer Ansible Mixin - Tests
 
 # Imports #####################################################################
 
+from contextlib import ExitStack
 import os
 from unittest.mock import patch, call, Mock
 
 import ddt
+from django.utils import timezone
 
+from instance.ansible import TaskTiming
 from instance.models.mixins.ansible import Playbook
 from instance.tests.base import TestCase
 from instance.tests.models.factories.openedx_appserver import make_test_appserver
@@ -73,7 +76,7 @@ class AnsibleAppServerTestCase(TestCase):
     @patch('instance.ansible.poll_streams')
     @patch('instance.ansible.run_playbook')
     @patch('instance.models.openedx_appserver.OpenEdXAppServer.inventory_str')
-    @patch('instance.models.mixins.ansible.open_repository')
+    @patch('instance.models.mixins.ansible.open_cached_repository')
     def test_provisioning(
             self, playbook_returncode, mock_open_repo, mock_inventory, mock_run_playbook, mock_poll_streams
     ):
@@ -92,6 +95,9 @@ class AnsibleAppServerTestCase(TestCase):
             playbook_path='{}/playbooks'.format(working_dir),
             playbook_name='edx_sandbox.yml',
             username='ubuntu',
+            tags=None,
+            skip_tags=None,
+            task_timings=[],
         ), mock_run_playbook.mock_calls)
 
         assert_func = self.assertIn if playbook_returncode == 0 else self.assertNotIn
@@ -102,8 +108,70 @@ class AnsibleAppServerTestCase(TestCase):
             playbook_path='{}/playbooks'.format(working_dir),
             playbook_name='appserver.yml',
             username='ubuntu',
+            tags=None,
+            skip_tags=None,
+            task_timings=[],
         ), mock_run_playbook.mock_calls)
 
+    @patch('instance.models.mixins.ansible.AnsibleAppServerMixin._run_playbook', return_value=(['log'], 0))
+    @patch('instance.models.mixins.ansible.ansible.venv_cache.venv')
+    @patch('instance.models.mixins.ansible.open_cached_repository')
+    def test_prepare_ansible_playbooks(self, mock_open_repo, mock_venv, mock_run_playbook):
+        """
+        The playbooks are checked out and their virtualenvs built until the stack is closed,
+        and running the prepared playbooks doesn't check them out again.
+        """
+        appserver = make_test_appserver()
+        working_dir = '/cloned/configuration-repo/path'
+        mock_open_repo.return_value.__enter__.return_value.working_dir = working_dir
+        playbooks = appserver.get_playbooks()
+
+        with ExitStack() as stack:
+            prepared_playbooks = appserver.prepare_ansible_playbooks(stack)
+            self.assertEqual(
+                [(prepared.playbook.playbook_path, prepared.working_dir) for prepared in prepared_playbooks],
+                [(playbook.playbook_path, working_dir) for playbook in playbooks],
+            )
+            self.assertEqual(mock_venv.call_args_list, [
+                call(os.path.join(working_dir, playbook.requirements_path)) for playbook in playbooks
+            ])
+            self.assertFalse(mock_open_repo.return_value.__exit__.called)
+            self.assertFalse(mock_venv.return_value.__exit__.called)
+
+            self.assertEqual(appserver.run_ansible_playbooks(prepared_playbooks), (['log'] * len(playbooks), 0))
+        self.assertEqual(mock_open_repo.call_count, len(playbooks))
+        self.assertEqual(mock_open_repo.return_value.__exit__.call_count, len(playbooks))
+        self.assertEqual(mock_venv.return_value.__exit__.call_count, len(playbooks))
+        self.assertEqual(
+            mock_run_playbook.call_args_list,
+            [call(working_dir, prepared.playbook, task_timings=[]) for prepared in prepared_playbooks]
+        )
+
+    @patch('instance.models.mixins.ansible.AnsibleAppServerMixin._run_playbook',
+           side_effect=[(['log1'], 0), (['log2'], 1), (['log3'], 0)])
+    @patch('instance.models.mixins.ansible.open_cached_repository')
+    def test_run_ansible_playbooks_checkpoint(self, mock_open_repo, mock_run_playbook):
+        """
+        The completed playbooks are saved, and not run again.
+        """
+        appserver = make_test_appserver()
+        working_dir = '/cloned/configuration-repo/path'
+        mock_open_repo.return_value.__enter__.return_value.working_dir = working_dir
+        playbooks = appserver.get_playbooks()
+        self.assertEqual(len(playbooks), 2)
+
+        self.assertEqual(appserver.run_ansible_playbooks(), (['log1', 'log2'], 1))
+        appserver.refresh_from_db()
+        self.assertEqual(appserver.completed_playbooks, 1)
+        self.assertEqual(appserver.get_remaining_playbooks(), playbooks[1:])
+
+        self.assertEqual(appserver.run_ansible_playbooks(), (['log3'], 0))
+        self.assertEqual(mock_run_playbook.call_args, call(working_dir, playbooks[1], task_timings=[]))
+        appserver.refresh_from_db()
+        self.assertEqual(appserver.completed_playbooks, 2)
+        self.assertEqual(appserver.run_ansible_playbooks(), ([], 0))
+        self.assertEqual(mock_run_playbook.call_count, 3)
+
     @patch('instance.models.mixins.ansible.ansible.run_playbook')
     @patch('instance.models.mixins.ansible.AnsibleAppServerMixin.inventory_str')
     def test_run_playbook_logging(self, mock_inventory_str, mock_run_playbook):
@@ -126,3 +194,32 @@ class AnsibleAppServerTestCase(TestCase):
             log, returncode = appserver._run_playbook("/tmp/test/working/dir/", playbook)
             self.assertCountEqual(log, ['Hello', 'Hi'])
             self.assertEqual(returncode, 0)
+
+    @patch('instance.models.mixins.ansible.ansible.capture_playbook_output')
+    @patch('instance.models.mixins.ansible.AnsibleAppServerMixin.inventory_str')
+    def test_run_playbook_task_timings(self, mock_inventory_str, mock_capture_playbook_output):
+        """
+        The timings of the tasks of the playbook are stored, even if it failed
+        """
+        def capture_playbook_output(task_timings, **kwargs):
+            """ Report the timings of two tasks """
+            for task, duration in (('Install packages', 300.0), ('Restart nginx', 2.0)):
+                task_timings.append(TaskTiming(
+                    role='common', task=task, host='1.2.3.4', started=timezone.now(), duration=duration,
+                    changed=True, failed=False, skipped=False,
+                ))
+            return ['log'], 2
+        mock_capture_playbook_output.side_effect = capture_playbook_output
+
+        appserver = make_test_appserver()
+        playbook = Playbook(source_repo='dummy', playbook_path='playbooks/edx_sandbox.yml', requirements_path='dummy',
+                            version='dummy', variables='dummy')
+        self.assertEqual(appserver._run_playbook('/tmp/test/working/dir/', playbook), (['log'], 2))
+        self.assertCountEqual(
+            appserver.ansible_task_timings.values_list('playbook', 'role', 'task', 'duration'),
+            [
+                ('playbooks/edx_sandbox.yml', 'common', 'Install packages', 300.0),
+                ('playbooks/edx_sandbox.yml', 'common', 'Restart nginx', 2.0),
+            ],
+        )
+        self.assertFalse(appserver.provisioning_spans.get(phase='playbook:playbooks/edx_sandbox.yml').success)
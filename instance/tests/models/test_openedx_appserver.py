@@ -22,7 +22,8 @@ OpenEdXAppServer model - Tests
 
 # Imports #####################################################################
 
-from unittest.mock import patch, Mock
+import time
+from unittest.mock import ANY, patch, Mock
 
 import novaclient
 import requests
@@ -32,12 +33,18 @@ from ddt import ddt, data
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core import mail as django_mail
+from django.core.cache import cache
 from django.test import override_settings
 from freezegun import freeze_time
 from pytz import utc
 
 from instance.models.appserver import Status as AppServerStatus, AppServer
-from instance.models.openedx_appserver import OpenEdXAppServer, OPENEDX_APPSERVER_SECURITY_GROUP_RULES
+from instance.models.openedx_appserver import (
+    _revalidate_main_security_group,
+    get_security_group_cache_key,
+    OpenEdXAppServer,
+    OPENEDX_APPSERVER_SECURITY_GROUP_RULES,
+)
 from instance.models.server import Server
 from instance.models.utils import WrongStateException
 from instance.tests.base import TestCase
@@ -82,8 +89,14 @@ class OpenEdXAppServerTestCase(TestCase):
         self.assertTrue(result)
         self.assertEqual(appserver.status, AppServerStatus.Running)
         self.assertEqual(appserver.server.status, Server.Status.Ready)
-        self.assertEqual(mocks.mock_run_ansible_playbooks.call_count, 1)
+        self.assertEqual(mocks.mock_prepare_ansible_playbooks.call_count, 1)
+        mocks.mock_run_ansible_playbooks.assert_called_once_with(mocks.mock_prepare_ansible_playbooks.return_value)
         self.assertEqual(mock_reboot.call_count, 1)
+        self.assertCountEqual(
+            appserver.provisioning_spans.values_list('phase', 'success'),
+            [('security_groups', True), ('vm_build', True), ('boot', True), ('reboot', True), ('heartbeat', True)],
+        )
+        self.assertTrue(all(span.instance == appserver.owner for span in appserver.provisioning_spans.all()))
 
     @patch_services
     def test_provision_build_failed(self, mocks):
@@ -102,6 +115,10 @@ class OpenEdXAppServerTestCase(TestCase):
         self.assertEqual(appserver.status, AppServerStatus.Error)
         self.assertEqual(appserver.server.status, Server.Status.BuildFailed)
         mocks.mock_provision_failed_email.assert_called_once_with('Unable to start an OpenStack server')
+        self.assertCountEqual(
+            appserver.provisioning_spans.values_list('phase', 'success'),
+            [('security_groups', True), ('vm_build', False)],
+        )
 
     @patch_services
     def test_provision_failed(self, mocks):
@@ -122,6 +139,35 @@ class OpenEdXAppServerTestCase(TestCase):
             "AppServer deploy failed: Ansible play exited with non-zero exit code", log_lines
         )
 
+    @patch_services
+    def test_resume_provisioning(self, mocks):
+        """
+        The failed provisioning of an AppServer whose server is still up can be resumed
+        """
+        mocks.mock_run_ansible_playbooks.side_effect = [(['log'], 1), (['log'], 0)]
+        appserver = make_test_appserver()
+        self.assertFalse(appserver.can_resume_provisioning())
+        self.assertFalse(appserver.provision())
+        self.assertEqual(appserver.status, AppServerStatus.ConfigurationFailed)
+
+        self.assertTrue(appserver.can_resume_provisioning())
+        self.assertTrue(appserver.resume_provisioning())
+        self.assertEqual(appserver.status, AppServerStatus.Running)
+        self.assertEqual(appserver.server.status, Server.Status.Ready)
+        self.assertEqual(mocks.mock_run_ansible_playbooks.call_count, 2)
+        self.assertFalse(appserver.can_resume_provisioning())
+
+    @patch_services
+    def test_cannot_resume_provisioning_server_down(self, mocks):
+        """
+        The failed provisioning of an AppServer can't be resumed if its server isn't up anymore
+        """
+        mocks.mock_run_ansible_playbooks.return_value = (['log'], 1)
+        appserver = make_test_appserver()
+        self.assertFalse(appserver.provision())
+        appserver.server._status_to_terminated()
+        self.assertFalse(appserver.can_resume_provisioning())
+
     @patch_services
     def test_provision_unhandled_exception(self, mocks):
         """
@@ -134,6 +180,21 @@ class OpenEdXAppServerTestCase(TestCase):
         self.assertFalse(result)
         mocks.mock_provision_failed_email.assert_called_once_with("AppServer deploy failed: unhandled exception")
 
+    @patch_services
+    def test_provision_preparation_failed(self, mocks):
+        """
+        Make sure that if the playbooks can't be prepared while the server boots, the provision()
+        method should return False and send an email, without running the playbooks.
+        """
+        mocks.mock_prepare_ansible_playbooks.side_effect = Exception('Unable to clone the repository')
+        appserver = make_test_appserver()
+        result = appserver.provision()
+        self.assertFalse(result)
+        self.assertEqual(appserver.status, AppServerStatus.ConfigurationFailed)
+        self.assertEqual(appserver.server.status, Server.Status.Ready)
+        self.assertFalse(mocks.mock_run_ansible_playbooks.called)
+        mocks.mock_provision_failed_email.assert_called_once_with("AppServer deploy failed: unhandled exception")
+
     def test_admin_users(self):
         """
         By default, all users that belong to an organization that owns the
@@ -210,12 +271,15 @@ class OpenEdXAppServerTestCase(TestCase):
                 app_server.provision()
 
     @patch('instance.openstack_utils.get_nova_client')
-    def test_launch_in_other_region(self, mock_get_nova_client):  # pylint: disable=no-self-use
+    def test_launch_in_other_region(self, mock_get_nova_client):
         """
         Test launching an appserver in a non-default region.
         """
         instance = OpenEdXInstanceFactory(openstack_region="elsewhere")
-        make_test_appserver(instance)
+        appserver = make_test_appserver(instance)
+        # The nova client is only looked up once it is needed
+        mock_get_nova_client.assert_not_called()
+        self.assertEqual(appserver.server.nova, mock_get_nova_client.return_value)
         mock_get_nova_client.assert_called_once_with("elsewhere")
 
     @data(
@@ -382,12 +446,14 @@ class OpenEdXAppServerTestCase(TestCase):
             "Unable to check/update the network security groups for the new VM"
         )
 
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
     @patch("instance.models.openedx_appserver.get_openstack_connection")
     @patch("instance.models.openedx_appserver.sync_security_group_rules")
     def test_check_security_groups(self, mock_sync_security_group_rules, mock_get_openstack_connection):
         """
         Test that check_security_groups() can create and synchronize security groups
         """
+        cache.clear()
         # We simulate the existence of these network security groups on the OpenStack cloud:
         existing_groups = ["group_a", "group_b"]
         new_security_group = Mock()
@@ -404,9 +470,14 @@ class OpenEdXAppServerTestCase(TestCase):
             new_security_group.__dict__.update(**args)
             return new_security_group
 
+        def mocked_security_groups():
+            """ Mock openstack network.security_groups """
+            return [mocked_find_security_group(name) for name in existing_groups]
+
         network = mock_get_openstack_connection().network
         network.find_security_group.side_effect = mocked_find_security_group
         network.create_security_group.side_effect = mocked_create_security_group
+        network.security_groups.side_effect = mocked_security_groups
 
         instance = OpenEdXInstanceFactory(additional_security_groups=["group_a", "group_b"])
         app_server = make_test_appserver(instance)
@@ -422,6 +493,9 @@ class OpenEdXAppServerTestCase(TestCase):
         mock_sync_security_group_rules.assert_called_once_with(
             new_security_group, OPENEDX_APPSERVER_SECURITY_GROUP_RULES, network=network
         )
+        # The additional groups were checked with a single listing:
+        self.assertEqual(network.security_groups.call_count, 1)
+        network.find_security_group.assert_called_once_with(settings.OPENEDX_APPSERVER_SECURITY_GROUP_NAME)
 
         # Now, if we change the additional groups, we expect to get an exception:
         instance.additional_security_groups = ["invalid"]
@@ -429,6 +503,42 @@ class OpenEdXAppServerTestCase(TestCase):
         app_server = make_test_appserver(instance)
         with self.assertRaisesRegex(Exception, "Unable to find the OpenStack network security group called 'invalid'."):
             app_server.check_security_groups()
+        # The main group wasn't synchronized again
+        self.assertEqual(mock_sync_security_group_rules.call_count, 1)
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        OPENEDX_APPSERVER_SECURITY_GROUP_CACHE_TTL=3600,
+    )
+    @patch("instance.models.openedx_appserver.threading.Thread")
+    @patch("instance.models.openedx_appserver.sync_main_security_group")
+    def test_check_security_groups_cache(self, mock_sync_main_security_group, mock_thread):
+        """
+        Test that the main security group is synchronized again in the background once the cache is stale,
+        and right away when its rules change
+        """
+        cache.clear()
+        app_server = make_test_appserver()
+        region = app_server.instance.openstack_region
+        with freeze_time('2026-10-18 10:00:00'):
+            cache.set(get_security_group_cache_key(region), time.time())
+            app_server.check_security_groups()
+        self.assertFalse(mock_sync_main_security_group.called)
+        self.assertFalse(mock_thread.called)
+
+        with freeze_time('2026-10-18 11:30:00'):
+            app_server.check_security_groups()
+            app_server.check_security_groups()
+        self.assertFalse(mock_sync_main_security_group.called)
+        # Only one revalidation runs at a time
+        mock_thread.assert_called_once_with(
+            target=_revalidate_main_security_group, args=(region, ANY), daemon=True
+        )
+        self.assertEqual(mock_thread.return_value.start.call_count, 1)
+
+        with patch('instance.models.openedx_appserver.OPENEDX_APPSERVER_SECURITY_GROUP_RULES', []):
+            app_server.check_security_groups()
+        mock_sync_main_security_group.assert_called_once_with(region)
 
     @patch_services
     def test_default_openstack_settings(self, mocks):
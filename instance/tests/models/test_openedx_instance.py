@@ -383,6 +383,39 @@ class OpenEdXInstanceTestCase(TestCase):
         appserver = instance.appserver_set.last()
         self.assertEqual(appserver.status, AppServerStatus.ConfigurationFailed)
 
+    @patch_services
+    def test_spawn_appserver_resume_failed_provisioning(self, mocks):
+        """
+        When a playbook fails, the next attempt reruns the playbooks on the server of the same AppServer.
+        """
+        mocks.mock_run_ansible_playbooks.side_effect = [(['log: provisioning failed'], 1), (['log'], 0)]
+        mocks.mock_create_server.side_effect = [Mock(id='test-run-provisioning-server'), None]
+        mocks.os_server_manager.add_fixture('test-run-provisioning-server', 'openstack/api_server_2_active.json')
+
+        instance = OpenEdXInstanceFactory(sub_domain='test.spawn')
+        result = instance.spawn_appserver(num_attempts=2)
+
+        appserver = instance.appserver_set.get()
+        self.assertEqual(result, appserver.pk)
+        self.assertEqual(appserver.status, AppServerStatus.Running)
+        self.assertEqual(mocks.mock_create_server.call_count, 1)
+        self.assertEqual(mocks.mock_run_ansible_playbooks.call_count, 2)
+        self.assertEqual(mocks.mock_prepare_ansible_playbooks.call_count, 2)
+
+    @patch_services
+    @override_settings(RESUME_FAILED_PROVISIONING=False)
+    @patch('instance.models.openedx_appserver.OpenEdXAppServer.resume_provisioning')
+    @patch('instance.models.openedx_appserver.OpenEdXAppServer.provision', return_value=False)
+    def test_spawn_appserver_resume_disabled(self, mocks, mock_provision, mock_resume_provisioning):
+        """
+        When resuming failed provisioning is disabled, each attempt spawns a new AppServer.
+        """
+        instance = OpenEdXInstanceFactory(sub_domain='test.spawn')
+        self.assertIsNone(instance.spawn_appserver(num_attempts=2))
+        self.assertEqual(instance.appserver_set.count(), 2)
+        self.assertEqual(mock_provision.call_count, 2)
+        self.assertFalse(mock_resume_provisioning.called)
+
     @patch_services
     @patch('instance.models.openedx_appserver.OpenEdXAppServer.provision', return_value=True)
     def test_spawn_appserver_with_external_databases(self, mocks, mock_provision):
@@ -403,6 +436,61 @@ class OpenEdXInstanceTestCase(TestCase):
                         'EDXAPP_SWIFT_USERNAME', 'EDXAPP_SWIFT_KEY'):
             self.assertTrue(ansible_vars[setting])
 
+    @patch_services
+    def test_spawn_appserver_provisioning_failed(self, mocks):
+        """
+        When an external resource can't be provisioned, the other ones still are, but no AppServer is created.
+        """
+        mocks.mock_provision_mongo.side_effect = RuntimeError('MongoDB is down')
+        instance = OpenEdXInstanceFactory(sub_domain='test.provisioning_failed')
+
+        with self.assertRaisesRegex(RuntimeError, 'MongoDB is down'):
+            instance._spawn_appserver()
+        self.assertEqual(mocks.mock_provision_mysql.call_count, 1)
+        self.assertEqual(mocks.mock_provision_swift.call_count, 1)
+        self.assertEqual(mocks.mock_provision_rabbitmq.call_count, 1)
+        self.assertEqual(instance.appserver_set.count(), 0)
+
+        instance.refresh_from_db()
+        self.assertIsNotNone(instance.load_balancing_server)
+
+    @patch_services
+    @patch('instance.models.openedx_instance.OpenEdXInstance._create_owned_appserver')
+    def test_spawn_appserver_skip_provisioned_mysql(self, mocks, mock_create_appserver):
+        """
+        When asked to, the MySQL databases are only provisioned if they weren't already.
+        """
+        instance = OpenEdXInstanceFactory(sub_domain='test.skip_provisioned_mysql')
+        instance._spawn_appserver(skip_provisioned_mysql=True)
+        self.assertEqual(mocks.mock_provision_mysql.call_count, 1)
+
+        instance.mysql_provisioned = True
+        instance._spawn_appserver(skip_provisioned_mysql=True)
+        self.assertEqual(mocks.mock_provision_mysql.call_count, 1)
+        self.assertEqual(mocks.mock_provision_mongo.call_count, 2)
+
+        instance._spawn_appserver()
+        self.assertEqual(mocks.mock_provision_mysql.call_count, 2)
+
+    @patch_services
+    @patch('instance.models.openedx_instance.OpenEdXInstance._create_owned_appserver')
+    @patch('instance.models.openedx_instance.OpenEdXInstance.update_consul_metadata')
+    def test_spawn_appserver_provisioning_saves(self, mocks, mock_update_consul_metadata, mock_create_appserver):
+        """
+        The provisioning steps only write the fields they set, and the instance is fully saved once, by the caller.
+        """
+        instance = OpenEdXInstanceFactory(sub_domain='test.provisioning_saves')
+        instance.load_balancing_server = None
+        instance.save()
+        mock_update_consul_metadata.reset_mock()
+
+        instance._spawn_appserver()
+        self.assertEqual(mock_update_consul_metadata.call_count, 1)
+        self.assertIsNotNone(instance.load_balancing_server)
+        self.assertEqual(
+            type(instance).objects.get(pk=instance.pk).load_balancing_server, instance.load_balancing_server,
+        )
+
     @patch_services
     @patch('instance.models.openedx_appserver.OpenEdXAppServer.provision', return_value=True)
     def test_forum_api_key(self, mocks, mock_provision):
@@ -467,6 +555,32 @@ class OpenEdXInstanceTestCase(TestCase):
             appserver.server.save()
             self.assertRaises(WrongStateException, instance.get_load_balancer_configuration)
 
+    @patch_services
+    def test_get_load_balancer_fingerprint(self, mocks):
+        """
+        Test that the load balancer fingerprint changes with the active appservers and domains.
+        """
+        instance = OpenEdXInstanceFactory(sub_domain='test.load_balancer')
+        preliminary_fingerprint = instance.get_load_balancer_fingerprint()
+        self.assertEqual(instance.get_load_balancer_fingerprint(), preliminary_fingerprint)
+
+        appserver_id = instance.spawn_appserver()
+        appserver = instance.appserver_set.get(pk=appserver_id)
+        appserver.server._public_ip = '1.1.1.1'
+        appserver.server.save()
+        self.assertEqual(instance.get_load_balancer_fingerprint(), preliminary_fingerprint)
+        appserver.make_active()
+        active_fingerprint = instance.get_load_balancer_fingerprint()
+        self.assertNotEqual(active_fingerprint, preliminary_fingerprint)
+
+        instance.external_lms_domain = 'courses.myexternal.org'
+        self.assertNotEqual(instance.get_load_balancer_fingerprint(), active_fingerprint)
+
+        # The configuration can't be cached while the public IP address of an active appserver is unknown
+        appserver.server._public_ip = None
+        appserver.server.save()
+        self.assertIsNone(instance.get_load_balancer_fingerprint())
+
     def test_get_load_balancer_config_ext_domains(self):
         """
         Test the load balancer configuration when external domains are set.
@@ -867,6 +981,7 @@ class OpenEdXInstanceTestCase(TestCase):
 
 
 @skip_unless_consul_running()
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class OpenEdXInstanceConsulTestCase(TestCase):
     """
     Test cases for all Consul-related functionalities that resides in
@@ -1022,6 +1137,103 @@ class OpenEdXInstanceConsulTestCase(TestCase):
         self.assertFalse(metadata)
 
 
+@override_settings(
+    CONSUL_ENABLED=True,
+    OCIM_ID='ocim-test',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class OpenEdXInstanceConsulTransactionTestCase(TestCase):
+    """
+    Test cases for the requests made to Consul when writing the metadata of instances
+    """
+    def setUp(self):
+        super().setUp()
+        patcher = patch('instance.models.utils.ConsulAgent.get_client')
+        self.addCleanup(patcher.stop)
+        self.client = patcher.start().return_value
+        self.client.kv.get.return_value = (1, None)
+
+    def test_write_metadata_to_consul(self):
+        """
+        Only the changed keys and the version are written, in a single transaction, and
+        writing the same configurations again doesn't make any request.
+        """
+        instance = OpenEdXInstanceFactory()
+        prefix = instance.consul_prefix
+        self.client.reset_mock()
+        self.client.kv.get.return_value = (11, [
+            {'Key': prefix + 'key1', 'Value': b'value1', 'ModifyIndex': 10},
+            {'Key': prefix + 'version', 'Value': b'1', 'ModifyIndex': 11},
+        ])
+
+        configs = {'key1': 'value1', 'key2': 'value2'}
+        self.assertEqual(instance._write_metadata_to_consul(configs), (2, True))
+        self.client.kv.get.assert_called_once_with(prefix, recurse=True)
+        self.client.txn.put.assert_called_once_with([
+            {'KV': {'Verb': 'cas', 'Key': prefix + 'key2', 'Value': 'dmFsdWUy', 'Index': 0}},
+            {'KV': {'Verb': 'cas', 'Key': prefix + 'version', 'Value': 'Mg==', 'Index': 11}},
+        ])
+
+        self.client.reset_mock()
+        self.assertEqual(instance._write_metadata_to_consul(configs), (2, False))
+        self.client.kv.get.assert_not_called()
+        self.client.txn.put.assert_not_called()
+
+        # Purging the metadata forgets what was written
+        instance.purge_consul_metadata()
+        self.assertEqual(instance._write_metadata_to_consul(configs), (2, True))
+
+    def test_write_metadata_to_consul_conflict(self):
+        """
+        The transaction is retried if the metadata changed while it was being written.
+        """
+        instance = OpenEdXInstanceFactory()
+        self.client.reset_mock()
+        self.client.txn.put.side_effect = [consul.base.ClientError('409 Conflict'), None]
+
+        self.assertEqual(instance._write_metadata_to_consul({'key1': 'value1'}), (1, True))
+        self.assertEqual(self.client.kv.get.call_count, 2)
+        self.assertEqual(self.client.txn.put.call_count, 2)
+
+    @override_settings(CONSUL_TXN_MAX_OPERATIONS=20)
+    def test_bulk_update_consul_metadata(self):
+        """
+        The metadata of several instances is read with a single request, and written in as
+        few transactions as possible.
+        """
+        instances = [OpenEdXInstanceFactory() for dummy in range(3)]
+        for instance in instances:
+            instance.purge_consul_metadata()
+        self.client.reset_mock()
+
+        # Each instance needs 8 operations, so 2 instances fit in a transaction
+        self.assertEqual(OpenEdXInstance.bulk_update_consul_metadata(instances), 3)
+        self.assertEqual(self.client.kv.get.call_count, 1)
+        self.assertTrue(self.client.kv.get.call_args[0][0].startswith('ocim-test/instances/'))
+        self.assertEqual([len(call[0][0]) for call in self.client.txn.put.call_args_list], [16, 8])
+
+        self.client.reset_mock()
+        self.assertEqual(OpenEdXInstance.bulk_update_consul_metadata(instances), 0)
+        for instance in instances:
+            instance.save()
+        self.client.kv.get.assert_not_called()
+        self.client.txn.put.assert_not_called()
+
+    def test_bulk_update_consul_metadata_stored(self):
+        """
+        The metadata already read from Consul for all instances is used instead of reading it again.
+        """
+        instances = [OpenEdXInstanceFactory() for dummy in range(2)]
+        for instance in instances:
+            instance.purge_consul_metadata()
+        self.client.reset_mock()
+
+        self.assertEqual(OpenEdXInstance.bulk_update_consul_metadata(instances, stored_all={}), 2)
+        self.client.kv.get.assert_not_called()
+        self.assertEqual(self.client.txn.put.call_count, 1)
+        self.assertEqual(OpenEdXInstance.get_consul_instances_prefix(), 'ocim-test/instances/')
+
+
 @ddt.ddt
 class OpenEdXInstanceDNSTestCase(TestCase):
     """
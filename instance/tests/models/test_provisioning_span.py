@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+ProvisioningSpan model - Tests
+"""
+
+# Imports #####################################################################
+
+import time
+from unittest.mock import patch
+
+import ddt
+from django.utils import timezone
+
+from instance.models.provisioning_span import percentile, ProvisioningSpan
+from instance.tests.base import TestCase
+from instance.tests.models.factories.openedx_appserver import make_test_appserver
+
+
+# Tests #######################################################################
+
+@ddt.ddt
+class ProvisioningSpanTestCase(TestCase):
+    """
+    Test cases for the ProvisioningSpan model
+    """
+    def setUp(self):
+        super().setUp()
+        self.appserver = make_test_appserver()
+
+    @ddt.data(
+        ([], 50, None),
+        ([3.0], 95, 3.0),
+        ([1.0, 2.0, 3.0, 4.0], 50, 2.0),
+        ([1.0, 2.0, 3.0, 4.0], 95, 4.0),
+        (list(range(1, 101)), 95, 95),
+    )
+    @ddt.unpack
+    def test_percentile(self, values, percent, expected):
+        """
+        Percentiles are computed with the nearest-rank method.
+        """
+        self.assertEqual(percentile(values, percent), expected)
+
+    def test_record(self):
+        """
+        The duration of the block is recorded.
+        """
+        with self.appserver.record_span('boot') as span:
+            self.assertIsNone(span.pk)
+            time.sleep(0.1)
+        span = ProvisioningSpan.objects.get()
+        self.assertEqual(span.instance, self.appserver.owner)
+        self.assertEqual(span.appserver, self.appserver)
+        self.assertEqual(span.phase, 'boot')
+        self.assertLessEqual(span.started, timezone.now())
+        self.assertGreaterEqual(span.duration, 0.1)
+        self.assertTrue(span.success)
+
+    def test_record_failure(self):
+        """
+        The span of a block raising an exception is recorded as failed, and the exception is re-raised.
+        """
+        with self.assertRaises(ValueError):
+            with self.appserver.record_span('vm_build'):
+                raise ValueError('Nope')
+        self.assertFalse(ProvisioningSpan.objects.get(phase='vm_build').success)
+
+        with self.appserver.record_span('playbook:playbooks/edx_sandbox.yml') as span:
+            span.success = False
+        self.assertFalse(ProvisioningSpan.objects.get(phase__startswith='playbook:').success)
+
+    @patch('instance.models.provisioning_span.ProvisioningSpan.save', side_effect=RuntimeError('Database down'))
+    def test_record_save_failure(self, mock_save):
+        """
+        Failing to record a span doesn't interrupt the provisioning.
+        """
+        with self.appserver.record_span('boot'):
+            pass
+        self.assertEqual(mock_save.call_count, 1)
+
+    def test_phase_timings(self):
+        """
+        The percentiles of each phase are computed from the durations of its successful spans.
+        """
+        for duration in (40, 10, 30, 20):
+            ProvisioningSpan.objects.add(self.appserver.owner, 'boot', duration, appserver=self.appserver)
+        ProvisioningSpan.objects.add(self.appserver.owner, 'boot', 1000, success=False)
+        ProvisioningSpan.objects.add(self.appserver.owner, 'dns', 5, success=False)
+        self.assertEqual(ProvisioningSpan.objects.get_phase_timings(), {
+            'boot': {'count': 5, 'failed': 1, 'p50': 20, 'p95': 40},
+            'dns': {'count': 1, 'failed': 1, 'p50': None, 'p95': None},
+        })
+        self.assertEqual(list(ProvisioningSpan.objects.filter(phase='dns').get_phase_timings()), ['dns'])
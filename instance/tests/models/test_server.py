@@ -74,6 +74,16 @@ class OpenStackServerTestCase(TestCase):
         self.assertEqual(str(server), 'Pending OpenStack Server')
         self.assertEqual(server.status, ServerStatus.Pending)
 
+    @patch('instance.models.server.openstack_utils.get_nova_client')
+    def test_load_servers_without_nova_client(self, mock_get_nova_client):
+        """
+        Loading servers from the database doesn't need a nova client
+        """
+        for dummy in range(3):
+            OpenStackServer.objects.create(name_prefix='test-inst')
+        self.assertEqual(len(list(OpenStackServer.objects.all())), 3)
+        mock_get_nova_client.assert_not_called()
+
     @patch('instance.models.server.openstack_utils.create_server')
     def test_start_server(self, mock_create_server):
         """
@@ -260,6 +270,31 @@ class OpenStackServerTestCase(TestCase):
             self.assertEqual(mock_sleep.call_count, 1)
             self.assertIn("Waited 0.01", timeout_error.exception)
 
+    @patch('instance.models.server.openstack_utils.status_watcher')
+    @patch('instance.models.server.is_port_open')
+    def test_sleep_until_status_watcher(self, mock_is_port_open, mock_status_watcher):
+        """
+        Check that sleep_until uses the server listings of the status watcher once the VM has been requested,
+        instead of querying nova for this server
+        """
+        server = OpenStackServerFactory(openstack_id='vm1_id', status=ServerStatus.Building, _public_ip='1.1.1.1')
+        server.nova.servers.get.return_value = Mock(_loaded=True, status='BUILD')
+        os_server = Mock(_loaded=True, status='ACTIVE')
+        mock_status_watcher.wait.return_value = (3, os_server)
+        mock_is_port_open.return_value = False
+
+        server.sleep_until(lambda: server.status.vm_available, timeout=5)
+        self.assertEqual(server.status, ServerStatus.Booting)
+        mock_status_watcher.wait.assert_called_once_with(server.openstack_region, 'vm1_id', 5)
+        # Only the first status check, before any waiting, queries nova directly
+        server.nova.servers.get.assert_called_once_with('vm1_id')
+
+        # The timeout is decreased by the time actually waited
+        mock_status_watcher.wait.return_value = (3, None)
+        with self.assertRaises(TimeoutError):
+            server.sleep_until(lambda: server.status.accepts_ssh_commands, timeout=5)
+        self.assertEqual(mock_status_watcher.wait.call_count, 3)
+
     def test_sleep_until_invalid_timeout(self):
         """
         Check if sleep_until behaves correctly when passed an invalid timeout value.
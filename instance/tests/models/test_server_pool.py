@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Warm server pool - Tests
+"""
+
+# Imports #####################################################################
+
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from freezegun import freeze_time
+import novaclient
+
+from instance.models.server import OpenStackServer, Status as ServerStatus
+from instance.models.server_pool import WarmPool, WarmServer, WARM_POOL_NAME_PREFIX
+from instance.tests.base import TestCase
+from instance.tests.models.factories.server import OpenStackServerFactory, ReadyOpenStackServerFactory
+
+
+# Tests #######################################################################
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    OPENSTACK_REGION='region1',
+    OPENSTACK_SANDBOX_FLAVOR={'name': 'flavor1'},
+    OPENSTACK_SANDBOX_BASE_IMAGE={'name': 'image1'},
+    OPENSTACK_SANDBOX_SSH_KEYNAME='key1',
+    OPENSTACK_WARM_POOLS=[{'size': 2}],
+    OPENSTACK_WARM_POOL_MAX_AGE=3600,
+    OPENEDX_APPSERVER_SECURITY_GROUP_NAME='edxapp-appserver',
+)
+class WarmServerTestCase(TestCase):
+    """
+    Test cases for the warm pools of servers
+    """
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.pool = WarmPool.get_all()[0]
+        self.server_settings = dict(
+            flavor_selector={'name': 'flavor1'},
+            image_selector={'name': 'image1'},
+            key_name='key1',
+            security_groups=['edxapp-appserver', 'extra-group'],
+        )
+
+    def make_warm_server(self, **kwargs):
+        """
+        Create a booted server in the warm pool
+        """
+        server = ReadyOpenStackServerFactory(
+            name_prefix=WARM_POOL_NAME_PREFIX, openstack_region='region1', _public_ip='192.0.2.1',
+        )
+        return WarmServer.objects.create(server=server, pool_key=self.pool.key, boot_duration=120.4, **kwargs)
+
+    def test_get_all(self):
+        """
+        The pools default to the sandbox settings
+        """
+        self.assertEqual(self.pool, WarmPool('region1', {'name': 'flavor1'}, {'name': 'image1'}, 'key1', 2))
+        self.assertEqual(self.pool.key, WarmPool.get_key('region1', {'name': 'flavor1'}, {'name': 'image1'}, 'key1'))
+        self.assertNotEqual(self.pool.key, WarmPool.get_key('region1', {'name': 'flavor2'}, {'name': 'image1'}, 'key1'))
+
+    @patch('instance.models.server.openstack_utils.get_nova_client')
+    def test_start_server(self, mock_get_nova_client):
+        """
+        A pending server takes over a booted server of the matching pool
+        """
+        warm_server = self.make_warm_server()
+        pooled_server = warm_server.server
+        os_server = mock_get_nova_client.return_value.servers.get.return_value
+        server = OpenStackServerFactory(openstack_region='region1')
+
+        self.assertTrue(WarmServer.objects.start_server(server, **self.server_settings))
+        server.refresh_from_db()
+        self.assertEqual(server.status, ServerStatus.Ready)
+        self.assertEqual(server.openstack_id, pooled_server.openstack_id)
+        self.assertEqual(server.public_ip, '192.0.2.1')
+        os_server.update.assert_called_once_with(name=server.name)
+        os_server.add_security_group.assert_called_once_with('extra-group')
+        self.assertFalse(WarmServer.objects.exists())
+        self.assertFalse(OpenStackServer.objects.filter(pk=pooled_server.pk).exists())
+        self.assertEqual(self.pool.get_stats(), {'hits': 1, 'misses': 0, 'time_saved': 120, 'hit_rate': 1.0})
+
+    def test_start_server_empty_pool(self):
+        """
+        When the pool is empty, or only holds expired servers, the server must be started normally
+        """
+        with freeze_time(timezone.now() - timezone.timedelta(hours=2)):
+            self.make_warm_server()
+        server = OpenStackServerFactory(openstack_region='region1')
+        self.assertFalse(WarmServer.objects.start_server(server, **self.server_settings))
+        self.assertEqual(server.status, ServerStatus.Pending)
+        self.assertEqual(WarmServer.objects.count(), 1)
+        self.assertEqual(self.pool.get_stats(), {'hits': 0, 'misses': 1, 'time_saved': 0, 'hit_rate': 0.0})
+
+    def test_start_server_other_pool(self):
+        """
+        Servers using other settings than the pools don't use them
+        """
+        self.make_warm_server()
+        server = OpenStackServerFactory(openstack_region='region1')
+        self.server_settings['flavor_selector'] = {'name': 'flavor2'}
+        self.assertFalse(WarmServer.objects.start_server(server, **self.server_settings))
+        self.assertEqual(WarmServer.objects.count(), 1)
+        self.assertEqual(self.pool.get_stats()['hit_rate'], None)
+
+    @patch('instance.models.server.OpenStackServer.terminate', autospec=True)
+    @patch('instance.models.server.openstack_utils.get_nova_client')
+    def test_start_server_rename_failed(self, mock_get_nova_client, mock_terminate):
+        """
+        A pooled server that can't be taken over is terminated
+        """
+        pooled_server = self.make_warm_server().server
+        os_server = mock_get_nova_client.return_value.servers.get.return_value
+        os_server.update.side_effect = novaclient.exceptions.ClientException(500)
+        server = OpenStackServerFactory(openstack_region='region1')
+
+        self.assertFalse(WarmServer.objects.start_server(server, **self.server_settings))
+        self.assertEqual(server.status, ServerStatus.Pending)
+        self.assertEqual([call[0][0].pk for call in mock_terminate.call_args_list], [pooled_server.pk])
+        self.assertEqual(self.pool.get_stats()['misses'], 1)
+
+    def test_claim(self):
+        """
+        Each warm server is only claimed once, oldest first
+        """
+        with freeze_time(timezone.now() - timezone.timedelta(minutes=10)):
+            oldest = self.make_warm_server()
+        newest = self.make_warm_server()
+        self.assertEqual(WarmServer.objects.claim(self.pool.key), oldest)
+        self.assertEqual(WarmServer.objects.claim(self.pool.key), newest)
+        self.assertIsNone(WarmServer.objects.claim(self.pool.key))
+
+    @patch('instance.models.server.OpenStackServer.terminate', autospec=True)
+    @patch('instance.models.server.OpenStackServer.sleep_until')
+    @patch('instance.models.server.OpenStackServer.start')
+    def test_refill(self, mock_start, mock_sleep_until, mock_terminate):
+        """
+        Expired servers are recycled, and the missing servers are all started before waiting for them
+        """
+        with freeze_time(timezone.now() - timezone.timedelta(hours=2)):
+            expired = self.make_warm_server()
+        self.make_warm_server()
+        self.pool = self.pool._replace(size=3)
+        calls = []
+        mock_start.side_effect = lambda **kwargs: calls.append('start')
+        mock_sleep_until.side_effect = lambda *args, **kwargs: calls.append('sleep_until')
+
+        WarmServer.objects.refill(self.pool)
+
+        self.assertEqual([call[0][0].pk for call in mock_terminate.call_args_list], [expired.server.pk])
+        self.assertEqual(calls, ['start', 'start', 'sleep_until', 'sleep_until'])
+        self.assertEqual(mock_start.call_args[1]['security_groups'], ['edxapp-appserver'])
+        self.assertEqual(WarmServer.objects.not_expired().filter(pool_key=self.pool.key).count(), 3)
+        self.assertEqual(
+            OpenStackServer.objects.filter(name_prefix=WARM_POOL_NAME_PREFIX, warm_server__isnull=False).count(), 3
+        )
+
+    @patch('instance.models.server.OpenStackServer.terminate', autospec=True)
+    @patch('instance.models.server.OpenStackServer.sleep_until', side_effect=TimeoutError)
+    @patch('instance.models.server.OpenStackServer.start')
+    def test_refill_boot_failed(self, mock_start, mock_sleep_until, mock_terminate):
+        """
+        Servers that fail to boot are terminated instead of joining the pool
+        """
+        WarmServer.objects.refill(self.pool)
+        self.assertEqual(mock_start.call_count, 2)
+        self.assertEqual(mock_terminate.call_count, 2)
+        self.assertFalse(WarmServer.objects.exists())
@@ -865,6 +865,48 @@ class ConsulAgentTest(TestCase):
         _, values = self.client.kv.get('', recurse=True)
         self.assertEqual(len(values), 1)
 
+    def test_init_shared_client(self):
+        """
+        All agents share the same Consul client.
+        """
+        self.assertIs(self.agent._client, self.prefixed_agent._client)
+        self.assertIs(self.agent._client, ConsulAgent.get_client())
+
+    def test_get_all(self):
+        """
+        Getting all keys with a prefix returns their modify index and casted value.
+        """
+        self.client.kv.put(self.prefix + 'key', '1')
+        self.client.kv.put(self.prefix + 'another_key', json.dumps({'test': 'value'}))
+        self.client.kv.put('dummy_key', 'dummy')
+
+        values = self.prefixed_agent.get_all()
+        self.assertEqual(set(values), {'key', 'another_key'})
+        self.assertEqual(values['key'][1], 1)
+        self.assertEqual(values['another_key'][1], {'test': 'value'})
+        self.assertEqual(values['key'][0], self.client.kv.get(self.prefix + 'key')[1]['ModifyIndex'])
+        self.assertEqual(self.prefixed_agent.get_all('nope'), {})
+
+    def test_txn(self):
+        """
+        Transactions of check-and-set operations are applied atomically.
+        """
+        agent = self.prefixed_agent
+        self.assertTrue(agent.txn([agent.cas_operation('key', {'test': 'value'}, 0)]))
+        stored = agent.get_all()
+        self.assertEqual(stored['key'][1], {'test': 'value'})
+
+        # A check-and-set with an outdated index rolls back the whole transaction
+        self.assertFalse(agent.txn([agent.cas_operation('another_key', 1, 0), agent.cas_operation('key', 2, 0)]))
+        self.assertEqual(agent.get_all(), stored)
+
+        self.assertTrue(agent.txn([
+            agent.cas_operation('another_key', 1, 0),
+            agent.cas_operation('key', 2, stored['key'][0]),
+        ]))
+        self.assertEqual(agent.get('key'), 2)
+        self.assertEqual(agent.get('another_key'), 1)
+
     def test_cast_value(self):
         """
         Test the supported casted values in our Consul agent. Currently supporting integers,
@@ -22,10 +22,17 @@ Ansible - Tests
 
 # Imports #####################################################################
 
+from datetime import datetime, timezone
 import os.path
+from tempfile import mkdtemp
+import shutil
+import threading
+import time
 from unittest import mock
 from unittest.mock import patch
 
+from django.conf import settings
+from django.test import override_settings
 import yaml
 
 from instance import ansible
@@ -97,6 +104,7 @@ class AnsibleTestCase(TestCase):
     """
     Test cases for ansible helper functions & wrappers
     """
+    @override_settings(ANSIBLE_VENV_CACHE_DIR='')
     def test_run_playbook(self):
         """
         Run the ansible-playbook command
@@ -128,7 +136,10 @@ class AnsibleTestCase(TestCase):
                 requirements_path='/tmp/requirements.txt',
                 playbook_name='playbook_name',
                 remote_username='root',
-                venv_path='/tmp/tempdir/venv'
+                venv_path='/tmp/tempdir/venv',
+                create_venv=True,
+                tags=None,
+                skip_tags=None,
             )
 
             mock_popen.assert_called_once_with(
@@ -138,6 +149,29 @@ class AnsibleTestCase(TestCase):
             self.assertIn('env', call_kwargs)
             self.assertEqual(call_kwargs['env']['TMPDIR'], '/tmp/tempdir')
 
+    def test_run_playbook_cached_venv(self):
+        """
+        Run the ansible-playbook command in a cached venv
+        """
+        with patch('instance.ansible.render_sandbox_creation_command', return_value="ANSIBLE CMD") as mock_render, \
+                patch('instance.ansible.venv_cache.venv') as mock_venv, \
+                patch('subprocess.Popen'):
+            mock_venv.return_value.__enter__.return_value = '/cache/venv'
+            with ansible.run_playbook(
+                requirements_path="/tmp/requirements.txt",
+                inventory_str="INVENTORY: 'str'",
+                vars_str="VARS: 'str2'",
+                playbook_path='/play/book',
+                playbook_name='playbook_name'
+            ):
+                # The venv must not be released while the playbook is running
+                mock_venv.return_value.__exit__.assert_not_called()
+
+        mock_venv.assert_called_once_with('/tmp/requirements.txt')
+        mock_venv.return_value.__exit__.assert_called_once_with(None, None, None)
+        self.assertEqual(mock_render.call_args[1]['venv_path'], '/cache/venv')
+        self.assertFalse(mock_render.call_args[1]['create_venv'])
+
     def test_render_command(self):
         """
         Run the render_sandbox_creation_command function
@@ -160,6 +194,103 @@ class AnsibleTestCase(TestCase):
 
         self.assertEqual(expected, run_playbook_command)
 
+    def test_render_command_existing_venv(self):
+        """
+        Run the render_sandbox_creation_command function for an existing venv
+        """
+        run_playbook_command = ansible.render_sandbox_creation_command(
+            requirements_path='/requirements/path.txt',
+            inventory_path="/tmp/inventory/path",
+            vars_path="/tmp/vars/path",
+            playbook_name='playbook_name',
+            remote_username="root",
+            venv_path='/tmp/venv',
+            create_venv=False,
+        )
+        self.assertEqual(
+            run_playbook_command,
+            '/tmp/venv/bin/python -u /tmp/venv/bin/ansible-playbook -i /tmp/inventory/path '
+            '-e @/tmp/vars/path -u root playbook_name'
+        )
+
+    def test_render_command_tags(self):
+        """
+        Run the render_sandbox_creation_command function with tags to run and skip
+        """
+        run_playbook_command = ansible.render_sandbox_creation_command(
+            requirements_path='/requirements/path.txt',
+            inventory_path="/tmp/inventory/path",
+            vars_path="/tmp/vars/path",
+            playbook_name='playbook_name',
+            remote_username="root",
+            venv_path='/tmp/venv',
+            create_venv=False,
+            tags='install:base,install:system-requirements',
+            skip_tags='manage',
+        )
+        self.assertEqual(
+            run_playbook_command,
+            '/tmp/venv/bin/python -u /tmp/venv/bin/ansible-playbook -i /tmp/inventory/path '
+            '-e @/tmp/vars/path -u root playbook_name '
+            '--tags install:base,install:system-requirements --skip-tags manage'
+        )
+
+    @override_settings(ANSIBLE_VENV_CACHE_DIR='')
+    def test_run_playbook_task_timings(self):
+        """
+        Run the ansible-playbook command with the task timing callback plugin, and collect the task timings
+        """
+        def popen(cmd, env, **kwargs):
+            """ Write the events of the task timing callback plugin """
+            self.assertIn(ansible.TASK_TIMING_CALLBACK, env['ANSIBLE_CALLBACK_WHITELIST'].split(','))
+            self.assertTrue(os.path.isfile(os.path.join(
+                env['ANSIBLE_CALLBACK_PLUGINS'].split(os.pathsep)[-1], ansible.TASK_TIMING_CALLBACK + '.py'
+            )))
+            with open(env[ansible.TASK_TIMING_PATH_VARIABLE], 'a') as events_file:
+                events_file.write(
+                    '{"event": "task_start", "uuid": "1", "role": "common", "task": "Install", "time": 100.0}\n'
+                    '{"event": "task_end", "uuid": "1", "host": "1.2.3.4", "time": 160.5, '
+                    '"changed": true, "failed": false, "skipped": false}\n'
+                )
+
+        task_timings = []
+        with patch('instance.ansible.render_sandbox_creation_command', return_value="ANSIBLE CMD"), \
+                patch('subprocess.Popen', side_effect=popen):
+            with ansible.run_playbook(
+                requirements_path="/tmp/requirements.txt",
+                inventory_str="INVENTORY: 'str'",
+                vars_str="VARS: 'str2'",
+                playbook_path='/play/book',
+                playbook_name='playbook_name',
+                task_timings=task_timings,
+            ):
+                self.assertEqual(task_timings, [])
+
+        self.assertEqual(task_timings, [ansible.TaskTiming(
+            role='common', task='Install', host='1.2.3.4', started=datetime(1970, 1, 1, 0, 1, 40, tzinfo=timezone.utc),
+            duration=60.5, changed=True, failed=False, skipped=False,
+        )])
+
+    def test_read_task_timings(self):
+        """
+        The tasks that didn't end and the incomplete lines are ignored
+        """
+        path = ansible.string_to_file_path(
+            '{"event": "task_start", "uuid": "1", "role": null, "task": "setup", "time": 10.0}\n'
+            '{"event": "task_start", "uuid": "2", "role": "nginx", "task": "Configure", "time": 12.0}\n'
+            '{"event": "task_end", "uuid": "2", "host": "a", "time": 13.0, "changed": false, '
+            '"failed": false, "skipped": true}\n'
+            '{"event": "task_end", "uuid": "2", "host": "b", "time": 15.0, "changed": true, '
+            '"failed": true, "skipped": false}\n'
+            '{"event": "task_start", "uuid": "3", "ro'
+        )
+        self.addCleanup(os.remove, path)
+        self.assertEqual(
+            [(timing.role, timing.task, timing.host, timing.duration, timing.changed, timing.failed, timing.skipped)
+             for timing in ansible.read_task_timings(path)],
+            [('nginx', 'Configure', 'a', 1.0, False, False, True), ('nginx', 'Configure', 'b', 3.0, True, True, False)],
+        )
+
     def test_create_temp_dir_ok(self):
         """
         Check if create_temp_dir behaves correctly when no exception is
@@ -201,3 +332,143 @@ class AnsibleTestCase(TestCase):
                 self.assertEqual("TEST ąęłźżó", f.read())
         finally:
             os.remove(file_path)
+
+
+class AnsibleVenvCacheTestCase(TestCase):
+    """
+    Test cases for the Ansible virtualenv cache
+    """
+    def setUp(self):
+        super().setUp()
+        cache_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        settings_override = override_settings(ANSIBLE_VENV_CACHE_DIR=cache_dir, ANSIBLE_VENV_CACHE_MAX_SIZE=10000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache = ansible.AnsibleVenvCache()
+
+        # Build fake 1000-byte virtualenvs instead of running virtualenv and pip
+        patcher = patch(
+            'instance.ansible.render_venv_creation_command',
+            side_effect=lambda requirements_path, venv_path: (
+                'mkdir -p {0} && head -c 1000 /dev/zero > {0}/python'.format(venv_path)
+            ),
+        )
+        self.mock_render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_requirements(self, content):
+        """
+        Return the path of a requirements file with the given content
+        """
+        path = ansible.string_to_file_path(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_venv_built_once(self):
+        """
+        The virtualenv of a requirements file is only built the first time it is needed
+        """
+        requirements_path = self.make_requirements('ansible==2.3.1.0\n')
+        with self.cache.venv(requirements_path) as venv_path:
+            self.assertTrue(os.path.exists(os.path.join(venv_path, 'python')))
+        with self.cache.venv(self.make_requirements('ansible==2.3.1.0\n')) as cached_venv_path:
+            self.assertEqual(cached_venv_path, venv_path)
+        self.assertEqual(self.mock_render.call_count, 1)
+        self.assertEqual([(key, size) for key, size, unused_last_used in self.cache.entries()], [
+            (os.path.basename(venv_path), 1000),
+        ])
+
+    def test_venv_concurrent(self):
+        """
+        Concurrent callers wait for a single build, but not for the other runs using the virtualenv
+        """
+        self.mock_render.side_effect = lambda requirements_path, venv_path: (
+            'mkdir -p {0} && sleep 0.5 && head -c 1000 /dev/zero > {0}/python'.format(venv_path)
+        )
+        requirements_path = self.make_requirements('ansible==2.3.1.0\n')
+        venv_path = os.path.join(settings.ANSIBLE_VENV_CACHE_DIR, self.cache.get_key(requirements_path))
+        release = threading.Event()
+        results = []
+
+        def use_venv(hold):
+            """ Use the virtualenv, and keep it in use until released if `hold` is set """
+            with self.cache.venv(requirements_path) as path:
+                results.append(path)
+                if hold:
+                    release.wait(10)
+
+        holder = threading.Thread(target=use_venv, args=(True,))
+        holder.start()
+        self.addCleanup(holder.join, 10)
+        self.addCleanup(release.set)
+        # Start the second caller while the virtualenv is being built
+        deadline = time.monotonic() + 5
+        while not os.path.isdir(venv_path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(os.path.exists(os.path.join(venv_path, self.cache.MARKER_FILENAME)))
+        waiter = threading.Thread(target=use_venv, args=(False,))
+        waiter.start()
+
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.assertTrue(holder.is_alive())
+        self.assertEqual(results, [venv_path, venv_path])
+        self.assertEqual(self.mock_render.call_count, 1)
+
+    def test_key(self):
+        """
+        The cache key depends on the content of the requirements file and the Python interpreter
+        """
+        requirements_path = self.make_requirements('ansible==2.3.1.0\n')
+        key = self.cache.get_key(requirements_path)
+        self.assertEqual(self.cache.get_key(self.make_requirements('ansible==2.3.1.0\n')), key)
+        self.assertNotEqual(self.cache.get_key(self.make_requirements('ansible==2.4.0.0\n')), key)
+        self.assertNotEqual(self.cache.get_key(requirements_path, python_path='/usr/bin/python2.7'), key)
+
+    def test_build_failure(self):
+        """
+        No virtualenv is cached when building it fails
+        """
+        self.mock_render.side_effect = lambda requirements_path, venv_path: 'mkdir -p {} && false'.format(venv_path)
+        requirements_path = self.make_requirements('ansible==2.3.1.0\n')
+        with self.assertLogs('instance.ansible', 'ERROR'), self.cache.venv(requirements_path) as venv_path:
+            self.assertIsNone(venv_path)
+        self.assertEqual(self.cache.entries(), [])
+        venv_path = os.path.join(settings.ANSIBLE_VENV_CACHE_DIR, self.cache.get_key(requirements_path))
+        self.assertFalse(os.path.exists(venv_path))
+
+    @override_settings(ANSIBLE_VENV_CACHE_DIR='')
+    def test_disabled(self):
+        """
+        No virtualenv is provided when the cache is disabled
+        """
+        with self.cache.venv(self.make_requirements('ansible==2.3.1.0\n')) as venv_path:
+            self.assertIsNone(venv_path)
+        self.mock_render.assert_not_called()
+
+    def test_evict(self):
+        """
+        The least recently used virtualenvs are deleted when the cache is full, unless they are in use
+        """
+        keys = []
+        for version in range(4):
+            with self.cache.venv(self.make_requirements('ansible=={}\n'.format(version))) as venv_path:
+                keys.append(os.path.basename(venv_path))
+                os.utime(os.path.join(venv_path, self.cache.MARKER_FILENAME), (version, version))
+
+        self.assertEqual(self.cache.evict(max_size=3000), [keys[0]])
+        with self.cache.venv(self.make_requirements('ansible==1\n')):
+            self.assertEqual(self.cache.evict(max_size=0), [keys[2], keys[3]])
+        self.assertEqual([key for key, unused_size, unused_last_used in self.cache.entries()], [keys[1]])
+        self.assertFalse(os.path.exists(os.path.join(settings.ANSIBLE_VENV_CACHE_DIR, keys[0])))
+
+    def test_evict_when_full(self):
+        """
+        Building a virtualenv that makes the cache exceed its max size evicts the least recently used ones
+        """
+        with override_settings(ANSIBLE_VENV_CACHE_MAX_SIZE=2500):
+            for version in range(3):
+                with self.cache.venv(self.make_requirements('ansible=={}\n'.format(version))):
+                    pass
+        self.assertEqual(len(self.cache.entries()), 2)
@@ -22,9 +22,13 @@ Gandi - Tests
 
 # Imports #####################################################################
 
+import threading
 from unittest.mock import call, patch
 import xmlrpc.client
 
+from django.core.cache import cache
+from django.test import override_settings
+
 from instance import gandi
 from instance.tests.base import TestCase
 from instance.tests.fake_gandi_client import FakeGandiClient
@@ -39,6 +43,14 @@ class GandiTestCase(TestCase):
     def setUp(self):
         super().setUp()
         self.api = gandi.GandiAPI(client=FakeGandiClient())
+        self.clear_zone_id_cache()
+        self.addCleanup(self.clear_zone_id_cache)
+
+    def clear_zone_id_cache(self):
+        """
+        Remove the shared zone ID cache, and its refresh lock.
+        """
+        cache.delete_many([self.api.zone_id_cache_key, self.api.zone_id_cache_key + ':refreshing'])
 
     def populate_cache(self):
         """
@@ -81,6 +93,57 @@ class GandiTestCase(TestCase):
             call.info('TEST_GANDI_API_KEY', 'opencraft.co.uk'),
         ], any_order=True)
 
+    def test_zone_id_cache_shared(self):
+        """
+        Test that the zone ID cache populated by one process is used by the others, without any API calls.
+        """
+        self.populate_cache()
+        other_api = gandi.GandiAPI(client=FakeGandiClient())
+        self.assertEqual(other_api.get_zone_id('example.com'), 1234)
+        self.assertEqual(other_api.split_domain_name('sub.domain.test.com'), ('sub.domain', 'test.com'))
+        self.assertEqual(other_api.client.domain.mock_calls, [])
+
+    def test_zone_id_cache_miss(self):
+        """
+        Test that a domain missing from the zone ID cache is looked up on its own.
+        """
+        self.populate_cache()
+        zone_ids, populated_at = cache.get(self.api.zone_id_cache_key)
+        del zone_ids['opencraft.co.uk']
+        cache.set(self.api.zone_id_cache_key, (zone_ids, populated_at))
+
+        other_api = gandi.GandiAPI(client=FakeGandiClient())
+        self.assertEqual(other_api.split_domain_name('sub.domain.opencraft.co.uk'), ('sub.domain', 'opencraft.co.uk'))
+        self.assertEqual(other_api.client.domain.mock_calls, [
+            call.info('TEST_GANDI_API_KEY', 'co.uk'),
+            call.info('TEST_GANDI_API_KEY', 'opencraft.co.uk'),
+        ])
+        self.assertEqual(cache.get(self.api.zone_id_cache_key)[0]['opencraft.co.uk'], 4711)
+
+        # The domain is now cached
+        other_api.client.domain.reset_mock()
+        self.assertEqual(other_api.get_zone_id('opencraft.co.uk'), 4711)
+        self.assertEqual(other_api.client.domain.mock_calls, [])
+
+    def test_zone_id_cache_refresh(self):
+        """
+        Test that a stale zone ID cache is refreshed in the background, once at a time.
+        """
+        self.populate_cache()
+        other_api = gandi.GandiAPI(client=FakeGandiClient())
+        with override_settings(GANDI_ZONE_ID_CACHE_TTL=-1), patch('instance.gandi.threading.Thread') as mock_thread:
+            self.assertEqual(other_api.get_zone_id('test.com'), 9900)
+            self.assertEqual(gandi.GandiAPI(client=FakeGandiClient()).get_zone_id('test.com'), 9900)
+        self.assertEqual(other_api.client.domain.mock_calls, [])
+        self.assertEqual(mock_thread.call_count, 1)
+        mock_thread.return_value.start.assert_called_once_with()
+
+        # Run the refresh
+        refresh_kwargs = mock_thread.call_args[1]
+        refresh_kwargs['target'](*refresh_kwargs['args'])
+        self.assertEqual(len(other_api.client.domain.mock_calls), 4)
+        self.assertIsNone(cache.get(refresh_kwargs['args'][0]))
+
     def test_split_domain_name(self):
         """
         Test that splitting domain names in subdomain and registered domain works correctly.
@@ -168,3 +231,154 @@ class GandiTestCase(TestCase):
             ),
             call.zone.version.set('TEST_GANDI_API_KEY', 9900, 1),
         ])
+
+    def test_update_dns_records(self):
+        """
+        Test that update_dns_records() uses a single zone version for all changes to a zone.
+        """
+        self.populate_cache()
+        self.api.set_dns_record('old.test.com', type='A', value='192.168.99.1')
+        self.api.client.domain.reset_mock()
+        self.api.update_dns_records(
+            set_records=[
+                ('sub.domain.test.com', dict(type='A', value='192.168.99.99')),
+                ('studio.example.com', dict(type='CNAME', value='lb.example.com.', ttl=300)),
+            ],
+            remove_domains=['old.test.com'],
+        )
+        self.assertEqual(self.api.client.domain.mock_calls, [
+            call.zone.version.new('TEST_GANDI_API_KEY', 9900),
+            call.zone.record.delete('TEST_GANDI_API_KEY', 9900, 2, {'type': ['A', 'CNAME'], 'name': 'sub.domain'}),
+            call.zone.record.add(
+                'TEST_GANDI_API_KEY', 9900, 2,
+                {'value': '192.168.99.99', 'ttl': 1200, 'type': 'A', 'name': 'sub.domain'}
+            ),
+            call.zone.record.delete('TEST_GANDI_API_KEY', 9900, 2, {'type': ['A', 'CNAME'], 'name': 'old'}),
+            call.zone.version.set('TEST_GANDI_API_KEY', 9900, 2),
+            call.zone.version.new('TEST_GANDI_API_KEY', 1234),
+            call.zone.record.delete('TEST_GANDI_API_KEY', 1234, 1, {'type': ['A', 'CNAME'], 'name': 'studio'}),
+            call.zone.record.add(
+                'TEST_GANDI_API_KEY', 1234, 1,
+                {'value': 'lb.example.com.', 'ttl': 300, 'type': 'CNAME', 'name': 'studio'}
+            ),
+            call.zone.version.set('TEST_GANDI_API_KEY', 1234, 1),
+        ])
+        self.assertEqual(self.api.client.list_records('test.com'), [
+            {'value': '192.168.99.99', 'ttl': 1200, 'type': 'A', 'name': 'sub.domain'},
+        ])
+
+    def test_update_dns_records_benchmark(self):
+        """
+        Count the XML-RPC calls needed to set the DNS records of an instance,
+        record by record and in a single batch.
+        """
+        domains = [
+            '{}test.example.com'.format(prefix) for prefix in ('', 'studio-', 'preview-', 'discovery-', 'ecommerce-')
+        ]
+        self.populate_cache()
+        for domain in domains:
+            self.api.set_dns_record(domain, type='CNAME', value='lb.example.com.')
+        record_by_record_calls = len(self.api.client.domain.mock_calls)
+
+        self.api.client.domain.reset_mock()
+        self.api.update_dns_records(set_records=[
+            (domain, dict(type='CNAME', value='lb.example.com.')) for domain in domains
+        ])
+        batch_calls = self.api.client.domain.mock_calls
+
+        # Each record used to need its own zone version: new, delete, add and set.
+        self.assertEqual(record_by_record_calls, 4 * len(domains))
+        # The batch creates and activates a single zone version.
+        self.assertEqual(len(batch_calls), 2 + 2 * len(domains))
+        self.assertEqual(
+            [name for name, _, _ in batch_calls if name.startswith('zone.version')],
+            ['zone.version.new', 'zone.version.set'],
+        )
+        self.assertEqual(len(self.api.client.list_records('example.com')), len(domains))
+
+    def block_zone_changes(self, registered_domain):
+        """
+        Make the worker committing changes to the zone of `registered_domain` wait for the returned event.
+
+        Returns the list of (registered domain, changes) batches committed by the workers,
+        the event signalling that the blocked zone is being committed and the event releasing it.
+        """
+        batches = []
+        committing, release = threading.Event(), threading.Event()
+        apply_zone_changes = self.api.apply_zone_changes
+
+        def blocking_apply_zone_changes(zone, changes):
+            """ Record the batch, and wait for the release of the blocked zone """
+            batches.append((zone, changes))
+            if zone == registered_domain:
+                committing.set()
+                release.wait(5)
+            apply_zone_changes(zone, changes)
+
+        patcher = patch.object(self.api, 'apply_zone_changes', side_effect=blocking_apply_zone_changes)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(release.set)
+        return batches, committing, release
+
+    def test_enqueue_dns_changes(self):
+        """
+        Test that the changes enqueued while a zone is being committed are coalesced, and that
+        the last change for each name wins.
+        """
+        self.populate_cache()
+        batches, committing, release = self.block_zone_changes('test.com')
+        first = self.api.enqueue_dns_changes(set_records=[('a.test.com', dict(type='A', value='192.168.99.1'))])
+        self.assertTrue(committing.wait(5))
+        second = self.api.enqueue_dns_changes(set_records=[('b.test.com', dict(type='A', value='192.168.99.2'))])
+        third = self.api.enqueue_dns_changes(
+            set_records=[('b.test.com', dict(type='A', value='192.168.99.3'))],
+            remove_domains=['a.test.com'],
+        )
+        self.assertFalse(second.done())
+        release.set()
+        for change in (first, second, third):
+            change.wait(5)
+
+        self.assertEqual(batches, [
+            ('test.com', [('a', {'name': 'a', 'type': 'A', 'value': '192.168.99.1', 'ttl': 1200})]),
+            ('test.com', [('b', {'name': 'b', 'type': 'A', 'value': '192.168.99.3', 'ttl': 1200}), ('a', None)]),
+        ])
+        self.assertEqual(self.api.client.list_records('test.com'), [
+            {'name': 'b', 'type': 'A', 'value': '192.168.99.3', 'ttl': 1200},
+        ])
+
+    def test_enqueue_dns_changes_parallel_zones(self):
+        """
+        Test that the changes to different zones are committed in parallel.
+        """
+        self.populate_cache()
+        _, committing, release = self.block_zone_changes('test.com')
+        blocked = self.api.enqueue_dns_changes(set_records=[('a.test.com', dict(type='A', value='192.168.99.1'))])
+        self.assertTrue(committing.wait(5))
+        other_zone = self.api.enqueue_dns_changes(
+            set_records=[('a.example.com', dict(type='A', value='192.168.99.2'))],
+        )
+        other_zone.wait(5)
+        self.assertFalse(blocked.done())
+        self.assertEqual(len(self.api.client.list_records('example.com')), 1)
+        release.set()
+        blocked.wait(5)
+        self.assertEqual(len(self.api.client.list_records('test.com')), 1)
+
+    @patch('time.sleep')
+    def test_enqueue_dns_changes_error(self, sleep):
+        """
+        Test that waiting for changes that failed to be committed raises the error.
+        """
+        self.populate_cache()
+        self.api.client.make_version_creation_fail(10)
+        change = self.api.enqueue_dns_changes(set_records=[('a.test.com', dict(type='A', value='192.168.99.1'))])
+        with self.assertRaises(xmlrpc.client.Fault):
+            change.wait(5)
+        self.assertEqual(sleep.call_count, 3)
+
+        # The worker of the zone has stopped, and a new one handles the next changes
+        self.api.client.make_version_creation_fail(0)
+        self.api.enqueue_dns_changes(set_records=[('a.test.com', dict(type='A', value='192.168.99.1'))]).wait(5)
+        self.assertEqual(len(self.api.client.list_records('test.com')), 1)
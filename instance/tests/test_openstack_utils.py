@@ -23,11 +23,13 @@ OpenStack Utilities - Tests
 # Imports #####################################################################
 
 from collections import namedtuple
+import threading
 from unittest import mock
 from unittest.mock import Mock, call, patch, MagicMock
 
 import ddt
 from django.conf import settings
+from django.test import override_settings
 from openstack.network.v2.security_group import SecurityGroup
 from openstack.network.v2.security_group_rule import SecurityGroupRule
 import requests
@@ -88,6 +90,8 @@ class OpenStackTestCase(TestCase):
         super().setUp()
 
         self.nova = Mock()
+        openstack_utils.client_pool.clear()
+        self.addCleanup(openstack_utils.client_pool.clear)
 
     def test_get_openstack_connection(self):
         """
@@ -99,6 +103,69 @@ class OpenStackTestCase(TestCase):
         # TODO: In future we could use 'mimic' to fake the OpenStack API for testing.
         # Then, here we could test 'conn.authorize()'
 
+    def test_get_openstack_connection_pooled(self):
+        """
+        Test that get_openstack_connection() reuses the connection of each region
+        """
+        conn = openstack_utils.get_openstack_connection("some_region")
+        self.assertIs(openstack_utils.get_openstack_connection("some_region"), conn)
+        self.assertIsNot(openstack_utils.get_openstack_connection("other_region"), conn)
+        self.assertEqual(openstack_utils.client_pool.stats, {'hits': 1, 'misses': 2})
+
+    def test_get_nova_client_pooled(self):
+        """
+        Test that get_nova_client() reuses the client of each region
+        """
+        nova = openstack_utils.get_nova_client("some_region")
+        self.assertIs(openstack_utils.get_nova_client("some_region"), nova)
+        self.assertIsNot(openstack_utils.get_nova_client("other_region"), nova)
+        self.assertEqual(openstack_utils.client_pool.stats, {'hits': 1, 'misses': 2})
+
+    def test_client_pool_reauth(self):
+        """
+        Test that pooled clients are recreated once they have reached their max age
+        """
+        create_client = Mock(side_effect=lambda: object())
+        client = openstack_utils.client_pool.get('key', create_client)
+        with override_settings(OPENSTACK_CLIENT_POOL_MAX_AGE=0):
+            new_client = openstack_utils.client_pool.get('key', create_client)
+        self.assertIsNot(new_client, client)
+        self.assertIs(openstack_utils.client_pool.get('key', create_client), new_client)
+        self.assertEqual(create_client.call_count, 2)
+        self.assertEqual(openstack_utils.client_pool.stats, {'hits': 1, 'misses': 1, 'reauths': 1})
+
+    def test_client_pool_concurrent_creation(self):
+        """
+        Test that creating a client only blocks the callers that need the same client
+        """
+        creating = threading.Event()
+        release = threading.Event()
+
+        def create_slow_client():
+            """ Stand for a slow authentication """
+            creating.set()
+            release.wait(5)
+            return 'slow'
+
+        results = []
+        slow_thread = threading.Thread(target=lambda: results.append(
+            openstack_utils.client_pool.get('slow', create_slow_client)
+        ))
+        waiting_thread = threading.Thread(target=lambda: results.append(
+            openstack_utils.client_pool.get('slow', lambda: 'duplicate')
+        ))
+        slow_thread.start()
+        self.assertTrue(creating.wait(5))
+        waiting_thread.start()
+
+        # Other clients can be fetched while the slow one is being created
+        self.assertEqual(openstack_utils.client_pool.get('fast', lambda: 'fast'), 'fast')
+        release.set()
+        slow_thread.join(5)
+        waiting_thread.join(5)
+        self.assertEqual(results, ['slow', 'slow'])
+        self.assertEqual(openstack_utils.client_pool.stats, {'hits': 1, 'misses': 2})
+
     RULE1_DICT = {
         "direction": "egress", "ether_type": "IPv6", "protocol": None,
         "port_range_min": None, "port_range_max": None,
@@ -310,6 +377,82 @@ class OpenStackTestCase(TestCase):
         self.assertEqual(mock_retry_sleep.call_count, 10)
 
 
+@override_settings(SERVER_STATUS_WATCHER_MIN_INTERVAL=0.01, SERVER_STATUS_WATCHER_MAX_INTERVAL=0.04)
+class ServerStatusWatcherTestCase(TestCase):
+    """
+    Tests for the ServerStatusWatcher
+    """
+    def setUp(self):
+        super().setUp()
+        self.watcher = openstack_utils.ServerStatusWatcher()
+        self.os_servers = [Mock(id='vm1', status='BUILD', addresses={}), Mock(id='vm2', status='ACTIVE', addresses={})]
+        patcher = patch('instance.openstack_utils.get_nova_client')
+        self.mock_get_nova_client = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_list = self.mock_get_nova_client.return_value.servers.list
+        self.mock_list.side_effect = lambda: self.os_servers
+
+    def test_wait(self):
+        """
+        Test that wait() returns the server from the next listing of its region
+        """
+        waited, os_server = self.watcher.wait('some_region', 'vm2', timeout=5)
+        self.assertIs(os_server, self.os_servers[1])
+        self.assertLess(waited, 5)
+        self.mock_get_nova_client.assert_called_with('some_region')
+
+    def test_wait_unknown_server(self):
+        """
+        Test that wait() returns None for servers missing from the listing
+        """
+        _waited, os_server = self.watcher.wait('some_region', 'vm3', timeout=5)
+        self.assertIsNone(os_server)
+
+    def test_wait_listing_error(self):
+        """
+        Test that wait() returns None when the servers can't be listed, and the watcher keeps going
+        """
+        self.mock_list.side_effect = requests.RequestException('Unreachable')
+        _waited, os_server = self.watcher.wait('some_region', 'vm1', timeout=5)
+        self.assertIsNone(os_server)
+        self.mock_list.side_effect = lambda: self.os_servers
+        _waited, os_server = self.watcher.wait('some_region', 'vm1', timeout=5)
+        self.assertIs(os_server, self.os_servers[0])
+
+    def test_shared_listing(self):
+        """
+        Test that concurrent waiters on the same region share a single listing
+        """
+        results = {}
+
+        def wait(openstack_id):
+            """ Wait for the given server in a separate thread """
+            results[openstack_id] = self.watcher.wait('some_region', openstack_id, timeout=5)[1]
+
+        # Hold the watcher lock so that both waiters are registered before the first listing completes
+        with self.watcher._condition:
+            threads = [threading.Thread(target=wait, args=(openstack_id,)) for openstack_id in ('vm1', 'vm2')]
+            for thread in threads:
+                thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {'vm1': self.os_servers[0], 'vm2': self.os_servers[1]})
+        self.assertLessEqual(self.mock_list.call_count, 2)
+
+    def test_poll_backoff(self):
+        """
+        Test that the poll interval doubles up to the maximum while nothing changes, and resets on changes
+        """
+        self.watcher._waiters['some_region']['vm1'] += 1
+        self.assertEqual(self.watcher.poll('some_region', 0.01), 0.01)  # First listing of vm1
+        self.assertEqual(self.watcher.poll('some_region', 0.01), 0.02)
+        self.assertEqual(self.watcher.poll('some_region', 0.02), 0.04)
+        self.assertEqual(self.watcher.poll('some_region', 0.04), 0.04)
+        self.os_servers[0].status = 'ACTIVE'
+        self.assertEqual(self.watcher.poll('some_region', 0.04), 0.01)
+        self.assertEqual(self.watcher.stats['polls'], 5)
+
+
 @ddt.ddt
 class SwiftTestCase(TestCase):
     """Tests for various swift functions."""
@@ -470,10 +613,16 @@ class SwiftTestCase(TestCase):
 class ServicePassesAuthTestCase(TestCase):
     """Tests for swift_service call."""
 
-    # pylint: disable=no-self-use
+    def setUp(self):
+        super().setUp()
+        openstack_utils.client_pool.clear()
+        self.addCleanup(openstack_utils.client_pool.clear)
+
     def test_service_passes_auth(self):
         """Test if swift_service passes authorization properly. """
-        with mock.patch('instance.openstack_utils.SwiftService') as service:
+        with mock.patch('instance.openstack_utils.SwiftService') as service, \
+                mock.patch('instance.openstack_utils.swift_get_auth') as get_auth:
+            get_auth.return_value = ('https://storage.example.com/v1/AUTH_tenant', 'token')
             openstack_utils.swift_service(
                 user='user',
                 password='password',
@@ -482,6 +631,10 @@ class ServicePassesAuthTestCase(TestCase):
                 region='Region'
             )
 
+        get_auth.assert_called_once_with(
+            'http://example.com/auth', 'user', 'password',
+            auth_version='2', os_options={'tenant_name': 'tenant', 'region_name': 'Region'},
+        )
         service.assert_called_once_with(
             options={
                 'auth_version': '2',
@@ -489,6 +642,20 @@ class ServicePassesAuthTestCase(TestCase):
                 'os_password': 'password',
                 'os_tenant_name':  'tenant',
                 'os_auth_url': 'http://example.com/auth',
-                'os_region_name': 'Region'
+                'os_region_name': 'Region',
+                'os_auth_token': 'token',
+                'os_storage_url': 'https://storage.example.com/v1/AUTH_tenant',
             }
         )
+
+    def test_service_reuses_token(self):
+        """Test that swift services created with the same credentials share the authentication token."""
+        with mock.patch('instance.openstack_utils.SwiftService'), \
+                mock.patch('instance.openstack_utils.swift_get_auth') as get_auth:
+            get_auth.return_value = ('https://storage.example.com/v1/AUTH_tenant', 'token')
+            openstack_utils.swift_service(**CONTAINER_AUTH)
+            openstack_utils.swift_service(**CONTAINER_AUTH)
+            openstack_utils.swift_service(**dict(CONTAINER_AUTH, region='BHS1'))
+
+        self.assertEqual(get_auth.call_count, 2)
+        self.assertEqual(openstack_utils.client_pool.stats, {'hits': 1, 'misses': 2})
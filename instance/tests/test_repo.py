@@ -23,8 +23,13 @@ Git repository - Tests
 # Imports #####################################################################
 
 import os.path
+import shutil
+import subprocess
+from tempfile import mkdtemp
 from unittest.mock import call, patch
 
+from django.test import override_settings
+
 from instance import repo
 from instance.tests.base import TestCase
 
@@ -48,3 +53,114 @@ class RepoTestCase(TestCase):
             self.assertTrue(os.path.isdir(tmp_dir_path))
             self.assertEqual(mock_repo.mock_calls, [call.checkout('test-branch')])
         self.assertFalse(os.path.isdir(tmp_dir_path))
+
+
+class RepositoryCacheTestCase(TestCase):
+    """
+    Test cases for the git repository cache
+    """
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        settings_override = override_settings(GIT_CACHE_DIR=self.cache_dir, GIT_CACHE_MAX_SIZE=10 ** 9)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache = repo.RepositoryCache()
+
+        # A local repository standing in for the remote one
+        self.origin = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.origin)
+        self.git('init', '--quiet')
+        self.git('symbolic-ref', 'HEAD', 'refs/heads/master')
+        self.commit('first_file')
+
+    def git(self, *args):
+        """
+        Run a git command in the origin repository and return its output
+        """
+        return subprocess.check_output(
+            ('git', '-c', 'user.name=Test', '-c', 'user.email=test@example.com') + args, cwd=self.origin,
+        ).decode().strip()
+
+    def commit(self, filename):
+        """
+        Commit a new file to the origin repository and return the commit hash
+        """
+        with open(os.path.join(self.origin, filename), 'w') as new_file:
+            new_file.write(filename)
+        self.git('add', filename)
+        self.git('commit', '--quiet', '-m', 'Add {}'.format(filename))
+        return self.git('rev-parse', 'HEAD')
+
+    def test_checkout(self):
+        """
+        The first checkout clones the mirror, later ones only fetch the new commits of branches
+        """
+        with self.cache.checkout(self.origin, 'master') as checkout:
+            working_dir = checkout.working_dir
+            self.assertEqual(sorted(os.listdir(working_dir)), ['.git', 'first_file'])
+        self.assertFalse(os.path.exists(working_dir))
+        self.assertEqual(self.cache.stats, {'misses': 1})
+
+        self.commit('second_file')
+        with self.cache.checkout(self.origin, 'master') as checkout:
+            self.assertEqual(sorted(os.listdir(checkout.working_dir)), ['.git', 'first_file', 'second_file'])
+        self.assertEqual(self.cache.stats, {'misses': 1, 'fetches': 1})
+        self.assertEqual(len(self.cache.entries()), 1)
+
+    def test_checkout_immutable_refs(self):
+        """
+        Commit hashes and tags that are already in the mirror are checked out without fetching
+        """
+        first_commit = self.git('rev-parse', 'HEAD')
+        self.git('tag', 'v1')
+        with self.cache.checkout(self.origin, 'master'):
+            pass
+        self.commit('second_file')
+        with patch('git.cmd.Git.fetch', create=True) as mock_fetch:
+            for ref in (first_commit, 'v1'):
+                with self.cache.checkout(self.origin, ref) as checkout:
+                    self.assertEqual(sorted(os.listdir(checkout.working_dir)), ['.git', 'first_file'])
+        mock_fetch.assert_not_called()
+        self.assertEqual(self.cache.stats, {'misses': 1, 'hits': 2})
+
+    def test_concurrent_checkouts(self):
+        """
+        Checkouts of the same repository don't affect each other
+        """
+        first_commit = self.git('rev-parse', 'HEAD')
+        second_commit = self.commit('second_file')
+        with self.cache.checkout(self.origin, first_commit) as first, \
+                self.cache.checkout(self.origin, second_commit) as second:
+            self.assertNotEqual(first.working_dir, second.working_dir)
+            self.assertEqual(first.rev_parse('HEAD'), first_commit)
+            self.assertEqual(second.rev_parse('HEAD'), second_commit)
+
+    def test_evict(self):
+        """
+        The least recently used mirrors are deleted when the cache is full, unless they are in use
+        """
+        with self.cache.checkout(self.origin, 'master'):
+            pass
+        other_origin = mkdtemp()
+        self.addCleanup(shutil.rmtree, other_origin)
+        shutil.rmtree(other_origin)
+        shutil.copytree(self.origin, other_origin)
+        with self.cache.checkout(other_origin, 'master'):
+            self.assertEqual(self.cache.evict(max_size=0), [self.cache.get_mirror_path(self.origin)])
+        self.assertEqual(
+            [mirror_path for mirror_path, unused_size, unused_last_used in self.cache.entries()],
+            [self.cache.get_mirror_path(other_origin)],
+        )
+
+    @override_settings(GIT_CACHE_DIR='')
+    @patch('instance.repo.open_repository')
+    def test_cache_disabled(self, mock_open_repository):
+        """
+        Repositories are cloned for each checkout when the cache is disabled
+        """
+        with self.cache.checkout(self.origin, 'master') as checkout:
+            self.assertEqual(checkout, mock_open_repository.return_value.__enter__.return_value)
+        mock_open_repository.assert_called_once_with(self.origin, ref='master')
+        self.assertEqual(os.listdir(self.cache_dir), [])
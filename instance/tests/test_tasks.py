@@ -23,21 +23,28 @@ Worker tasks - Tests
 # Imports #####################################################################
 
 from datetime import timedelta
-from unittest.mock import call, patch, PropertyMock
+from unittest.mock import ANY, call, patch, PropertyMock
 
 import ddt
 import freezegun
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from django.test import override_settings
 from django.utils import timezone
+import requests
 
 from instance import tasks
-from instance.models.log_entry import LogEntry
+from instance.models.baked_image import BakedImage, BAKED_IMAGE_KEY_FIELDS
+from instance.models.log_entry import LogEntry, LogEntryPartition
+from instance.models.openedx_appserver import OpenEdXAppServer
+from instance.models.server_pool import WarmPool
 from instance.tests.base import TestCase
 from instance.tests.models.factories.load_balancer import LoadBalancingServerFactory
 from instance.tests.models.factories.openedx_appserver import make_test_appserver
 from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
 from instance.tests.models.factories.server import ReadyOpenStackServerFactory, BootingOpenStackServerFactory
+from pr_watch import github
 from pr_watch.tests.factories import make_watched_pr_and_instance
 
 
@@ -74,7 +81,8 @@ class SpawnAppServerTestCase(TestCase):
             instance,
             failure_tag=None,
             success_tag=None,
-            num_attempts=1
+            num_attempts=1,
+            skip_provisioned_mysql=False,
         )
         # By default we don't mark_active_on_success:
         self.assertEqual(self.mock_make_appserver_active.call_count, 0)
@@ -310,6 +318,7 @@ class MakeAppserverActiveTestCase(TestCase):
 
 
 @ddt.ddt
+@override_settings(CLEAN_UP_MAX_WORKERS=1)  # Worker threads wouldn't see the data of the test transaction
 class CleanUpTestCase(TestCase):
     """
     Test cases for clean up tasks
@@ -369,12 +378,15 @@ class CleanUpTestCase(TestCase):
             closed_at = None
 
         with patch(
-            'pr_watch.github.get_pr_info_by_number',
-            return_value={'state': pr_state, 'closed_at': closed_at},
-        ):
+            'pr_watch.github.get_pr_info_by_numbers',
+            side_effect=lambda pr_keys: {pr_key: {'state': pr_state, 'closed_at': closed_at} for pr_key in pr_keys},
+        ) as mock_get_pr_info_by_numbers:
             # Run task
             tasks.shut_down_obsolete_pr_sandboxes()
 
+            # All the PRs are fetched at once
+            self.assertEqual(mock_get_pr_info_by_numbers.call_count, 1)
+
             # Check if task tried to shut down instances
             if data['instance_is_archived']:
                 self.assertEqual(mock_archive.call_count, 5)
@@ -384,6 +396,58 @@ class CleanUpTestCase(TestCase):
                 self.assertEqual(mock_archive.call_count, 0)
                 self.assertEqual(mock_logger.call_count, 10)
 
+    @patch('instance.logging.ModelLoggerAdapter.process')
+    @patch('instance.models.openedx_instance.OpenEdXInstance.archive')
+    def test_shut_down_obsolete_pr_sandboxes_missing_pr(self, mock_archive, mock_logger):
+        """
+        Test that `shut_down_obsolete_pr_sandboxes` skips the instances whose PRs can't be found on GitHub.
+        """
+        mock_logger.side_effect = self.mock_logger_process
+        for i in range(2):
+            make_watched_pr_and_instance(source_fork_name='some/fork{}'.format(i))
+
+        with patch('pr_watch.github.get_pr_info_by_numbers', return_value={}):
+            tasks.shut_down_obsolete_pr_sandboxes()
+
+        self.assertEqual(mock_archive.call_count, 0)
+        mock_logger.assert_called_with("Pull request not found on GitHub, skipping", {})
+
+    @ddt.data(github.RateLimitExceeded('Rate limit exceeded'), requests.ConnectionError('GitHub is down'))
+    @patch('instance.models.openedx_instance.OpenEdXInstance.archive')
+    def test_shut_down_obsolete_pr_sandboxes_github_error(self, error, mock_archive):
+        """
+        Test that `shut_down_obsolete_pr_sandboxes` logs a warning, instead of failing, when the PRs can't be fetched.
+        """
+        make_watched_pr_and_instance(source_fork_name='some/fork')
+
+        with patch('pr_watch.github.get_pr_info_by_numbers', side_effect=error), \
+                patch('instance.tasks.logger') as mock_logger:
+            tasks.shut_down_obsolete_pr_sandboxes()
+
+        self.assertEqual(mock_archive.call_count, 0)
+        mock_logger.warning.assert_called_once_with(
+            'Could not fetch the PRs of the sandboxes to shut down: %s', str(error),
+        )
+
+    @patch('instance.models.openedx_instance.OpenEdXInstance.terminate_obsolete_appservers')
+    def test_terminate_obsolete_appservers_errors(self, mock_terminate_appservers):
+        """
+        Test that `terminate_obsolete_appservers_all_instances` handles all instances even if
+        some of them fail.
+        """
+        for dummy in range(3):
+            OpenEdXInstanceFactory()
+        mock_terminate_appservers.side_effect = [None, Exception('Nova is down'), None]
+
+        with patch('instance.utils.logger') as mock_utils_logger:
+            tasks.terminate_obsolete_appservers_all_instances()
+
+        self.assertEqual(mock_terminate_appservers.call_count, 3)
+        mock_utils_logger.exception.assert_called_once_with('Error while processing %s', ANY)
+        report_args = mock_utils_logger.info.call_args[0]
+        self.assertEqual(report_args[1:4], ('Terminating obsolete appservers', 3, ANY))
+        self.assertEqual(report_args[4], 1)
+
     @patch('instance.models.openedx_instance.OpenEdXInstance.archive')
     def test_shut_down_obsolete_pr_sandboxes_no_pr(self, mock_archive):
         """
@@ -447,6 +511,199 @@ class ReconfigureDirtyLoadBalancersTestCase(TestCase):
         self.assertEqual(mock_reconfigure.call_count, 3)
 
 
+@override_settings(OPENSTACK_WARM_POOLS=[{'size': 2}, {'size': 1, 'openstack_region': 'other-region'}])
+@patch('instance.models.server_pool.WarmServerQuerySet.terminate_orphans')
+@patch('instance.models.server_pool.WarmServerQuerySet.refill')
+class RefillWarmPoolsTestCase(TestCase):
+    """
+    Test cases for periodic task that refills the warm pools.
+
+    These use the Redis cache, since the task relies on its locks.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.delete('refill_warm_pools')
+        self.addCleanup(cache.delete, 'refill_warm_pools')
+
+    def assert_lock_released(self):
+        """
+        Check that the lock of the task is not held.
+        """
+        lock = cache.lock('refill_warm_pools')
+        self.assertTrue(lock.acquire(blocking=False))
+        lock.release()
+
+    def test_refill_warm_pools(self, mock_refill, mock_terminate_orphans):
+        """
+        The orphan servers are terminated, and each pool is refilled.
+        """
+        tasks.refill_warm_pools()
+        mock_terminate_orphans.assert_called_once_with()
+        self.assertEqual(mock_refill.call_args_list, [call(pool) for pool in WarmPool.get_all()])
+        self.assert_lock_released()
+
+    @override_settings(OPENSTACK_WARM_POOLS=[])
+    def test_refill_warm_pools_none(self, mock_refill, mock_terminate_orphans):
+        """
+        Nothing is done when no warm pools are configured.
+        """
+        tasks.refill_warm_pools()
+        mock_terminate_orphans.assert_not_called()
+        mock_refill.assert_not_called()
+
+    def test_refill_warm_pools_in_progress(self, mock_refill, mock_terminate_orphans):
+        """
+        The run is skipped while a previous one still holds the lock.
+        """
+        lock = cache.lock('refill_warm_pools', timeout=60)
+        self.assertTrue(lock.acquire(blocking=False))
+        try:
+            tasks.refill_warm_pools()
+        finally:
+            lock.release()
+        mock_terminate_orphans.assert_not_called()
+        mock_refill.assert_not_called()
+
+    def test_refill_warm_pools_error(self, mock_refill, mock_terminate_orphans):
+        """
+        The lock is released when refilling a pool fails, so that the next run isn't skipped.
+        """
+        mock_refill.side_effect = RuntimeError('Boot failed')
+        with self.assertRaises(RuntimeError):
+            tasks.refill_warm_pools()
+        mock_terminate_orphans.assert_called_once_with()
+        self.assertEqual(mock_refill.call_count, 1)
+        self.assert_lock_released()
+
+
+@override_settings(
+    BAKED_IMAGES_ENABLED=True, BAKED_IMAGE_MIN_APPSERVERS=2, BAKED_IMAGE_MAX_AGE_DAYS=14,
+    BAKED_IMAGE_UNUSED_DAYS=3, BAKED_IMAGE_FAILURE_BACKOFF_HOURS=24,
+)
+class BakedImagesTestCase(TestCase):
+    """
+    Test cases for the tasks that bake images and delete them.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.instance = OpenEdXInstanceFactory()
+
+    def make_appservers(self, count, **fields):
+        """
+        Create `count` AppServers for self.instance, with the given fields changed, and return the last one.
+        """
+        appservers = [make_test_appserver(instance=self.instance) for dummy in range(count)]
+        if fields:
+            OpenEdXAppServer.objects.filter(pk__in=[appserver.pk for appserver in appservers]).update(**fields)
+        return OpenEdXAppServer.objects.get(pk=appservers[-1].pk)
+
+    @staticmethod
+    def make_baked_image(appserver, status=BakedImage.READY, **kwargs):
+        """
+        Create an image baked for the configuration of the given AppServer.
+        """
+        fields = dict(
+            openstack_region=appserver.instance.openstack_region,
+            base_image=appserver.openstack_server_base_image,
+            openstack_image_id='image-id',
+            status=status,
+            bake_duration=600,
+            **{field: getattr(appserver, field) for field in BAKED_IMAGE_KEY_FIELDS}
+        )
+        fields.update(kwargs)
+        return BakedImage.objects.create(**fields)
+
+    @patch('instance.tasks.bake_image')
+    def test_bake_images(self, mock_bake_image):
+        """
+        Images are baked for the configurations used by enough recent AppServers that didn't boot from a baked image.
+        """
+        appserver = self.make_appservers(2)
+        self.make_appservers(1, edx_platform_commit='rare')
+        with freezegun.freeze_time(timezone.now() - timedelta(days=8)):
+            self.make_appservers(2, edx_platform_commit='old')
+        # The image these booted from has expired since, but they don't count
+        booted_from_image = self.make_appservers(2, edx_platform_commit='baked')
+        with freezegun.freeze_time(timezone.now() - timedelta(days=15)):
+            expired = self.make_baked_image(booted_from_image)
+        OpenEdXAppServer.objects.filter(edx_platform_commit='baked').update(baked_image=expired)
+
+        tasks.bake_images()
+        baked_image = BakedImage.objects.get(status=BakedImage.BAKING)
+        self.assertEqual(BakedImage.objects.matching(appserver).get(), baked_image)
+        mock_bake_image.assert_called_once_with(baked_image.pk, appserver.pk)
+
+        # Images are only baked once
+        tasks.bake_images()
+        self.assertEqual(mock_bake_image.call_count, 1)
+
+    @override_settings(BAKED_IMAGES_ENABLED=False)
+    @patch('instance.tasks.bake_image')
+    def test_bake_images_disabled(self, mock_bake_image):
+        """
+        No images are baked when baked images are disabled.
+        """
+        self.make_appservers(2)
+        tasks.bake_images()
+        self.assertFalse(BakedImage.objects.exists())
+        mock_bake_image.assert_not_called()
+
+    @patch('instance.tasks.bake_image')
+    def test_bake_images_after_failure(self, mock_bake_image):
+        """
+        Images that failed to bake are only baked again after BAKED_IMAGE_FAILURE_BACKOFF_HOURS.
+        """
+        appserver = self.make_appservers(2)
+        failed = self.make_baked_image(appserver, status=BakedImage.FAILED, openstack_image_id='')
+
+        tasks.bake_images()
+        mock_bake_image.assert_not_called()
+
+        with freezegun.freeze_time(failed.modified + timedelta(hours=25)):
+            tasks.bake_images()
+        baked_image = BakedImage.objects.get(status=BakedImage.BAKING)
+        mock_bake_image.assert_called_once_with(baked_image.pk, appserver.pk)
+
+    @patch('instance.models.baked_image.BakedImage.bake', autospec=True)
+    def test_bake_image(self, mock_bake):
+        """
+        The image is baked with the configuration of the given AppServer.
+        """
+        appserver = self.make_appservers(1)
+        baked_image = BakedImage.objects.start_baking(appserver)
+        tasks.bake_image(baked_image.pk, appserver.pk)
+        mock_bake.assert_called_once_with(baked_image, appserver)
+
+    @override_settings(BAKED_IMAGE_SNAPSHOT_TIMEOUT=3600, ANSIBLE_GLOBAL_TIMEOUT=3600)
+    @patch('instance.tasks.logger')
+    @patch('instance.models.baked_image.openstack_utils.get_nova_client')
+    def test_delete_unused_baked_images(self, mock_get_nova_client, mock_logger):
+        """
+        Expired and unused images are deleted, and abandoned images are marked as failed.
+        """
+        appserver = self.make_appservers(1)
+        with freezegun.freeze_time(timezone.now() - timedelta(days=15)):
+            expired = self.make_baked_image(appserver, openstack_image_id='expired')
+        with freezegun.freeze_time(timezone.now() - timedelta(hours=3)):
+            abandoned = self.make_baked_image(appserver, status=BakedImage.BAKING, openstack_image_id='abandoned')
+        self.make_baked_image(appserver, openstack_image_id='new')
+
+        tasks.delete_unused_baked_images()
+        self.assertEqual(
+            {image.openstack_image_id: image.status for image in BakedImage.objects.all()},
+            {'expired': BakedImage.DELETED, 'abandoned': BakedImage.FAILED, 'new': BakedImage.READY},
+        )
+        self.assertCountEqual(
+            [delete_call[0][0] for delete_call in mock_get_nova_client.return_value.images.delete.call_args_list],
+            [expired.openstack_image_id, abandoned.openstack_image_id],
+        )
+        mock_logger.info.assert_called_once_with(
+            'Deleted baked image %s, which saved %.0fs of deployment', expired, expired.time_saved,
+        )
+
+
 class DeleteOldLogsTestCase(TestCase):
     """
     Test cases for periodic task that deletes old logs.
@@ -461,8 +718,9 @@ class DeleteOldLogsTestCase(TestCase):
         # Some Django start-up tasks produce logs which interfere with our tests.
         LogEntry.objects.all().delete()
 
+    @patch('instance.tasks.LogEntryPartition.is_enabled', return_value=False)
     @override_settings(LOG_DELETION_DAYS=30)
-    def test_delete_old_logs(self):
+    def test_delete_old_logs(self, mock_is_enabled):
         """
         Only logs created before a cutoff date are deleted.
         """
@@ -489,3 +747,33 @@ class DeleteOldLogsTestCase(TestCase):
         # Only the new log remains.
         self.assertFalse(remaining_logs.filter(text__contains='old log').exists())
         self.assertTrue(remaining_logs.filter(text__contains='new log').exists())
+
+    @override_settings(LOG_DELETION_DAYS=30, LOG_PARTITION_MONTHS_AHEAD=1)
+    def test_delete_old_logs_partitioned(self):
+        """
+        When the LogEntry table is partitioned, the partitions only holding old logs are dropped.
+        """
+        if not LogEntryPartition.is_enabled():
+            self.skipTest('The LogEntry table is not partitioned')
+        # Partitions can't be dropped while they have pending deferred foreign key checks
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        # Log entries can only be written in months that have a partition, so use upcoming months
+        old_month = LogEntryPartition.for_month(timezone.now() + timezone.timedelta(days=400))
+        new_month = LogEntryPartition.for_month(old_month.end + timezone.timedelta(days=31))
+        with freezegun.freeze_time(old_month.start + timezone.timedelta(days=1)):
+            tasks.delete_old_logs()
+            instance = OpenEdXInstanceFactory()
+            instance.logger.info('old log')
+        self.assertIn(old_month, LogEntryPartition.get_all())
+        self.assertIn(LogEntryPartition.for_month(old_month.end), LogEntryPartition.get_all())
+
+        with freezegun.freeze_time(old_month.end + timezone.timedelta(days=31)):
+            tasks.delete_old_logs()
+            instance.logger.info('new log')
+        partitions = LogEntryPartition.get_all()
+        self.assertEqual(partitions[0], LogEntryPartition.for_month(old_month.end))
+        self.assertIn(new_month, partitions)
+        self.assertFalse(LogEntry.objects.filter(text__contains='old log').exists())
+        self.assertTrue(LogEntry.objects.filter(text__contains='new log').exists())
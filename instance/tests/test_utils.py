@@ -25,10 +25,12 @@ Utils module - Tests
 from datetime import datetime
 import itertools
 import subprocess
-from unittest.mock import patch
+import threading
+from unittest.mock import Mock, patch
 
 from instance.tests.base import TestCase
-from instance.utils import sufficient_time_passed, poll_streams, _line_timeout_generator, to_json
+from instance.utils import sufficient_time_passed, poll_streams, _line_timeout_generator, to_json, run_concurrently
+from instance.utils import run_steps, SkippedStepError, Step
 
 
 # Tests #######################################################################
@@ -129,3 +131,92 @@ class UtilsTestCase(TestCase):
         self.assertEqual(to_json(non_serializable), '{\n    "attr": 42\n}')
         serializable.attr = non_serializable  # pylint: disable=attribute-defined-outside-init
         self.assertEqual(to_json(serializable), '{\n    "attr": "%s"\n}' % (non_serializable,))
+
+    def test_run_concurrently(self):
+        """
+        Test that run_concurrently() calls the function for all items concurrently, and reports errors.
+        """
+        barrier = threading.Barrier(3, timeout=10)
+
+        def process(item):
+            """ Wait until all items are being processed at the same time """
+            barrier.wait()
+            if item == 'b':
+                raise ValueError(item)
+
+        with patch('instance.utils.logger') as mock_logger:
+            results = run_concurrently(process, ['a', 'b', 'c'], 'Processing', max_workers=3)
+        self.assertEqual(sorted(result.item for result in results), ['a', 'b', 'c'])
+        self.assertEqual([str(result.exception) for result in results if result.exception], ['b'])
+        mock_logger.exception.assert_called_once_with('Error while processing %s', 'b')
+        self.assertEqual(mock_logger.info.call_args[0][1:3], ('Processing', 3))
+
+    def test_run_concurrently_sequential(self):
+        """
+        Test that run_concurrently() calls the function in the calling thread with a single worker.
+        """
+        threads = []
+        results = run_concurrently(
+            lambda item: threads.append(threading.current_thread()), range(25), 'Processing', max_workers=1,
+        )
+        self.assertEqual([result.item for result in results], list(range(25)))
+        self.assertEqual(set(threads), {threading.current_thread()})
+
+    def _get_steps(self, calls, barrier=None):
+        """
+        Return test steps appending their name to `calls`, where 'd' fails and 'e' requires it.
+        """
+        def step(name, requires=(), wait=False):
+            """ Return a step named `name` """
+            def func():
+                """ Record the call, waiting for the other independent steps if needed """
+                if wait and barrier:
+                    barrier.wait()
+                calls.append(name)
+                if name == 'd':
+                    raise ValueError(name)
+            return Step(name, func, requires)
+
+        return [
+            step('c', requires=['a', 'b']),
+            step('a', wait=True),
+            step('b', wait=True),
+            step('d'),
+            step('e', requires=['d']),
+        ]
+
+    def test_run_steps(self):
+        """
+        Test that run_steps() runs independent steps concurrently, after the steps they require.
+        """
+        calls = []
+        steps = self._get_steps(calls, barrier=threading.Barrier(2, timeout=10))
+        with patch('instance.utils.logger'):
+            results = run_steps(steps, 'Running steps', max_workers=3)
+
+        self.assertEqual(list(results), ['c', 'a', 'b', 'd', 'e'])
+        self.assertCountEqual(calls, ['a', 'b', 'c', 'd'])
+        self.assertGreater(calls.index('c'), max(calls.index('a'), calls.index('b')))
+        self.assertEqual(str(results['d'].exception), 'd')
+        self.assertIsInstance(results['e'].exception, SkippedStepError)
+        self.assertIsNone(results['c'].exception)
+
+    def test_run_steps_sequential(self):
+        """
+        Test that run_steps() runs the steps in the calling thread in order with a single worker.
+        """
+        calls = []
+        with patch('instance.utils.logger'):
+            results = run_steps(self._get_steps(calls), 'Running steps', max_workers=1)
+        self.assertEqual(calls, ['a', 'b', 'd', 'c'])
+        self.assertEqual([name for name, result in results.items() if result.exception], ['d', 'e'])
+
+    def test_run_steps_circular(self):
+        """
+        Test that run_steps() refuses steps with circular or unknown requirements, without running any.
+        """
+        func = Mock()
+        for steps in ([Step('a', func, ['b']), Step('b', func, ['a'])], [Step('a', func, ['z'])]):
+            with self.assertRaises(ValueError):
+                run_steps(steps, 'Running steps', max_workers=1)
+        self.assertFalse(func.called)
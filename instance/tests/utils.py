@@ -105,6 +105,14 @@ def patch_services(func):
                 self.assertLess(mock_sleep.call_count, 1000, "time.sleep() called too many times.")
             mock_sleep.side_effect = check_sleep_count
 
+            def wait_for_status_watcher(_region_name, _openstack_id, _timeout):
+                """ Don't start the status watcher thread; let update_status() query the mocked nova client """
+                mock_sleep(1)
+                return 1, None
+            stack_patch(
+                'instance.models.server.openstack_utils.status_watcher.wait', side_effect=wait_for_status_watcher,
+            )
+
             mocks = Mock(
                 os_server_manager=os_server_manager,
                 mock_get_nova_client=mock_get_nova_client,
@@ -113,6 +121,10 @@ def patch_services(func):
                     'instance.models.server.openstack_utils.create_server', side_effect=new_servers,
                 ),
                 mock_sleep=mock_sleep,
+                mock_prepare_ansible_playbooks=stack_patch(
+                    'instance.models.mixins.ansible.AnsibleAppServerMixin.prepare_ansible_playbooks',
+                    return_value=[],
+                ),
                 mock_run_ansible_playbooks=stack_patch(
                     'instance.models.mixins.ansible.AnsibleAppServerMixin.run_ansible_playbooks',
                     return_value=([], 0),
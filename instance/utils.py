@@ -22,16 +22,48 @@ Instance app - Util functions
 
 # Imports #####################################################################
 
+from collections import namedtuple, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 import itertools
 import json
+import logging
 import selectors
 import socket
 import time
 from unittest.mock import Mock
 
+from django.db import connection
 import requests
 
 
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Classes #####################################################################
+
+ConcurrentCallResult = namedtuple('ConcurrentCallResult', ['item', 'duration', 'exception'])
+
+
+class Step(namedtuple('Step', ['name', 'func', 'requires'])):
+    """
+    A step run by run_steps(): `func()` is called once the steps named in `requires` succeeded.
+    """
+    def __new__(cls, name, func, requires=()):
+        return super().__new__(cls, name, func, tuple(requires))
+
+    def __str__(self):
+        return self.name
+
+
+class SkippedStepError(RuntimeError):
+    """
+    Recorded as the exception of a step that wasn't run because a step it requires failed.
+    """
+    pass
+
+
 # Functions ###################################################################
 
 def is_port_open(ip, port):
@@ -133,3 +165,150 @@ def sufficient_time_passed(earlier_date, later_date, expected_days_since):
     """
     days_passed = (later_date - earlier_date).days
     return days_passed >= expected_days_since
+
+
+def _timed_call(func, item, close_connection):
+    """
+    Call `func(item)`, and return a ConcurrentCallResult with its duration and the exception it raised, if any.
+    """
+    start = time.monotonic()
+    exception = None
+    try:
+        func(item)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception('Error while processing %s', item)
+        exception = exc
+    finally:
+        if close_connection:
+            # Each thread of the pool opens its own database connection
+            connection.close()
+    return ConcurrentCallResult(item, time.monotonic() - start, exception)
+
+
+def run_concurrently(func, items, description, max_workers, progress_interval=10, slowest_count=5):
+    """
+    Call `func(item)` for each of the given items from a pool of `max_workers` threads, or
+    sequentially in the calling thread if `max_workers` is 1. Meant for I/O-bound work, like
+    calling external APIs or waiting for servers.
+
+    Exceptions raised by `func` are logged, and don't prevent processing the other items.
+    The progress is logged every `progress_interval` items, followed by a timing report
+    listing the `slowest_count` slowest items.
+
+    Returns the list of ConcurrentCallResult, in order of completion.
+    """
+    items = list(items)
+    start = time.monotonic()
+    results = []
+
+    def record(result):
+        """ Keep the result of a call, and log the progress """
+        results.append(result)
+        if len(results) % progress_interval == 0 and len(results) < len(items):
+            logger.info('%s: %d/%d done, %d failed', description, len(results), len(items),
+                        sum(1 for result in results if result.exception))
+
+    if max_workers <= 1:
+        for item in items:
+            record(_timed_call(func, item, close_connection=False))
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_timed_call, func, item, True) for item in items]
+            for future in as_completed(futures):
+                record(future.result())
+
+    elapsed = time.monotonic() - start
+    slowest = sorted(results, key=lambda result: result.duration, reverse=True)[:slowest_count]
+    logger.info(
+        '%s: %d done in %.1fs, %d failed, %.1fs of work with %d worker(s). Slowest: %s',
+        description, len(results), elapsed, sum(1 for result in results if result.exception),
+        sum(result.duration for result in results), max_workers,
+        ', '.join('{} ({:.1f}s)'.format(result.item, result.duration) for result in slowest) or 'none',
+    )
+    return results
+
+
+def _call_step(step):
+    """
+    Run the given step.
+    """
+    step.func()
+
+
+def _sort_steps(steps):
+    """
+    Return the given steps sorted so that each step comes after the steps it requires.
+
+    Raises ValueError if some requirements are unknown or circular.
+    """
+    ordered = []
+    done = set()
+    while len(ordered) < len(steps):
+        ready = [step for step in steps if step.name not in done and done.issuperset(step.requires)]
+        if not ready:
+            raise ValueError('Unknown or circular step requirements: {}'.format(
+                ', '.join('{} requires {}'.format(step, step.requires) for step in steps if step.name not in done)
+            ))
+        ordered.extend(ready)
+        done.update(step.name for step in ready)
+    return ordered
+
+
+def run_steps(steps, description, max_workers):
+    """
+    Run the given Steps from a pool of `max_workers` threads, or sequentially in the calling
+    thread if `max_workers` is 1. Each step starts as soon as the steps it requires succeeded,
+    so independent steps run concurrently; steps requiring a step that failed are skipped.
+
+    Exceptions raised by the steps are logged, and don't prevent running the other steps.
+    A timing report of all steps is logged at the end.
+
+    Returns an OrderedDict mapping the name of each step to its ConcurrentCallResult, in the
+    order the steps were given.
+    """
+    steps = list(steps)
+    remaining = _sort_steps(steps)
+    results = {}
+    start = time.monotonic()
+
+    def pop_ready_steps():
+        """ Return the remaining steps whose requirements succeeded, and skip those whose requirements failed """
+        ready = []
+        for step in list(remaining):
+            if all(name in results for name in step.requires):
+                remaining.remove(step)
+                failed = [name for name in step.requires if results[name].exception]
+                if failed:
+                    error = SkippedStepError('Skipped, since {} failed'.format(', '.join(failed)))
+                    results[step.name] = ConcurrentCallResult(step, 0.0, error)
+                else:
+                    ready.append(step)
+        return ready
+
+    if max_workers <= 1:
+        while remaining:
+            for step in pop_ready_steps():
+                results[step.name] = _timed_call(_call_step, step, close_connection=False)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+            while remaining or running:
+                for step in pop_ready_steps():
+                    running[executor.submit(_timed_call, _call_step, step, True)] = step
+                done, dummy = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future).name] = future.result()
+
+    results = OrderedDict((step.name, results[step.name]) for step in steps)
+    logger.info(
+        '%s: %d step(s) in %.1fs, %.1fs of work with %d worker(s): %s',
+        description, len(results), time.monotonic() - start,
+        sum(result.duration for result in results.values()), max_workers,
+        ', '.join(
+            '{} ({})'.format(name, 'skipped' if isinstance(result.exception, SkippedStepError) else '{:.1f}s{}'.format(
+                result.duration, ', failed' if result.exception else '',
+            ))
+            for name, result in results.items()
+        ),
+    )
+    return results
@@ -57,6 +57,15 @@ CONSUL_ENABLED = env.bool('CONSUL_ENABLED', default=False)
 OCIM_ID = env('OCIM_ID', default='ocim')
 CONSUL_PREFIX = env('CONSUL_PREFIX', default='{ocim}/instances/{instance}/')
 
+# Instances' metadata is written to Consul in transactions of at most this many operations
+# (Consul's own limit is 64), retried up to CONSUL_TXN_RETRIES times on conflicting changes.
+CONSUL_TXN_MAX_OPERATIONS = env.int('CONSUL_TXN_MAX_OPERATIONS', default=64)
+CONSUL_TXN_RETRIES = env.int('CONSUL_TXN_RETRIES', default=3)
+
+# How long to remember the metadata last written to Consul for each instance, during which
+# saving an instance without changing its metadata makes no request to Consul (in seconds)
+CONSUL_METADATA_CACHE_TIMEOUT = env.int('CONSUL_METADATA_CACHE_TIMEOUT', default=3600)
+
 # Auth ########################################################################
 
 AUTHENTICATION_BACKENDS = (
@@ -257,6 +266,15 @@ OPENSTACK_TENANT = env('OPENSTACK_TENANT')
 OPENSTACK_AUTH_URL = env('OPENSTACK_AUTH_URL')
 OPENSTACK_REGION = env('OPENSTACK_REGION')
 
+# OpenStack clients are shared by all callers in a process, and recreated (re-authenticated)
+# after this number of seconds.
+OPENSTACK_CLIENT_POOL_MAX_AGE = env.int('OPENSTACK_CLIENT_POOL_MAX_AGE', default=3000)
+
+# While waiting for servers to change status, the servers of each region are listed once per interval,
+# which grows from the min to the max value (in seconds) as long as none of the watched servers changes
+SERVER_STATUS_WATCHER_MIN_INTERVAL = env.float('SERVER_STATUS_WATCHER_MIN_INTERVAL', default=1.0)
+SERVER_STATUS_WATCHER_MAX_INTERVAL = env.float('SERVER_STATUS_WATCHER_MAX_INTERVAL', default=10.0)
+
 OPENSTACK_SANDBOX_FLAVOR = env.json('OPENSTACK_SANDBOX_FLAVOR', default={"ram": 4096, "disk": 40})
 OPENSTACK_SANDBOX_BASE_IMAGE = env.json('OPENSTACK_SANDBOX_BASE_IMAGE', default={"name": "Ubuntu 16.04"})
 OPENSTACK_SANDBOX_SSH_KEYNAME = env('OPENSTACK_SANDBOX_SSH_KEYNAME', default='opencraft')
@@ -266,6 +284,29 @@ OPENSTACK_PRODUCTION_INSTANCE_FLAVOR = env.json(
     default={"ram": 8192, "disk": 80}
 )
 
+# Pools of booted servers kept ready for new AppServers, as a list of {"size": 2} dicts, which can
+# also override the "openstack_region", "flavor_selector", "image_selector" and "key_name" of the
+# pool (the sandbox settings by default)
+OPENSTACK_WARM_POOLS = env.json('OPENSTACK_WARM_POOLS', default=[])
+# Servers of the warm pools are recycled after this number of seconds
+OPENSTACK_WARM_POOL_MAX_AGE = env.int('OPENSTACK_WARM_POOL_MAX_AGE', default=24 * 3600)
+# How many seconds servers of the warm pools may take to boot
+OPENSTACK_WARM_POOL_BOOT_TIMEOUT = env.int('OPENSTACK_WARM_POOL_BOOT_TIMEOUT', default=1800)
+
+# Bake images for the Open edX releases and configurations used by at least BAKED_IMAGE_MIN_APPSERVERS
+# AppServers over the last week, with the tasks of the configuration playbook that have one of the
+# BAKED_IMAGE_ANSIBLE_TAGS already run, so new AppServers boot from them and skip those tasks
+BAKED_IMAGES_ENABLED = env.bool('BAKED_IMAGES_ENABLED', default=False)
+BAKED_IMAGE_ANSIBLE_TAGS = env('BAKED_IMAGE_ANSIBLE_TAGS', default='install:base,install:system-requirements')
+BAKED_IMAGE_MIN_APPSERVERS = env.int('BAKED_IMAGE_MIN_APPSERVERS', default=2)
+# Baked images are deleted after this number of days, or when no AppServer used them for BAKED_IMAGE_UNUSED_DAYS
+BAKED_IMAGE_MAX_AGE_DAYS = env.int('BAKED_IMAGE_MAX_AGE_DAYS', default=14)
+BAKED_IMAGE_UNUSED_DAYS = env.int('BAKED_IMAGE_UNUSED_DAYS', default=3)
+# How many seconds OpenStack may take to snapshot a baked image
+BAKED_IMAGE_SNAPSHOT_TIMEOUT = env.int('BAKED_IMAGE_SNAPSHOT_TIMEOUT', default=3600)
+# No new image is baked for a release and configuration for this many hours after baking one failed
+BAKED_IMAGE_FAILURE_BACKOFF_HOURS = env.int('BAKED_IMAGE_FAILURE_BACKOFF_HOURS', default=24)
+
 # Separate credentials for Swift.  These credentials are currently passed on to each instance
 # when Swift is enabled.
 
@@ -318,6 +359,10 @@ BILLING_RATE = env('BILLING_RATE', default=3)
 # See https://www.gandi.net/admin/api_key
 GANDI_API_KEY = env('GANDI_API_KEY')
 
+# The zone IDs of the domains in the Gandi account are kept in the shared cache, and refreshed
+# in the background once they are older than this many seconds
+GANDI_ZONE_ID_CACHE_TTL = env.int('GANDI_ZONE_ID_CACHE_TTL', default=3600)
+
 
 # GitHub - Forks & organizations ##############################################
 
@@ -327,6 +372,13 @@ GANDI_API_KEY = env('GANDI_API_KEY')
 # Get it from https://github.com/settings/tokens
 GITHUB_ACCESS_TOKEN = env('GITHUB_ACCESS_TOKEN')
 
+# How long responses from the GitHub API are cached, in seconds, to be requested again conditionally
+GITHUB_RESPONSE_CACHE_TIMEOUT = env.int('GITHUB_RESPONSE_CACHE_TIMEOUT', default=86400)  # 1 day
+
+# Requests to the GitHub API are paced so that the remaining quota lasts until it is reset.
+# Give up with RateLimitExceeded instead of waiting longer than this many seconds for the next request.
+GITHUB_RATE_LIMIT_MAX_WAIT = env.int('GITHUB_RATE_LIMIT_MAX_WAIT', default=60)
+
 # Default github repository to pull code from
 DEFAULT_FORK = env('DEFAULT_FORK', default='edx/edx-platform')
 DEFAULT_EDX_PLATFORM_REPO_URL = 'https://github.com/{}.git'.format(DEFAULT_FORK)
@@ -479,6 +531,10 @@ OPENEDX_APPSERVER_SECURITY_GROUP_RULES = [
     },
 ]
 
+# How many seconds a synchronization of the rules of the AppServer security group is trusted in a region,
+# as long as the name and rules above don't change. Later provisionings resynchronize it in the background.
+OPENEDX_APPSERVER_SECURITY_GROUP_CACHE_TTL = env.int('OPENEDX_APPSERVER_SECURITY_GROUP_CACHE_TTL', default=3600)
+
 # Ansible #####################################################################
 
 # Ansible requires a Python 2 interpreter
@@ -490,6 +546,13 @@ ANSIBLE_LINE_TIMEOUT = env.int('ANSIBLE_LINE_TIMEOUT', default=1500)  # 25 minut
 # Timeout in seconds for an entire Ansible playbook.
 ANSIBLE_GLOBAL_TIMEOUT = env.int('ANSIBLE_GLOBAL_TIMEOUT', default=9000)  # 2.5 hours
 
+# Directory where the virtualenvs Ansible runs in are cached, keyed by their requirements.
+# Set to an empty value to create a new virtualenv for each playbook run.
+ANSIBLE_VENV_CACHE_DIR = env('ANSIBLE_VENV_CACHE_DIR', default=root('build/ansible-venvs'))
+
+# Maximum total size in bytes of the cached virtualenvs; the least recently used ones are deleted beyond it.
+ANSIBLE_VENV_CACHE_MAX_SIZE = env.int('ANSIBLE_VENV_CACHE_MAX_SIZE', default=2 * 1024 ** 3)  # 2 GiB
+
 # The repository to pull the default Ansible playbook from.
 ANSIBLE_APPSERVER_REPO = env('ANSIBLE_APPSERVER_REPO', default='https://github.com/open-craft/ansible-playbooks.git')
 
@@ -502,6 +565,13 @@ ANSIBLE_APPSERVER_REQUIREMENTS_PATH = env('ANSIBLE_APPSERVER_REQUIREMENTS_PATH',
 # The version of the Ansible playbook repository to checkout.
 ANSIBLE_APPSERVER_VERSION = env('ANSIBLE_APPSERVER_VERSION', default='master')
 
+# Directory where bare mirrors of the playbook repositories are cached, so checkouts only fetch new commits.
+# Set to an empty value to clone the repositories for each playbook run.
+GIT_CACHE_DIR = env('GIT_CACHE_DIR', default=root('build/git-cache'))
+
+# Maximum total size in bytes of the cached mirrors; the least recently used ones are deleted beyond it.
+GIT_CACHE_MAX_SIZE = env.int('GIT_CACHE_MAX_SIZE', default=5 * 1024 ** 3)  # 5 GiB
+
 # Emails ######################################################################
 
 EMAIL_BACKEND = env('EMAIL_BACKEND',
@@ -623,9 +693,30 @@ DEFAULT_INSTANCE_RABBITMQ_URL = env('DEFAULT_INSTANCE_RABBITMQ_URL', default=Non
 # Limit the number of log entries fetched for each instance, for performance
 LOG_LIMIT = env.int('LOG_LIMIT', default=10000)
 
+# When buffering database log entries (e.g. while running Ansible playbooks), write them in
+# batches of at most this many entries, and at least every LOG_BUFFER_FLUSH_INTERVAL seconds.
+LOG_BUFFER_CAPACITY = env.int('LOG_BUFFER_CAPACITY', default=200)
+LOG_BUFFER_FLUSH_INTERVAL = env.float('LOG_BUFFER_FLUSH_INTERVAL', default=2.0)
+
+# How many instances the daily clean up task handles concurrently, in a pool of threads
+# (set to 1 to handle them one at a time)
+CLEAN_UP_MAX_WORKERS = env.int('CLEAN_UP_MAX_WORKERS', default=8)
+
+# How many external resources (databases, storage, DNS records...) are provisioned concurrently
+# when spawning an AppServer (set to 1 to provision them one at a time)
+SPAWN_APPSERVER_MAX_WORKERS = env.int('SPAWN_APPSERVER_MAX_WORKERS', default=4)
+
+# When a playbook fails while spawning an AppServer with several attempts, retry the failed and remaining
+# playbooks on the same server if it's still up, instead of spawning a new AppServer and server
+RESUME_FAILED_PROVISIONING = env.bool('RESUME_FAILED_PROVISIONING', default=True)
+
 # How old a log entry needs to be before it's deleted.
 LOG_DELETION_DAYS = env.int('LOG_DELETION_DAYS', default=60)
 
+# When the LogEntry table is partitioned by month (on PostgreSQL 10+), how many months of
+# partitions to create in advance of the current one.
+LOG_PARTITION_MONTHS_AHEAD = env.int('LOG_PARTITION_MONTHS_AHEAD', default=3)
+
 # When configured, email sent from instances is relayed via external SMTP provider.
 INSTANCE_SMTP_RELAY_HOST = env('INSTANCE_SMTP_RELAY_HOST', default=None)
 INSTANCE_SMTP_RELAY_PORT = env.int('INSTANCE_SMTP_RELAY_PORT', default=587)
@@ -675,6 +766,10 @@ DEFAULT_LOAD_BALANCING_SERVER = env('DEFAULT_LOAD_BALANCING_SERVER', default=Non
 LOAD_BALANCER_FRAGMENT_NAME_PREFIX = env('LOAD_BALANCER_FRAGMENT_NAME_PREFIX', default='opencraft-')
 PRELIMINARY_PAGE_SERVER_IP = env('PRELIMINARY_PAGE_SERVER_IP', default=None)
 
+# The rendered load balancer configuration of each instance is cached for this number of seconds,
+# and re-rendered earlier whenever its active appservers or domains change.
+LOAD_BALANCER_FRAGMENT_CACHE_TIMEOUT = env.int('LOAD_BALANCER_FRAGMENT_CACHE_TIMEOUT', default=24 * 60 * 60)
+
 # AWS #########################################################################
 
 # Must be set if `INSTANCE_STORAGE_TYPE = 's3'`.
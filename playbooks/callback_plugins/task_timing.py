@@ -0,0 +1,78 @@
+# pylint: skip-file
+"""
+Ansible callback plugin writing the start and end events of each task, as JSON lines, to the file
+named by the OPENCRAFT_TASK_TIMING_PATH environment variable.
+
+Enabled by instance.ansible.run_playbook() when it is asked for the task timings, which it parses
+with instance.ansible.read_task_timings().
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+
+class CallbackModule(CallbackBase):
+    """
+    Write a `task_start` event when a task starts, and a `task_end` event when it is done on each host.
+    """
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'task_timing'
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        path = os.environ.get('OPENCRAFT_TASK_TIMING_PATH')
+        self._events_file = open(path, 'a') if path else None
+
+    def _write_event(self, event, **fields):
+        if self._events_file is None:
+            return
+        fields.update(event=event, time=time.time())
+        self._events_file.write(json.dumps(fields) + '\n')
+        # Flush each event, so that the events of a run that gets killed are kept
+        self._events_file.flush()
+
+    def _task_start(self, task):
+        self._write_event(
+            'task_start',
+            uuid=task._uuid,
+            role=task._role.get_name() if task._role else None,
+            task=task.name or task.action,
+        )
+
+    def _task_end(self, result, changed=None, failed=False, skipped=False):
+        if changed is None:
+            changed = bool(result._result.get('changed', False))
+        self._write_event(
+            'task_end',
+            uuid=result._task._uuid,
+            host=result._host.get_name(),
+            changed=changed,
+            failed=failed,
+            skipped=skipped,
+        )
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._task_start(task)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self._task_start(task)
+
+    def v2_runner_on_ok(self, result):
+        self._task_end(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._task_end(result, failed=not ignore_errors)
+
+    def v2_runner_on_unreachable(self, result):
+        self._task_end(result, changed=False, failed=True)
+
+    def v2_runner_on_skipped(self, result):
+        self._task_end(result, changed=False, skipped=True)
@@ -22,13 +22,21 @@ GitHub Service API - Helper functions
 
 # Imports #####################################################################
 
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 import functools
+import hashlib
+import json
 import logging
 import operator
 import re
+import threading
+import time
+from urllib.parse import urlparse
 
 from django.conf import settings
+from django.core.cache import cache
 from django.template.defaultfilters import truncatewords
 import requests
 import yaml
@@ -47,6 +55,31 @@ GH_HEADERS = {
     'Time-Zone': 'UTC',
 }
 
+# Number of requests that can be sent in a burst before the rate limiter starts pacing them
+RATE_LIMIT_BURST = 20
+
+# The resources of the GitHub API that have separate quotas, as named by the `X-RateLimit-Resource` header
+RATE_LIMIT_RESOURCES = ('core', 'search', 'graphql')
+
+GRAPHQL_URL = 'https://api.github.com/graphql'
+
+# Maximum number of pull requests fetched by a single GraphQL query
+GRAPHQL_MAX_PULL_REQUESTS = 100
+
+# Fields of the pull requests fetched with GraphQL queries
+GRAPHQL_PULL_REQUEST_FRAGMENT = '''
+fragment pullRequestFields on PullRequest {
+  number
+  title
+  body
+  state
+  closedAt
+  author { login }
+  headRefName
+  headRepository { nameWithOwner }
+}
+'''
+
 
 # Functions ###################################################################
 
@@ -57,15 +90,7 @@ def get_object_from_url(url):
 
     Raises ObjectDoesNotExist if github returns a 404 response.
     """
-    logger.info('GET URL %s', url)
-    r = requests.get(url, headers=GH_HEADERS)
-    logger.debug('Response body: %s', r.text)
-    if r.status_code == 404:
-        raise ObjectDoesNotExist('404 response from {0}'.format(url))
-    if r.status_code == 403 and r.headers.get('X-RateLimit-Remaining', '') == '0':
-        raise RateLimitExceeded('Rate limit exceeded when requesting a resource at {}'.format(url))
-    r.raise_for_status()
-    return r.json()
+    return client.get_json(url)
 
 
 def fork_name2tuple(fork_name):
@@ -113,7 +138,13 @@ def get_pr_by_number(pr_target_fork_name, pr_number):
     """
     Returns a PR object based on the reponse
     """
-    r_pr = get_pr_info_by_number(pr_target_fork_name, pr_number)
+    return make_pr(pr_target_fork_name, pr_number, get_pr_info_by_number(pr_target_fork_name, pr_number))
+
+
+def make_pr(pr_target_fork_name, pr_number, r_pr):
+    """
+    Returns a PR object based on the information about the PR, as returned by the REST API
+    """
     pr_fork_name = r_pr['head']['repo']['full_name']
     pr_branch_name = r_pr['head']['ref']
     pr = PR(
@@ -128,6 +159,85 @@ def get_pr_by_number(pr_target_fork_name, pr_number):
     return pr
 
 
+def _build_pull_requests_query(pr_keys):
+    """
+    Build a GraphQL query fetching the given (target fork name, PR number) pull requests.
+
+    Each repository and pull request gets an alias, one per line: `repo<index>` and `pr<number>`.
+    """
+    pr_numbers_by_fork = OrderedDict()
+    for pr_target_fork_name, pr_number in pr_keys:
+        pr_numbers_by_fork.setdefault(pr_target_fork_name, []).append(int(pr_number))
+    lines = ['query {']
+    for index, (pr_target_fork_name, pr_numbers) in enumerate(pr_numbers_by_fork.items()):
+        owner, name = fork_name2tuple(pr_target_fork_name)
+        lines.append('  repo{index}: repository(owner: {owner}, name: {name}) {{'.format(
+            index=index, owner=json.dumps(owner), name=json.dumps(name),
+        ))
+        for pr_number in pr_numbers:
+            lines.append('    pr{number}: pullRequest(number: {number}) {{ ...pullRequestFields }}'.format(
+                number=pr_number,
+            ))
+        lines.append('  }')
+    lines.append('}')
+    return '\n'.join(lines) + GRAPHQL_PULL_REQUEST_FRAGMENT, list(pr_numbers_by_fork)
+
+
+def _pr_info_from_graphql(node):
+    """
+    Convert a pull request fetched with GraphQL to the format of the REST API, with the fields we use.
+    """
+    head_repository = node['headRepository']
+    return {
+        'number': node['number'],
+        'title': node['title'],
+        'body': node['body'],
+        # Merged pull requests are closed, as far as the REST API is concerned
+        'state': 'open' if node['state'] == 'OPEN' else 'closed',
+        'closed_at': node['closedAt'],
+        'user': {'login': node['author']['login'] if node['author'] else None},
+        'head': {
+            'ref': node['headRefName'],
+            'repo': {'full_name': head_repository['nameWithOwner']} if head_repository else None,
+        },
+    }
+
+
+def get_pr_info_by_numbers(pr_keys):
+    """
+    Return information about the pull requests identified by the given (target fork name, PR number) pairs,
+    in the format of the REST API, as a dict keyed by those pairs.
+
+    The pull requests are fetched with batched GraphQL queries, up to GRAPHQL_MAX_PULL_REQUESTS at a time.
+    Pull requests that don't exist are missing from the returned dict.
+    """
+    pr_keys = list(OrderedDict.fromkeys((fork_name, int(number)) for fork_name, number in pr_keys))
+    pr_infos = {}
+    for start in range(0, len(pr_keys), GRAPHQL_MAX_PULL_REQUESTS):
+        query, fork_names = _build_pull_requests_query(pr_keys[start:start + GRAPHQL_MAX_PULL_REQUESTS])
+        data, errors = client.graphql(query)
+        for error in errors:
+            if error.get('type') != 'NOT_FOUND':
+                logger.error('Error while fetching pull requests: %s', error.get('message'))
+        for index, fork_name in enumerate(fork_names):
+            repository = data.get('repo{}'.format(index)) or {}
+            for alias, node in repository.items():
+                if node:
+                    pr_infos[(fork_name, int(alias[len('pr'):]))] = _pr_info_from_graphql(node)
+    return pr_infos
+
+
+def get_prs_by_numbers(pr_target_fork_name, pr_numbers):
+    """
+    Returns the PR objects of the given PR numbers, fetched with batched GraphQL queries.
+    """
+    pr_infos = get_pr_info_by_numbers((pr_target_fork_name, pr_number) for pr_number in pr_numbers)
+    return [
+        make_pr(pr_target_fork_name, pr_number, pr_infos[(pr_target_fork_name, pr_number)])
+        for pr_number in pr_numbers if (pr_target_fork_name, pr_number) in pr_infos
+    ]
+
+
 def get_pr_list_from_username(user_name, fork_name):
     """
     Retrieve the current active PRs for a given user
@@ -146,11 +256,11 @@ def get_pr_list_from_usernames(user_names, fork_name):
     q = 'is:open is:pr {authors} repo:{repo}'.format(authors=authors, repo=fork_name)
     r_pr_list = get_object_from_url('https://api.github.com/search/issues?sort=created&q={}'.format(q))
 
-    pr_list = []
+    pr_numbers = []
     for pr_dict in r_pr_list['items']:
         logger.debug('Received PR for user %s: %s', pr_dict['user']['login'], pr_dict)
-        pr_list.append(get_pr_by_number(fork_name, pr_dict['number']))
-    return pr_list
+        pr_numbers.append(pr_dict['number'])
+    return get_prs_by_numbers(fork_name, pr_numbers)
 
 
 def parse_date(date):
@@ -230,3 +340,189 @@ class RateLimitExceeded(Exception):
     Exception raised when trying to access a GitHub object and a rate limit is hit
     """
     pass
+
+
+class RateLimiter:
+    """
+    Token bucket pacing the requests to the GitHub API, so that the remaining quota lasts until it is reset.
+
+    The bucket is refilled at the rate of the remaining quota over the time left until it is reset,
+    as reported by the `X-RateLimit-Remaining` and `X-RateLimit-Reset` headers of the last response.
+    """
+    def __init__(self, burst=RATE_LIMIT_BURST):
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.time()
+        self.remaining = None
+        self.reset_at = None
+        self._lock = threading.Lock()
+
+    def update(self, headers):
+        """
+        Update the quota from the rate limit headers of a response.
+        """
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_at = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset_at is None:
+            return
+        with self._lock:
+            self.remaining = int(remaining)
+            self.reset_at = int(reset_at)
+
+    def acquire(self):
+        """
+        Take a token from the bucket, waiting for one if necessary.
+
+        Raises RateLimitExceeded without waiting if the quota is exhausted, or if the next token
+        won't be available within GITHUB_RATE_LIMIT_MAX_WAIT seconds.
+        """
+        with self._lock:
+            now = time.time()
+            if self.remaining is None or now >= self.reset_at:
+                # The quota is unknown, or has been reset since the last response
+                return
+            if self.remaining <= 0:
+                raise RateLimitExceeded('Rate limit exhausted, it will be reset in {:.0f}s'.format(self.reset_at - now))
+            rate = self.remaining / max(self.reset_at - now, 1)
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * rate)
+            self.updated_at = now
+            wait = max(0, (1 - self.tokens) / rate)
+            if wait > settings.GITHUB_RATE_LIMIT_MAX_WAIT:
+                raise RateLimitExceeded('Rate limit nearly exhausted, the next request would be sent in {:.0f}s'.format(
+                    wait
+                ))
+            # Reserve the token now, so that concurrent callers wait for the following ones
+            self.tokens -= 1
+        if wait:
+            logger.info('Waiting %.1fs before sending the next request to GitHub', wait)
+            time.sleep(wait)
+
+
+class GitHubClient:
+    """
+    Client for the GitHub API.
+
+    Requests are sent over a persistent session and paced by the RateLimiter of the quota they count
+    against (see RATE_LIMIT_RESOURCES). Responses with an ETag
+    or Last-Modified header are kept in the shared cache, and requested again conditionally:
+    a `304 Not Modified` response doesn't count against the rate limit.
+    """
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.headers.update(GH_HEADERS)
+        self.rate_limiters = {resource: RateLimiter() for resource in RATE_LIMIT_RESOURCES}
+        self._local = threading.local()
+
+    @staticmethod
+    def get_cache_key(url):
+        """
+        Key of the cached response for the given URL, which depends on the access token used.
+        """
+        fingerprint = hashlib.sha256('{}:{}'.format(settings.GITHUB_ACCESS_TOKEN, url).encode()).hexdigest()
+        return 'github_response:{}'.format(fingerprint)
+
+    @contextmanager
+    def track_usage(self):
+        """
+        Context manager yielding a Counter of the requests sent by the current thread within the block:
+        `requests`, `cache_hits` (not modified responses) and `quota_spent`.
+        """
+        usage = Counter(requests=0, cache_hits=0, quota_spent=0)
+        if not hasattr(self._local, 'usages'):
+            self._local.usages = []
+        self._local.usages.append(usage)
+        try:
+            yield usage
+        finally:
+            self._local.usages.pop()
+
+    def _count(self, **counts):
+        """
+        Add the given counts to the usage counters of the current thread.
+        """
+        for usage in getattr(self._local, 'usages', []):
+            usage.update(counts)
+
+    def get_json(self, url):
+        """
+        Send a GET request to the provided URL, and return the deserialized object from the returned JSON.
+
+        Raises ObjectDoesNotExist if github returns a 404 response,
+        and RateLimitExceeded if the rate limit has been reached.
+        """
+        cache_key = self.get_cache_key(url)
+        cached = cache.get(cache_key)
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        r = self._send('get', url, headers=headers)
+        if cached and r.status_code == 304:
+            logger.debug('Response not modified, using the cached body')
+            self._count(requests=1, cache_hits=1)
+            return cached['body']
+        self._count(requests=1, quota_spent=1)
+
+        self._check_response(url, r)
+        body = r.json()
+        if r.headers.get('ETag') or r.headers.get('Last-Modified'):
+            cache.set(cache_key, {
+                'etag': r.headers.get('ETag'),
+                'last_modified': r.headers.get('Last-Modified'),
+                'body': body,
+            }, timeout=settings.GITHUB_RESPONSE_CACHE_TIMEOUT)
+        return body
+
+    def graphql(self, query):
+        """
+        Run the given query against the GraphQL API, and return its `data` and `errors`.
+
+        Raises RateLimitExceeded if the rate limit has been reached.
+        """
+        r = self._send('post', GRAPHQL_URL, json={'query': query})
+        self._count(requests=1, quota_spent=1)
+        self._check_response(GRAPHQL_URL, r)
+        result = r.json()
+        errors = result.get('errors') or []
+        if any(error.get('type') == 'RATE_LIMITED' for error in errors):
+            raise RateLimitExceeded('Rate limit exceeded when running a GraphQL query')
+        return result.get('data') or {}, errors
+
+    def get_rate_limiter(self, url):
+        """
+        Return the rate limiter of the quota that requests to the given URL count against.
+        """
+        if url == GRAPHQL_URL:
+            return self.rate_limiters['graphql']
+        if urlparse(url).path.startswith('/search/'):
+            return self.rate_limiters['search']
+        return self.rate_limiters['core']
+
+    def _send(self, method, url, **kwargs):
+        """
+        Send a request once the rate limiter of its quota allows it, and update that rate limiter from the response.
+        """
+        rate_limiter = self.get_rate_limiter(url)
+        rate_limiter.acquire()
+        logger.info('%s URL %s', method.upper(), url)
+        r = self.session.request(method, url, **kwargs)
+        self.rate_limiters.get(r.headers.get('X-RateLimit-Resource'), rate_limiter).update(r.headers)
+        return r
+
+    @staticmethod
+    def _check_response(url, r):
+        """
+        Raise the appropriate exception if the given response is an error.
+        """
+        logger.debug('Response body: %s', r.text)
+        if r.status_code == 404:
+            raise ObjectDoesNotExist('404 response from {0}'.format(url))
+        if r.status_code == 403 and r.headers.get('X-RateLimit-Remaining', '') == '0':
+            raise RateLimitExceeded('Rate limit exceeded when requesting a resource at {}'.format(url))
+        r.raise_for_status()
+
+
+client = GitHubClient()
@@ -28,6 +28,7 @@ from huey.contrib.djhuey import crontab, db_periodic_task
 
 from userprofile.models import UserProfile
 
+from pr_watch import github
 from pr_watch.github import (
     get_pr_list_from_usernames,
     RateLimitExceeded
@@ -50,22 +51,27 @@ def watch_pr():
     Automatically create sandboxes for PRs opened by members of the watched
     organization on the watched repository
     """
-    try:
-        for watched_fork in WatchedFork.objects.filter(enabled=True):
-            usernames = list(
-                UserProfile.objects.filter(
-                    organization=watched_fork.organization,
-                ).exclude(
-                    github_username__isnull=True,
-                ).values_list(
-                    'github_username',
-                    flat=True
+    with github.client.track_usage() as usage:
+        try:
+            for watched_fork in WatchedFork.objects.filter(enabled=True):
+                usernames = list(
+                    UserProfile.objects.filter(
+                        organization=watched_fork.organization,
+                    ).exclude(
+                        github_username__isnull=True,
+                    ).values_list(
+                        'github_username',
+                        flat=True
+                    )
                 )
-            )
-            for pr in get_pr_list_from_usernames(usernames, watched_fork.fork):
-                instance, created = WatchedPullRequest.objects.get_or_create_from_pr(pr, watched_fork)
-                if created:
-                    logger.info('New PR found, creating sandbox: %s', pr)
-                    spawn_appserver(instance.ref.pk, mark_active_on_success=True, num_attempts=2)
-    except RateLimitExceeded as err:
-        logger.warning('Could not complete PR scan due to an error: %s', str(err))
+                for pr in get_pr_list_from_usernames(usernames, watched_fork.fork):
+                    instance, created = WatchedPullRequest.objects.get_or_create_from_pr(pr, watched_fork)
+                    if created:
+                        logger.info('New PR found, creating sandbox: %s', pr)
+                        spawn_appserver(instance.ref.pk, mark_active_on_success=True, num_attempts=2)
+        except RateLimitExceeded as err:
+            logger.warning('Could not complete PR scan due to an error: %s', str(err))
+    logger.info(
+        'GitHub API usage of the PR scan: %d requests, %d cache hits, %d quota spent, %s remaining',
+        usage['requests'], usage['cache_hits'], usage['quota_spent'], github.client.rate_limiters['core'].remaining,
+    )
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Fake implementation of the GitHub GraphQL API, replaying recorded pull requests.
+"""
+
+# Imports #####################################################################
+
+import json
+import re
+
+import responses
+
+from pr_watch import github
+
+
+# Constants ###################################################################
+
+REPOSITORY_ALIAS_RE = re.compile(r'^\s*(repo\d+): repository\(owner: ("[^"]*"), name: ("[^"]*")\) \{$')
+PULL_REQUEST_ALIAS_RE = re.compile(r'^\s*(pr\d+): pullRequest\(number: (\d+)\)')
+
+
+# Classes #####################################################################
+
+class FakeGitHubGraphQL:
+    """
+    Answers the pull request queries sent to the GitHub GraphQL API, from the recorded pull requests
+    given as a dict of GraphQL `PullRequest` objects, keyed by target fork name and PR number.
+
+    Pull requests that weren't recorded are returned as `null`, with a NOT_FOUND error, like GitHub does.
+    Use `register()` while `responses` is active to intercept the queries.
+    """
+    def __init__(self, pull_requests):
+        self.pull_requests = pull_requests
+        self.queries = []
+
+    def register(self):
+        """
+        Intercept the queries sent to the GraphQL API.
+        """
+        responses.add_callback(
+            responses.POST, github.GRAPHQL_URL, callback=self.callback, content_type='application/json',
+        )
+
+    def callback(self, request):
+        """
+        Answer a query, with the recorded pull requests.
+        """
+        query = json.loads(request.body.decode() if isinstance(request.body, bytes) else request.body)['query']
+        self.queries.append(query)
+        data = {}
+        errors = []
+        fork_name = repository = None
+        for line in query.splitlines():
+            match = REPOSITORY_ALIAS_RE.match(line)
+            if match:
+                alias, owner, name = match.groups()
+                fork_name = '{}/{}'.format(json.loads(owner), json.loads(name))
+                repository = data[alias] = {}
+                continue
+            match = PULL_REQUEST_ALIAS_RE.match(line)
+            if match:
+                alias, number = match.groups()
+                pull_request = self.pull_requests.get(fork_name, {}).get(number)
+                repository[alias] = pull_request
+                if pull_request is None:
+                    errors.append({
+                        'type': 'NOT_FOUND',
+                        'message': 'Could not resolve to a PullRequest with the number of {}.'.format(number),
+                    })
+        body = {'data': data}
+        if errors:
+            body['errors'] = errors
+        headers = {'X-RateLimit-Remaining': '4999', 'X-RateLimit-Reset': '2000000000'}
+        return (200, headers, json.dumps(body))
@@ -26,11 +26,13 @@ from datetime import datetime
 import json
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 import responses
 
-from instance.tests.base import get_raw_fixture
+from instance.tests.base import get_fixture, get_raw_fixture
 from pr_watch import github
+from pr_watch.tests.fake_github import FakeGitHubGraphQL
 
 
 # Tests #######################################################################
@@ -146,9 +148,16 @@ class GitHubTestCase(TestCase):
         with self.assertRaises(github.ObjectDoesNotExist):
             github.get_pr_by_number('edx/edx-platform', 1234567890)
 
+    def use_fake_graphql(self):
+        """
+        Answer the GraphQL queries with the recorded pull requests, and return the fake API.
+        """
+        fake_graphql = FakeGitHubGraphQL(get_fixture('github/graphql_pull_requests.json'))
+        fake_graphql.register()
+        return fake_graphql
+
     @responses.activate
-    @patch('pr_watch.github.get_pr_by_number')
-    def test_get_pr_list_from_username(self, mock_get_pr_by_number):
+    def test_get_pr_list_from_username(self):
         """
         Get list of open PR for user
         """
@@ -159,17 +168,18 @@ class GitHubTestCase(TestCase):
             body=get_raw_fixture('github/api_search_open_prs_user.json'),
             content_type='application/json; charset=utf8',
             status=200)
+        fake_graphql = self.use_fake_graphql()
 
-        mock_get_pr_by_number.side_effect = lambda fork_name, pr_number: [fork_name, pr_number]
-
-        self.assertEqual(
-            github.get_pr_list_from_username('itsjeyd', 'edx/edx-platform'),
-            [['edx/edx-platform', 9147], ['edx/edx-platform', 9146]]
-        )
+        pr_list = github.get_pr_list_from_username('itsjeyd', 'edx/edx-platform')
+        self.assertEqual([(pr.repo_name, pr.number) for pr in pr_list], [('edx/edx-platform', 9147),
+                                                                          ('edx/edx-platform', 9146)])
+        self.assertEqual(pr_list[0].fork_name, 'open-craft/edx-platform')
+        self.assertEqual(pr_list[0].branch_name, 'tim/problem-responses-export')
+        self.assertEqual(pr_list[0].username, 'itsjeyd')
+        self.assertEqual(len(fake_graphql.queries), 1)
 
     @responses.activate
-    @patch('pr_watch.github.get_pr_by_number')
-    def test_get_pr_list_from_usernames(self, mock_get_pr_by_number):
+    def test_get_pr_list_from_usernames(self):
         """
         Get list of open PR for a list of users
         """
@@ -183,13 +193,77 @@ class GitHubTestCase(TestCase):
             body=get_raw_fixture('github/api_search_open_prs_multiple_users.json'),
             content_type='application/json; charset=utf8',
             status=200)
+        fake_graphql = self.use_fake_graphql()
 
-        mock_get_pr_by_number.side_effect = lambda fork_name, pr_number: [fork_name, pr_number]
-
+        pr_list = github.get_pr_list_from_usernames(['itsjeyd', 'haikuginger'], 'edx/edx-platform')
         self.assertEqual(
-            github.get_pr_list_from_usernames(['itsjeyd', 'haikuginger'], 'edx/edx-platform'),
-            [['edx/edx-platform', 9147], ['edx/edx-platform', 9146], ['edx/edx-platform', 15921]]
+            [(pr.repo_name, pr.number, pr.fork_name) for pr in pr_list],
+            [('edx/edx-platform', 9147, 'open-craft/edx-platform'),
+             ('edx/edx-platform', 9146, 'open-craft/edx-platform'),
+             ('edx/edx-platform', 15921, 'haikuginger/edx-platform')]
+        )
+        self.assertEqual(len(fake_graphql.queries), 1)
+
+    @responses.activate
+    def test_get_prs_by_numbers(self):
+        """
+        The PR objects fetched with GraphQL match the ones fetched from the REST API
+        """
+        responses.add(
+            responses.GET, 'https://api.github.com/repos/edx/edx-platform/pulls/8474',
+            body=get_raw_fixture('github/api_pr.json'),
+            content_type='application/json; charset=utf8',
+            status=200
+        )
+        self.use_fake_graphql()
+
+        pr = github.get_pr_by_number('edx/edx-platform', 8474)
+        pr_list = github.get_prs_by_numbers('edx/edx-platform', [8474, 1234567890])
+        self.assertEqual(len(pr_list), 1)
+        self.assertEqual(vars(pr_list[0]), vars(pr))
+
+    @responses.activate
+    def test_get_pr_info_by_numbers(self):
+        """
+        Get information about PRs of several repositories, with missing PRs left out
+        """
+        fake_graphql = self.use_fake_graphql()
+
+        pr_infos = github.get_pr_info_by_numbers([
+            ('edx/edx-platform', 8474), ('edx/edx-platform', '15921'), ('open-craft/edx-platform', 8474),
+        ])
+        self.assertEqual(set(pr_infos), {('edx/edx-platform', 8474), ('edx/edx-platform', 15921)})
+        pr_info = pr_infos[('edx/edx-platform', 8474)]
+        self.assertEqual(pr_info['state'], 'closed')
+        self.assertEqual(pr_info['closed_at'], '2015-06-14T20:56:19Z')
+        self.assertEqual(pr_info['head']['repo']['full_name'], 'open-craft/edx-platform')
+        self.assertEqual(pr_infos[('edx/edx-platform', 15921)]['state'], 'open')
+        self.assertEqual(len(fake_graphql.queries), 1)
+
+    @responses.activate
+    def test_get_pr_info_by_numbers_batches(self):
+        """
+        PRs are fetched in batches of up to GRAPHQL_MAX_PULL_REQUESTS per query
+        """
+        fake_graphql = self.use_fake_graphql()
+
+        pr_numbers = [8474] + list(range(1, 250))
+        pr_infos = github.get_pr_info_by_numbers(('edx/edx-platform', pr_number) for pr_number in pr_numbers)
+        self.assertEqual(list(pr_infos), [('edx/edx-platform', 8474)])
+        self.assertEqual(len(fake_graphql.queries), 3)
+        self.assertEqual([query.count('pullRequest(') for query in fake_graphql.queries], [100, 100, 50])
+
+    @responses.activate
+    def test_get_pr_info_by_numbers_rate_limited(self):
+        """
+        A rate-limited GraphQL query raises RateLimitExceeded
+        """
+        responses.add(
+            responses.POST, github.GRAPHQL_URL,
+            json={'data': None, 'errors': [{'type': 'RATE_LIMITED', 'message': 'API rate limit exceeded'}]},
         )
+        with self.assertRaises(github.RateLimitExceeded):
+            github.get_pr_info_by_numbers([('edx/edx-platform', 8474)])
 
     def test_parse_date(self):
         """
@@ -203,3 +277,160 @@ class GitHubTestCase(TestCase):
         self.assertEqual(date.hour, 15)
         self.assertEqual(date.minute, 10)
         self.assertEqual(date.second, 30)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GitHubClientTestCase(TestCase):
+    """
+    Test cases for the GitHub API client
+    """
+    url = 'https://api.github.com/repos/edx/edx-platform/git/refs/heads/master'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        patcher = patch('pr_watch.github.client', github.GitHubClient())
+        self.client = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @responses.activate
+    def test_conditional_requests(self):
+        """
+        Responses with an ETag are requested again conditionally, and used when not modified.
+        """
+        request_headers = []
+
+        def callback(request):
+            """ Return the object the first time, and "304 Not Modified" afterwards """
+            request_headers.append(request.headers)
+            if request.headers.get('If-None-Match') == '"abc"':
+                return (304, {'X-RateLimit-Remaining': '4999', 'X-RateLimit-Reset': '2000000000'}, '')
+            return (200, {'ETag': '"abc"', 'X-RateLimit-Remaining': '4999', 'X-RateLimit-Reset': '2000000000'},
+                    json.dumps({'object': {'sha': 'test-sha'}}))
+
+        responses.add_callback(responses.GET, self.url, callback=callback, content_type='application/json')
+        with self.client.track_usage() as usage:
+            self.assertEqual(github.get_commit_id_from_ref('edx/edx-platform', 'master'), 'test-sha')
+            self.assertEqual(github.get_commit_id_from_ref('edx/edx-platform', 'master'), 'test-sha')
+
+        self.assertNotIn('If-None-Match', request_headers[0])
+        self.assertEqual(request_headers[1]['If-None-Match'], '"abc"')
+        self.assertEqual(request_headers[1]['Authorization'], 'token test-token')
+        self.assertEqual(usage, {'requests': 2, 'cache_hits': 1, 'quota_spent': 1})
+        self.assertEqual(self.client.rate_limiters['core'].remaining, 4999)
+
+    @responses.activate
+    def test_rate_limit_per_resource(self):
+        """
+        Exhausting the quota of the search API doesn't prevent requests against the core quota.
+        """
+        search_url = 'https://api.github.com/search/issues?q=is:pr'
+        responses.add(responses.GET, search_url, json={'items': []}, adding_headers={
+            'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '2000000000', 'X-RateLimit-Resource': 'search',
+        })
+        responses.add(responses.GET, self.url, json={'object': {'sha': 'test-sha'}}, adding_headers={
+            'X-RateLimit-Remaining': '4999', 'X-RateLimit-Reset': '2000000000', 'X-RateLimit-Resource': 'core',
+        })
+
+        github.get_object_from_url(search_url)
+        self.assertEqual(github.get_commit_id_from_ref('edx/edx-platform', 'master'), 'test-sha')
+        self.assertEqual(self.client.rate_limiters['core'].remaining, 4999)
+        with self.assertRaises(github.RateLimitExceeded):
+            github.get_object_from_url(search_url)
+
+    @responses.activate
+    def test_track_usage_nested(self):
+        """
+        Usage is counted for each block that tracks it.
+        """
+        responses.add(responses.GET, self.url, json={'object': {'sha': 'test-sha'}})
+        with self.client.track_usage() as outer_usage:
+            github.get_object_from_url(self.url)
+            with self.client.track_usage() as inner_usage:
+                github.get_object_from_url(self.url)
+        github.get_object_from_url(self.url)
+        self.assertEqual(outer_usage, {'requests': 2, 'cache_hits': 0, 'quota_spent': 2})
+        self.assertEqual(inner_usage, {'requests': 1, 'cache_hits': 0, 'quota_spent': 1})
+
+    @responses.activate
+    def test_rate_limit_exceeded(self):
+        """
+        Once the quota is exhausted, no request is sent until it is reset.
+        """
+        responses.add(
+            responses.GET, self.url, json={'message': 'API rate limit exceeded'}, status=403,
+            adding_headers={'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '2000000000'},
+        )
+        with patch('time.time', return_value=1999999000):
+            with self.assertRaises(github.RateLimitExceeded):
+                github.get_object_from_url(self.url)
+            with self.assertRaises(github.RateLimitExceeded):
+                github.get_object_from_url(self.url)
+        self.assertEqual(len(responses.calls), 1)
+
+        # The quota has been reset
+        with patch('time.time', return_value=2000000001), self.assertRaises(github.RateLimitExceeded):
+            github.get_object_from_url(self.url)
+        self.assertEqual(len(responses.calls), 2)
+
+
+class RateLimiterTestCase(TestCase):
+    """
+    Test cases for the token bucket pacing requests to the GitHub API
+    """
+    def setUp(self):
+        super().setUp()
+        patcher = patch('time.time', return_value=1000)
+        self.mock_time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rate_limiter = github.RateLimiter(burst=2)
+
+    @patch('time.sleep')
+    def test_unknown_quota(self, mock_sleep):
+        """
+        Requests aren't paced until the quota is known.
+        """
+        for _ in range(5):
+            self.rate_limiter.acquire()
+        mock_sleep.assert_not_called()
+
+    @patch('time.sleep')
+    def test_pacing(self, mock_sleep):
+        """
+        Once the burst is spent, requests are spread over the time left until the quota is reset.
+        """
+        self.rate_limiter.update({'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '1100'})
+        self.rate_limiter.acquire()
+        self.rate_limiter.acquire()
+        mock_sleep.assert_not_called()
+        self.rate_limiter.acquire()
+        mock_sleep.assert_called_once_with(10)
+
+        # Tokens are refilled over time
+        mock_sleep.reset_mock()
+        self.mock_time.return_value = 1030
+        self.rate_limiter.acquire()
+        mock_sleep.assert_not_called()
+
+    @override_settings(GITHUB_RATE_LIMIT_MAX_WAIT=60)
+    @patch('time.sleep')
+    def test_max_wait(self, mock_sleep):
+        """
+        Requests that would wait too long fail instead.
+        """
+        self.rate_limiter.update({'X-RateLimit-Remaining': '2', 'X-RateLimit-Reset': '4600'})
+        self.rate_limiter.acquire()
+        self.rate_limiter.acquire()
+        with self.assertRaises(github.RateLimitExceeded):
+            self.rate_limiter.acquire()
+        mock_sleep.assert_not_called()
+
+    def test_quota_reset(self):
+        """
+        Requests aren't paced once the reset time of the last known quota has passed.
+        """
+        self.rate_limiter.update({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1100'})
+        with self.assertRaises(github.RateLimitExceeded):
+            self.rate_limiter.acquire()
+        self.mock_time.return_value = 1100
+        self.rate_limiter.acquire()